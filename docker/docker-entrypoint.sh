@@ -38,6 +38,19 @@ if ! nc -z 127.0.0.1 9000 2>/dev/null; then
     exit 1
 fi
 
+# Bootstrap an empty news database from a seed snapshot so the first
+# update_news.py run only has to fetch what is new (see utils/seed_snapshot.py)
+NEWS_SEED_PATH="${NEWS_SEED_PATH:-/var/www/html/data/news-seed.jsonl.gz}"
+if [ ! -f "$NEWS_SEED_PATH" ]; then
+    echo "No news seed snapshot at $NEWS_SEED_PATH; skipping seed import"
+elif ! command -v python3 >/dev/null 2>&1; then
+    echo "⚠ python3 not found; skipping seed import of $NEWS_SEED_PATH"
+else
+    echo "Loading news seed snapshot..."
+    runuser -u www-data -- python3 /var/www/html/utils/seed_snapshot.py --import "$NEWS_SEED_PATH" --if-empty \
+        || echo "⚠ Seed import failed; feeds will fill in on the first update"
+fi
+
 # Start nginx in foreground
 echo "Starting nginx..."
 exec "$@"
@@ -66,7 +66,10 @@ class DotEnv {
             'OPENWX_KEY',
             'BREVO_KEY',
             'FINNHUB_KEY',
-            'SQLITE_PATH'
+            'SQLITE_PATH',
+            'SQLITE_LAYOUT',
+            'SQLITE_DIR',
+            'OPENWX_CACHE_DIR'
         ];
 
         $envVarsFound = false;
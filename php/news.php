@@ -3,6 +3,7 @@
 // Include the git info function
 require_once __DIR__ . '/git_info.php';
 require_once __DIR__ . '/dotenv.php';
+require_once __DIR__ . '/util.php';
 
 // Set response headers to disable caching
 header('Cache-Control: no-cache, no-store, must-revalidate');
@@ -18,6 +19,7 @@ $version = isset($gitInfo['commit']) ? $gitInfo['commit'] : 'unknown';
 // Settings
 $logFile = '/tmp/rss_php_' . $version . '.log';
 $maxStories = 5000;
+$maxDeltaChanges = 500; // change log rows per delta response (see utils/news_delta.py)
 $diagnostics = [];
 $forceSqliteOverride = false; // Set to true to skip MySQL and always use SQLite
 
@@ -131,12 +133,16 @@ function getDbConnection(&$diagnostics = null, $forceSqliteOverride = false) {
     if ($forceSqliteOverride) {
         addDiagnostic($diagnostics, 'FORCE_SQLITE override enabled, using SQLite regardless of SQL_HOST settings');
     }
-    $dbPath = $_ENV['SQLITE_PATH'] ?? __DIR__ . '/../news/news_articles.db';
+    $layoutPath = sqliteLayoutPath($_ENV, 'news');
+    $dbPath = $layoutPath ?? ($_ENV['SQLITE_PATH'] ?? __DIR__ . '/../news/news_articles.db');
     $dsn = 'sqlite:' . $dbPath;
     addDiagnostic($diagnostics, "Attempting SQLite connection at {$dbPath}");
     try {
         $pdo = new PDO($dsn);
         $pdo->setAttribute(PDO::ATTR_ERRMODE, PDO::ERRMODE_EXCEPTION);
+        if ($layoutPath !== null) {
+            configureSqliteLayout($pdo, 'news');
+        }
         logMessage("Connected to SQLite database at {$dbPath}");
         addDiagnostic($diagnostics, "Connected to SQLite database at {$dbPath}");
         return $pdo;
@@ -156,6 +162,7 @@ $shouldReturnStats = !$isPostRequest || !$hasRequestBody;
 // Check if we're receiving a POST request with included feeds
 $includedFeeds = [];
 $userHash = '';
+$sinceSeq = null;
 if ($isPostRequest && $hasRequestBody) {
     $requestData = json_decode($requestBody, true);
     
@@ -176,6 +183,11 @@ if ($isPostRequest && $hasRequestBody) {
                 logMessage('Ignoring invalid userHash provided to news endpoint');
             }
         }
+        
+        // Delta polling: only the changes after the client's last sequence number
+        if (isset($requestData['since']) && is_numeric($requestData['since'])) {
+            $sinceSeq = max(0, intval($requestData['since']));
+        }
     }
 }
 
@@ -221,7 +233,7 @@ $readArticleIds = [];
 $readFilterApplied = false;
 $readFilterHeader = 'skipped';
 if ($userHash !== '') {
-    $readDbConnection = getReadStatusDbConnection($diagnostics);
+    $readDbConnection = getReadStatusDbConnection($diagnostics, $pdo);
     if ($readDbConnection) {
         $readArticleIds = fetchReadArticleIds($readDbConnection, $userHash, $diagnostics);
         $readFilterApplied = true;
@@ -232,6 +244,24 @@ if ($userHash !== '') {
 }
 header('X-News-Read-Filter: ' . $readFilterHeader);
 
+if ($sinceSeq !== null) {
+    $delta = fetchNewsDelta($pdo, $sinceSeq, $includedFeeds, $readArticleIds, $readFilterApplied, $feedIcons, $diagnostics);
+    if ($delta !== null) {
+        header('X-News-Seq: ' . $delta['seq']);
+        echo json_encode($delta);
+        ob_end_flush();
+        exit;
+    }
+    // No change log yet; fall through to the full list
+}
+
+// Read the change log position before the articles, so the next delta
+// covers everything written after this snapshot
+$currentSeq = fetchChangeLogSeq($pdo);
+if ($currentSeq !== null) {
+    header('X-News-Seq: ' . $currentSeq);
+}
+
 // Build query to fetch articles
 $allItems = [];
 $outputItemsGlobal = [];
@@ -489,8 +519,10 @@ function sanitizeUserHash($userHash) {
 
 /**
  * Open a connection to the REST key/value database that tracks read articles.
+ * On the consolidated SQLite layout the hot database is attached to the news
+ * connection instead of opening a second one.
  */
-function getReadStatusDbConnection(&$diagnostics) {
+function getReadStatusDbConnection(&$diagnostics, $newsPdo = null) {
     global $_ENV;
     
     // Attempt MySQL if configured
@@ -513,14 +545,30 @@ function getReadStatusDbConnection(&$diagnostics) {
         }
     }
     
+    $layoutPath = sqliteLayoutPath($_ENV, 'hot');
+    if ($layoutPath !== null && $newsPdo && $newsPdo->getAttribute(PDO::ATTR_DRIVER_NAME) === 'sqlite') {
+        try {
+            attachSqliteLayout($newsPdo, $_ENV, 'hot');
+            addDiagnostic($diagnostics, "Attached read-status SQLite database at {$layoutPath}");
+            return $newsPdo;
+        } catch (PDOException $e) {
+            logMessage('Read-status SQLite attach failed: ' . $e->getMessage());
+            addDiagnostic($diagnostics, 'Read-status SQLite attach failed: ' . $e->getMessage());
+            return null;
+        }
+    }
+    
     // Fallback to SQLite path (use dedicated path if provided)
-    $dbPath = $_ENV['RESTDB_SQLITE_PATH'] ?? (sys_get_temp_dir() . '/restdb.sqlite');
+    $dbPath = $layoutPath ?? ($_ENV['RESTDB_SQLITE_PATH'] ?? (sys_get_temp_dir() . '/restdb.sqlite'));
     $dsn = 'sqlite:' . $dbPath;
     addDiagnostic($diagnostics, "Attempting read-status SQLite connection at {$dbPath}");
     
     try {
         $pdo = new PDO($dsn);
         $pdo->setAttribute(PDO::ATTR_ERRMODE, PDO::ERRMODE_EXCEPTION);
+        if ($layoutPath !== null) {
+            configureSqliteLayout($pdo, 'hot');
+        }
         addDiagnostic($diagnostics, "Connected to read-status SQLite database at {$dbPath}");
         return $pdo;
     } catch (PDOException $e) {
@@ -530,6 +578,131 @@ function getReadStatusDbConnection(&$diagnostics) {
     }
 }
 
+/**
+ * Highest news_changes sequence number, or null when the change log is absent.
+ */
+function fetchChangeLogSeq($pdo) {
+    try {
+        $stmt = $pdo->query("SELECT MAX(seq) FROM news_changes");
+        return intval($stmt->fetchColumn());
+    } catch (PDOException $e) {
+        return null;
+    }
+}
+
+/**
+ * Build the delta response for a client that last saw sequence $sinceSeq.
+ *
+ * Contract (mirrors fetch_changes() in utils/news_delta.py):
+ *   seq     - send as "since" on the next poll (also in the X-News-Seq header)
+ *   reset   - the log no longer covers $sinceSeq; reload without "since"
+ *   more    - more changes are waiting; poll again right away
+ *   pruned  - windows {source, after, before} (epoch seconds, null = open;
+ *             source null = every feed) whose articles were removed
+ *   removed - ids of articles replaced by a retitled version
+ *   items   - new or retitled articles, same shape as the full response
+ * Clients apply pruned and removed first, then add items.
+ * Returns null when the change log table does not exist.
+ */
+function fetchNewsDelta($pdo, $sinceSeq, $includedFeeds, $readArticleIds, $readFilterApplied, $feedIcons, &$diagnostics) {
+    global $maxDeltaChanges, $maxAgeSeconds;
+    
+    $headSeq = fetchChangeLogSeq($pdo);
+    if ($headSeq === null) {
+        addDiagnostic($diagnostics, 'news_changes table missing; delta polling unavailable');
+        return null;
+    }
+    $oldestSeq = intval($pdo->query("SELECT MIN(seq) FROM news_changes")->fetchColumn());
+    $delta = ['seq' => $headSeq, 'reset' => false, 'more' => false, 'pruned' => [], 'removed' => [], 'items' => []];
+    if ($sinceSeq > $headSeq || ($oldestSeq > 0 && $sinceSeq < $oldestSeq - 1)) {
+        $delta['reset'] = true;
+        return $delta;
+    }
+    if ($sinceSeq === $headSeq) {
+        return $delta;
+    }
+    
+    $params = [':since' => $sinceSeq];
+    $feedFilter = '';
+    if (!empty($includedFeeds)) {
+        $placeholders = [];
+        foreach (array_values($includedFeeds) as $idx => $feedId) {
+            $placeholders[] = ":feed_$idx";
+            $params[":feed_$idx"] = $feedId;
+        }
+        $feedFilter = 'AND (feed_id IS NULL OR feed_id IN (' . implode(', ', $placeholders) . '))';
+    }
+    $stmt = $pdo->prepare("
+        SELECT seq, op, feed_id, url, title, previous_title, published_date, range_start, range_end
+        FROM news_changes
+        WHERE seq > :since $feedFilter
+        ORDER BY seq
+        LIMIT :max_changes
+    ");
+    foreach ($params as $key => $value) {
+        $stmt->bindValue($key, $value, is_int($value) ? PDO::PARAM_INT : PDO::PARAM_STR);
+    }
+    $stmt->bindValue(':max_changes', $maxDeltaChanges + 1, PDO::PARAM_INT);
+    $stmt->execute();
+    $rows = $stmt->fetchAll(PDO::FETCH_ASSOC);
+    if (count($rows) > $maxDeltaChanges) {
+        $rows = array_slice($rows, 0, $maxDeltaChanges);
+        $delta['more'] = true;
+        $delta['seq'] = intval($rows[count($rows) - 1]['seq']);
+    }
+    
+    $cutoff = $maxAgeSeconds > 0 ? time() - $maxAgeSeconds : null;
+    $items = [];
+    $removed = [];
+    foreach ($rows as $row) {
+        $feedId = $row['feed_id'];
+        if ($row['op'] === 'P') {
+            $after = $row['range_start'] !== null ? strtotime($row['range_start']) : null;
+            $before = $row['range_end'] !== null ? strtotime($row['range_end']) : null;
+            $delta['pruned'][] = ['source' => $feedId, 'after' => $after, 'before' => $before];
+            // Articles added earlier in this delta that the prune removed again
+            foreach ($items as $key => $item) {
+                if (($feedId === null || $feedId === $item['source'])
+                    && ($after === null || $item['date'] >= $after)
+                    && ($before === null || $item['date'] < $before)) {
+                    unset($items[$key]);
+                }
+            }
+            continue;
+        }
+        
+        $key = $feedId . "\n" . $row['url'];
+        unset($items[$key]);
+        if ($row['previous_title'] !== null) {
+            $removed[generateArticleId($feedId, $row['previous_title'])] = true;
+        }
+        $pubDate = strtotime($row['published_date']);
+        if ($cutoff !== null && $pubDate < $cutoff) {
+            continue;
+        }
+        $articleId = generateArticleId($feedId, $row['title'] ?? '');
+        unset($removed[$articleId]);
+        $newsItem = [
+            'id' => $articleId,
+            'title' => $row['title'],
+            'link' => $row['url'],
+            'date' => $pubDate,
+            'source' => $feedId,
+            'isRead' => $readFilterApplied && isset($readArticleIds[$articleId])
+        ];
+        if (isset($feedIcons[$feedId])) {
+            $newsItem['icon'] = $feedIcons[$feedId];
+        }
+        $items[$key] = $newsItem;
+    }
+    
+    // PHP turns all-digit array keys into ints; clients compare IDs as strings
+    $delta['removed'] = array_map('strval', array_keys($removed));
+    $delta['items'] = array_values($items);
+    logMessage("Returning delta of " . count($delta['items']) . " articles since seq {$sinceSeq}");
+    return $delta;
+}
+
 /**
  * Fetch all read article IDs for a given user hash.
  */
@@ -554,7 +727,6 @@ function fetchReadArticleIds($pdo, $userHash, &$diagnostics) {
     }
     
     $now = time();
-    $expiredKeys = [];
     
     foreach ($rows as $row) {
         // Skip directories or malformed records
@@ -562,7 +734,7 @@ function fetchReadArticleIds($pdo, $userHash, &$diagnostics) {
             continue;
         }
         
-        // Enforce expiration in the same way as rest_db.php
+        // Enforce expiration in the same way as rest_db.php; utils/retention.py deletes the rows
         $createdAt = isset($row['created_at']) ? strtotime($row['created_at']) : 0;
         $lifeTimeDays = isset($row['life_time']) ? (float)$row['life_time'] : 2.0;
         $expiresAt = ($createdAt > 0 && $lifeTimeDays > 0)
@@ -570,7 +742,6 @@ function fetchReadArticleIds($pdo, $userHash, &$diagnostics) {
             : 0;
         
         if ($expiresAt > 0 && $now > $expiresAt) {
-            $expiredKeys[] = $row['key'];
             continue;
         }
         
@@ -583,17 +754,55 @@ function fetchReadArticleIds($pdo, $userHash, &$diagnostics) {
         $ids[$articleId] = true;
     }
     
-    if (!empty($expiredKeys)) {
-        try {
-            $placeholders = implode(',', array_fill(0, count($expiredKeys), '?'));
-            $deleteStmt = $pdo->prepare("DELETE FROM key_value WHERE `key` IN ($placeholders)");
-            $deleteStmt->execute($expiredKeys);
-        } catch (PDOException $e) {
-            logMessage('Failed to prune expired read-status keys: ' . $e->getMessage());
+    $compactCount = 0;
+    foreach (fetchCompactReadArticleIds($pdo, $userHash, $diagnostics) as $articleId) {
+        $ids[$articleId] = true;
+        $compactCount++;
+    }
+    
+    addDiagnostic($diagnostics, 'Loaded ' . count($ids) . ' read IDs for user ' . $userHash
+        . " ({$compactCount} from compact sets)");
+    return $ids;
+}
+
+/**
+ * Fetch read article IDs compacted into read_status_sets by utils/read_status.py.
+ * Each row holds one day's read IDs as a sorted array of big-endian 32-bit hashes.
+ * Expired buckets are skipped here and removed by the maintenance job.
+ */
+function fetchCompactReadArticleIds($pdo, $userHash, &$diagnostics) {
+    $ids = [];
+    
+    try {
+        $stmt = $pdo->prepare("
+            SELECT `article_hashes`, `expires_at`
+            FROM read_status_sets
+            WHERE `user_hash` = :user_hash
+        ");
+        $stmt->execute([':user_hash' => $userHash]);
+        $rows = $stmt->fetchAll(PDO::FETCH_ASSOC);
+    } catch (PDOException $e) {
+        // Table is absent until setup_tables.py has been run; key_value still works
+        addDiagnostic($diagnostics, 'Compact read-status sets unavailable: ' . $e->getMessage());
+        return $ids;
+    }
+    
+    $now = time();
+    foreach ($rows as $row) {
+        if (!empty($row['expires_at']) && strtotime($row['expires_at']) < $now) {
+            continue;
+        }
+        $blob = is_resource($row['article_hashes'])
+            ? stream_get_contents($row['article_hashes'])
+            : (string)$row['article_hashes'];
+        if ($blob === '') {
+            continue;
+        }
+        foreach (unpack('N*', $blob) as $hash) {
+            $ids[] = dechex($hash);
         }
     }
     
-    addDiagnostic($diagnostics, 'Loaded ' . count($ids) . ' read IDs for user ' . $userHash);
     return $ids;
 }
 
@@ -3,9 +3,77 @@
 // openwx.php
 // This script acts as a proxy for OpenWeatherMap API requests.
 // It reads the API key from a .env file and forwards requests to the OpenWeatherMap API.
+// City geocodes and weather responses are cached in files shared with
+// utils/wx_cache.py, which warms cells seen in ping_data and evicts old entries.
 
 require_once 'dotenv.php';
 
+// Cache configuration; utils/wx_cache.py mirrors these, keys and file names must match
+$wxCachePaths = [
+    // path => TTL seconds, grid cell size in degrees
+    'data/3.0/onecall' => ['ttl' => 600, 'grid' => 0.1],
+    'data/2.5/forecast' => ['ttl' => 1800, 'grid' => 0.1],
+    'data/2.5/air_pollution' => ['ttl' => 1800, 'grid' => 0.1],
+    'geo/1.0/reverse' => ['ttl' => 30 * 86400, 'grid' => 0.01],
+];
+$wxKeyParams = ['units', 'lang', 'exclude', 'limit'];
+$geoCacheTtl = 30 * 86400;
+$geoMissCacheTtl = 86400;
+
+// Return a cached entry that has not expired, marking it recently used
+function openwxCacheRead($file) {
+    if (!is_file($file)) {
+        return null;
+    }
+    $entry = json_decode(@file_get_contents($file), true);
+    if (!is_array($entry) || !isset($entry['timestamp'], $entry['ttl'], $entry['body'])) {
+        return null;
+    }
+    if ($entry['timestamp'] + $entry['ttl'] <= time()) {
+        return null;
+    }
+    // wx_cache.py evicts the least recently touched files first
+    @touch($file);
+    return $entry;
+}
+
+// Write a cache entry atomically; failures only cost the next request a miss
+function openwxCacheWrite($dir, $file, $key, $body, $ttl) {
+    if (!is_dir($dir) && !@mkdir($dir, 0755, true) && !is_dir($dir)) {
+        return;
+    }
+    $tmp = @tempnam($dir, '.wx_');
+    if ($tmp === false) {
+        return;
+    }
+    $entry = ['timestamp' => time(), 'ttl' => $ttl, 'status' => 200, 'key' => $key, 'body' => $body];
+    if (@file_put_contents($tmp, json_encode($entry)) === false) {
+        @unlink($tmp);
+        return;
+    }
+    @chmod($tmp, 0644);
+    if (!@rename($tmp, $file)) {
+        @unlink($tmp);
+    }
+}
+
+// "New  York , NY" -> "new york,ny"
+function openwxNormalizeCity($city) {
+    $parts = array_map(function ($part) {
+        return preg_replace('/\s+/', ' ', trim($part));
+    }, explode(',', strtolower($city)));
+    return implode(',', array_filter($parts, 'strlen'));
+}
+
+// Cache key of a weather response; see weather_key() in utils/wx_cache.py
+function openwxWeatherKey($path, $row, $col, $grid, $params, $keyParams) {
+    $options = [];
+    foreach ($keyParams as $name) {
+        $options[] = isset($params[$name]) ? (string)$params[$name] : '';
+    }
+    return $path . '|' . (string)$grid . '|' . $row . '|' . $col . '|' . implode('|', $options);
+}
+
 // Load the .env file (default path is './.env')
 $dotenv = new DotEnv(__DIR__ . '/../.env');
 
@@ -19,26 +87,41 @@ if (!isset($_ENV['OPENWX_KEY'])) {
     exit;
 }
 
+$wxCacheDir = $_ENV['OPENWX_CACHE_DIR'] ?? '/tmp/openwx_cache';
+
 // Get query parameters
 $queryParams = $_GET;
 
 // Check if 'city' parameter is provided
 if (isset($queryParams['city']) && !empty($queryParams['city'])) {
-    $city = urlencode($queryParams['city']);
-    $geoUrl = "http://api.openweathermap.org/geo/1.0/direct?q={$city}&limit=1&appid={$_ENV['OPENWX_KEY']}";
-    
-    // Set up context for Geocoding API request
-    $geoOptions = [
-        'http' => [
-            'method' => 'GET',
-            'header' => 'User-Agent: PHP/' . phpversion(),
-            'ignore_errors' => true
-        ]
-    ];
-    $geoContext = stream_context_create($geoOptions);
-    
-    $geoResponse = file_get_contents($geoUrl, false, $geoContext);
-    $geoData = json_decode($geoResponse, true);
+    $geoKey = openwxNormalizeCity($queryParams['city']);
+    $geoFile = $wxCacheDir . '/geo_' . md5($geoKey) . '.json';
+    $geoEntry = openwxCacheRead($geoFile);
+    if ($geoEntry !== null) {
+        $geoData = json_decode($geoEntry['body'], true);
+    } else {
+        $city = urlencode($queryParams['city']);
+        $geoUrl = "http://api.openweathermap.org/geo/1.0/direct?q={$city}&limit=1&appid={$_ENV['OPENWX_KEY']}";
+        
+        // Set up context for Geocoding API request
+        $geoOptions = [
+            'http' => [
+                'method' => 'GET',
+                'header' => 'User-Agent: PHP/' . phpversion(),
+                'ignore_errors' => true
+            ]
+        ];
+        $geoContext = stream_context_create($geoOptions);
+        
+        $geoResponse = file_get_contents($geoUrl, false, $geoContext);
+        $geoData = json_decode($geoResponse, true);
+        
+        // Cache answers (an empty list means "no such city"), not API errors
+        if (is_array($geoData) && array_is_list($geoData)) {
+            openwxCacheWrite($wxCacheDir, $geoFile, $geoKey, $geoResponse,
+                empty($geoData) ? $geoMissCacheTtl : $geoCacheTtl);
+        }
+    }
 
     if (!empty($geoData) && isset($geoData[0]['lat']) && isset($geoData[0]['lon'])) {
         $queryParams['lat'] = $geoData[0]['lat'];
@@ -71,6 +154,29 @@ if (empty($pathInfo)) {
 // Remove leading slash if present
 $pathInfo = ltrim($pathInfo, '/');
 
+// Serve cacheable requests (known endpoint and options) from the grid cell cache
+$wxCacheFile = null;
+$wxCacheKey = null;
+if (isset($wxCachePaths[$pathInfo], $queryParams['lat'], $queryParams['lon'])
+    && is_numeric($queryParams['lat']) && is_numeric($queryParams['lon'])
+    && !array_diff(array_keys($queryParams), array_merge(['lat', 'lon', 'appid'], $wxKeyParams))) {
+    $grid = $wxCachePaths[$pathInfo]['grid'];
+    $row = (int)floor((float)$queryParams['lat'] / $grid);
+    $col = (int)floor((float)$queryParams['lon'] / $grid);
+    // Ask upstream for the cell centre, so the response is right for every car in the cell
+    $queryParams['lat'] = sprintf('%.4f', ($row + 0.5) * $grid);
+    $queryParams['lon'] = sprintf('%.4f', ($col + 0.5) * $grid);
+    $wxCacheKey = openwxWeatherKey($pathInfo, $row, $col, $grid, $queryParams, $wxKeyParams);
+    $wxCacheFile = $wxCacheDir . '/wx_' . md5($wxCacheKey) . '.json';
+    $wxEntry = openwxCacheRead($wxCacheFile);
+    if ($wxEntry !== null) {
+        header('Content-Type: application/json');
+        header('X-Cache: HIT');
+        echo $wxEntry['body'];
+        exit;
+    }
+}
+
 // Build the proxied URL
 $baseUrl = 'https://api.openweathermap.org/';
 $proxiedUrl = $baseUrl . $pathInfo . '?' . http_build_query($queryParams);
@@ -103,7 +209,14 @@ if ($responseHeaders && isset($responseHeaders[0])) {
     }
 }
 
+if ($wxCacheFile !== null && $httpCode === 200 && $response !== false && json_decode($response) !== null) {
+    openwxCacheWrite($wxCacheDir, $wxCacheFile, $wxCacheKey, $response, $wxCachePaths[$pathInfo]['ttl']);
+}
+
 // Set HTTP response code and output the response
 http_response_code($httpCode);
 header('Content-Type: application/json');
+if ($wxCacheFile !== null) {
+    header('X-Cache: MISS');
+}
 echo $response;
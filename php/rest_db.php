@@ -1,6 +1,7 @@
 <?php
 
 require_once 'dotenv.php';
+require_once 'util.php';
 
 // Configuration
 define('LOG_FILE_PATH', '/tmp/rest_db_php.log');
@@ -52,6 +53,83 @@ function getRequestPath() {
     return $path;
 }
 
+// Split a "<user>/<articleId>" read marker key into [user, 32-bit hash], or null.
+// Only IDs that utils/read_status.py can compact (lowercase hex, no leading zeros) match.
+function parseReadMarkerKey($key) {
+    $parts = explode('/', $key);
+    if (count($parts) !== 2 || $parts[0] === '' || !preg_match('/^[0-9a-f]{1,8}$/', $parts[1])) {
+        return null;
+    }
+    $hash = hexdec($parts[1]);
+    return dechex($hash) === $parts[1] ? [$parts[0], $hash] : null;
+}
+
+// Load the compacted read markers for a user from read_status_sets.
+// Returns articleId => JSON timestamp (start of the bucket day, in ms).
+function loadCompactReadEntries($pdo, $userHash) {
+    $entries = [];
+    try {
+        $stmt = $pdo->prepare("SELECT `bucket_day`, `article_hashes`, `expires_at` FROM read_status_sets WHERE `user_hash` = ?");
+        $stmt->execute([$userHash]);
+        $rows = $stmt->fetchAll(PDO::FETCH_ASSOC);
+    } catch (PDOException $e) {
+        // Table only exists once setup_tables.py has run
+        return $entries;
+    }
+
+    $now = time();
+    foreach ($rows as $row) {
+        if (!empty($row['expires_at']) && strtotime($row['expires_at']) < $now) {
+            continue;
+        }
+        $blob = is_resource($row['article_hashes']) ? stream_get_contents($row['article_hashes']) : (string)$row['article_hashes'];
+        if ($blob === '') {
+            continue;
+        }
+        $timestamp = json_encode(strtotime($row['bucket_day']) * 1000);
+        foreach (unpack('N*', $blob) as $hash) {
+            $entries[dechex($hash)] = $timestamp;
+        }
+    }
+    return $entries;
+}
+
+// Remove one article hash from every compacted bucket of a user.
+// Returns the number of buckets that contained it.
+function removeFromCompactReadSets($pdo, $userHash, $hash) {
+    try {
+        $stmt = $pdo->prepare("SELECT `bucket_day`, `article_hashes` FROM read_status_sets WHERE `user_hash` = ?");
+        $stmt->execute([$userHash]);
+        $rows = $stmt->fetchAll(PDO::FETCH_ASSOC);
+    } catch (PDOException $e) {
+        return 0;
+    }
+
+    $changed = 0;
+    foreach ($rows as $row) {
+        $blob = is_resource($row['article_hashes']) ? stream_get_contents($row['article_hashes']) : (string)$row['article_hashes'];
+        $hashes = $blob === '' ? [] : array_values(unpack('N*', $blob));
+        $index = array_search($hash, $hashes, true);
+        if ($index === false) {
+            continue;
+        }
+        array_splice($hashes, $index, 1);
+        if (empty($hashes)) {
+            $update = $pdo->prepare("DELETE FROM read_status_sets WHERE `user_hash` = ? AND `bucket_day` = ?");
+            $update->execute([$userHash, $row['bucket_day']]);
+        } else {
+            $update = $pdo->prepare("UPDATE read_status_sets SET `article_hashes` = ?, `id_count` = ? WHERE `user_hash` = ? AND `bucket_day` = ?");
+            $update->bindValue(1, pack('N*', ...$hashes), PDO::PARAM_LOB);
+            $update->bindValue(2, count($hashes), PDO::PARAM_INT);
+            $update->bindValue(3, $userHash);
+            $update->bindValue(4, $row['bucket_day']);
+            $update->execute();
+        }
+        $changed++;
+    }
+    return $changed;
+}
+
 // Load configuration if available
 try {
     $dotenv = new DotEnv(__DIR__ . '/../.env');
@@ -73,9 +151,13 @@ try {
         $pdo = new PDO($dsn, $username, $password);
     } else {
         // Fall back to SQLite database for local testing
-        $dbPath = $_ENV['SQLITE_PATH'] ?? sys_get_temp_dir() . '/restdb.sqlite';
+        $layoutPath = sqliteLayoutPath($_ENV, 'hot');
+        $dbPath = $layoutPath ?? ($_ENV['SQLITE_PATH'] ?? sys_get_temp_dir() . '/restdb.sqlite');
         $dsn = 'sqlite:' . $dbPath;
         $pdo = new PDO($dsn);
+        if ($layoutPath !== null) {
+            configureSqliteLayout($pdo, 'hot');
+        }
     }
 
     $pdo->setAttribute(PDO::ATTR_ERRMODE, PDO::ERRMODE_EXCEPTION);
@@ -377,7 +459,21 @@ if ($method === 'POST') {
             ];
         }
 
-        if (count($validResults) > 0) {
+        // Merge read markers compacted out of key_value by utils/read_status.py
+        if (strpos($prefix, '/') === false) {
+            $listed = [];
+            foreach ($transformed as $item) {
+                $listed[$item['key']] = true;
+            }
+            foreach (loadCompactReadEntries($pdo, $prefix) as $articleId => $timestamp) {
+                $key = "$prefix/$articleId";
+                if (!isset($listed[$key])) {
+                    $transformed[] = ['key' => $key, 'isDir' => false, 'value' => $timestamp];
+                }
+            }
+        }
+
+        if (count($transformed) > 0) {
             sendJsonResponse($transformed);
         } else {
             sendJsonResponse(['error' => "No keys found under $prefix/"], 404);
@@ -396,6 +492,14 @@ if ($method === 'POST') {
             // Return the value directly (it should already be JSON)
             sendJsonResponse($result['value']);
         } else {
+            $marker = parseReadMarkerKey($path);
+            if ($marker !== null) {
+                $entries = loadCompactReadEntries($pdo, $marker[0]);
+                $articleId = dechex($marker[1]);
+                if (isset($entries[$articleId])) {
+                    sendJsonResponse($entries[$articleId]);
+                }
+            }
             sendJsonResponse(['error' => "Key not found: $path"], 404);
         }
     } // GET specific key
@@ -420,6 +524,17 @@ if ($method === 'POST') {
             
             $rowCount = $stmt->rowCount();
             
+            // Drop the user's compacted read markers along with the directory
+            if (strpos($prefix, '/') === false) {
+                try {
+                    $stmt = $pdo->prepare("DELETE FROM read_status_sets WHERE `user_hash` = ?");
+                    $stmt->execute([$prefix]);
+                    $rowCount += $stmt->rowCount();
+                } catch (PDOException $e) {
+                    // read_status_sets not created yet
+                }
+            }
+            
             if ($rowCount > 0) {
                 $pdo->commit();
                 header('Content-Type: application/json');
@@ -444,8 +559,14 @@ if ($method === 'POST') {
         try {
             $stmt = $pdo->prepare("DELETE FROM key_value WHERE `key` = ?");
             $stmt->execute([$path]);
+            $rowCount = $stmt->rowCount();
+            
+            $marker = parseReadMarkerKey($path);
+            if ($marker !== null) {
+                $rowCount += removeFromCompactReadSets($pdo, $marker[0], $marker[1]);
+            }
             
-            if ($stmt->rowCount() > 0) {
+            if ($rowCount > 0) {
                 header('Content-Type: application/json');
                 echo json_encode(['status' => 'success', 'message' => "Key deleted: $path"]);
             } else {
@@ -45,9 +45,13 @@ $dbPort = $_ENV['SQL_PORT'] ?? '3306';
 // Use SQLite for development if MySQL not configured
 if (!$dbHost || !$dbName || !$dbUser) {
     // Fall back to SQLite for development
-    $sqliteDb = '/tmp/teslacloud_settings.db';
+    $layoutPath = sqliteLayoutPath($_ENV, 'settings');
+    $sqliteDb = $layoutPath ?? '/tmp/teslacloud_settings.db';
     $dbConnection = new PDO("sqlite:$sqliteDb");
     $dbConnection->setAttribute(PDO::ATTR_ERRMODE, PDO::ERRMODE_EXCEPTION);
+    if ($layoutPath !== null) {
+        configureSqliteLayout($dbConnection, 'settings');
+    }
     
     logMessage("Using SQLite database for development", "INFO");
 } else {
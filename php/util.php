@@ -11,3 +11,36 @@ function getClientIP(): string {
     }
     return filter_var($ip, FILTER_VALIDATE_IP) ? $ip : 'unknown';
 }
+
+// Consolidated SQLite layout (SQLITE_LAYOUT=consolidated): each table lives in
+// one of these files under SQLITE_DIR. Mirrors CONSOLIDATED_SQLITE_FILES in
+// utils/db_utils.py, which also sets each file's page size and journal mode.
+const SQLITE_LAYOUT_FILES = [
+    'news' => ['file' => 'news.db', 'synchronous' => 'NORMAL'],
+    'hot' => ['file' => 'hot.db', 'synchronous' => 'NORMAL'],
+    'settings' => ['file' => 'settings.db', 'synchronous' => 'FULL'],
+];
+
+// Path of a consolidated layout file, or null when the legacy layout is in use
+function sqliteLayoutPath(array $env, string $group): ?string {
+    if (strtolower(trim($env['SQLITE_LAYOUT'] ?? '')) !== 'consolidated') {
+        return null;
+    }
+    // Default outside the web root, like the legacy /tmp files; keep in sync with db_utils.py
+    $dir = $env['SQLITE_DIR'] ?? '/tmp/teslacloud';
+    return rtrim($dir, '/') . '/' . SQLITE_LAYOUT_FILES[$group]['file'];
+}
+
+// Apply the per-connection settings of a consolidated layout file
+function configureSqliteLayout(PDO $pdo, string $group): void {
+    $pdo->exec('PRAGMA busy_timeout = 5000');
+    $pdo->exec('PRAGMA synchronous = ' . SQLITE_LAYOUT_FILES[$group]['synchronous']);
+}
+
+// ATTACH another consolidated layout file to an open SQLite connection, so its
+// tables can be queried unqualified on the same connection
+function attachSqliteLayout(PDO $pdo, array $env, string $group): void {
+    $path = sqliteLayoutPath($env, $group);
+    $pdo->exec('ATTACH DATABASE ' . $pdo->quote($path) . ' AS ' . $group);
+    $pdo->exec("PRAGMA {$group}.synchronous = " . SQLITE_LAYOUT_FILES[$group]['synchronous']);
+}
@@ -0,0 +1,128 @@
+#!/bin/bash
+
+# =============================================================================
+# Ingest Journal Test Suite
+# Runs several journal writers and the loader at the same time against a
+# temporary SQLite database and checks that every journaled article is
+# stored exactly once, that no segment is left behind, and that a batch
+# with a failing article stays in the journal.
+# =============================================================================
+
+ROOT_DIR="$(cd "$(dirname "$0")/.." && pwd)"
+TMP_DIR="$(mktemp -d /tmp/ingest_journal_XXXXXX)"
+trap 'rm -rf "$TMP_DIR"' EXIT
+
+WRITERS="${WRITERS:-4}"
+FEEDS_PER_WRITER="${FEEDS_PER_WRITER:-300}"
+
+echo "🔍 Running Ingest Journal Tests..."
+
+cd "$ROOT_DIR/utils" || exit 1
+python3 - "$TMP_DIR" "$WRITERS" "$FEEDS_PER_WRITER" <<'EOF'
+import io
+import os
+import sys
+import time
+import sqlite3
+import multiprocessing
+from contextlib import redirect_stdout
+from datetime import datetime
+
+import trending
+from setup_tables import setup_tables_sqlite
+from ingest_journal import JournalWriter, load_journal, _segments, load_offsets
+
+tmp_dir, writers, feeds_per_writer = sys.argv[1], int(sys.argv[2]), int(sys.argv[3])
+ARTICLES_PER_FEED = 3
+failures = 0
+
+# Keep the loader away from the real trend state
+trending._settings = {'enabled': False, 'path': os.path.join(tmp_dir, 'trending.gz')}
+
+
+def check(description, condition, detail=''):
+    global failures
+    if condition:
+        print(f"✓ {description}")
+    else:
+        failures += 1
+        print(f"✗ {description} {detail}")
+
+
+def write_feeds(directory, writer_id, feeds):
+    # Small segments so writers roll over while the loader is deleting
+    with JournalWriter(directory, segment_max_bytes=2048, fsync_batch=8) as writer:
+        for n in range(feeds):
+            writer.append_feed(f"feed{writer_id}", [
+                {'url': f"https://example.com/{writer_id}/{n}/{i}", 'title': f"Story {n}.{i}",
+                 'date': datetime(2026, 1, 2, 3, 4, 5)}
+                for i in range(ARTICLES_PER_FEED)
+            ])
+            time.sleep(0.002)
+
+
+def new_database(name):
+    path = os.path.join(tmp_dir, f"{name}.db")
+    with redirect_stdout(io.StringIO()):
+        setup_tables_sqlite(path)
+    return path
+
+
+def count_articles(path):
+    connection = sqlite3.connect(path)
+    try:
+        return connection.execute("SELECT COUNT(*) FROM news_articles").fetchone()[0]
+    finally:
+        connection.close()
+
+
+# Writers and loader side by side
+directory = os.path.join(tmp_dir, 'journal')
+env_vars = {'SQLITE_PATH': new_database('concurrent')}
+processes = [multiprocessing.Process(target=write_feeds, args=(directory, w, feeds_per_writer))
+             for w in range(writers)]
+for process in processes:
+    process.start()
+loads, errors = 0, []
+while any(process.is_alive() for process in processes):
+    summary = load_journal(env_vars, directory, batch_records=50)
+    loads += 1
+    if summary['error']:
+        errors.append(summary['error'])
+for process in processes:
+    process.join()
+summary = load_journal(env_vars, directory, batch_records=50)
+if summary['error']:
+    errors.append(summary['error'])
+
+expected = writers * feeds_per_writer * ARTICLES_PER_FEED
+stored = count_articles(env_vars['SQLITE_PATH'])
+check(f"concurrent load stores every article ({loads} loads while writing)", stored == expected,
+      f"(stored {stored:,} of {expected:,})")
+check("writers exited cleanly", all(process.exitcode == 0 for process in processes))
+check("loader reported no errors", not errors, f"({errors[:3]})")
+check("no segment left after the final load", not _segments(directory), f"({_segments(directory)[:3]})")
+check("no temporary segment left", not [n for n in os.listdir(directory) if n.endswith('.tmp')])
+
+# A batch with a failing article is rolled back and kept
+directory = os.path.join(tmp_dir, 'failing')
+env_vars = {'SQLITE_PATH': new_database('failing')}
+with JournalWriter(directory) as writer:
+    writer.append_feed('good', [{'url': 'https://example.com/good', 'title': 'Good', 'date': datetime.now()}])
+    writer.append_feed('bad', [{'url': 'https://example.com/bad', 'title': None, 'date': datetime.now()}])
+summary = load_journal(env_vars, directory)
+check("failing article fails the load", bool(summary['error']))
+check("failed batch is rolled back", count_articles(env_vars['SQLITE_PATH']) == 0,
+      f"(found {count_articles(env_vars['SQLITE_PATH'])})")
+check("failed batch stays in the journal", len(_segments(directory)) == 1 and not any(load_offsets(directory).values()))
+
+sys.exit(1 if failures else 0)
+EOF
+status=$?
+
+if [ $status -eq 0 ]; then
+    echo "✅ All ingest journal tests passed"
+else
+    echo "❌ Ingest journal tests failed"
+fi
+exit $status
@@ -0,0 +1,147 @@
+#!/bin/bash
+
+# =============================================================================
+# store_articles Test Suite
+# Re-stores feed items into temporary SQLite databases, with the legacy
+# (feed_id, url) key, half-migrated (url_hash column, old key) and with
+# the url_hash key, and on the partitioned layout, and checks that a story
+# fetched twice keeps a single row and a single change-log entry.
+# =============================================================================
+
+ROOT_DIR="$(cd "$(dirname "$0")/.." && pwd)"
+TMP_DIR="$(mktemp -d /tmp/store_articles_XXXXXX)"
+trap 'rm -rf "$TMP_DIR"' EXIT
+
+echo "🔍 Running store_articles Tests..."
+
+cd "$ROOT_DIR/utils" || exit 1
+python3 - "$TMP_DIR" <<'EOF'
+import io
+import sys
+import sqlite3
+from contextlib import redirect_stdout
+from datetime import datetime
+
+from setup_tables import setup_tables_sqlite
+from fetch_feeds import store_articles
+from url_canon import url_hash
+from partitions import convert_to_partitioned
+
+tmp_dir = sys.argv[1]
+failures = 0
+
+
+def check(description, condition, detail=''):
+    global failures
+    if condition:
+        print(f"✓ {description}")
+    else:
+        failures += 1
+        print(f"✗ {description} {detail}")
+
+
+def open_db(name, legacy, hash_column=False):
+    path = f"{tmp_dir}/{name}.db"
+    with redirect_stdout(io.StringIO()):
+        setup_tables_sqlite(path, tables=['news_articles', 'news_changes'])
+    connection = sqlite3.connect(path)
+    if legacy:
+        # The schema before url_canon.py --migrate: no url_hash column
+        connection.execute("DROP TABLE news_articles")
+        connection.execute("""
+            CREATE TABLE news_articles (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                feed_id TEXT NOT NULL,
+                url TEXT NOT NULL,
+                title TEXT NOT NULL,
+                published_date DATETIME NOT NULL,
+                created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                UNIQUE(feed_id, url)
+            )
+        """)
+        if hash_column:
+            # After backfill.py url_hash or an interrupted --migrate
+            connection.execute("ALTER TABLE news_articles ADD COLUMN url_hash CHAR(32)")
+        connection.commit()
+    return connection
+
+
+def count(connection, table):
+    return connection.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+
+
+def store(connection, url, title='Story', date=datetime(2026, 1, 2, 3, 4, 5)):
+    article = {'url': url, 'title': title, 'date': date}
+    with redirect_stdout(io.StringIO()):
+        return store_articles(connection, 'sqlite', 'feed', [article])
+
+
+raw_url = 'https://Example.com/story/?utm_source=rss'
+
+# Legacy key: an existing row stored before the upgrade is found again
+connection = open_db('legacy', legacy=True)
+connection.execute("INSERT INTO news_articles (feed_id, url, title, published_date) VALUES (?, ?, ?, ?)",
+                   ('feed', raw_url, 'Story', '2026-01-02 03:04:05'))
+connection.commit()
+store(connection, raw_url)
+store(connection, raw_url)
+check("legacy key: re-stored story keeps one row", count(connection, 'news_articles') == 1,
+      f"(found {count(connection, 'news_articles')})")
+stored = [row[0] for row in connection.execute("SELECT url FROM news_articles")]
+check("legacy key: URL is stored as fetched", stored == [raw_url], f"(found {stored})")
+check("legacy key: no change-log entry for a known story", count(connection, 'news_changes') == 0,
+      f"(found {count(connection, 'news_changes')})")
+store(connection, raw_url, title='Story (updated)')
+check("legacy key: retitle is logged once", count(connection, 'news_changes') == 1,
+      f"(found {count(connection, 'news_changes')})")
+connection.close()
+
+# Half-migrated: url_hash is filled in but (feed_id, url) is still the key
+connection = open_db('half_migrated', legacy=True, hash_column=True)
+connection.execute("INSERT INTO news_articles (feed_id, url, title, published_date, url_hash) VALUES (?, ?, ?, ?, ?)",
+                   ('feed', raw_url, 'Story', '2026-01-02 03:04:05', url_hash(raw_url)))
+connection.commit()
+store(connection, raw_url)
+check("half-migrated: re-stored story keeps one row", count(connection, 'news_articles') == 1,
+      f"(found {count(connection, 'news_articles')})")
+stored = connection.execute("SELECT url, url_hash FROM news_articles").fetchall()
+check("half-migrated: URL is stored as fetched with its hash", stored == [(raw_url, url_hash(raw_url))],
+      f"(found {stored})")
+check("half-migrated: no change-log entry for a known story", count(connection, 'news_changes') == 0,
+      f"(found {count(connection, 'news_changes')})")
+connection.close()
+
+# url_hash key: tracking variants of one story collapse to a canonical row
+connection = open_db('hashed', legacy=False)
+store(connection, raw_url)
+store(connection, 'https://example.com/story?utm_medium=email')
+check("url_hash key: URL variants keep one row", count(connection, 'news_articles') == 1,
+      f"(found {count(connection, 'news_articles')})")
+stored = connection.execute("SELECT url FROM news_articles").fetchone()[0]
+check("url_hash key: URL is stored canonical", stored == 'https://example.com/story', f"(found {stored})")
+check("url_hash key: one change-log entry", count(connection, 'news_changes') == 1,
+      f"(found {count(connection, 'news_changes')})")
+connection.close()
+
+# Partitioned: a re-fetched story whose date moves it to another month
+connection = open_db('partitioned', legacy=False)
+with redirect_stdout(io.StringIO()):
+    convert_to_partitioned(connection, 'sqlite', now=datetime(2026, 10, 15))
+store(connection, 'https://ex.com/a', date=datetime(2026, 9, 30, 23))
+store(connection, 'https://ex.com/a', date=datetime(2026, 10, 1, 1))
+check("partitioned: story re-dated across months keeps one row", count(connection, 'news_articles') == 1,
+      f"(found {count(connection, 'news_articles')})")
+check("partitioned: one change-log entry", count(connection, 'news_changes') == 1,
+      f"(found {count(connection, 'news_changes')})")
+connection.close()
+
+sys.exit(1 if failures else 0)
+EOF
+status=$?
+
+if [ $status -eq 0 ]; then
+    echo "✅ All store_articles tests passed"
+else
+    echo "❌ store_articles tests failed"
+fi
+exit $status
@@ -0,0 +1,389 @@
+#!/usr/bin/env python3
+"""
+Parallel, resumable backfill of derived news_articles columns.
+Walks the table in id order with keyset pagination, runs a registered
+transform over each batch in a process pool and writes the results back
+in batched UPDATEs. Progress is checkpointed after every batch so an
+interrupted run resumes where it stopped, and an optional rate limit
+keeps it from crowding out live traffic.
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import hashlib
+import argparse
+import unicodedata
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+
+from db_utils import SCRIPT_DIR, load_env_file, get_db_connection
+from partitions import is_partitioned
+from url_canon import url_hash
+
+DEFAULT_BATCH_SIZE = 2000
+DEFAULT_WORKERS = min(os.cpu_count() or 1, 4)
+PROGRESS_INTERVAL_SECONDS = 5.0
+
+# Registered transforms, by name. See register_transform().
+TRANSFORMS = {}
+
+
+def register_transform(name, columns, reads=('feed_id', 'url', 'title', 'published_date'), description=''):
+    """
+    Register a row transform for backfill runs.
+
+    columns maps each output column to its type per database, e.g.
+    {'article_id': {'mysql': 'VARCHAR(16) NULL', 'sqlite': 'TEXT'}}.
+    The decorated function receives a dict of the columns named in reads
+    (plus 'id') and returns a dict of output values, or None to leave the
+    row unchanged. It runs in worker processes, so it must be a module-level
+    function without side effects.
+    """
+    def decorator(func):
+        TRANSFORMS[name] = {
+            'name': name,
+            'func': func,
+            'columns': columns,
+            'reads': tuple(reads),
+            'description': description or (func.__doc__ or '').strip().splitlines()[0],
+        }
+        return func
+    return decorator
+
+
+def generate_article_id(source_id, title):
+    """Python port of generateArticleId() in php/news.php (genItemID() in js/news.js)."""
+    data = f"{source_id}{title}"
+    if not data:
+        return '0'
+    encoded = data.encode('utf-16-be')
+    value = 0
+    for i in range(0, len(encoded), 2):
+        value = ((value << 5) - value + ((encoded[i] << 8) + encoded[i + 1])) & 0xFFFFFFFF
+    if value & 0x80000000:
+        value -= 0x100000000
+    return format(abs(value), 'x')
+
+
+def normalize_title(title):
+    """Lowercase, strip accents and punctuation, and collapse whitespace."""
+    text = unicodedata.normalize('NFKD', title or '')
+    text = ''.join(ch for ch in text if not unicodedata.combining(ch)).casefold()
+    return ' '.join(re.sub(r'[^\w\s]', ' ', text).split())
+
+
+@register_transform('article_id', {'article_id': {'mysql': 'VARCHAR(16) NULL', 'sqlite': 'TEXT'}},
+                    reads=('feed_id', 'title'))
+def transform_article_id(row):
+    """Store the read-status article ID news.php derives from feed_id + title."""
+    return {'article_id': generate_article_id(row['feed_id'], row['title'])}
+
+
+@register_transform('published_epoch', {'published_epoch': {'mysql': 'BIGINT NULL', 'sqlite': 'INTEGER'}},
+                    reads=('published_date',))
+def transform_published_epoch(row):
+    """Store published_date as Unix seconds (naive values are taken as UTC)."""
+    value = row['published_date']
+    if isinstance(value, str):
+        try:
+            value = datetime.fromisoformat(value.strip())
+        except ValueError:
+            return None
+    if not isinstance(value, datetime):
+        return None
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return {'published_epoch': int(value.timestamp())}
+
+
+@register_transform('title_fingerprint', {'title_fingerprint': {'mysql': 'CHAR(16) NULL', 'sqlite': 'TEXT'}},
+                    reads=('title',))
+def transform_title_fingerprint(row):
+    """Store a 64-bit fingerprint of the normalized title for duplicate clustering."""
+    normalized = normalize_title(row['title'])
+    if not normalized:
+        return None
+    return {'title_fingerprint': hashlib.sha1(normalized.encode('utf-8')).hexdigest()[:16]}
+
+
+@register_transform('url_hash', {'url_hash': {'mysql': 'CHAR(16) NULL', 'sqlite': 'TEXT'}},
+                    reads=('url',))
+def transform_url_hash(row):
+    """Store the canonical URL hash that url_canon.py --migrate makes the article key."""
+    return {'url_hash': url_hash(row['url'])}
+
+
+def _transform_batch(name, rows):
+    """Worker entry point: return [(id, values), ...] for rows that changed."""
+    func = TRANSFORMS[name]['func']
+    results = []
+    for row in rows:
+        values = func(row)
+        if values:
+            results.append((row['id'], values))
+    return results
+
+
+def checkpoint_path(name):
+    return SCRIPT_DIR / f"backfill_{name}.checkpoint.json"
+
+
+def load_checkpoint(name):
+    """Return the saved checkpoint for a transform, or None."""
+    try:
+        with open(checkpoint_path(name), 'r') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as exc:
+        print(f"⚠ Ignoring unreadable checkpoint {checkpoint_path(name)}: {exc}")
+        return None
+
+
+def save_checkpoint(name, state):
+    """Atomically record progress so an interrupted run can resume."""
+    path = checkpoint_path(name)
+    state = dict(state, updated_at=datetime.now(timezone.utc).replace(tzinfo=None).isoformat(sep=' '))
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(state, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def clear_checkpoint(name):
+    try:
+        os.remove(checkpoint_path(name))
+    except FileNotFoundError:
+        pass
+
+
+def existing_columns(connection, db_type, table='news_articles'):
+    cursor = connection.cursor()
+    if db_type == 'mysql':
+        cursor.execute("""
+            SELECT column_name AS name FROM information_schema.columns
+            WHERE table_schema = DATABASE() AND table_name = %s
+        """, (table,))
+        return {row['name'] for row in cursor.fetchall()}
+    cursor.execute(f"PRAGMA table_info({table})")
+    return {row[1] for row in cursor.fetchall()}
+
+
+def ensure_columns(connection, db_type, transform):
+    """Add any missing output columns for a transform; returns the names added."""
+    present = existing_columns(connection, db_type)
+    added = []
+    cursor = connection.cursor()
+    for column, types in transform['columns'].items():
+        if column in present:
+            continue
+        cursor.execute(f"ALTER TABLE news_articles ADD COLUMN {column} {types[db_type]}")
+        added.append(column)
+    connection.commit()
+    return added
+
+
+def _fetch_batch(connection, db_type, transform, last_id, batch_size, missing_only):
+    p = '%s' if db_type == 'mysql' else '?'
+    columns = ', '.join(('id',) + transform['reads'])
+    where = f"id > {p}"
+    if missing_only:
+        where += ' AND (' + ' OR '.join(f"{column} IS NULL" for column in transform['columns']) + ')'
+    cursor = connection.cursor()
+    cursor.execute(f"""
+        SELECT {columns} FROM news_articles
+        WHERE {where}
+        ORDER BY id
+        LIMIT {int(batch_size)}
+    """, (last_id,))
+    return [dict(row) for row in cursor.fetchall()]
+
+
+def _write_batch(connection, db_type, transform, results):
+    if not results:
+        return 0
+    p = '%s' if db_type == 'mysql' else '?'
+    columns = list(transform['columns'])
+    assignments = ', '.join(f"{column} = {p}" for column in columns)
+    params = [tuple(values.get(column) for column in columns) + (row_id,) for row_id, values in results]
+    cursor = connection.cursor()
+    cursor.executemany(f"UPDATE news_articles SET {assignments} WHERE id = {p}", params)
+    connection.commit()
+    return len(params)
+
+
+class RateLimiter:
+    """Sleep as needed to keep a running row count under rows_per_second."""
+
+    def __init__(self, rows_per_second):
+        self.rows_per_second = rows_per_second
+        self.started = time.monotonic()
+        self.rows = 0
+        self.slept = 0.0
+
+    def throttle(self, rows):
+        self.rows += rows
+        if not self.rows_per_second:
+            return
+        wait = self.rows / self.rows_per_second - (time.monotonic() - self.started)
+        if wait > 0:
+            time.sleep(wait)
+            self.slept += wait
+
+
+def run_backfill(env_vars, name, batch_size=DEFAULT_BATCH_SIZE, workers=DEFAULT_WORKERS,
+                 rows_per_second=None, restart=False, missing_only=False, dry_run=False):
+    """
+    Apply a registered transform to every news_articles row.
+
+    Batches are read in id order on the main process, transformed by
+    `workers` processes (inline when workers is 1) and written back in
+    order, so the checkpoint is always the highest id fully written.
+    Returns a summary dict.
+    """
+    transform = TRANSFORMS[name]
+    connection, db_type = get_db_connection(env_vars)
+    try:
+        if db_type == 'sqlite' and is_partitioned(connection, db_type):
+            # Columns would have to be added to every monthly table and the view rebuilt
+            raise RuntimeError("the partitioned SQLite layout is not supported; backfill before converting")
+        if dry_run:
+            missing = set(transform['columns']) - existing_columns(connection, db_type)
+            if missing:
+                print(f"  Would add column(s): {', '.join(sorted(missing))}")
+                missing_only = False
+        else:
+            for column in ensure_columns(connection, db_type, transform):
+                print(f"  ✓ Added column news_articles.{column}")
+
+        checkpoint = None if restart or dry_run else load_checkpoint(name)
+        if checkpoint and checkpoint.get('db_type') != db_type:
+            print(f"⚠ Checkpoint was written for {checkpoint.get('db_type')}; starting over")
+            checkpoint = None
+        state = checkpoint or {'transform': name, 'db_type': db_type, 'last_id': 0, 'rows_read': 0, 'rows_written': 0}
+        if checkpoint:
+            print(f"  Resuming after id {state['last_id']:,} ({state['rows_read']:,} row(s) already processed)")
+
+        cursor = connection.cursor()
+        cursor.execute("SELECT MAX(id) AS max_id FROM news_articles")
+        row = cursor.fetchone()
+        max_id = (row['max_id'] if db_type == 'mysql' else row[0]) or 0
+
+        limiter = RateLimiter(rows_per_second)
+        started = time.monotonic()
+        last_report = started
+        session = {'read': 0, 'written': 0}
+        pool = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+        in_flight = deque()
+        last_id = state['last_id']
+        exhausted = False
+        try:
+            while True:
+                # Keep the pool busy: read ahead up to two batches per worker
+                while not exhausted and len(in_flight) < max(workers, 1) * 2:
+                    rows = _fetch_batch(connection, db_type, transform, last_id, batch_size, missing_only)
+                    if not rows:
+                        exhausted = True
+                        break
+                    last_id = rows[-1]['id']
+                    job = pool.submit(_transform_batch, name, rows) if pool else _transform_batch(name, rows)
+                    in_flight.append((job, len(rows), last_id))
+                    if len(rows) < batch_size:
+                        exhausted = True
+                if not in_flight:
+                    break
+
+                job, row_count, batch_last_id = in_flight.popleft()
+                results = job.result() if pool else job
+                written = 0 if dry_run else _write_batch(connection, db_type, transform, results)
+                session['read'] += row_count
+                session['written'] += len(results) if dry_run else written
+                state['last_id'] = batch_last_id
+                state['rows_read'] += row_count
+                state['rows_written'] += written
+                if not dry_run:
+                    save_checkpoint(name, state)
+                limiter.throttle(row_count)
+
+                now = time.monotonic()
+                if now - last_report >= PROGRESS_INTERVAL_SECONDS:
+                    rate = session['read'] / max(now - started, 1e-9)
+                    done = min(batch_last_id / max_id, 1.0) if max_id else 1.0
+                    print(f"  … id {batch_last_id:,}/{max_id:,} ({done:.0%}), "
+                          f"{session['read']:,} row(s) at {rate:,.0f} rows/s")
+                    last_report = now
+        finally:
+            if pool:
+                pool.shutdown(cancel_futures=True)
+
+        if not dry_run:
+            clear_checkpoint(name)
+        elapsed = time.monotonic() - started
+        return {
+            'transform': name,
+            'rows_read': session['read'],
+            'rows_written': session['written'],
+            'elapsed_seconds': elapsed,
+            'rows_per_second': session['read'] / elapsed if elapsed > 0 else 0.0,
+            'throttled_seconds': limiter.slept,
+        }
+    finally:
+        connection.close()
+
+
+def main():
+    """Main function."""
+    parser = argparse.ArgumentParser(description="Backfill derived columns on news_articles.")
+    parser.add_argument('transform', nargs='?', choices=sorted(TRANSFORMS), help="transform to run")
+    parser.add_argument('--list', action='store_true', help="list registered transforms")
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE,
+                        help=f"rows per read/write batch (default {DEFAULT_BATCH_SIZE})")
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS,
+                        help=f"transform processes; 1 runs inline (default {DEFAULT_WORKERS})")
+    parser.add_argument('--max-rows-per-second', type=float, default=None,
+                        help="throttle to this many rows per second")
+    parser.add_argument('--missing-only', action='store_true',
+                        help="only process rows where an output column is NULL")
+    parser.add_argument('--restart', action='store_true', help="ignore any saved checkpoint")
+    parser.add_argument('--dry-run', action='store_true', help="run the transform without writing")
+    args = parser.parse_args()
+
+    if args.list or not args.transform:
+        for name in sorted(TRANSFORMS):
+            transform = TRANSFORMS[name]
+            print(f"  {name:<18} {', '.join(transform['columns'])}: {transform['description']}")
+        return
+    if args.batch_size < 1:
+        parser.error("--batch-size must be at least 1")
+    if args.workers < 1:
+        parser.error("--workers must be at least 1")
+    if args.max_rows_per_second is not None and args.max_rows_per_second <= 0:
+        parser.error("--max-rows-per-second must be positive")
+
+    print(f"Backfilling {args.transform}..." + (" (dry run)" if args.dry_run else ""))
+    try:
+        result = run_backfill(
+            load_env_file(), args.transform, args.batch_size, args.workers,
+            args.max_rows_per_second, args.restart, args.missing_only, args.dry_run
+        )
+    except KeyboardInterrupt:
+        print(f"\nInterrupted; rerun to resume from {checkpoint_path(args.transform)}")
+        sys.exit(130)
+    except Exception as e:
+        print(f"ERROR: {e}")
+        sys.exit(1)
+
+    verb = "Would update" if args.dry_run else "Updated"
+    line = (f"✓ {verb} {result['rows_written']:,} of {result['rows_read']:,} row(s) "
+            f"in {result['elapsed_seconds']:.1f}s ({result['rows_per_second']:,.0f} rows/s)")
+    if result['throttled_seconds']:
+        line += f", {result['throttled_seconds']:.1f}s throttled"
+    print(line)
+
+
+if __name__ == '__main__':
+    main()
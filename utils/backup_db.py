@@ -0,0 +1,371 @@
+#!/usr/bin/env python3
+"""
+Online snapshots of the SQLite databases.
+Copies each live database with SQLite's backup API a batch of pages at a
+time, pausing between batches so news.php readers and the cron writer only
+ever wait for one batch. The copy is gzip-compressed into BACKUP_DIR next to
+a JSON manifest with its SHA-256, and older snapshots are rotated out.
+BACKUP_DIR must lie outside the project tree, which the web server serves.
+--restore verifies a snapshot and copies it back through the same API, so
+open connections see the restored data instead of a swapped-out file.
+"""
+
+import os
+import sys
+import json
+import gzip
+import time
+import shutil
+import sqlite3
+import hashlib
+import argparse
+import tempfile
+from datetime import datetime
+from pathlib import Path
+
+from db_utils import (
+    PROJECT_ROOT,
+    CONSOLIDATED_SQLITE_FILES,
+    load_env_file,
+    is_consolidated_sqlite,
+    consolidated_sqlite_path,
+    resolve_sqlite_path,
+    resolve_restdb_sqlite_path,
+    resolve_settings_sqlite_path
+)
+
+DEFAULT_BACKUP_DIR = Path('/tmp/teslacloud-backups')
+DEFAULT_KEEP = 7
+DEFAULT_PAGES_PER_STEP = 256
+DEFAULT_PAUSE_SECONDS = 0.01
+MAX_RESTARTS = 3
+COPY_CHUNK_BYTES = 1024 * 1024
+SNAPSHOT_SUFFIX = '.db.gz'
+
+
+class _TooManyRestarts(Exception):
+    """Raised from the backup progress callback to stop restarting."""
+
+
+def database_files(env_vars):
+    """{name: path} of the SQLite files of the configured layout that exist."""
+    if is_consolidated_sqlite(env_vars):
+        files = {group: consolidated_sqlite_path(env_vars, group) for group in CONSOLIDATED_SQLITE_FILES}
+    else:
+        files = {
+            'news': resolve_sqlite_path(env_vars),
+            'restdb': resolve_restdb_sqlite_path(env_vars),
+            'settings': resolve_settings_sqlite_path(env_vars),
+        }
+    return {name: path for name, path in files.items() if os.path.exists(path)}
+
+
+def backup_dir(env_vars):
+    """BACKUP_DIR; raises ValueError for a directory the web server would serve."""
+    directory = Path(env_vars.get('BACKUP_DIR') or DEFAULT_BACKUP_DIR)
+    resolved = directory.resolve()
+    if resolved == PROJECT_ROOT or PROJECT_ROOT in resolved.parents:
+        raise ValueError(f"BACKUP_DIR {directory} is inside the web root {PROJECT_ROOT}; "
+                         f"snapshots there could be downloaded")
+    return directory
+
+
+def online_copy(source_path, dest_path, pages=DEFAULT_PAGES_PER_STEP, pause=DEFAULT_PAUSE_SECONDS,
+                max_restarts=MAX_RESTARTS):
+    """
+    Copy a live database to dest_path with the backup API.
+
+    Each step holds the source's shared lock for `pages` pages only; the
+    pause between steps runs with no lock held. A write by another
+    connection restarts the copy, and after max_restarts the rest is copied
+    in a single step (which a WAL source serves from a snapshot without
+    blocking its writer). Returns timing and lock statistics.
+    """
+    stats = {'steps': 0, 'restarts': 0, 'longest_step_ms': 0.0, 'paused_seconds': 0.0,
+             'pages': 0, 'final_single_step': False}
+    source = sqlite3.connect(source_path, timeout=30)
+    dest = sqlite3.connect(dest_path)
+    state = {'remaining': None, 'step_started': time.perf_counter()}
+
+    def progress(status, remaining, total):
+        held_ms = (time.perf_counter() - state['step_started']) * 1000
+        stats['steps'] += 1
+        stats['longest_step_ms'] = max(stats['longest_step_ms'], held_ms)
+        stats['pages'] = total
+        if state['remaining'] is not None and remaining > state['remaining']:
+            # The source changed under us and SQLite started over
+            stats['restarts'] += 1
+            if stats['restarts'] > max_restarts:
+                raise _TooManyRestarts()
+        state['remaining'] = remaining
+        if remaining and pause:
+            time.sleep(pause)
+            stats['paused_seconds'] += pause
+        state['step_started'] = time.perf_counter()
+
+    started = time.perf_counter()
+    try:
+        try:
+            source.backup(dest, pages=pages, progress=progress)
+        except _TooManyRestarts:
+            stats['final_single_step'] = True
+            step_started = time.perf_counter()
+            source.backup(dest)
+            stats['longest_step_ms'] = max(stats['longest_step_ms'], (time.perf_counter() - step_started) * 1000)
+    finally:
+        stats['seconds'] = time.perf_counter() - started
+        source.close()
+        dest.close()
+    stats['page_size'] = _page_size(dest_path)
+    stats['bytes'] = os.path.getsize(dest_path)
+    return stats
+
+
+def _page_size(path):
+    connection = sqlite3.connect(path)
+    try:
+        return connection.execute("PRAGMA page_size").fetchone()[0]
+    finally:
+        connection.close()
+
+
+def _sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(COPY_CHUNK_BYTES), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def snapshot_database(name, source_path, directory, pages=DEFAULT_PAGES_PER_STEP, pause=DEFAULT_PAUSE_SECONDS,
+                      level=6):
+    """
+    Write {name}-{timestamp}.db.gz and its .json manifest; returns the manifest.
+
+    The copy is checked with PRAGMA quick_check before it is compressed, and
+    files appear under their final names only once complete.
+    """
+    # Snapshots hold user settings and login IPs: owner only
+    directory.mkdir(mode=0o700, parents=True, exist_ok=True)
+    stamp = datetime.now().strftime('%Y%m%d-%H%M%S')
+    snapshot_path = directory / f"{name}-{stamp}{SNAPSHOT_SUFFIX}"
+    fd, raw_path = tempfile.mkstemp(dir=directory, prefix=f".{name}-", suffix='.db')
+    os.close(fd)
+    gz_tmp = str(snapshot_path) + '.tmp'
+    try:
+        stats = online_copy(source_path, raw_path, pages, pause)
+        check = sqlite3.connect(raw_path)
+        try:
+            status = check.execute("PRAGMA quick_check").fetchone()[0]
+            # A restored file must not expect a -wal that the snapshot lacks
+            check.execute("PRAGMA journal_mode = DELETE")
+        finally:
+            check.close()
+        if status != 'ok':
+            raise RuntimeError(f"quick_check of the copy failed: {status}")
+
+        compress_started = time.perf_counter()
+        with open(raw_path, 'rb') as raw, gzip.open(gz_tmp, 'wb', compresslevel=level) as gz:
+            shutil.copyfileobj(raw, gz, COPY_CHUNK_BYTES)
+        stats['compress_seconds'] = time.perf_counter() - compress_started
+        manifest = {
+            'database': name,
+            'source': source_path,
+            'created_at': datetime.now().isoformat(sep=' ', timespec='seconds'),
+            'bytes': os.path.getsize(raw_path),
+            'raw_sha256': _sha256(raw_path),
+            'compressed_bytes': os.path.getsize(gz_tmp),
+            'sha256': _sha256(gz_tmp),
+            'page_size': stats['page_size'],
+            'copy': {key: round(value, 4) if isinstance(value, float) else value for key, value in stats.items()},
+        }
+        os.replace(gz_tmp, snapshot_path)
+        with open(manifest_path(snapshot_path), 'w') as f:
+            json.dump(manifest, f, indent=2)
+        manifest['path'] = str(snapshot_path)
+        return manifest
+    finally:
+        for path in (raw_path, gz_tmp):
+            if os.path.exists(path):
+                os.remove(path)
+
+
+def manifest_path(snapshot_path):
+    return Path(str(snapshot_path)[:-len(SNAPSHOT_SUFFIX)] + '.json')
+
+
+def list_snapshots(directory, name=None):
+    """[(snapshot path, manifest or None)] newest first, optionally for one database."""
+    if not directory.exists():
+        return []
+    snapshots = []
+    for path in directory.glob(f"{name or '*'}-*{SNAPSHOT_SUFFIX}"):
+        try:
+            with open(manifest_path(path), 'r') as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            manifest = None
+        snapshots.append((path, manifest))
+    snapshots.sort(key=lambda item: item[0].name, reverse=True)
+    return snapshots
+
+
+def rotate(directory, name, keep):
+    """Delete all but the newest `keep` snapshots of a database; returns the deleted paths."""
+    removed = []
+    for path, _ in list_snapshots(directory, name)[keep:]:
+        for stale in (path, manifest_path(path)):
+            if stale.exists():
+                stale.unlink()
+        removed.append(path)
+    return removed
+
+
+def verify_snapshot(path):
+    """(ok, message): the compressed file matches the SHA-256 in its manifest."""
+    try:
+        with open(manifest_path(path), 'r') as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return False, "manifest missing or unreadable"
+    if _sha256(path) != manifest.get('sha256'):
+        return False, "checksum mismatch"
+    return True, "ok"
+
+
+def restore_snapshot(path, target_path):
+    """
+    Verify a snapshot and copy it into target_path in one backup step.
+
+    Connections open on the target see the restored content on their next
+    read; the target keeps its own journal mode. Returns elapsed seconds.
+    """
+    ok, message = verify_snapshot(path)
+    if not ok:
+        raise RuntimeError(f"{path.name}: {message}")
+    with open(manifest_path(path), 'r') as f:
+        manifest = json.load(f)
+    started = time.perf_counter()
+    directory = os.path.dirname(os.path.abspath(target_path))
+    os.makedirs(directory, exist_ok=True)
+    fd, raw_path = tempfile.mkstemp(dir=directory, prefix='.restore-', suffix='.db')
+    os.close(fd)
+    try:
+        digest = hashlib.sha256()
+        with gzip.open(path, 'rb') as gz, open(raw_path, 'wb') as raw:
+            for chunk in iter(lambda: gz.read(COPY_CHUNK_BYTES), b''):
+                digest.update(chunk)
+                raw.write(chunk)
+        if digest.hexdigest() != manifest.get('raw_sha256'):
+            raise RuntimeError(f"{path.name}: decompressed data does not match the manifest")
+        source = sqlite3.connect(raw_path)
+        target = sqlite3.connect(target_path, timeout=30)
+        try:
+            source.backup(target)
+        finally:
+            source.close()
+            target.close()
+    finally:
+        os.remove(raw_path)
+    return time.perf_counter() - started
+
+
+def _format_bytes(size):
+    for unit in ('B', 'KB', 'MB', 'GB'):
+        if size < 1024 or unit == 'GB':
+            return f"{size:,.0f} {unit}" if unit == 'B' else f"{size:,.1f} {unit}"
+        size /= 1024
+
+
+def print_snapshot_report(manifest):
+    copy = manifest['copy']
+    working = max(copy['seconds'] - copy['paused_seconds'], 1e-9)
+    ratio = manifest['compressed_bytes'] / manifest['bytes'] if manifest['bytes'] else 0
+    print(f"✓ {manifest['database']}: {manifest['path']}")
+    print(f"  {_format_bytes(manifest['bytes'])} in {copy['steps']:,} step(s), {copy['seconds']:.2f}s "
+          f"({manifest['bytes'] / working / 1048576:,.1f} MB/s while copying), "
+          f"longest lock hold {copy['longest_step_ms']:.1f} ms, {copy['restarts']} restart(s)")
+    print(f"  compressed to {_format_bytes(manifest['compressed_bytes'])} ({ratio:.0%}) "
+          f"in {copy['compress_seconds']:.2f}s, sha256 {manifest['sha256'][:16]}…")
+
+
+def main():
+    """Main function."""
+    parser = argparse.ArgumentParser(description="Online, compressed snapshots of the SQLite databases.")
+    parser.add_argument('databases', nargs='*', help="databases to snapshot (default: all that exist)")
+    parser.add_argument('--keep', type=int, help=f"snapshots kept per database (default BACKUP_KEEP or {DEFAULT_KEEP})")
+    parser.add_argument('--pages', type=int, default=DEFAULT_PAGES_PER_STEP,
+                        help="pages copied per lock hold (default %(default)s)")
+    parser.add_argument('--pause', type=float, default=DEFAULT_PAUSE_SECONDS,
+                        help="seconds between steps, with no lock held (default %(default)s)")
+    parser.add_argument('--list', action='store_true', help="list snapshots and verify their checksums")
+    parser.add_argument('--restore', metavar='SNAPSHOT', help="restore a snapshot file into its database")
+    parser.add_argument('--to', metavar='PATH', help="with --restore, write to this file instead")
+    args = parser.parse_args()
+
+    env_vars = load_env_file()
+    try:
+        directory = backup_dir(env_vars)
+    except ValueError as e:
+        print(f"ERROR: {e}")
+        sys.exit(1)
+
+    if args.list:
+        snapshots = list_snapshots(directory)
+        if not snapshots:
+            print(f"No snapshots in {directory}")
+        for path, manifest in snapshots:
+            ok, message = verify_snapshot(path)
+            size = _format_bytes(path.stat().st_size)
+            print(f"  {'✓' if ok else '✗'} {path.name:<40} {size:>10}  {message}")
+        return
+
+    if args.restore:
+        path = Path(args.restore)
+        if not path.exists() and (directory / args.restore).exists():
+            path = directory / args.restore
+        target = args.to
+        if not target:
+            name = path.name.rsplit('-', 2)[0]
+            target = database_files(env_vars).get(name)
+            if not target:
+                print(f"ERROR: Unknown database '{name}' for this layout; pass --to")
+                sys.exit(1)
+        try:
+            seconds = restore_snapshot(path, target)
+        except (OSError, RuntimeError, sqlite3.Error) as e:
+            print(f"ERROR: Restore failed: {e}")
+            sys.exit(1)
+        print(f"✓ Restored {path.name} into {target} in {seconds:.2f}s")
+        return
+
+    if env_vars.get('SQL_HOST'):
+        print("⚠ MySQL is configured; its tables are not covered (use mysqldump --single-transaction)")
+    if args.pages < 1 or args.pause < 0:
+        parser.error("--pages must be positive and --pause not negative")
+    keep = args.keep if args.keep is not None else int(env_vars.get('BACKUP_KEEP') or DEFAULT_KEEP)
+    files = database_files(env_vars)
+    unknown = set(args.databases) - set(files)
+    if unknown:
+        parser.error(f"unknown or missing database(s): {', '.join(sorted(unknown))} (have: {', '.join(files)})")
+
+    failed = False
+    for name, source_path in files.items():
+        if args.databases and name not in args.databases:
+            continue
+        try:
+            manifest = snapshot_database(name, source_path, directory, args.pages, args.pause)
+        except (OSError, RuntimeError, sqlite3.Error) as e:
+            print(f"✗ {name}: snapshot failed: {e}")
+            failed = True
+            continue
+        print_snapshot_report(manifest)
+        removed = rotate(directory, name, max(keep, 1))
+        if removed:
+            print(f"  rotated out {len(removed)} old snapshot(s)")
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,13 +1,21 @@
 #!/usr/bin/env python3
 """
 Clean up old news articles from the database.
-Removes articles older than the configured lifetime.
+Removes articles older than the configured lifetime. On the partitioned
+layout (see partitions.py) whole expired months are dropped first.
+Hourly article histogram buckets (see histogram.py) are trimmed as well;
+their counts are never decremented when articles are removed.
 """
 
 import sys
+import time
 from datetime import datetime, timedelta
 
-from db_utils import load_env_file, get_db_connection, load_feed_config
+from db_utils import load_env_file, get_db_connection
+from feed_registry import get_registry
+from partitions import is_partitioned, article_tables, drop_expired_partitions
+from news_delta import change_log_available, change_log_keep_days, record_prune, trim_change_log
+from histogram import histogram_available, prune_histogram
 
 
 def cleanup_old_articles(connection, db_type, max_age_days=7):
@@ -21,110 +29,105 @@ def cleanup_old_articles(connection, db_type, max_age_days=7):
     """
     cursor = connection.cursor()
     cutoff_date = datetime.now() - timedelta(days=max_age_days)
+    placeholder = '%s' if db_type == 'mysql' else '?'
     
-    if db_type == 'mysql':
-        cursor.execute("""
-            DELETE FROM news_articles 
-            WHERE published_date < %s
+    deleted_count = 0
+    for table in article_tables(connection, db_type, cutoff_date):
+        cursor.execute(f"""
+            DELETE FROM {table} 
+            WHERE published_date < {placeholder}
         """, (cutoff_date,))
-    else:
-        cursor.execute("""
-            DELETE FROM news_articles 
-            WHERE published_date < ?
-        """, (cutoff_date,))
-    
-    deleted_count = cursor.rowcount
+        deleted_count += cursor.rowcount
+    if deleted_count > 0 and change_log_available(connection, db_type):
+        record_prune(cursor, db_type, None, before=cutoff_date)
     connection.commit()
     
     return deleted_count
 
 
-def cleanup_by_feed_lifetime():
+def cleanup_by_feed_lifetime(stop_at=None):
     """
     Clean up articles based on each feed's configured lifetime.
     Feeds with no lifetime or a lifetime <= 0 are treated as infinite
     retention and are never pruned automatically.
+
+    If stop_at (a time.monotonic() value) is given, lifetime groups not yet
+    processed when it passes are left for the next run.
     """
     # Load environment and get DB connection
     env_vars = load_env_file()
-    connection, db_type = get_db_connection(env_vars)
-    
-    # Load feed configuration
-    feeds = load_feed_config()
-    
-    # Build a map of feed_id to lifetime (in days)
-    feed_lifetimes = {}
-    for feed in feeds:
-        feed_id = feed.get('id')
-        if not feed_id:
-            continue
-
-        lifetime_value = feed.get('lifetime')
-        if lifetime_value is None:
-            # A missing lifetime means infinite retention
-            continue
-
-        try:
-            lifetime = float(lifetime_value)
-        except (TypeError, ValueError):
-            print(f"⚠ Invalid lifetime '{lifetime_value}' for feed '{feed_id}', skipping cleanup for this feed")
-            continue
-
-        if lifetime <= 0:
-            # Zero or negative lifetime means keep forever
-            continue
+    connection, db_type = get_db_connection(env_vars, pooled=True)
+    try:
+        return _cleanup_by_feed_lifetime(connection, db_type, env_vars, stop_at)
+    finally:
+        connection.close()
 
-        if lifetime.is_integer():
-            lifetime = int(lifetime)
 
-        feed_lifetimes[feed_id] = lifetime
+def _cleanup_by_feed_lifetime(connection, db_type, env_vars, stop_at):
+    if change_log_available(connection, db_type):
+        trimmed = trim_change_log(connection, db_type, change_log_keep_days(env_vars))
+        if trimmed:
+            print(f"✓ Trimmed {trimmed} delta log entries")
+    
+    if histogram_available(connection, db_type):
+        pruned = prune_histogram(connection, db_type, env_vars)
+        if pruned:
+            print(f"✓ Trimmed {pruned} histogram buckets")
+    
+    # Feeds grouped by lifetime (in days); invalid and non-positive
+    # lifetimes are excluded by the registry and kept forever
+    registry = get_registry()
+    lifetime_buckets = registry.lifetime_buckets
 
-    if not feed_lifetimes:
-        connection.close()
+    if not lifetime_buckets:
         print("No feeds have a finite lifetime. Skipping cleanup.")
         return 0
     
-    # Get unique lifetime values to minimize DB queries
-    unique_lifetimes = set(feed_lifetimes.values())
-    
     total_deleted = 0
     
-    for lifetime in sorted(unique_lifetimes):
-        # Get all feeds with this lifetime
-        feed_ids_with_lifetime = [fid for fid, lt in feed_lifetimes.items() if lt == lifetime]
-        
-        if not feed_ids_with_lifetime:
-            continue
+    if is_partitioned(connection, db_type):
+        lifetimes = {feed['id']: feed['lifetime'] for feed in registry.feeds}
+        dropped = drop_expired_partitions(connection, db_type, lifetimes)
+        if dropped:
+            if change_log_available(connection, db_type):
+                cursor = connection.cursor()
+                for partition in dropped:
+                    record_prune(cursor, db_type, None, before=partition['end'], after=partition['start'])
+                connection.commit()
+            dropped_rows = sum(partition['rows'] for partition in dropped)
+            total_deleted += dropped_rows
+            print(f"✓ Dropped {len(dropped)} expired partition(s) holding {dropped_rows} articles")
+    
+    for lifetime, feed_ids_with_lifetime in lifetime_buckets.items():
+        if stop_at is not None and time.monotonic() >= stop_at:
+            print("⚠ Time budget reached, leaving remaining lifetime groups for the next run")
+            break
         
         # Delete articles older than this lifetime for these feeds
         cursor = connection.cursor()
         cutoff_date = datetime.now() - timedelta(days=lifetime)
         
-        placeholders = ','.join(['%s' if db_type == 'mysql' else '?'] * len(feed_ids_with_lifetime))
+        placeholder = '%s' if db_type == 'mysql' else '?'
+        placeholders = ','.join([placeholder] * len(feed_ids_with_lifetime))
         
-        if db_type == 'mysql':
+        deleted_count = 0
+        for table in article_tables(connection, db_type, cutoff_date):
             query = f"""
-                DELETE FROM news_articles 
+                DELETE FROM {table} 
                 WHERE feed_id IN ({placeholders})
-                AND published_date < %s
+                AND published_date < {placeholder}
             """
             cursor.execute(query, (*feed_ids_with_lifetime, cutoff_date))
-        else:
-            query = f"""
-                DELETE FROM news_articles 
-                WHERE feed_id IN ({placeholders})
-                AND published_date < ?
-            """
-            cursor.execute(query, (*feed_ids_with_lifetime, cutoff_date))
-        
-        deleted_count = cursor.rowcount
+            deleted_count += cursor.rowcount
         total_deleted += deleted_count
         
+        if deleted_count > 0 and change_log_available(connection, db_type):
+            record_prune(cursor, db_type, feed_ids_with_lifetime, before=cutoff_date)
+        
         if deleted_count > 0:
             print(f"✓ Deleted {deleted_count} articles older than {lifetime} days from {len(feed_ids_with_lifetime)} feed(s)")
     
     connection.commit()
-    connection.close()
     
     print(f"\nTotal cleanup: {total_deleted} articles removed")
     return total_deleted
@@ -0,0 +1,219 @@
+#!/usr/bin/env python3
+"""
+Small thread-safe pool of MySQL connections.
+
+get_db_connection(env_vars, pooled=True) hands out a PooledConnection
+from the process-wide pool for the configured server; its close() returns
+the connection instead of dropping it, so a long-running loader or several
+threads share a few connections to a remote server. An idle connection is
+pinged before reuse once it has been idle for SQL_POOL_IDLE_CHECK seconds,
+and replaced if the server has dropped it. At most SQL_POOL_SIZE
+connections (default 4) are open; further callers wait up to
+SQL_POOL_WAIT seconds.
+
+ConnectionPool.run() and run_idempotent() retry a unit of work on a live
+connection when the server goes away mid-statement. Only use them for
+work that is safe to repeat: reads, or upserts committed in one
+transaction.
+
+pymysql is imported only when a connection is opened.
+"""
+
+import time
+import threading
+from collections import deque
+
+from db_utils import mysql_connect_args, env_number
+
+DEFAULT_POOL_SIZE = 4
+DEFAULT_IDLE_CHECK_SECONDS = 30
+DEFAULT_WAIT_SECONDS = 30
+RETRY_ATTEMPTS = 3
+RETRY_BACKOFF_SECONDS = 0.5
+
+# Client error codes for a connection that cannot be used any more:
+# can't connect, server has gone away, lost connection (during query / at handshake)
+CONNECTION_LOST_CODES = {2003, 2006, 2013, 2055}
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+class PoolTimeout(Exception):
+    """No pooled connection became free within the wait time."""
+
+
+def is_connection_lost(exc):
+    """True for a pymysql error that means the connection is dead, not that the statement failed."""
+    if type(exc).__module__.split('.')[0] != 'pymysql':
+        return False
+    if type(exc).__name__ == 'InterfaceError':
+        return True
+    return bool(exc.args) and exc.args[0] in CONNECTION_LOST_CODES
+
+
+class ConnectionPool:
+    """Up to max_size open connections, handed out one caller at a time."""
+
+    def __init__(self, connect_args, max_size=DEFAULT_POOL_SIZE, idle_check_seconds=DEFAULT_IDLE_CHECK_SECONDS,
+                 wait_seconds=DEFAULT_WAIT_SECONDS):
+        self.connect_args = connect_args
+        self.max_size = max_size
+        self.idle_check_seconds = idle_check_seconds
+        self.wait_seconds = wait_seconds
+        self.stats = {'opened': 0, 'reused': 0, 'replaced': 0, 'discarded': 0, 'retries': 0}
+        self._slots = threading.BoundedSemaphore(max_size)
+        self._idle = deque()  # (connection, monotonic time it was returned)
+        self._lock = threading.Lock()
+
+    def _open(self):
+        import pymysql
+        connection = pymysql.connect(cursorclass=pymysql.cursors.DictCursor, **self.connect_args)
+        with self._lock:
+            self.stats['opened'] += 1
+        return connection
+
+    def _alive(self, connection):
+        try:
+            connection.ping(reconnect=False)
+            return True
+        except Exception:
+            return False
+
+    def acquire(self):
+        """A live raw connection; pair with release()."""
+        if not self._slots.acquire(timeout=self.wait_seconds):
+            raise PoolTimeout(f"no MySQL connection free after {self.wait_seconds:g}s "
+                              f"({self.max_size} in use)")
+        try:
+            while True:
+                with self._lock:
+                    if not self._idle:
+                        break
+                    connection, returned_at = self._idle.pop()
+                if time.monotonic() - returned_at < self.idle_check_seconds or self._alive(connection):
+                    with self._lock:
+                        self.stats['reused'] += 1
+                    return connection
+                _close_quietly(connection)
+                with self._lock:
+                    self.stats['replaced'] += 1
+            return self._open()
+        except BaseException:
+            self._slots.release()
+            raise
+
+    def release(self, connection, discard=False):
+        """Return a connection; an open transaction is rolled back, a broken connection is closed."""
+        try:
+            if not discard:
+                try:
+                    connection.rollback()
+                except Exception:
+                    discard = True
+            if discard:
+                _close_quietly(connection)
+                with self._lock:
+                    self.stats['discarded'] += 1
+            else:
+                with self._lock:
+                    self._idle.append((connection, time.monotonic()))
+        finally:
+            self._slots.release()
+
+    def connection(self):
+        return PooledConnection(self, self.acquire())
+
+    def run(self, work, attempts=RETRY_ATTEMPTS):
+        """
+        Call work(connection) and return its result, retrying on a new
+        connection when the old one is lost. work must be idempotent and
+        commit its own writes.
+        """
+        for attempt in range(1, attempts + 1):
+            connection = self.acquire()
+            try:
+                result = work(connection)
+            except Exception as e:
+                lost = is_connection_lost(e)
+                self.release(connection, discard=lost)
+                if not lost or attempt == attempts:
+                    raise
+                with self._lock:
+                    self.stats['retries'] += 1
+                time.sleep(RETRY_BACKOFF_SECONDS * 2 ** (attempt - 1))
+                continue
+            self.release(connection)
+            return result
+
+    def close_all(self):
+        with self._lock:
+            idle, self._idle = list(self._idle), deque()
+        for connection, _ in idle:
+            _close_quietly(connection)
+
+
+class PooledConnection:
+    """A pool connection that behaves like a pymysql one; close() gives it back."""
+
+    def __init__(self, pool, connection):
+        self._pool = pool
+        self._connection = connection
+
+    def __getattr__(self, name):
+        if self._connection is None:
+            raise AttributeError(f"pooled connection already closed ({name})")
+        return getattr(self._connection, name)
+
+    def close(self):
+        if self._connection is not None:
+            connection, self._connection = self._connection, None
+            self._pool.release(connection, discard=not connection.open)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _close_quietly(connection):
+    try:
+        connection.close()
+    except Exception:
+        pass
+
+
+def get_pool(env_vars):
+    """The process-wide pool for the MySQL server configured in env_vars."""
+    connect_args = mysql_connect_args(env_vars)
+    key = tuple(sorted((k, str(v)) for k, v in connect_args.items()))
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            pool = ConnectionPool(
+                connect_args,
+                max_size=max(env_number(env_vars, 'SQL_POOL_SIZE', DEFAULT_POOL_SIZE, int), 1),
+                idle_check_seconds=env_number(env_vars, 'SQL_POOL_IDLE_CHECK', DEFAULT_IDLE_CHECK_SECONDS),
+                wait_seconds=env_number(env_vars, 'SQL_POOL_WAIT', DEFAULT_WAIT_SECONDS),
+            )
+            _pools[key] = pool
+        return pool
+
+
+def run_idempotent(connection, db_type, work, attempts=RETRY_ATTEMPTS):
+    """
+    Call work(connection) on a connection from get_db_connection(), and if
+    the MySQL server drops it mid-way reconnect it in place and try again.
+    SQLite connections are used as they are.
+    """
+    if db_type != 'mysql':
+        return work(connection)
+    for attempt in range(1, attempts + 1):
+        try:
+            return work(connection)
+        except Exception as e:
+            if not is_connection_lost(e) or attempt == attempts:
+                raise
+            time.sleep(RETRY_BACKOFF_SECONDS * 2 ** (attempt - 1))
+            connection.ping(reconnect=True)
@@ -2,10 +2,21 @@
 """
 Display statistics about news articles in the database.
 Shows article count and age of most recent article for each news source.
+With --histogram, shows article counts per hour or day from the
+pre-aggregated article_histogram table (see histogram.py). With
+--trending, shows the headline terms of the last hour or day that most
+exceed their baseline, from the sketches kept by trending.py.
 """
 
+import sys
+import json
+import time
+import argparse
 from datetime import datetime
-from db_utils import load_env_file, get_db_connection
+from db_utils import load_env_file, get_db_connection, DatabaseUnavailable
+
+SPARK_CHARS = '▁▂▃▄▅▆▇█'
+DEFAULT_SPANS = {'hour': 48, 'day': 30}
 
 
 def get_feed_stats(connection, db_type):
@@ -137,15 +148,162 @@ def print_stats(stats):
     print("=" * 85)
 
 
+def sparkline(counts):
+    """One block character per bucket, scaled to the busiest bucket."""
+    peak = max(counts) if counts else 0
+    if not peak:
+        return ' ' * len(counts)
+    return ''.join(
+        ' ' if count == 0 else SPARK_CHARS[-(-count * len(SPARK_CHARS) // peak) - 1]
+        for count in counts
+    )
+
+
+def get_histogram(connection, db_type, bucket, span, feed_ids=None, group_by='feed'):
+    """
+    Article counts per bucket for the last `span` hours or days.
+
+    group_by is 'feed', 'category' or 'total'. Returns a dict ready for JSON
+    output, including the query time in milliseconds.
+    """
+    # Imported here: plain stats runs do not need the histogram helpers
+    from histogram import window, query_histogram, build_series
+
+    starts = window(bucket, span)
+    started = time.perf_counter()
+    counts = query_histogram(connection, db_type, bucket, starts, feed_ids)
+    query_ms = (time.perf_counter() - started) * 1000
+
+    if group_by == 'category':
+        from feed_registry import get_registry
+        by_id = get_registry().by_id
+        group_of = lambda feed_id: (by_id.get(feed_id) or {}).get('category') or 'unknown'
+    elif group_by == 'total':
+        group_of = lambda feed_id: 'TOTAL'
+    else:
+        group_of = lambda feed_id: feed_id
+
+    return {
+        'bucket': bucket,
+        'group_by': group_by,
+        'buckets': [start.strftime('%Y-%m-%d %H:00:00') for start in starts],
+        'series': build_series(counts, starts, group_of),
+        'query_ms': round(query_ms, 2),
+    }
+
+
+def print_histogram(histogram):
+    """Print one sparkline row per series."""
+    buckets = histogram['buckets']
+    unit = 'hour' if histogram['bucket'] == 'hour' else 'day'
+    print(f"\nArticles per {unit} (UTC), {buckets[0]} .. {buckets[-1]}")
+    print("=" * 85)
+    if not histogram['series']:
+        print("No articles in this window.")
+        print("=" * 85)
+        return
+    print(f"{'Series':<30} {'Total':>8} {'Peak':>6}  Trend (oldest → newest)")
+    print("-" * 85)
+    for series in histogram['series']:
+        print(f"{str(series['name'])[:30]:<30} {series['total']:>8} {max(series['counts']):>6}  "
+              f"{sparkline(series['counts'])}")
+    print("-" * 85)
+    total = sum(series['total'] for series in histogram['series'])
+    print(f"{'TOTAL':<30} {total:>8}   ({len(buckets)} {unit}s, query {histogram['query_ms']:.1f} ms)")
+    print("=" * 85)
+
+
+def print_trending(report):
+    """Print the trending terms of one window against their baseline."""
+    print(f"\nTrending terms, last {report['window']} (UTC {report['window_start']} .. {report['window_end']})")
+    print("=" * 85)
+    print(f"{report['titles']:,} new title(s) in window; baseline {report['baseline_titles']:,.0f} title(s), "
+          f"half-life {report['baseline_half_life_hours']:g}h")
+    if not report['terms']:
+        print("No terms above their baseline.")
+        print("=" * 85)
+        return
+    print("-" * 85)
+    print(f"{'Term':<40} {'Count':>8} {'Expected':>10} {'Ratio':>8} {'Score':>8}")
+    print("-" * 85)
+    for entry in report['terms']:
+        print(f"{entry['term'][:40]:<40} {entry['count']:>8} {entry['expected']:>10.1f} "
+              f"{entry['ratio']:>7.1f}x {entry['score']:>8.1f}")
+    print("=" * 85)
+
+
 def main():
     """Main function to display database statistics."""
+    parser = argparse.ArgumentParser(description="Display news article statistics.")
+    parser.add_argument('feeds', nargs='*', help="with --histogram, only count these feeds")
+    parser.add_argument('--histogram', nargs='?', const='hour', choices=('hour', 'day'),
+                        help="show article counts per hour (default) or day")
+    parser.add_argument('--span', type=int, default=None,
+                        help=f"number of buckets to show (default {DEFAULT_SPANS['hour']} hours "
+                             f"or {DEFAULT_SPANS['day']} days)")
+    parser.add_argument('--by', choices=('feed', 'category', 'total'), default='feed',
+                        help="group histogram rows by feed (default), category or one total")
+    parser.add_argument('--trending', nargs='?', const='1h', choices=('1h', '24h'),
+                        help="show trending headline terms of the last hour (default) or day")
+    parser.add_argument('--top', type=int, default=20, help="number of trending terms to show (default 20)")
+    parser.add_argument('--json', action='store_true', help="print the histogram or trending terms as JSON")
+    parser.add_argument('--rebuild-histogram', action='store_true',
+                        help="recount the histogram from the stored articles")
+    parser.add_argument('--rebuild-trending', type=int, nargs='?', const=7, metavar='DAYS',
+                        help="recreate the trending sketches from the titles of the last DAYS days (default 7)")
+    args = parser.parse_args()
+    if args.span is not None and args.span < 1:
+        parser.error("--span must be at least 1")
+    if args.top < 1:
+        parser.error("--top must be at least 1")
+    if args.rebuild_trending is not None and args.rebuild_trending < 1:
+        parser.error("--rebuild-trending needs at least 1 day")
+
+    # Trending terms come from the sketch file, not the database
+    if args.trending and args.rebuild_trending is None:
+        from trending import trend_report
+        report = trend_report(args.trending, args.top)
+        if args.json:
+            print(json.dumps(report, indent=2))
+        else:
+            print_trending(report)
+        return
+
     # Load environment variables
     env_vars = load_env_file()
 
     # Get database connection
-    connection, db_type = get_db_connection(env_vars)
+    try:
+        connection, db_type = get_db_connection(env_vars)
+    except DatabaseUnavailable as e:
+        print(f"ERROR: {e}")
+        sys.exit(1)
 
     try:
+        if args.rebuild_trending is not None:
+            from trending import rebuild_trending, trend_report
+            read = rebuild_trending(connection, db_type, args.rebuild_trending)
+            print(f"✓ Rebuilt trending sketches from {read:,} title(s) of the last {args.rebuild_trending} day(s)")
+            if args.trending:
+                print_trending(trend_report(args.trending, args.top))
+            return
+
+        if args.rebuild_histogram or args.histogram:
+            from histogram import histogram_available, rebuild_histogram
+            if not histogram_available(connection, db_type):
+                sys.exit(1)
+            if args.rebuild_histogram:
+                print(f"✓ Rebuilt article histogram ({rebuild_histogram(connection, db_type):,} buckets)")
+            if args.histogram:
+                histogram = get_histogram(connection, db_type, args.histogram,
+                                          args.span or DEFAULT_SPANS[args.histogram],
+                                          args.feeds or None, args.by)
+                if args.json:
+                    print(json.dumps(histogram, indent=2))
+                else:
+                    print_histogram(histogram)
+            return
+
         # Get and display statistics
         stats = get_feed_stats(connection, db_type)
         print_stats(stats)
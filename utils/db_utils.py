@@ -6,8 +6,6 @@ Provides database connections, environment loading, and configuration parsing.
 
 import os
 import json
-import sys
-import sqlite3
 from pathlib import Path
 
 # Configuration constants
@@ -15,6 +13,47 @@ SCRIPT_DIR = Path(__file__).resolve().parent
 PROJECT_ROOT = SCRIPT_DIR.parent
 FORCE_SQLITE = False  # Set to True to force SQLite usage
 
+# MySQL connection defaults, overridable in .env (see mysql_connect_args)
+DEFAULT_SQL_PORT = 3306
+DEFAULT_SQL_CONNECT_TIMEOUT = 5
+DEFAULT_SQL_READ_TIMEOUT = 300
+
+# Default SQLite files used by the PHP endpoints
+RESTDB_SQLITE_DEFAULT = '/tmp/restdb.sqlite'
+SETTINGS_SQLITE_DEFAULT = '/tmp/teslacloud_settings.db'
+
+# Consolidated SQLite layout (SQLITE_LAYOUT=consolidated, see sqlite_layout.py):
+# every table lives in exactly one file, tuned for how that file is used.
+# php/util.php mirrors the file names and synchronous settings.
+# Outside the web root: nginx serves the whole project directory
+CONSOLIDATED_SQLITE_DIR_DEFAULT = '/tmp/teslacloud'
+CONSOLIDATED_SQLITE_FILES = {
+    # Read-mostly: many news.php readers, one cron writer
+    'news': {
+        'file': 'news.db',
+        'tables': ('news_articles', 'news_changes', 'article_histogram', 'feed_updates'),
+        'page_size': 8192,
+        'journal_mode': 'wal',
+        'synchronous': 'NORMAL',
+    },
+    # Write-heavy: pings and read markers on every client request
+    'hot': {
+        'file': 'hot.db',
+        'tables': ('key_value', 'read_status_sets', 'ping_data', 'ping_hourly'),
+        'page_size': 4096,
+        'journal_mode': 'wal',
+        'synchronous': 'NORMAL',
+    },
+    # Small and rarely written, but not worth losing
+    'settings': {
+        'file': 'settings.db',
+        'tables': ('user_settings', 'user_ids', 'login_hist'),
+        'page_size': 4096,
+        'journal_mode': 'delete',
+        'synchronous': 'FULL',
+    },
+}
+
 
 def load_env_file(env_path=None):
     """Load environment variables from .env file (JSON or KEY=VALUE)."""
@@ -49,53 +88,161 @@ def load_env_file(env_path=None):
     return env_vars
 
 
+def is_consolidated_sqlite(env_vars):
+    """True when .env selects the consolidated SQLite layout."""
+    return str(env_vars.get('SQLITE_LAYOUT', '')).strip().lower() == 'consolidated'
+
+
+def consolidated_sqlite_path(env_vars, group):
+    """Path of one file of the consolidated layout ('news', 'hot' or 'settings')."""
+    directory = env_vars.get('SQLITE_DIR') or CONSOLIDATED_SQLITE_DIR_DEFAULT
+    return str(Path(directory) / CONSOLIDATED_SQLITE_FILES[group]['file'])
+
+
+def consolidated_sqlite_group(table):
+    """Name of the consolidated file group that owns table, or None."""
+    for group, spec in CONSOLIDATED_SQLITE_FILES.items():
+        if table in spec['tables']:
+            return group
+    return None
+
+
 def resolve_sqlite_path(env_vars):
     """Resolve the filesystem path for the SQLite database."""
+    if is_consolidated_sqlite(env_vars):
+        return consolidated_sqlite_path(env_vars, 'news')
     return env_vars.get('SQLITE_PATH') or str(SCRIPT_DIR / 'news_articles.db')
 
 
-def get_db_connection(env_vars):
+def resolve_restdb_sqlite_path(env_vars):
+    """Resolve the SQLite file holding key_value (rest_db.php and read status)."""
+    if is_consolidated_sqlite(env_vars):
+        return consolidated_sqlite_path(env_vars, 'hot')
+    return env_vars.get('RESTDB_SQLITE_PATH') or RESTDB_SQLITE_DEFAULT
+
+
+def resolve_settings_sqlite_path(env_vars):
+    """Resolve the SQLite file holding user settings and login history."""
+    if is_consolidated_sqlite(env_vars):
+        return consolidated_sqlite_path(env_vars, 'settings')
+    # settings.php does not read a path from .env, so neither do we
+    return SETTINGS_SQLITE_DEFAULT
+
+
+def resolve_table_sqlite_path(env_vars, table):
+    """Resolve the SQLite file a given table is read and written in."""
+    if is_consolidated_sqlite(env_vars) and consolidated_sqlite_group(table):
+        return consolidated_sqlite_path(env_vars, consolidated_sqlite_group(table))
+    if table in ('key_value', 'read_status_sets'):
+        return resolve_restdb_sqlite_path(env_vars)
+    if table in ('user_settings', 'user_ids', 'login_hist'):
+        return resolve_settings_sqlite_path(env_vars)
+    # The legacy layout keeps the ping tables next to the news tables
+    return resolve_sqlite_path(env_vars)
+
+
+def env_number(env_vars, key, default, cast=float):
+    """A numeric .env setting, or default when it is unset or invalid."""
+    value = env_vars.get(key)
+    if value in (None, ''):
+        return default
+    try:
+        return cast(value)
+    except (TypeError, ValueError):
+        print(f"⚠ Ignoring invalid {key}={value!r}, using {default}")
+        return default
+
+
+def mysql_connect_args(env_vars, database=None):
+    """
+    pymysql.connect() arguments from .env: SQL_HOST and SQL_PORT (default
+    3306) with SQL_CONNECT_TIMEOUT (default 5s) and SQL_READ_TIMEOUT, also
+    used for writes (default 300s, long enough for partition DDL).
+    database overrides SQL_DB_NAME.
+    """
+    read_timeout = env_number(env_vars, 'SQL_READ_TIMEOUT', DEFAULT_SQL_READ_TIMEOUT)
+    return {
+        'host': env_vars.get('SQL_HOST'),
+        'port': env_number(env_vars, 'SQL_PORT', DEFAULT_SQL_PORT, int),
+        'user': env_vars.get('SQL_USER'),
+        'password': env_vars.get('SQL_PASS'),
+        'database': database or env_vars.get('SQL_DB_NAME'),
+        'charset': 'utf8mb4',
+        'connect_timeout': env_number(env_vars, 'SQL_CONNECT_TIMEOUT', DEFAULT_SQL_CONNECT_TIMEOUT),
+        'read_timeout': read_timeout,
+        'write_timeout': read_timeout,
+    }
+
+
+def sql_placeholder(db_type):
+    """Parameter placeholder for the backend's DB-API driver."""
+    return '%s' if db_type == 'mysql' else '?'
+
+
+def row_field(row, key, index):
+    """A column from a DictCursor row by name, or a tuple/sqlite3.Row by index."""
+    return row[key] if isinstance(row, dict) else row[index]
+
+
+class DatabaseUnavailable(Exception):
+    """MySQL is configured but pymysql is missing or the server cannot be reached."""
+
+
+def get_db_connection(env_vars, sqlite_path=None, pooled=False):
     """
     Get database connection based on environment variables.
     Returns tuple of (connection, db_type).
     db_type is either 'mysql' or 'sqlite'.
+    sqlite_path overrides the news database file when SQLite is used.
+    With pooled=True a MySQL connection comes from the shared db_pool and
+    goes back to it on close(), so long-running processes reuse it.
+    Raises DatabaseUnavailable when MySQL cannot be used; command-line
+    scripts report it and exit, library callers can keep their work for later.
     """
     # Check for MySQL configuration unless forced to SQLite
     if not FORCE_SQLITE and env_vars.get('SQL_HOST'):
         # MySQL/MariaDB connection
         try:
+            if pooled:
+                from db_pool import get_pool
+                return get_pool(env_vars).connection(), 'mysql'
             import pymysql
             connection = pymysql.connect(
-                host='localhost',
-                user=env_vars.get('SQL_USER'),
-                password=env_vars.get('SQL_PASS'),
-                database=env_vars.get('SQL_DB_NAME'),
-                charset='utf8mb4',
-                cursorclass=pymysql.cursors.DictCursor
+                cursorclass=pymysql.cursors.DictCursor,
+                **mysql_connect_args(env_vars)
             )
             return connection, 'mysql'
-        except ImportError:
-            print("ERROR: pymysql package required for MySQL connection")
-            print("Install with: pip install pymysql")
-            sys.exit(1)
+        except ImportError as e:
+            raise DatabaseUnavailable(
+                "pymysql package required for MySQL connection (install with: pip install pymysql)"
+            ) from e
         except Exception as e:
-            print(f"ERROR: Failed to connect to MySQL: {e}")
-            sys.exit(1)
+            raise DatabaseUnavailable(f"Failed to connect to MySQL: {e}") from e
     else:
         if FORCE_SQLITE:
             print("FORCE_SQLITE enabled - using SQLite database")
-        # SQLite connection (default)
-        db_path = resolve_sqlite_path(env_vars)
+        # SQLite connection (default); imported here so MySQL runs skip it
+        import sqlite3
+        db_path = sqlite_path or resolve_sqlite_path(env_vars)
         connection = sqlite3.connect(db_path)
         connection.row_factory = sqlite3.Row
+        if is_consolidated_sqlite(env_vars):
+            # synchronous is per connection; page size and journal mode are
+            # stored in the file by sqlite_layout.py
+            for group in CONSOLIDATED_SQLITE_FILES:
+                if os.path.abspath(db_path) == os.path.abspath(consolidated_sqlite_path(env_vars, group)):
+                    connection.execute(f"PRAGMA synchronous = {CONSOLIDATED_SQLITE_FILES[group]['synchronous']}")
         return connection, 'sqlite'
 
 
-def load_feed_config():
-    """Load news feed configuration from JSON file."""
-    config_path = PROJECT_ROOT / 'config' / 'news.json'
+def load_news_config():
+    """Load the full news configuration (sections, feeds, fetch settings)."""
+    # Imported here: feed_registry builds on this module
+    from feed_registry import get_registry
+    return get_registry().config
 
-    with open(config_path, 'r') as f:
-        config = json.load(f)
 
-    return config.get('feeds', [])
+def load_feed_config():
+    """Load the validated news feed list (see feed_registry.FeedRegistry)."""
+    from feed_registry import get_registry
+    return get_registry().feeds
@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+"""
+Validated, cached view of config/news.json.
+Parses and validates the feed list once, indexes it by id, category and
+host, and precomputes lifetime and refresh buckets. The file is re-read
+only when its mtime or size changes, so long-running processes can call
+get_registry() freely and still pick up edits.
+"""
+
+import os
+import sys
+import json
+import threading
+
+from db_utils import PROJECT_ROOT
+from fetch_limits import feed_host
+
+CONFIG_PATH = PROJECT_ROOT / 'config' / 'news.json'
+DEFAULT_REFRESH_MINUTES = 60
+
+
+class FeedConfigError(ValueError):
+    """Raised when news.json cannot be used at all (unreadable or malformed)."""
+
+
+def _positive_number(value):
+    """Return value as an int/float if it is a positive number, else raise ValueError."""
+    if isinstance(value, bool):
+        raise ValueError(value)
+    number = float(value)
+    if number != number or number in (float('inf'), float('-inf')):
+        raise ValueError(value)
+    if number <= 0:
+        return None
+    return int(number) if number.is_integer() else number
+
+
+class FeedRegistry:
+    """
+    Feeds from news.json, validated and indexed.
+
+    Feed dicts in self.feeds are copies of the config entries with 'refresh'
+    normalized to minutes (default 60) and 'lifetime' to days, or None for
+    feeds kept forever. Problems that only affect one feed are collected in
+    self.warnings and the feed is kept with a safe value; entries without a
+    usable id, and duplicate ids, are dropped.
+    """
+
+    def __init__(self, path=CONFIG_PATH):
+        self.path = path
+        self._signature = None
+        self._lock = threading.Lock()
+        self.config = {}
+        self.feeds = []
+        self.warnings = []
+        self.by_id = {}
+        self.by_category = {}
+        self.by_host = {}
+        self.lifetime_buckets = {}
+        self.refresh_buckets = {}
+        self.loads = 0
+
+    def _file_signature(self):
+        try:
+            stat = os.stat(self.path)
+        except OSError as e:
+            raise FeedConfigError(f"Cannot read {self.path}: {e}") from e
+        return stat.st_mtime_ns, stat.st_size
+
+    def refresh(self):
+        """Reload the config if the file changed; returns True when it was reloaded."""
+        signature = self._file_signature()
+        if signature == self._signature:
+            return False
+        with self._lock:
+            if signature == self._signature:
+                return False
+            self._load(signature)
+        return True
+
+    def _load(self, signature):
+        try:
+            with open(self.path, 'r') as f:
+                config = json.load(f)
+        except (OSError, ValueError) as e:
+            raise FeedConfigError(f"Cannot parse {self.path}: {e}") from e
+        if not isinstance(config, dict) or not isinstance(config.get('feeds', []), list):
+            raise FeedConfigError(f"{self.path} must be an object with a 'feeds' array")
+
+        sections = {s.get('id') for s in config.get('sections', []) if isinstance(s, dict)}
+        warnings = []
+        feeds = []
+        by_id = {}
+        for index, entry in enumerate(config.get('feeds', [])):
+            feed_id = entry.get('id') if isinstance(entry, dict) else None
+            if not isinstance(feed_id, str) or not feed_id:
+                warnings.append(f"feeds[{index}] has no id; ignored")
+                continue
+            if feed_id in by_id:
+                warnings.append(f"Duplicate feed id '{feed_id}' at feeds[{index}]; ignored")
+                continue
+            feed = self._validate_feed(entry, sections, warnings)
+            feeds.append(feed)
+            by_id[feed_id] = feed
+
+        by_category = {}
+        by_host = {}
+        lifetime_buckets = {}
+        refresh_buckets = {}
+        for feed in feeds:
+            by_category.setdefault(feed.get('category'), []).append(feed)
+            by_host.setdefault(feed_host(feed), []).append(feed)
+            if feed['lifetime'] is not None:
+                lifetime_buckets.setdefault(feed['lifetime'], []).append(feed['id'])
+            refresh_buckets.setdefault(feed['refresh'], []).append(feed['id'])
+
+        self.config = config
+        self.feeds = feeds
+        self.warnings = warnings
+        self.by_id = by_id
+        self.by_category = by_category
+        self.by_host = by_host
+        self.lifetime_buckets = dict(sorted(lifetime_buckets.items()))
+        self.refresh_buckets = dict(sorted(refresh_buckets.items()))
+        self._signature = signature
+        self.loads += 1
+        for warning in warnings:
+            print(f"⚠ news.json: {warning}")
+
+    @staticmethod
+    def _validate_feed(entry, sections, warnings):
+        feed = dict(entry)
+        feed_id = feed['id']
+
+        if not feed.get('url'):
+            warnings.append(f"Feed '{feed_id}' has no url")
+
+        refresh = feed.get('refresh')
+        try:
+            refresh = DEFAULT_REFRESH_MINUTES if refresh is None else _positive_number(refresh)
+            if refresh is None:
+                raise ValueError(feed.get('refresh'))
+        except (TypeError, ValueError):
+            warnings.append(
+                f"Invalid refresh '{feed.get('refresh')}' for feed '{feed_id}', using {DEFAULT_REFRESH_MINUTES} minutes"
+            )
+            refresh = DEFAULT_REFRESH_MINUTES
+        feed['refresh'] = refresh
+
+        # A missing, zero or negative lifetime means keep forever
+        lifetime = feed.get('lifetime')
+        try:
+            lifetime = None if lifetime is None else _positive_number(lifetime)
+        except (TypeError, ValueError):
+            warnings.append(f"Invalid lifetime '{feed.get('lifetime')}' for feed '{feed_id}', never cleaning it up")
+            lifetime = None
+        feed['lifetime'] = lifetime
+
+        if sections and feed.get('category') not in sections:
+            warnings.append(f"Feed '{feed_id}' has unknown category '{feed.get('category')}'")
+        return feed
+
+    def get(self, feed_id):
+        return self.by_id.get(feed_id)
+
+    def select(self, feed_ids):
+        """Return feeds for the given IDs in the caller's order, skipping unknown ones."""
+        return [self.by_id[feed_id] for feed_id in feed_ids if feed_id in self.by_id]
+
+
+_registries = {}
+_registries_lock = threading.Lock()
+
+
+def get_registry(path=CONFIG_PATH):
+    """Return the shared registry for a config file, reloaded if it changed."""
+    with _registries_lock:
+        registry = _registries.get(str(path))
+        if registry is None:
+            registry = _registries[str(path)] = FeedRegistry(path)
+    registry.refresh()
+    return registry
+
+
+def main():
+    """Validate news.json and print a summary of the registry."""
+    try:
+        registry = get_registry()
+    except FeedConfigError as e:
+        print(f"ERROR: {e}")
+        sys.exit(1)
+
+    print(f"✓ {len(registry.feeds)} feed(s) in {len(registry.by_category)} categories "
+          f"across {len(registry.by_host)} host(s)")
+    print("  Refresh buckets: " + ', '.join(
+        f"{minutes:g}m ×{len(ids)}" for minutes, ids in registry.refresh_buckets.items()))
+    print("  Lifetime buckets: " + (', '.join(
+        f"{days:g}d ×{len(ids)}" for days, ids in registry.lifetime_buckets.items()) or "none (keep forever)"))
+    kept = sum(1 for feed in registry.feeds if feed['lifetime'] is None)
+    if kept:
+        print(f"  {kept} feed(s) kept forever")
+    if registry.warnings:
+        print(f"{len(registry.warnings)} warning(s)")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
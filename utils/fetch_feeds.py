@@ -4,20 +4,34 @@ Fetch news feeds and store articles in the database.
 Reads feed definitions from config/news.json and fetches RSS feeds.
 """
 
+import re
 import sys
+import time
+import queue
+import argparse
+import threading
 from datetime import datetime
-from urllib.request import urlopen, Request
-from urllib.error import URLError, HTTPError
 import xml.etree.ElementTree as ET
 from email.utils import parsedate_to_datetime
 
-from db_utils import load_env_file, get_db_connection, load_feed_config
+from db_utils import load_env_file, get_db_connection
+from feed_registry import get_registry
+from http_client import HttpClient, FetchError, format_bytes
+from fetch_limits import HostScheduler, resolve_fetch_settings, print_host_wait_report
+from news_delta import change_log_available, existing_titles, record_article
+from histogram import histogram_available, record_articles
+from url_canon import canonical_url, url_hash, url_hash_mode
+from partitions import is_partitioned
+from ingest_validate import validate_articles, merge_counts, format_counts
+from ingest_journal import JournalWriter, journal_enabled, journal_dir, load_journal, print_load_summary
+import profiling
+import trending
 
 
 def parse_date(date_string):
-    """Parse various date formats to datetime object."""
+    """Parse various date formats to datetime object, or None if missing or unparseable."""
     if not date_string:
-        return datetime.now()
+        return None
     
     try:
         # Try RFC 2822 format (common in RSS)
@@ -25,35 +39,40 @@ def parse_date(date_string):
     except (TypeError, ValueError):
         pass
     
-    # Try ISO 8601 format
+    # Try ISO 8601 format (Atom), keeping the offset for ingest_validate to convert
     try:
-        # Remove timezone info for simplicity, parse as UTC
-        date_string = date_string.split('.')[0]  # Remove microseconds
-        date_string = date_string.replace('Z', '+00:00')
-        if '+' in date_string or date_string.endswith('00:00'):
-            date_string = date_string.split('+')[0].split('-')[0]
+        date_string = re.sub(r'\.\d+', '', date_string.strip())  # Remove fractional seconds
+        date_string = re.sub(r'Z$', '+00:00', date_string)
         return datetime.fromisoformat(date_string)
     except (ValueError, AttributeError):
         pass
     
-    # Fallback to current time
-    return datetime.now()
+    # Left to ingest_validate, which clamps it to the fetch time and counts it
+    return None
+
 
+def fetch_rss_feed(url, timeout=10, client=None):
+    """
+    Fetch RSS feed from URL.
 
-def fetch_rss_feed(url, timeout=10):
-    """Fetch RSS feed from URL."""
+    Uses the given HttpClient so feeds on the same host share keep-alive
+    connections; a one-off client is created when none is supplied.
+    Returns a tuple of (xml_data, transfer) where xml_data is None on failure.
+    """
+    own_client = client is None
+    if own_client:
+        client = HttpClient(timeout=timeout)
     try:
-        req = Request(url, headers={
-            'User-Agent': 'Mozilla/5.0 (compatible; RSS Reader/1.0)'
-        })
-        with urlopen(req, timeout=timeout) as response:
-            return response.read()
-    except (URLError, HTTPError) as e:
+        return client.fetch(url)
+    except FetchError as e:
         print(f"  ✗ Failed to fetch feed: {e}")
-        return None
+        return None, None
     except Exception as e:
         print(f"  ✗ Error fetching feed: {e}")
-        return None
+        return None, None
+    finally:
+        if own_client:
+            client.close()
 
 
 def parse_rss_feed(xml_data):
@@ -73,7 +92,8 @@ def parse_rss_feed(xml_data):
                 articles.append({
                     'title': title.text or 'No Title',
                     'url': link.text or '',
-                    'date': parse_date(pub_date.text if pub_date is not None else None)
+                    'date': parse_date(pub_date.text if pub_date is not None else None),
+                    'date_text': pub_date.text if pub_date is not None else None
                 })
         
         # Handle Atom format
@@ -94,7 +114,8 @@ def parse_rss_feed(xml_data):
                     articles.append({
                         'title': title.text or 'No Title',
                         'url': link_href,
-                        'date': parse_date(pub_date.text if pub_date is not None else None)
+                        'date': parse_date(pub_date.text if pub_date is not None else None),
+                        'date_text': pub_date.text if pub_date is not None else None
                     })
     
     except ET.ParseError as e:
@@ -104,39 +125,109 @@ def parse_rss_feed(xml_data):
     return articles
 
 
-def store_articles(connection, db_type, feed_id, articles):
-    """Store articles in database."""
+def store_articles(connection, db_type, feed_id, articles, commit=True, raise_errors=False, hash_mode=None):
+    """
+    Store articles in database, logging new and retitled ones for delta
+    polling and counting new ones in the article histogram. Once
+    url_canon.py --migrate has made (feed_id, url_hash) the article key,
+    URLs are stored canonical and keyed by url_hash; before that they are
+    stored as fetched, since canonicalizing would miss the rows already
+    keyed on (feed_id, url), and url_hash is only filled in if present.
+    hash_mode is url_canon.url_hash_mode(), looked up when not given;
+    callers storing many feeds pass it once per run.
+    Titles of new articles are queued for trending.flush().
+    On partitioned MySQL the article key includes published_date (see
+    partitions.py), so known articles are updated in place, keeping their
+    first-seen date, rather than inserted again.
+    With commit=False the caller commits, e.g. once per journal batch.
+    A failing article is reported and skipped, or with raise_errors=True
+    raised so the caller can roll the whole batch back.
+    """
     cursor = connection.cursor()
     stored_count = 0
+    log_changes = change_log_available(connection, db_type)
+    count_new = histogram_available(connection, db_type)
+    track_trends = trending.enabled()
+    update_known = db_type == 'mysql' and is_partitioned(connection, db_type)
+    if hash_mode is None:
+        hash_mode = url_hash_mode(connection, db_type)
+    keyed = hash_mode == 'key'
+    hashed = hash_mode != 'raw'
+    articles = [dict(article) for article in articles]
+    for article in articles:
+        if keyed:
+            article['url'] = canonical_url(article['url'])
+        article['hash'] = url_hash(article['url']) if hashed else None
+        article['key'] = article['hash'] if keyed else article['url']
+    known_titles = {}
+    if log_changes or count_new or track_trends or update_known:
+        known_titles = existing_titles(connection, db_type, feed_id, {a['key'] for a in articles},
+                                       column='url_hash' if keyed else 'url')
+    new_dates = []
+    columns = 'feed_id, url, title, published_date' + (', url_hash' if hashed else '')
+    placeholder = '%s' if db_type == 'mysql' else '?'
+    values = ', '.join([placeholder] * (5 if hashed else 4))
+    if db_type == 'mysql':
+        sql = f"""
+            INSERT INTO news_articles ({columns})
+            VALUES ({values})
+            ON DUPLICATE KEY UPDATE title = VALUES(title)
+        """
+        update_sql = f"""
+            UPDATE news_articles SET title = %s
+            WHERE feed_id = %s AND {'url_hash' if keyed else 'url'} = %s
+        """
+    else:
+        sql = f"""
+            INSERT OR REPLACE INTO news_articles ({columns})
+            VALUES ({values})
+        """
     
     for article in articles:
         try:
-            if db_type == 'mysql':
-                cursor.execute("""
-                    INSERT INTO news_articles (feed_id, url, title, published_date)
-                    VALUES (%s, %s, %s, %s)
-                    ON DUPLICATE KEY UPDATE title = VALUES(title)
-                """, (feed_id, article['url'], article['title'], article['date']))
+            if update_known and article['key'] in known_titles:
+                cursor.execute(update_sql, (article['title'], feed_id, article['key']))
             else:
-                cursor.execute("""
-                    INSERT OR REPLACE INTO news_articles (feed_id, url, title, published_date)
-                    VALUES (?, ?, ?, ?)
-                """, (feed_id, article['url'], article['title'], article['date']))
+                params = (feed_id, article['url'], article['title'], article['date'])
+                cursor.execute(sql, params + ((article['hash'],) if hashed else ()))
             
-            if cursor.rowcount > 0:
+            # REPLACE always writes a row, but through the partitioned SQLite
+            # view (see partitions.py) rowcount reports 0
+            if cursor.rowcount > 0 or db_type != 'mysql':
                 stored_count += 1
+            
+            previous_title = known_titles.get(article['key'])
+            if article['key'] not in known_titles:
+                new_dates.append(article['date'])
+                if track_trends:
+                    trending.observe(article['title'], article['date'])
+            if log_changes and previous_title != article['title']:
+                record_article(cursor, db_type, feed_id, article['url'], article['title'], article['date'],
+                               previous_title)
+            known_titles[article['key']] = article['title']
         except Exception as e:
+            if raise_errors:
+                raise
             print(f"  ✗ Error storing article: {e}")
             continue
     
-    connection.commit()
+    if count_new and new_dates:
+        try:
+            record_articles(cursor, db_type, feed_id, new_dates)
+        except Exception as e:
+            if raise_errors:
+                raise
+            print(f"  ⚠ Could not update article histogram: {e}")
+    
+    if commit:
+        connection.commit()
     return stored_count
 
 
-def update_feed_timestamp(connection, db_type, feed_id):
-    """Update the last_updated timestamp for a feed."""
+def update_feed_timestamp(connection, db_type, feed_id, now=None, commit=True):
+    """Update the last_updated timestamp for a feed (to now, or when it was fetched)."""
     cursor = connection.cursor()
-    now = datetime.now()
+    now = now or datetime.now()
     
     try:
         if db_type == 'mysql':
@@ -154,82 +245,261 @@ def update_feed_timestamp(connection, db_type, feed_id):
                 VALUES (?, ?, ?, COALESCE((SELECT update_count FROM feed_updates WHERE feed_id = ?), 0) + 1)
             """, (feed_id, now, now, feed_id))
         
-        connection.commit()
+        if commit:
+            connection.commit()
     except Exception as e:
         print(f"  ✗ Error updating timestamp: {e}")
 
 
-def fetch_feed(connection, db_type, feed):
-    """Fetch a single feed and store its articles."""
+def download_feed(feed, client):
+    """
+    Download and parse a single feed without touching the database.
+
+    Safe to call from worker threads. Returns a result dict with the feed,
+    the parsed articles that passed ingest_validate, its rejection and
+    clamp counts, transfer figures and an error message on failure.
+    """
+    result = {'feed': feed, 'articles': [], 'validation': None, 'transfer': None, 'error': None}
     feed_id = feed.get('id')
-    feed_name = feed.get('name', feed_id)
-    feed_url = feed.get('url')
-    
-    print(f"  Fetching {feed_id}...")
-    
-    # Fetch the RSS feed
-    xml_data = fetch_rss_feed(feed_url)
-    if not xml_data:
+    try:
+        with profiling.span(feed_id, 'fetch'):
+            xml_data, transfer = client.fetch(feed.get('url'))
+        result['transfer'] = transfer
+    except FetchError as e:
+        result['error'] = f"Failed to fetch feed: {e}"
+        return result
+    except Exception as e:
+        result['error'] = f"Error fetching feed: {e}"
+        return result
+
+    with profiling.span(feed_id, 'parse'):
+        parsed = parse_rss_feed(xml_data)
+        result['articles'], result['validation'] = validate_articles(feed, parsed)
+    if not parsed:
+        result['error'] = "No articles found"
+    elif not result['articles']:
+        result['error'] = f"No valid articles ({format_counts(result['validation'])})"
+    return result
+
+
+def report_feed_result(result):
+    """Print the transfer and any error of a downloaded feed. Returns True if it succeeded."""
+    feed_id = result['feed'].get('id')
+    transfer = result['transfer']
+
+    print(f"  Fetched {feed_id}")
+    if transfer:
+        print(
+            f"  ↓ {format_bytes(transfer['wire_bytes'])} on wire, "
+            f"{format_bytes(transfer['decoded_bytes'])} decoded ({transfer['encoding']}"
+            f"{', reused connection' if transfer['reused'] else ''})"
+        )
+    if result['error']:
+        print(f"  ✗ {result['error']}")
         return False
-    
-    # Parse the feed
-    articles = parse_rss_feed(xml_data)
-    if not articles:
-        print(f"  ✗ No articles found")
+    validation = format_counts(result['validation']) if result.get('validation') else ''
+    if validation:
+        print(f"  ⚠ Validation: {validation}")
+    return True
+
+
+def store_feed_result(connection, db_type, result, hash_mode=None):
+    """Report a downloaded feed and store its articles. Returns True on success."""
+    if not report_feed_result(result):
         return False
-    
+
     # Store articles
-    stored_count = store_articles(connection, db_type, feed_id, articles)
-    print(f"  ✓ Stored {stored_count} articles (fetched {len(articles)})")
-    
-    # Update feed timestamp
-    update_feed_timestamp(connection, db_type, feed_id)
-    
+    feed_id = result['feed'].get('id')
+    articles = result['articles']
+    with profiling.span(feed_id, 'store'):
+        stored_count = store_articles(connection, db_type, feed_id, articles, hash_mode=hash_mode)
+        print(f"  ✓ Stored {stored_count} articles (fetched {len(articles)})")
+
+        # Update feed timestamp
+        update_feed_timestamp(connection, db_type, feed_id)
+
     return True
 
 
-def fetch_feeds(feed_ids=None):
+def journal_feed_result(writer, result):
+    """Report a downloaded feed and append its articles to the ingest journal."""
+    if not report_feed_result(result):
+        return False
+    feed_id = result['feed'].get('id')
+    with profiling.span(feed_id, 'store'):
+        writer.append_feed(feed_id, result['articles'])
+    print(f"  ✓ Journaled {len(result['articles'])} articles")
+    return True
+
+
+def fetch_feed(connection, db_type, feed, client=None):
+    """Fetch a single feed and store its articles."""
+    own_client = client is None
+    if own_client:
+        client = HttpClient()
+    try:
+        result = download_feed(feed, client)
+    finally:
+        if own_client:
+            client.close()
+    return store_feed_result(connection, db_type, result)
+
+
+def _fetch_worker(scheduler, client, results):
+    """Worker loop: take feeds from the scheduler until none are left."""
+    with profiling.thread_scope():
+        while True:
+            item = scheduler.next()
+            if item is None:
+                # Tell the consumer this worker has finished
+                results.put(None)
+                return
+            feed, host, delay = item
+            if delay > 0:
+                time.sleep(delay)
+            try:
+                result = download_feed(feed, client)
+            except Exception as e:
+                result = {'feed': feed, 'articles': [], 'validation': None, 'transfer': None,
+                          'error': f"Error processing feed: {e}"}
+            finally:
+                scheduler.done(host)
+            results.put(result)
+
+
+def fetch_feeds(feed_ids=None, stop_at=None, deferred=None, journal=None):
     """
     Fetch specified feeds or all feeds if feed_ids is None.
 
+    Downloads run in parallel worker threads under the global concurrency
+    budget and per-host politeness limits; all database writes happen on
+    the calling thread as results arrive. In journal mode results are
+    appended to the ingest journal instead and loaded once fetching is
+    done, so a database outage does not stall or lose the fetches.
+
     Args:
-        feed_ids: List of feed IDs to fetch, or None to fetch all feeds
+        feed_ids: List of feed IDs to fetch in priority order, or None to fetch all feeds
+        stop_at: Optional time.monotonic() deadline after which no new fetch is started
+        deferred: Optional list that receives the IDs of feeds not started before stop_at
+        journal: Route results through the ingest journal (default: INGEST_JOURNAL in .env)
     """
-    # Load environment and get DB connection
+    # Load environment and get DB connection (journal mode connects only to load)
     env_vars = load_env_file()
-    connection, db_type = get_db_connection(env_vars)
+    if journal is None:
+        journal = journal_enabled(env_vars)
+    if journal:
+        connection, db_type, hash_mode = None, None, None
+        writer = JournalWriter(journal_dir(env_vars))
+    else:
+        connection, db_type = get_db_connection(env_vars, pooled=True)
+        # The article key only changes under url_canon.py --migrate; look it up once per run
+        hash_mode = url_hash_mode(connection, db_type)
     
     # Load feed configuration
-    feeds = load_feed_config()
+    registry = get_registry()
+    settings = resolve_fetch_settings(registry.config, env_vars)
     
-    # Filter feeds if specific IDs requested
-    if feed_ids:
-        feeds = [f for f in feeds if f.get('id') in feed_ids]
+    # Filter feeds if specific IDs requested, keeping the caller's order
+    feeds = registry.select(feed_ids) if feed_ids else registry.feeds
     
-    print(f"Fetching {len(feeds)} feed(s)...")
+    worker_count = max(min(settings['maxConcurrency'], len(feeds)), 1)
+    print(
+        f"Fetching {len(feeds)} feed(s) with {worker_count} worker(s) "
+        f"(per-host limit {settings['perHostLimit']}, spacing {settings['hostSpacingSeconds']:g}s)..."
+    )
     
+    scheduler = HostScheduler(
+        feeds,
+        per_host_limit=settings['perHostLimit'],
+        host_spacing=settings['hostSpacingSeconds'],
+        prioritized=stop_at is not None,
+        stop_at=stop_at
+    )
+    results = queue.Queue()
     success_count = 0
-    for feed in feeds:
-        try:
-            if fetch_feed(connection, db_type, feed):
-                success_count += 1
-        except Exception as e:
-            print(f"  ✗ Error processing feed: {e}")
-            continue
+    validation_total = {'rejected': {}, 'clamped': {}}
+    with HttpClient(max_idle_per_host=settings['perHostLimit']) as client:
+        workers = [
+            threading.Thread(target=_fetch_worker, args=(scheduler, client, results), daemon=True)
+            for _ in range(worker_count)
+        ]
+        for worker in workers:
+            worker.start()
+        
+        finished_workers = 0
+        while finished_workers < worker_count:
+            result = results.get()
+            if result is None:
+                finished_workers += 1
+                continue
+            if result.get('validation'):
+                merge_counts(validation_total, result['validation'])
+            try:
+                if journal:
+                    stored = journal_feed_result(writer, result)
+                else:
+                    stored = store_feed_result(connection, db_type, result, hash_mode)
+                if stored:
+                    success_count += 1
+            except Exception as e:
+                print(f"  ✗ Error processing feed: {e}")
+                continue
+        
+        for worker in workers:
+            worker.join()
+        transfer_stats = dict(client.stats)
     
-    connection.close()
+    if journal:
+        writer.close()
+        print(f"\nJournaled {writer.records} feed(s) with {writer.fsyncs} fsync(s); loading...")
+        print_load_summary(load_journal(env_vars))
+    else:
+        connection.close()
+        trending.flush()
+    
+    skipped = [feed.get('id') for feed in scheduler.pending()]
+    if deferred is not None:
+        deferred.extend(skipped)
     
     print(f"\nCompleted: {success_count}/{len(feeds)} feeds fetched successfully")
+    if skipped:
+        print(f"Deferred {len(skipped)} feed(s) at deadline: {', '.join(skipped)}")
+    validation = format_counts(validation_total)
+    print(f"Validation: {validation}" if validation else "Validation: all items accepted")
+    print_transfer_summary(transfer_stats)
+    print_host_wait_report(scheduler.host_stats)
     return success_count
 
 
+def print_transfer_summary(stats):
+    """Print aggregate network transfer figures for a fetch run."""
+    if not stats['requests']:
+        return
+    wire = stats['wire_bytes']
+    decoded = stats['decoded_bytes']
+    ratio = f" ({decoded / wire:.1f}x compression)" if wire else ""
+    print(
+        f"Transfer: {stats['requests']} request(s) over {stats['connections_opened']} connection(s), "
+        f"{stats['connections_reused']} reused; "
+        f"{format_bytes(wire)} on wire, {format_bytes(decoded)} decoded{ratio}"
+    )
+
+
 def main():
     """Main function."""
-    # Check for command line arguments (specific feed IDs)
-    feed_ids = sys.argv[1:] if len(sys.argv) > 1 else None
+    parser = argparse.ArgumentParser(description="Fetch news feeds and store their articles.")
+    parser.add_argument('feeds', nargs='*', help="feed IDs to fetch (default: all feeds)")
+    parser.add_argument('--journal', action='store_true', default=None,
+                        help="append results to the ingest journal and load it afterwards (default: INGEST_JOURNAL)")
+    parser.add_argument('--profile', nargs='?', const='cprofile', choices=profiling.PROFILE_MODES,
+                        help="profile the run: cProfile .pstats (default) or sampled .collapsed stacks")
+    parser.add_argument('--profile-dir', default=None,
+                        help=f"directory for profile files (default {profiling.DEFAULT_PROFILE_DIR})")
+    args = parser.parse_args()
     
     try:
-        fetch_feeds(feed_ids)
+        with profiling.profiled_run(args.profile, args.profile_dir, 'fetch_feeds'):
+            fetch_feeds(args.feeds or None, journal=args.journal)
     except Exception as e:
         print(f"ERROR: {e}")
         sys.exit(1)
@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+"""
+Politeness limits for parallel feed fetching.
+Enforces a global in-flight budget, a per-host concurrency limit and a
+minimum spacing between requests to the same host, and hands feeds to
+workers in the order that keeps the limits cheapest in wall-clock time.
+"""
+
+import threading
+import time
+from urllib.parse import urlsplit
+
+DEFAULT_MAX_CONCURRENCY = 8
+DEFAULT_PER_HOST_LIMIT = 2
+DEFAULT_HOST_SPACING_SECONDS = 1.0
+
+# .env keys that override the "fetch" block of config/news.json
+ENV_SETTINGS = {
+    'FETCH_MAX_CONCURRENCY': 'maxConcurrency',
+    'FETCH_PER_HOST_LIMIT': 'perHostLimit',
+    'FETCH_HOST_SPACING': 'hostSpacingSeconds',
+}
+
+
+def resolve_fetch_settings(config, env_vars):
+    """
+    Build fetch limit settings from the news.json "fetch" block and .env.
+
+    Values from .env take precedence. Invalid values fall back to defaults
+    with a warning rather than aborting the run.
+    """
+    settings = {
+        'maxConcurrency': DEFAULT_MAX_CONCURRENCY,
+        'perHostLimit': DEFAULT_PER_HOST_LIMIT,
+        'hostSpacingSeconds': DEFAULT_HOST_SPACING_SECONDS,
+    }
+    overrides = dict((config or {}).get('fetch') or {})
+    for env_key, setting_key in ENV_SETTINGS.items():
+        if env_vars.get(env_key) not in (None, ''):
+            overrides[setting_key] = env_vars[env_key]
+
+    for key, value in overrides.items():
+        if key not in settings:
+            continue
+        try:
+            parsed = float(value) if key == 'hostSpacingSeconds' else int(value)
+        except (TypeError, ValueError):
+            print(f"⚠ Invalid fetch setting {key}='{value}', using {settings[key]}")
+            continue
+        if parsed < 0 or (key != 'hostSpacingSeconds' and parsed < 1):
+            print(f"⚠ Out-of-range fetch setting {key}='{value}', using {settings[key]}")
+            continue
+        settings[key] = parsed
+
+    return settings
+
+
+def feed_host(feed):
+    """Return the lowercase host name a feed is fetched from."""
+    return (urlsplit(feed.get('url') or '').hostname or '').lower()
+
+
+class HostScheduler:
+    """
+    Hand out feeds to fetch workers while respecting per-host limits.
+
+    Workers call next() to receive (feed, host, delay); they must sleep for
+    delay seconds before starting the request and call done(host) when it
+    finishes. Time a feed spends blocked on its host's limits is recorded in
+    self.host_stats so the run report can show it per host.
+
+    With prioritized=True the order of the feeds list is honoured ahead of
+    host backlog. With stop_at (a time.monotonic() value) no request is
+    started after that moment; feeds left over are returned by pending().
+    """
+
+    def __init__(self, feeds, per_host_limit=DEFAULT_PER_HOST_LIMIT,
+                 host_spacing=DEFAULT_HOST_SPACING_SECONDS,
+                 prioritized=False, stop_at=None):
+        self.per_host_limit = per_host_limit
+        self.host_spacing = host_spacing
+        self.prioritized = prioritized
+        self.stop_at = stop_at
+        self._rank = {}
+        self._pending = {}
+        for index, feed in enumerate(feeds):
+            self._rank[id(feed)] = index
+            self._pending.setdefault(feed_host(feed), []).append(feed)
+        self._active = {host: 0 for host in self._pending}
+        self._next_start = {host: 0.0 for host in self._pending}
+        self.host_stats = {
+            host: {'feeds': len(queue), 'wait_seconds': 0.0}
+            for host, queue in self._pending.items()
+        }
+        self._condition = threading.Condition()
+
+    def _pick_host(self, now):
+        """Return the best host to start next, or None if all are at their limit."""
+        best = None
+        best_key = None
+        for host, queue in self._pending.items():
+            if not queue or self._active[host] >= self.per_host_limit:
+                continue
+            # Prefer hosts that can start soonest, then those with the longest
+            # backlog since they bound the total run time.
+            delay = max(self._next_start[host] - now, 0.0)
+            if self.prioritized:
+                key = (delay, self._rank[id(queue[0])], -len(queue))
+            else:
+                key = (delay, -len(queue))
+            if best_key is None or key < best_key:
+                best, best_key = host, key
+        return best
+
+    def next(self):
+        """Reserve the next feed to fetch; returns None once nothing is pending."""
+        requested_at = time.monotonic()
+        with self._condition:
+            while True:
+                if not any(self._pending.values()):
+                    return None
+                now = time.monotonic()
+                if self.stop_at is not None and now >= self.stop_at:
+                    return None
+                host = self._pick_host(now)
+                if host is not None:
+                    break
+                timeout = None if self.stop_at is None else self.stop_at - now
+                self._condition.wait(timeout)
+
+            start_at = max(self._next_start[host], now)
+            if self.stop_at is not None and start_at >= self.stop_at:
+                # Spacing would push this request past the deadline
+                return None
+            self._next_start[host] = start_at + self.host_spacing
+            self._active[host] += 1
+            feed = self._pending[host].pop(0)
+            delay = start_at - now
+            self.host_stats[host]['wait_seconds'] += (now - requested_at) + delay
+        return feed, host, delay
+
+    def pending(self):
+        """Return feeds that were never handed out, in their original order."""
+        with self._condition:
+            remaining = [feed for queue in self._pending.values() for feed in queue]
+        return sorted(remaining, key=lambda feed: self._rank[id(feed)])
+
+    def done(self, host):
+        """Release the host slot held by a finished request."""
+        with self._condition:
+            self._active[host] -= 1
+            self._condition.notify_all()
+
+
+def print_host_wait_report(host_stats):
+    """Print time spent waiting on politeness limits for each host."""
+    if not host_stats:
+        return
+    total_wait = sum(stat['wait_seconds'] for stat in host_stats.values())
+    print(f"Host limit waits: {total_wait:.1f}s total")
+    ordered = sorted(host_stats.items(), key=lambda item: (-item[1]['wait_seconds'], item[0]))
+    for host, stat in ordered:
+        print(f"  {host or '(no host)':<32} {stat['feeds']:>3} feed(s)  {stat['wait_seconds']:6.1f}s waiting")
@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+"""
+Pre-aggregated article histograms.
+store_articles() adds each new article to hourly and daily per-feed count
+buckets in article_histogram, keyed by published_date (UTC). Cleanup trims
+old hourly buckets but never decrements counts, so trends outlive article
+retention. db_stats.py --histogram renders the buckets without scanning
+news_articles.
+"""
+
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+
+from db_utils import row_field, sql_placeholder
+
+HISTOGRAM_TABLE = 'article_histogram'
+BUCKET_STEPS = {'hour': timedelta(hours=1), 'day': timedelta(days=1)}
+DEFAULT_HOURLY_DAYS = 30
+DEFAULT_DAILY_DAYS = 0  # 0 keeps daily buckets forever
+
+_missing_reported = False
+
+
+def utc_naive(value):
+    """Aware datetimes in UTC without tzinfo; naive ones are taken as UTC already."""
+    if value.tzinfo is not None:
+        return value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def bucket_start(value, bucket):
+    """Start of the hour or day holding value."""
+    value = utc_naive(value)
+    if bucket == 'day':
+        return value.replace(hour=0, minute=0, second=0, microsecond=0)
+    return value.replace(minute=0, second=0, microsecond=0)
+
+
+def _format_bucket(value):
+    return value.strftime('%Y-%m-%d %H:00:00')
+
+
+def _parse_bucket(value):
+    if isinstance(value, datetime):
+        return value
+    return datetime.strptime(str(value)[:19], '%Y-%m-%d %H:%M:%S')
+
+
+def histogram_available(connection, db_type):
+    """True when article_histogram exists; rerun setup_tables.py to create it."""
+    global _missing_reported
+    cursor = connection.cursor()
+    if db_type == 'mysql':
+        cursor.execute("""
+            SELECT COUNT(*) AS count FROM information_schema.tables
+            WHERE table_schema = DATABASE() AND table_name = %s
+        """, (HISTOGRAM_TABLE,))
+        available = row_field(cursor.fetchone(), 'count', 0) > 0
+    else:
+        cursor.execute("SELECT COUNT(*) FROM sqlite_master WHERE type='table' AND name=?", (HISTOGRAM_TABLE,))
+        available = cursor.fetchone()[0] > 0
+    if not available and not _missing_reported:
+        print(f"⚠ {HISTOGRAM_TABLE} table missing; run setup_tables.py to enable histograms")
+        _missing_reported = True
+    return available
+
+
+def _upsert_sql(db_type):
+    p = sql_placeholder(db_type)
+    insert = f"""
+        INSERT INTO {HISTOGRAM_TABLE} (bucket, bucket_start, feed_id, article_count)
+        VALUES ({p}, {p}, {p}, {p})
+    """
+    if db_type == 'mysql':
+        return insert + " ON DUPLICATE KEY UPDATE article_count = article_count + VALUES(article_count)"
+    return insert + """
+        ON CONFLICT(bucket, bucket_start, feed_id) DO UPDATE SET
+            article_count = article_count + excluded.article_count
+    """
+
+
+def record_articles(cursor, db_type, feed_id, published_dates):
+    """Add newly stored articles of one feed to their hourly and daily buckets."""
+    counts = Counter()
+    for published in published_dates:
+        if not isinstance(published, datetime):
+            continue
+        for bucket in BUCKET_STEPS:
+            counts[(bucket, _format_bucket(bucket_start(published, bucket)))] += 1
+    if counts:
+        cursor.executemany(_upsert_sql(db_type), [
+            (bucket, start, feed_id, count) for (bucket, start), count in counts.items()
+        ])
+
+
+def rebuild_histogram(connection, db_type):
+    """
+    Recount every bucket from the articles currently stored.
+
+    Use this to fill the table once after creating it. Counts for articles
+    already removed by cleanup are lost. Returns the number of buckets written.
+    """
+    cursor = connection.cursor()
+    if db_type == 'mysql':
+        formats = {'hour': "DATE_FORMAT(published_date, '%%Y-%%m-%%d %%H:00:00')",
+                   'day': "DATE_FORMAT(published_date, '%%Y-%%m-%%d 00:00:00')"}
+    else:
+        # strftime() normalizes stored UTC offsets to UTC
+        formats = {'hour': "strftime('%Y-%m-%d %H:00:00', published_date)",
+                   'day': "strftime('%Y-%m-%d 00:00:00', published_date)"}
+    cursor.execute(f"DELETE FROM {HISTOGRAM_TABLE}")
+    for bucket, expression in formats.items():
+        cursor.execute(f"""
+            INSERT INTO {HISTOGRAM_TABLE} (bucket, bucket_start, feed_id, article_count)
+            SELECT {sql_placeholder(db_type)}, {expression} AS start, feed_id, COUNT(*)
+            FROM news_articles
+            WHERE published_date IS NOT NULL
+            GROUP BY start, feed_id
+        """, (bucket,))
+    cursor.execute(f"SELECT COUNT(*) AS count FROM {HISTOGRAM_TABLE}")
+    written = row_field(cursor.fetchone(), 'count', 0)
+    connection.commit()
+    return written
+
+
+def _env_days(env_vars, key, default):
+    value = env_vars.get(key)
+    if value in (None, ''):
+        return default
+    try:
+        days = float(value)
+    except (TypeError, ValueError):
+        print(f"⚠ Invalid {key}='{value}', using {default} days")
+        return default
+    return days if days >= 0 else default
+
+
+def prune_histogram(connection, db_type, env_vars, now=None):
+    """
+    Delete hourly buckets older than HISTOGRAM_HOURLY_DAYS (default 30) and
+    daily ones older than HISTOGRAM_DAILY_DAYS (default 0, keep forever).
+    Returns the number of buckets removed.
+    """
+    now = now or datetime.now(timezone.utc).replace(tzinfo=None)
+    retention = {
+        'hour': _env_days(env_vars, 'HISTOGRAM_HOURLY_DAYS', DEFAULT_HOURLY_DAYS),
+        'day': _env_days(env_vars, 'HISTOGRAM_DAILY_DAYS', DEFAULT_DAILY_DAYS),
+    }
+    p = sql_placeholder(db_type)
+    cursor = connection.cursor()
+    removed = 0
+    for bucket, days in retention.items():
+        if days <= 0:
+            continue
+        cursor.execute(f"""
+            DELETE FROM {HISTOGRAM_TABLE} WHERE bucket = {p} AND bucket_start < {p}
+        """, (bucket, _format_bucket(bucket_start(now - timedelta(days=days), bucket))))
+        removed += cursor.rowcount or 0
+    connection.commit()
+    return removed
+
+
+def window(bucket, span, now=None):
+    """The `span` bucket starts ending with the current bucket, oldest first."""
+    now = now or datetime.now(timezone.utc).replace(tzinfo=None)
+    step = BUCKET_STEPS[bucket]
+    last = bucket_start(now, bucket)
+    return [last - step * offset for offset in range(span - 1, -1, -1)]
+
+
+def query_histogram(connection, db_type, bucket, starts, feed_ids=None):
+    """Return {(feed_id, bucket_start): count} for the given window."""
+    p = sql_placeholder(db_type)
+    params = [bucket, _format_bucket(starts[0]), _format_bucket(starts[-1])]
+    feed_filter = ''
+    if feed_ids:
+        feed_filter = f"AND feed_id IN ({', '.join([p] * len(feed_ids))})"
+        params.extend(feed_ids)
+    cursor = connection.cursor()
+    cursor.execute(f"""
+        SELECT feed_id, bucket_start, article_count
+        FROM {HISTOGRAM_TABLE}
+        WHERE bucket = {p} AND bucket_start >= {p} AND bucket_start <= {p} {feed_filter}
+    """, params)
+    return {
+        (row_field(row, 'feed_id', 0), _parse_bucket(row_field(row, 'bucket_start', 1))): int(row_field(row, 'article_count', 2))
+        for row in cursor.fetchall()
+    }
+
+
+def build_series(counts, starts, group_of):
+    """
+    Fold per-feed counts into series.
+
+    group_of maps a feed_id to its series name (the feed, its category or
+    one total). Returns [{'name', 'total', 'counts'}], busiest first.
+    """
+    index = {start: position for position, start in enumerate(starts)}
+    series = {}
+    for (feed_id, start), count in counts.items():
+        if start not in index:
+            continue
+        name = group_of(feed_id)
+        series.setdefault(name, [0] * len(starts))[index[start]] += count
+    result = [{'name': name, 'total': sum(values), 'counts': values} for name, values in series.items()]
+    result.sort(key=lambda item: (-item['total'], str(item['name'])))
+    return result
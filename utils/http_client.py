@@ -0,0 +1,319 @@
+#!/usr/bin/env python3
+"""
+Keep-alive HTTP client used by the feed fetchers.
+Pools persistent connections per host, negotiates gzip/deflate and
+decompresses response bodies as a stream with a hard size cap.
+HTTP_PROXY/HTTPS_PROXY/NO_PROXY are honored like urlopen() does: plain
+HTTP goes to the proxy with absolute URLs, HTTPS is tunneled with CONNECT.
+"""
+
+import base64
+import threading
+import zlib
+import http.client
+from urllib.parse import urlsplit, urljoin, unquote
+from urllib.request import getproxies, proxy_bypass
+
+USER_AGENT = 'Mozilla/5.0 (compatible; RSS Reader/1.0)'
+DEFAULT_TIMEOUT = 10
+DEFAULT_MAX_BYTES = 10 * 1024 * 1024  # Decoded body cap per response
+MAX_IDLE_PER_HOST = 4
+MAX_REDIRECTS = 5
+READ_CHUNK_SIZE = 64 * 1024
+
+# Errors that mean a pooled keep-alive connection was closed by the server
+STALE_CONNECTION_ERRORS = (
+    http.client.RemoteDisconnected,
+    http.client.BadStatusLine,
+    ConnectionResetError,
+    BrokenPipeError,
+)
+
+
+class FetchError(Exception):
+    """
+    Raised when a URL cannot be fetched or its body is rejected.
+
+    HTTP error responses carry their status and Retry-After header.
+    """
+
+    def __init__(self, message, status=None, retry_after=None):
+        super().__init__(message)
+        self.status = status
+        self.retry_after = retry_after
+
+
+def _make_decoder(content_encoding):
+    """Return a streaming decoder for the given Content-Encoding, or None."""
+    encoding = (content_encoding or '').strip().lower()
+    if encoding in ('', 'identity'):
+        return None
+    if encoding in ('gzip', 'x-gzip'):
+        return zlib.decompressobj(16 + zlib.MAX_WBITS)
+    if encoding == 'deflate':
+        # Servers disagree on zlib-wrapped vs raw deflate; sniff on first chunk
+        return _DeflateDecoder()
+    raise FetchError(f"Unsupported Content-Encoding '{content_encoding}'")
+
+
+class _DeflateDecoder:
+    """Deflate decoder that accepts both zlib-wrapped and raw streams."""
+
+    def __init__(self):
+        self._decoder = None
+
+    def decompress(self, data, max_length=0):
+        if self._decoder is None:
+            self._decoder = zlib.decompressobj(zlib.MAX_WBITS)
+            try:
+                return self._decoder.decompress(data, max_length)
+            except zlib.error:
+                self._decoder = zlib.decompressobj(-zlib.MAX_WBITS)
+        return self._decoder.decompress(data, max_length)
+
+    def flush(self):
+        return self._decoder.flush() if self._decoder is not None else b''
+
+    @property
+    def unconsumed_tail(self):
+        return self._decoder.unconsumed_tail if self._decoder is not None else b''
+
+
+class HttpClient:
+    """
+    Thread-safe HTTP client with a small pool of keep-alive connections per host.
+
+    Each call to fetch() checks a connection out of the pool for the duration of
+    the request and returns it afterwards if the server allows reuse. Transfer
+    totals for the whole client are kept in self.stats.
+    """
+
+    def __init__(self, timeout=DEFAULT_TIMEOUT, max_bytes=DEFAULT_MAX_BYTES,
+                 max_idle_per_host=MAX_IDLE_PER_HOST, user_agent=USER_AGENT):
+        self.timeout = timeout
+        self.max_bytes = max_bytes
+        self.max_idle_per_host = max_idle_per_host
+        self.user_agent = user_agent
+        self._idle = {}
+        self._lock = threading.Lock()
+        self._proxies = getproxies()
+        self.stats = {
+            'requests': 0,
+            'connections_opened': 0,
+            'connections_reused': 0,
+            'wire_bytes': 0,
+            'decoded_bytes': 0,
+        }
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def close(self):
+        """Close every idle pooled connection."""
+        with self._lock:
+            idle, self._idle = self._idle, {}
+        for connections in idle.values():
+            for connection in connections:
+                connection.close()
+
+    def _count(self, key, amount=1):
+        with self._lock:
+            self.stats[key] += amount
+
+    def _proxy_for(self, scheme, host):
+        """(host, port, Proxy-Authorization or None) of the proxy for this request, or None."""
+        proxy = self._proxies.get(scheme)
+        if not proxy or proxy_bypass(host):
+            return None
+        if '://' not in proxy:
+            proxy = f"http://{proxy}"
+        parts = urlsplit(proxy)
+        if not parts.hostname:
+            return None
+        authorization = None
+        if parts.username is not None:
+            credentials = f"{unquote(parts.username)}:{unquote(parts.password or '')}"
+            authorization = 'Basic ' + base64.b64encode(credentials.encode('utf-8')).decode('ascii')
+        return parts.hostname, parts.port or 8080, authorization
+
+    def _checkout(self, pool_key):
+        """Return (connection, reused) for the given (scheme, host, port)."""
+        with self._lock:
+            connections = self._idle.get(pool_key)
+            if connections:
+                return connections.pop(), True
+
+        scheme, host, port = pool_key
+        proxy = self._proxy_for(scheme, host)
+        if proxy is None:
+            connect_host, connect_port = host, port
+        else:
+            connect_host, connect_port = proxy[0], proxy[1]
+        if scheme == 'https':
+            connection = http.client.HTTPSConnection(connect_host, connect_port, timeout=self.timeout)
+            if proxy is not None:
+                tunnel_headers = {'Proxy-Authorization': proxy[2]} if proxy[2] else None
+                connection.set_tunnel(host, port, headers=tunnel_headers)
+        else:
+            connection = http.client.HTTPConnection(connect_host, connect_port, timeout=self.timeout)
+        self._count('connections_opened')
+        return connection, False
+
+    def _checkin(self, pool_key, connection):
+        with self._lock:
+            connections = self._idle.setdefault(pool_key, [])
+            if len(connections) < self.max_idle_per_host:
+                connections.append(connection)
+                return
+        connection.close()
+
+    def fetch(self, url):
+        """
+        Fetch a URL, following redirects.
+
+        Returns a tuple of (body_bytes, transfer) where transfer is a dict with
+        'status', 'url', 'encoding', 'wire_bytes', 'decoded_bytes' and 'reused'.
+        Raises FetchError on HTTP errors, network failures or oversized bodies.
+        """
+        for _ in range(MAX_REDIRECTS + 1):
+            status, location, body, transfer = self._request(url)
+            if location is None:
+                transfer['url'] = url
+                return body, transfer
+            url = urljoin(url, location)
+        raise FetchError(f"Too many redirects (>{MAX_REDIRECTS})")
+
+    def _request(self, url):
+        parts = urlsplit(url)
+        scheme = parts.scheme.lower()
+        if scheme not in ('http', 'https') or not parts.hostname:
+            raise FetchError(f"Unsupported URL '{url}'")
+
+        default_port = 443 if scheme == 'https' else 80
+        pool_key = (scheme, parts.hostname, parts.port or default_port)
+        path = parts.path or '/'
+        if parts.query:
+            path = f"{path}?{parts.query}"
+        headers = {
+            'User-Agent': self.user_agent,
+            'Accept-Encoding': 'gzip, deflate',
+            'Connection': 'keep-alive',
+        }
+        if scheme == 'http':
+            proxy = self._proxy_for(scheme, parts.hostname)
+            if proxy is not None:
+                # A forward proxy takes the absolute URL
+                path = f"http://{parts.netloc.rsplit('@', 1)[-1]}{path}"
+                if proxy[2]:
+                    headers['Proxy-Authorization'] = proxy[2]
+
+        connection, reused = self._checkout(pool_key)
+        try:
+            try:
+                connection.request('GET', path, headers=headers)
+                response = connection.getresponse()
+            except STALE_CONNECTION_ERRORS:
+                if not reused:
+                    raise
+                # The server dropped an idle keep-alive connection; retry once fresh
+                connection.close()
+                connection, reused = self._checkout_fresh(pool_key)
+                connection.request('GET', path, headers=headers)
+                response = connection.getresponse()
+        except FetchError:
+            connection.close()
+            raise
+        except (OSError, http.client.HTTPException) as e:
+            connection.close()
+            raise FetchError(str(e)) from e
+
+        self._count('requests')
+        if reused:
+            self._count('connections_reused')
+
+        try:
+            status = response.status
+            if status in (301, 302, 303, 307, 308) and response.getheader('Location'):
+                location = response.getheader('Location')
+                body, transfer = self._read_body(response, None)
+            elif status >= 400:
+                # The body is not read: an error page can be any size, and
+                # the connection is dropped below instead of drained
+                raise FetchError(f"HTTP Error {status}: {response.reason}", status,
+                                 response.getheader('Retry-After'))
+            else:
+                location = None
+                decoder = _make_decoder(response.getheader('Content-Encoding'))
+                body, transfer = self._read_body(response, decoder)
+        except FetchError:
+            connection.close()
+            raise
+        except (OSError, http.client.HTTPException, zlib.error) as e:
+            connection.close()
+            raise FetchError(str(e)) from e
+
+        if response.will_close:
+            connection.close()
+        else:
+            self._checkin(pool_key, connection)
+
+        transfer['status'] = status
+        transfer['reused'] = reused
+        transfer['encoding'] = response.getheader('Content-Encoding') or 'identity'
+        return status, location, body, transfer
+
+    def _checkout_fresh(self, pool_key):
+        """Open a new connection, bypassing any idle (possibly stale) ones."""
+        with self._lock:
+            stale = self._idle.pop(pool_key, [])
+        for connection in stale:
+            connection.close()
+        return self._checkout(pool_key)
+
+    def _read_body(self, response, decoder):
+        """Read and decode a response body in chunks, enforcing self.max_bytes."""
+        chunks = []
+        wire_bytes = 0
+        decoded_bytes = 0
+        limit = self.max_bytes
+
+        def accept(data):
+            nonlocal decoded_bytes
+            decoded_bytes += len(data)
+            if limit and decoded_bytes > limit:
+                raise FetchError(f"Response exceeds {limit:,} byte limit")
+            chunks.append(data)
+
+        while True:
+            chunk = response.read(READ_CHUNK_SIZE)
+            if not chunk:
+                break
+            wire_bytes += len(chunk)
+            if limit and wire_bytes > limit:
+                raise FetchError(f"Response exceeds {limit:,} byte limit")
+            if decoder is None:
+                accept(chunk)
+                continue
+            # Bound each decompression step so a small bomb cannot blow up memory
+            data = chunk
+            while data:
+                accept(decoder.decompress(data, READ_CHUNK_SIZE))
+                data = decoder.unconsumed_tail
+        if decoder is not None:
+            accept(decoder.flush())
+
+        self._count('wire_bytes', wire_bytes)
+        self._count('decoded_bytes', decoded_bytes)
+        return b''.join(chunks), {'wire_bytes': wire_bytes, 'decoded_bytes': decoded_bytes}
+
+
+def format_bytes(size):
+    """Format a byte count for log output."""
+    if size < 1024:
+        return f"{size} B"
+    if size < 1024 * 1024:
+        return f"{size / 1024:.1f} KB"
+    return f"{size / (1024 * 1024):.1f} MB"
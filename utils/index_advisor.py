@@ -0,0 +1,470 @@
+#!/usr/bin/env python3
+"""
+Index advisor and query-plan regression check for the news read path.
+Replays the fixed query shapes used by php/news.php against synthetic
+SQLite databases at several scales (and optionally the configured MySQL
+database), flags full scans and sorts, times each shape and tries the
+candidate indexes to see which ones are worth adding.
+"""
+
+import io
+import os
+import sys
+import json
+import time
+import random
+import sqlite3
+import argparse
+import tempfile
+import statistics
+from contextlib import redirect_stdout
+from datetime import datetime, timedelta
+
+from db_utils import (
+    SCRIPT_DIR, load_env_file, get_db_connection, load_feed_config, sql_placeholder, DatabaseUnavailable
+)
+from url_canon import url_hash
+
+DEFAULT_SCALES = (10000, 100000)
+DEFAULT_REPEATS = 5
+MAX_STORIES = 5000  # news.php always queries with LIMIT $maxStories
+SYNTHETIC_SPAN_DAYS = 365
+READ_KEYS_PER_USER = 200
+RECOMMENDATIONS_PATH = SCRIPT_DIR / 'recommended_indexes.json'
+
+# A candidate is recommended when it speeds up some shape on its table by at
+# least this fraction without slowing another down by the same amount.
+# Differences under the noise floor are ignored.
+IMPROVEMENT_THRESHOLD = 0.2
+NOISE_FLOOR_MS = 0.25
+
+# Indexes the advisor may recommend, with DDL for each database type
+CANDIDATE_INDEXES = {
+    'idx_date_feed': {
+        'table': 'news_articles',
+        'description': 'published_date-first index so ORDER BY ... LIMIT walks the index',
+        'sqlite': "CREATE INDEX IF NOT EXISTS idx_date_feed ON news_articles(published_date, feed_id)",
+        'mysql': "CREATE INDEX idx_date_feed ON news_articles (published_date, feed_id)",
+    },
+    'idx_feed_date_cover': {
+        'table': 'news_articles',
+        'description': 'feed_id/published_date index covering the stats aggregates',
+        'sqlite': "CREATE INDEX IF NOT EXISTS idx_feed_date_cover ON news_articles(feed_id, published_date, id)",
+        'mysql': "CREATE INDEX idx_feed_date_cover ON news_articles (feed_id, published_date, id)",
+    },
+    'idx_key_nocase': {
+        'table': 'key_value',
+        'description': 'NOCASE key index enabling the SQLite LIKE prefix optimization',
+        'sqlite': "CREATE INDEX IF NOT EXISTS idx_key_nocase ON key_value(`key` COLLATE NOCASE)",
+        'mysql': None,  # InnoDB already range-scans the primary key for LIKE 'prefix%'
+    },
+}
+
+
+def _placeholders(db_type, count):
+    return ', '.join([sql_placeholder(db_type)] * count)
+
+
+def build_read_query(db_type, feed_ids, cutoff):
+    """The article query news.php builds for a client poll."""
+    p = '%s' if db_type == 'mysql' else '?'
+    where = []
+    params = []
+    if cutoff is not None:
+        where.append(f"published_date >= {p}")
+        params.append(cutoff)
+    if feed_ids:
+        where.append(f"feed_id IN ({_placeholders(db_type, len(feed_ids))})")
+        params.extend(feed_ids)
+    where_clause = f"WHERE {' AND '.join(where)}" if where else ''
+    sql = f"""
+        SELECT feed_id, url, title, published_date
+        FROM news_articles
+        {where_clause}
+        ORDER BY published_date DESC
+        LIMIT {MAX_STORIES}
+    """
+    return sql, params
+
+
+def _shape_read_feeds_cutoff(db_type, ctx, rng):
+    feeds = rng.sample(ctx['feed_ids'], rng.randint(3, min(20, len(ctx['feed_ids']))))
+    cutoff = ctx['newest'] - timedelta(days=rng.choice((1, 2, 7)))
+    return build_read_query(db_type, feeds, cutoff.strftime('%Y-%m-%d %H:%M:%S'))
+
+
+def _shape_read_default_feeds(db_type, ctx, rng):
+    return build_read_query(db_type, ctx['default_feed_ids'], None)
+
+
+def _shape_read_all(db_type, ctx, rng):
+    return build_read_query(db_type, [], None)
+
+
+def _shape_stats_summary(db_type, ctx, rng):
+    return "SELECT COUNT(*) AS total, COUNT(DISTINCT feed_id) AS feeds FROM news_articles", []
+
+
+def _shape_stats_newest(db_type, ctx, rng):
+    return "SELECT feed_id, title, published_date FROM news_articles ORDER BY published_date DESC LIMIT 1", []
+
+
+def _shape_stats_per_feed(db_type, ctx, rng):
+    return ("SELECT feed_id, COUNT(*) AS item_count, MAX(published_date) AS latest FROM news_articles "
+            "GROUP BY feed_id ORDER BY item_count DESC, feed_id ASC"), []
+
+
+def build_read_status_query(db_type, user_hash):
+    """The key_value lookup news.php uses to load a user's read article IDs."""
+    p = '%s' if db_type == 'mysql' else '?'
+    sql = f"""
+        SELECT `key`, `value`, `life_time`, `created_at`
+        FROM key_value
+        WHERE (`key` = {p} OR `key` LIKE {p})
+    """
+    return sql, [user_hash, user_hash + '/%']
+
+
+def _shape_read_status(db_type, ctx, rng):
+    return build_read_status_query(db_type, rng.choice(ctx['user_hashes']))
+
+
+# Query shapes replayed by the advisor. 'allow' lists plan flags that are
+# inherent to the shape (whole-table aggregates, or a sort bounded by the
+# cutoff) and should not fail the check.
+QUERY_SHAPES = [
+    {'name': 'read: feeds + cutoff', 'table': 'news_articles', 'build': _shape_read_feeds_cutoff,
+     'allow': {'filesort'}},
+    {'name': 'read: default feeds', 'table': 'news_articles', 'build': _shape_read_default_feeds,
+     'allow': set()},
+    {'name': 'read: all feeds', 'table': 'news_articles', 'build': _shape_read_all,
+     'allow': set()},
+    {'name': 'stats: summary', 'table': 'news_articles', 'build': _shape_stats_summary,
+     'allow': {'full scan', 'temp b-tree', 'temp table'}},
+    {'name': 'stats: newest', 'table': 'news_articles', 'build': _shape_stats_newest,
+     'allow': set()},
+    {'name': 'stats: per feed', 'table': 'news_articles', 'build': _shape_stats_per_feed,
+     'allow': {'full scan', 'filesort', 'temp b-tree', 'temp table'}},
+    {'name': 'read status lookup', 'table': 'key_value', 'build': _shape_read_status,
+     'allow': set()},
+]
+
+
+def sqlite_plan_flags(connection, sql, params):
+    """Return (plan_lines, flags) from SQLite EXPLAIN QUERY PLAN."""
+    rows = connection.execute(f"EXPLAIN QUERY PLAN {sql}", params).fetchall()
+    lines = [row[3] for row in rows]
+    flags = set()
+    for detail in lines:
+        words = detail.split()
+        if words[:1] == ['SCAN'] and 'USING' not in words:
+            flags.add('full scan')
+        if detail.startswith('USE TEMP B-TREE FOR ORDER BY') or detail.startswith('USE TEMP B-TREE FOR RIGHT PART OF ORDER BY'):
+            flags.add('filesort')
+        elif detail.startswith('USE TEMP B-TREE'):
+            flags.add('temp b-tree')
+    return lines, sorted(flags)
+
+
+def mysql_plan_flags(connection, sql, params):
+    """Return (plan_lines, flags) from MySQL EXPLAIN."""
+    cursor = connection.cursor()
+    cursor.execute(f"EXPLAIN {sql}", params)
+    lines = []
+    flags = set()
+    for row in cursor.fetchall():
+        extra = row.get('Extra') or ''
+        lines.append(f"{row.get('table')}: type={row.get('type')} key={row.get('key')} rows={row.get('rows')} {extra}".strip())
+        if row.get('type') == 'ALL':
+            flags.add('full scan')
+        if 'Using filesort' in extra:
+            flags.add('filesort')
+        if 'Using temporary' in extra:
+            flags.add('temp table')
+    return lines, sorted(flags)
+
+
+def time_query(connection, db_type, sql, params):
+    """Execute a query to completion and return elapsed milliseconds."""
+    cursor = connection.cursor()
+    started = time.perf_counter()
+    cursor.execute(sql, params)
+    cursor.fetchall()
+    return (time.perf_counter() - started) * 1000
+
+
+def replay_shapes(connection, db_type, ctx, repeats=DEFAULT_REPEATS, seed=1, table=None):
+    """
+    Explain and time every query shape (or only those on the given table).
+
+    Returns a list of result dicts. Timings report the median and the best
+    run; the best run is steadier and is what candidate comparisons use.
+    """
+    results = []
+    for shape in QUERY_SHAPES:
+        if table and shape['table'] != table:
+            continue
+        rng = random.Random(seed)
+        sql, params = shape['build'](db_type, ctx, rng)
+        if db_type == 'mysql':
+            plan, flags = mysql_plan_flags(connection, sql, params)
+        else:
+            plan, flags = sqlite_plan_flags(connection, sql, params)
+        timings = []
+        for _ in range(repeats):
+            sql, params = shape['build'](db_type, ctx, rng)
+            timings.append(time_query(connection, db_type, sql, params))
+        results.append({
+            'shape': shape['name'],
+            'table': shape['table'],
+            'plan': plan,
+            'flags': flags,
+            'unexpected': sorted(set(flags) - shape['allow']),
+            'median_ms': round(statistics.median(timings), 3),
+            'best_ms': round(min(timings), 3),
+        })
+    return results
+
+
+def build_context(feeds, feed_ids=None, newest=None, user_hashes=None):
+    """Collect the realistic parameter pools the query shapes draw from."""
+    feed_ids = feed_ids or [f.get('id') for f in feeds if f.get('id')]
+    default_ids = [f.get('id') for f in feeds if f.get('defaultEnabled') and f.get('id') in feed_ids]
+    return {
+        'feed_ids': feed_ids,
+        'default_feed_ids': default_ids or feed_ids[:5],
+        'newest': newest or datetime.now(),
+        'user_hashes': user_hashes or ['nouser00'],
+    }
+
+
+def create_synthetic_sqlite(path, feeds, article_count, seed=1):
+    """Create a SQLite database with the production schema and synthetic rows."""
+    import setup_tables
+
+    with redirect_stdout(io.StringIO()):
+        setup_tables.setup_tables_sqlite(path)
+
+    rng = random.Random(seed)
+    feed_ids = [f.get('id') for f in feeds if f.get('id')]
+    # Skew volume across feeds the way aggregator feeds dominate in practice
+    weights = [rng.paretovariate(1.2) for _ in feed_ids]
+    newest = datetime(2025, 1, 1)
+    span_seconds = SYNTHETIC_SPAN_DAYS * 86400
+
+    connection = sqlite3.connect(path)
+    chosen = rng.choices(feed_ids, weights=weights, k=article_count)
+    rows = (
+        (
+            feed_id,
+            f"https://example.com/{feed_id}/{index}",
+            f"Synthetic headline {index} for {feed_id}",
+            (newest - timedelta(seconds=rng.randrange(span_seconds))).strftime('%Y-%m-%d %H:%M:%S'),
+            url_hash(f"https://example.com/{feed_id}/{index}"),
+        )
+        for index, feed_id in enumerate(chosen)
+    )
+    connection.executemany(
+        "INSERT INTO news_articles (feed_id, url, title, published_date, url_hash) VALUES (?, ?, ?, ?, ?)", rows
+    )
+
+    user_count = max(article_count // (READ_KEYS_PER_USER * 10), 1)
+    user_hashes = [f"user{n:08x}" for n in range(user_count)]
+    kv_rows = (
+        (f"{user}/{rng.getrandbits(32):x}", '1', 2.0)
+        for user in user_hashes
+        for _ in range(READ_KEYS_PER_USER)
+    )
+    connection.executemany(
+        "INSERT OR IGNORE INTO key_value (`key`, `value`, `life_time`) VALUES (?, ?, ?)", kv_rows
+    )
+    connection.commit()
+    return connection, build_context(feeds, feed_ids, newest, user_hashes)
+
+
+def evaluate_candidates(connection, ctx, baseline, repeats):
+    """Try each candidate index on a SQLite database and measure its effect."""
+    evaluations = []
+    baseline_by_shape = {result['shape']: result for result in baseline}
+    for name, candidate in CANDIDATE_INDEXES.items():
+        ddl = candidate.get('sqlite')
+        if not ddl:
+            continue
+        connection.execute(ddl)
+        trial = replay_shapes(connection, 'sqlite', ctx, repeats, table=candidate['table'])
+        connection.execute(f"DROP INDEX {name}")
+
+        improved = []
+        regressed = []
+        for result in trial:
+            before = baseline_by_shape[result['shape']]
+            delta = before['best_ms'] - result['best_ms']
+            gain = delta / before['best_ms'] if before['best_ms'] else 0.0
+            if abs(delta) < NOISE_FLOOR_MS or result['plan'] == before['plan']:
+                # An unchanged plan means any timing difference is noise
+                gain = 0.0
+            cleared = sorted(set(before['unexpected']) - set(result['unexpected']))
+            if gain >= IMPROVEMENT_THRESHOLD or cleared:
+                improved.append({'shape': result['shape'], 'gain': round(gain, 3), 'cleared': cleared})
+            elif gain <= -IMPROVEMENT_THRESHOLD:
+                regressed.append({'shape': result['shape'], 'gain': round(gain, 3)})
+        evaluations.append({
+            'index': name,
+            'description': candidate['description'],
+            'improved': improved,
+            'regressed': regressed,
+            'recommended': bool(improved) and not regressed,
+        })
+    return evaluations
+
+
+def print_results(title, results):
+    print(f"\n{title}")
+    print("-" * 78)
+    print(f"{'Shape':<26} {'Median':>10}  Flags")
+    for result in results:
+        flags = ', '.join(result['flags']) or 'ok'
+        if result['flags'] and not result['unexpected']:
+            flags += ' (expected)'
+        print(f"{result['shape']:<26} {result['median_ms']:>8.2f}ms  {flags}")
+        for line in result['plan']:
+            print(f"{'':<29}· {line}")
+
+
+def print_evaluations(evaluations):
+    print("\nCandidate indexes")
+    print("-" * 78)
+    for evaluation in evaluations:
+        verdict = "RECOMMENDED" if evaluation['recommended'] else "not needed"
+        print(f"{evaluation['index']:<22} {verdict:<12} {evaluation['description']}")
+        for item in evaluation['improved']:
+            cleared = f", clears {', '.join(item['cleared'])}" if item['cleared'] else ''
+            print(f"{'':<24}+ {item['shape']}: {item['gain']:+.0%}{cleared}")
+        for item in evaluation['regressed']:
+            print(f"{'':<24}- {item['shape']}: {item['gain']:+.0%}")
+
+
+def unexpected_flags(results):
+    """Return shapes whose plans scan or sort where an index should be used."""
+    return [r for r in results if r['unexpected']]
+
+
+def save_recommendations(evaluations, path=RECOMMENDATIONS_PATH):
+    """Write recommended index names for setup_tables.py --apply-recommended-indexes."""
+    recommended = [e['index'] for e in evaluations if e['recommended']]
+    payload = {
+        'generated_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        'indexes': recommended,
+    }
+    with open(path, 'w') as f:
+        json.dump(payload, f, indent=2)
+    return recommended
+
+
+def load_recommendations(path=RECOMMENDATIONS_PATH):
+    """Return the recommended index definitions saved by a previous advisor run."""
+    if not os.path.exists(path):
+        return {}
+    with open(path, 'r') as f:
+        names = json.load(f).get('indexes', [])
+    return {name: CANDIDATE_INDEXES[name] for name in names if name in CANDIDATE_INDEXES}
+
+
+def run_sqlite(feeds, scales, repeats, report):
+    """Replay shapes on synthetic SQLite databases; candidates are tried at the largest scale."""
+    evaluations = []
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for scale in scales:
+            path = os.path.join(tmp_dir, f"advisor_{scale}.db")
+            print(f"\nBuilding synthetic SQLite database with {scale:,} articles...")
+            connection, ctx = create_synthetic_sqlite(path, feeds, scale)
+            try:
+                results = replay_shapes(connection, 'sqlite', ctx, repeats)
+                report['sqlite'][str(scale)] = results
+                print_results(f"SQLite, {scale:,} articles", results)
+                if scale == scales[-1]:
+                    evaluations = evaluate_candidates(connection, ctx, results, repeats)
+                    print_evaluations(evaluations)
+            finally:
+                connection.close()
+    report['candidates'] = evaluations
+    return evaluations
+
+
+def run_mysql(env_vars, feeds, repeats, report):
+    """Explain and time the shapes against the configured MySQL database."""
+    connection, db_type = get_db_connection(env_vars)
+    if db_type != 'mysql':
+        connection.close()
+        print("\n⚠ MySQL is not configured; skipping MySQL plans")
+        return []
+    try:
+        cursor = connection.cursor()
+        cursor.execute("SELECT MAX(published_date) AS newest FROM news_articles")
+        newest = cursor.fetchone()['newest']
+        cursor.execute("SELECT DISTINCT SUBSTRING_INDEX(`key`, '/', 1) AS user_hash FROM key_value LIMIT 50")
+        users = [row['user_hash'] for row in cursor.fetchall()]
+        ctx = build_context(feeds, newest=newest, user_hashes=users)
+        results = replay_shapes(connection, 'mysql', ctx, repeats)
+        report['mysql'] = results
+        print_results("MySQL (configured database)", results)
+        return results
+    finally:
+        connection.close()
+
+
+def main():
+    """Main function."""
+    parser = argparse.ArgumentParser(description="Check query plans for the news read path and suggest indexes.")
+    parser.add_argument('--scales', default=','.join(str(s) for s in DEFAULT_SCALES),
+                        help="comma-separated synthetic article counts (default %(default)s)")
+    parser.add_argument('--repeats', type=int, default=DEFAULT_REPEATS, help="timed runs per shape")
+    parser.add_argument('--mysql', action='store_true', help="also explain against the configured MySQL database")
+    parser.add_argument('--json', metavar='PATH', help="write the full report as JSON")
+    parser.add_argument('--write-recommendations', action='store_true',
+                        help=f"save recommended indexes to {RECOMMENDATIONS_PATH.name} for setup_tables.py")
+    parser.add_argument('--check', action='store_true',
+                        help="exit with status 1 if a read-path shape scans or sorts unexpectedly")
+    args = parser.parse_args()
+
+    try:
+        scales = sorted({int(s) for s in args.scales.split(',') if s.strip()})
+    except ValueError:
+        parser.error("--scales must be a comma-separated list of integers")
+    if not scales or scales[0] < 1 or args.repeats < 1:
+        parser.error("scales and --repeats must be positive")
+
+    feeds = load_feed_config()
+    report = {'sqlite': {}, 'mysql': None, 'candidates': []}
+
+    evaluations = run_sqlite(feeds, scales, args.repeats, report)
+    checked = list(report['sqlite'][str(scales[-1])])
+    if args.mysql:
+        try:
+            checked += run_mysql(load_env_file(), feeds, args.repeats, report)
+        except DatabaseUnavailable as e:
+            print(f"ERROR: {e}")
+            sys.exit(1)
+
+    if args.write_recommendations:
+        recommended = save_recommendations(evaluations)
+        print(f"\n✓ Saved {len(recommended)} recommended index(es) to {RECOMMENDATIONS_PATH}")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2, default=str)
+        print(f"✓ Wrote JSON report to {args.json}")
+
+    problems = unexpected_flags(checked)
+    if problems:
+        print("\n⚠ Plan regressions:")
+        for result in problems:
+            print(f"  {result['shape']}: {', '.join(result['unexpected'])}")
+        if args.check:
+            sys.exit(1)
+    else:
+        print("\n✓ All read-path shapes use indexes")
+
+
+if __name__ == '__main__':
+    main()
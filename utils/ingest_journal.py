@@ -0,0 +1,359 @@
+#!/usr/bin/env python3
+"""
+Local ingest journal between the feed fetchers and the database.
+With INGEST_JOURNAL=1 (or fetch_feeds.py --journal) a fetched feed is
+appended to an append-only segment file under INGEST_JOURNAL_DIR instead
+of being written to the database. load_journal() then applies the segments
+in large transactions and records how far each segment has been
+committed, so a slow or unreachable database no longer stalls fetching or
+throws fetched articles away: they wait in the journal for the next load.
+
+Each line is "<crc32> <json>\n" holding one fetched feed. Writers fsync
+every FSYNC_BATCH records or FSYNC_SECONDS, and always on close; a torn
+last line fails its checksum and is skipped until completed or dropped.
+Loading is at-least-once: a record may be applied again after a crash
+between the commit and the offsets update, which the article upserts absorb.
+"""
+
+import os
+import sys
+import json
+import time
+import zlib
+import fcntl
+import argparse
+from datetime import datetime
+
+from db_utils import SCRIPT_DIR, load_env_file, get_db_connection
+
+DEFAULT_JOURNAL_DIR = SCRIPT_DIR / 'journal'
+OFFSETS_FILE = 'offsets.json'
+LOADER_LOCK_FILE = 'loader.lock'
+SEGMENT_SUFFIX = '.jsonl'
+SEGMENT_MAX_BYTES = 4 * 1024 * 1024
+FSYNC_BATCH = 32
+FSYNC_SECONDS = 1.0
+LOAD_BATCH_RECORDS = 200
+
+
+def journal_enabled(env_vars):
+    """True when .env routes fetched feeds through the journal."""
+    return str(env_vars.get('INGEST_JOURNAL', '')).strip().lower() in ('1', 'true', 'yes', 'on')
+
+
+def journal_dir(env_vars):
+    return str(env_vars.get('INGEST_JOURNAL_DIR') or DEFAULT_JOURNAL_DIR)
+
+
+def _encode(record):
+    payload = json.dumps(record, separators=(',', ':'), ensure_ascii=False)
+    return f"{zlib.crc32(payload.encode('utf-8')):08x} {payload}\n".encode('utf-8')
+
+
+def _decode(line):
+    """The record of one complete line, or None if its checksum fails."""
+    try:
+        text = line.decode('utf-8').rstrip('\n')
+        checksum, payload = text.split(' ', 1)
+        if int(checksum, 16) != zlib.crc32(payload.encode('utf-8')):
+            return None
+        return json.loads(payload)
+    except ValueError:
+        return None
+
+
+class JournalWriter:
+    """
+    Appends fetched feeds to this process's own segment files.
+
+    A segment is locked (flock) while it is being written, so the loader
+    knows not to delete it, and a new one is started after
+    SEGMENT_MAX_BYTES. It is created and locked under a temporary name and
+    only then renamed into place, so the loader never sees it unlocked.
+    """
+
+    def __init__(self, directory, segment_max_bytes=SEGMENT_MAX_BYTES, fsync_batch=FSYNC_BATCH,
+                 fsync_seconds=FSYNC_SECONDS):
+        self.directory = directory
+        self.segment_max_bytes = segment_max_bytes
+        self.fsync_batch = fsync_batch
+        self.fsync_seconds = fsync_seconds
+        self.records = 0
+        self.fsyncs = 0
+        self._file = None
+        self._unsynced = 0
+        self._synced_at = time.monotonic()
+        os.makedirs(directory, exist_ok=True)
+
+    def _open_segment(self):
+        path = os.path.join(self.directory, f"{time.time_ns():020d}-{os.getpid()}{SEGMENT_SUFFIX}")
+        self._file = open(f"{path}.tmp", 'ab')
+        fcntl.flock(self._file.fileno(), fcntl.LOCK_EX)
+        os.rename(f"{path}.tmp", path)
+        # Make the new directory entry durable along with the data
+        directory_fd = os.open(self.directory, os.O_RDONLY)
+        try:
+            os.fsync(directory_fd)
+        finally:
+            os.close(directory_fd)
+
+    def append_feed(self, feed_id, articles, fetched_at=None):
+        """Journal one fetched feed: [{'url', 'title', 'date'}] as parsed by fetch_feeds."""
+        self.append({
+            'feed_id': feed_id,
+            'fetched_at': (fetched_at or datetime.now()).isoformat(sep=' '),
+            'articles': [
+                [article['url'], article['title'],
+                 article['date'].isoformat(sep=' ') if isinstance(article['date'], datetime) else article['date']]
+                for article in articles
+            ],
+        })
+
+    def append(self, record):
+        if self._file is None:
+            self._open_segment()
+        self._file.write(_encode(record))
+        self._file.flush()
+        self.records += 1
+        self._unsynced += 1
+        if self._unsynced >= self.fsync_batch or time.monotonic() - self._synced_at >= self.fsync_seconds:
+            self.sync()
+        if self._file.tell() >= self.segment_max_bytes:
+            self._close_segment()
+
+    def sync(self):
+        if self._file is not None and self._unsynced:
+            os.fsync(self._file.fileno())
+            self.fsyncs += 1
+        self._unsynced = 0
+        self._synced_at = time.monotonic()
+
+    def _close_segment(self):
+        self.sync()
+        fcntl.flock(self._file.fileno(), fcntl.LOCK_UN)
+        self._file.close()
+        self._file = None
+
+    def close(self):
+        if self._file is not None:
+            self._close_segment()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _segments(directory):
+    if not os.path.isdir(directory):
+        return []
+    return sorted(name for name in os.listdir(directory) if name.endswith(SEGMENT_SUFFIX))
+
+
+def _segment_active(path):
+    """True while a writer still holds the segment open."""
+    with open(path, 'rb') as f:
+        try:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return True
+        fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+        return False
+
+
+def load_offsets(directory):
+    try:
+        with open(os.path.join(directory, OFFSETS_FILE), 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_offsets(directory, offsets):
+    path = os.path.join(directory, OFFSETS_FILE)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(offsets, f, indent=2)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def read_records(path, offset):
+    """
+    Yield (record, end offset) for complete lines after offset. A last line
+    without its newline is still being written and is not returned; a line
+    that fails its checksum is yielded as None so it can be skipped.
+    """
+    with open(path, 'rb') as f:
+        f.seek(offset)
+        for line in f:
+            if not line.endswith(b'\n'):
+                return
+            offset += len(line)
+            yield _decode(line), offset
+
+
+def pending_status(directory):
+    """(segments, unapplied bytes) waiting in the journal."""
+    offsets = load_offsets(directory)
+    segments = _segments(directory)
+    waiting = sum(max(os.path.getsize(os.path.join(directory, name)) - offsets.get(name, 0), 0)
+                  for name in segments)
+    return len(segments), waiting
+
+
+def _apply_batch(connection, db_type, batch):
+    import trending
+    from fetch_feeds import store_articles, update_feed_timestamp
+    from url_canon import url_hash_mode
+
+    stored = 0
+    hash_mode = url_hash_mode(connection, db_type)
+    try:
+        for record in batch:
+            articles = [
+                {'url': url, 'title': title, 'date': datetime.fromisoformat(date) if date else datetime.now()}
+                for url, title, date in record['articles']
+            ]
+            # An article that fails must fail the batch, or the offsets would move past it
+            stored += store_articles(connection, db_type, record['feed_id'], articles, commit=False,
+                                     raise_errors=True, hash_mode=hash_mode)
+            update_feed_timestamp(connection, db_type, record['feed_id'],
+                                  datetime.fromisoformat(record['fetched_at']), commit=False)
+        connection.commit()
+    except Exception:
+        # Titles of a batch that is not committed must not reach the trend sketches
+        trending.discard()
+        raise
+    trending.flush()
+    return stored
+
+
+def load_journal(env_vars, directory=None, batch_records=LOAD_BATCH_RECORDS):
+    """
+    Apply every complete journal record to the database, oldest segment
+    first, committing every batch_records feeds and recording each
+    segment's committed offset after the commit. Fully applied segments
+    that no writer holds are deleted. Returns a summary; when the database
+    is unreachable nothing is applied and 'error' says why, and when a
+    batch fails it is rolled back and stays in the journal for the next load.
+    """
+    directory = directory or journal_dir(env_vars)
+    summary = {'records': 0, 'articles': 0, 'stored': 0, 'batches': 0, 'corrupt': 0,
+               'segments_done': 0, 'seconds': 0.0, 'error': None}
+    segments = _segments(directory)
+    if not segments:
+        return summary
+    started = time.perf_counter()
+    lock = open(os.path.join(directory, LOADER_LOCK_FILE), 'a')
+    try:
+        fcntl.flock(lock.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        lock.close()
+        summary['error'] = "another loader is running"
+        return summary
+    try:
+        connection, db_type = get_db_connection(env_vars, pooled=True)
+    except Exception as e:
+        lock.close()
+        summary['error'] = f"database unavailable: {e}"
+        return summary
+
+    offsets = load_offsets(directory)
+    try:
+        for name in segments:
+            path = os.path.join(directory, name)
+            batch, batch_end = [], offsets.get(name, 0)
+
+            def flush():
+                if batch:
+                    summary['stored'] += _apply_batch(connection, db_type, batch)
+                    summary['batches'] += 1
+                offsets[name] = batch_end
+                save_offsets(directory, offsets)
+                batch.clear()
+
+            # Checked before reading: a segment released after this point is reread next time
+            active = _segment_active(path)
+            for record, end in read_records(path, offsets.get(name, 0)):
+                if record is None:
+                    summary['corrupt'] += 1
+                else:
+                    batch.append(record)
+                    summary['records'] += 1
+                    summary['articles'] += len(record['articles'])
+                batch_end = end
+                if len(batch) >= batch_records:
+                    flush()
+            flush()
+            if not active and offsets[name] < os.path.getsize(path):
+                # A writer died mid-line; that record never completed
+                summary['corrupt'] += 1
+                offsets[name] = os.path.getsize(path)
+                save_offsets(directory, offsets)
+            if not active:
+                os.remove(path)
+                offsets.pop(name, None)
+                save_offsets(directory, offsets)
+                summary['segments_done'] += 1
+    except Exception as e:
+        try:
+            connection.rollback()
+        except Exception:
+            pass  # the connection is gone; close() drops it from the pool
+        summary['error'] = str(e)
+    finally:
+        connection.close()
+        lock.close()
+    summary['seconds'] = time.perf_counter() - started
+    return summary
+
+
+def print_load_summary(summary):
+    if summary['error']:
+        print(f"⚠ Journal not loaded: {summary['error']}")
+        return
+    rate = summary['records'] / summary['seconds'] if summary['seconds'] else 0
+    print(f"✓ Loaded {summary['records']:,} journaled feed(s), {summary['articles']:,} article(s) "
+          f"({summary['stored']:,} stored) in {summary['batches']} batch(es), "
+          f"{summary['seconds']:.2f}s ({rate:,.0f} feeds/s); {summary['segments_done']} segment(s) done")
+    if summary['corrupt']:
+        print(f"⚠ Skipped {summary['corrupt']} journal line(s) with a bad checksum")
+
+
+def main():
+    """Main function."""
+    parser = argparse.ArgumentParser(description="Apply the ingest journal to the database.")
+    parser.add_argument('--status', action='store_true', help="show what is waiting in the journal")
+    parser.add_argument('--follow', type=float, metavar='SECONDS',
+                        help="keep loading, checking the journal every SECONDS")
+    parser.add_argument('--batch', type=int, default=LOAD_BATCH_RECORDS,
+                        help="journaled feeds per transaction (default %(default)s)")
+    args = parser.parse_args()
+
+    env_vars = load_env_file()
+    directory = journal_dir(env_vars)
+    if args.status:
+        segments, waiting = pending_status(directory)
+        print(f"Journal {directory}: {segments} segment(s), {waiting:,} byte(s) waiting"
+              f"{'' if journal_enabled(env_vars) else ' (INGEST_JOURNAL is off)'}")
+        return
+    if args.batch < 1:
+        parser.error("--batch must be positive")
+
+    while True:
+        summary = load_journal(env_vars, directory, args.batch)
+        if summary['records'] or summary['error'] or not args.follow:
+            print_load_summary(summary)
+        if not args.follow:
+            sys.exit(1 if summary['error'] else 0)
+        try:
+            time.sleep(args.follow)
+        except KeyboardInterrupt:
+            return
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+Validation of parsed feed items before anything is written.
+
+fetch_feeds.py runs every downloaded feed through validate_articles() on
+the worker thread, so the database (or the ingest journal) only ever sees
+records that pass. Items are rejected when they have no usable URL, carry
+a date further in the future than FUTURE_SKEW or are already older than
+the feed's lifetime (cleanup_db.py would delete them on the next run).
+Missing or unparseable dates are clamped to the fetch time, dates slightly
+ahead are clamped to now and titles are cut to MAX_TITLE_LENGTH. Every
+decision is counted per feed and printed with the feed's report.
+"""
+
+from datetime import datetime, timedelta, timezone
+from urllib.parse import urlsplit
+
+MAX_TITLE_LENGTH = 500
+FUTURE_SKEW = timedelta(minutes=5)
+
+
+def utc_now():
+    """Current UTC time as the naive datetime stored in published_date."""
+    return datetime.now(timezone.utc).replace(tzinfo=None, microsecond=0)
+
+
+def normalize_date(value):
+    """A datetime as naive UTC; aware values are converted, naive ones are taken as UTC."""
+    if value.tzinfo is not None:
+        return value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def _valid_url(url):
+    if not url or not url.strip():
+        return False
+    parts = urlsplit(url.strip())
+    return parts.scheme in ('http', 'https') and bool(parts.netloc)
+
+
+def validate_articles(feed, articles, now=None):
+    """
+    Check parsed articles ({'url', 'title', 'date', 'date_text'}) of one feed.
+
+    Returns (accepted, counts) where accepted are copies with a naive UTC
+    date and a usable title, and counts maps 'rejected' and 'clamped' to
+    {reason: count}.
+    """
+    now = now or utc_now()
+    lifetime = feed.get('lifetime')
+    expires_before = now - timedelta(days=lifetime) if lifetime else None
+    counts = {'rejected': {}, 'clamped': {}}
+
+    def count(kind, reason):
+        counts[kind][reason] = counts[kind].get(reason, 0) + 1
+
+    accepted = []
+    for article in articles:
+        url = (article.get('url') or '').strip()
+        if not _valid_url(url):
+            count('rejected', 'no_url')
+            continue
+
+        date = article.get('date')
+        if date is None:
+            count('clamped', 'bad_date' if article.get('date_text') else 'undated')
+            date = now
+        else:
+            date = normalize_date(date)
+            if date > now + FUTURE_SKEW:
+                count('rejected', 'future')
+                continue
+            if date > now:
+                count('clamped', 'skew')
+                date = now
+            if expires_before is not None and date < expires_before:
+                count('rejected', 'expired')
+                continue
+
+        title = (article.get('title') or '').strip() or 'No Title'
+        if len(title) > MAX_TITLE_LENGTH:
+            count('clamped', 'long_title')
+            title = title[:MAX_TITLE_LENGTH - 1].rstrip() + '…'
+
+        accepted.append({'url': url, 'title': title, 'date': date})
+    return accepted, counts
+
+
+def merge_counts(total, counts):
+    """Add one feed's counts into a run total."""
+    for kind in ('rejected', 'clamped'):
+        for reason, n in counts[kind].items():
+            total[kind][reason] = total[kind].get(reason, 0) + n
+    return total
+
+
+def format_counts(counts):
+    """One-line summary such as 'rejected 3 (future 2, expired 1); clamped 1 (undated 1)', or ''."""
+    parts = []
+    for kind in ('rejected', 'clamped'):
+        if counts[kind]:
+            detail = ', '.join(f"{reason} {n}" for reason, n in sorted(counts[kind].items()))
+            parts.append(f"{kind} {sum(counts[kind].values())} ({detail})")
+    return '; '.join(parts)
@@ -4,7 +4,9 @@ Initialize the news database with required tables.
 Creates tables for storing news articles and feed update timestamps.
 """
 
-from db_utils import load_env_file, get_db_connection
+import sys
+
+from db_utils import load_env_file, get_db_connection, DatabaseUnavailable
 
 
 def init_database(connection, db_type):
@@ -21,12 +23,39 @@ def init_database(connection, db_type):
                 title TEXT NOT NULL,
                 published_date DATETIME NOT NULL,
                 created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-                UNIQUE KEY unique_article (feed_id, url(255)),
+                url_hash CHAR(16) NULL,
+                UNIQUE KEY unique_article (feed_id, url_hash),
                 INDEX idx_feed_date (feed_id, published_date),
                 INDEX idx_published_date (published_date)
             ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
         """)
         
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS news_changes (
+                seq BIGINT AUTO_INCREMENT PRIMARY KEY,
+                op CHAR(1) NOT NULL,
+                feed_id VARCHAR(50) NULL,
+                url TEXT NULL,
+                title TEXT NULL,
+                previous_title TEXT NULL,
+                published_date DATETIME NULL,
+                range_start DATETIME NULL,
+                range_end DATETIME NULL,
+                created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                INDEX idx_created_at (created_at)
+            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+        """)
+        
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS article_histogram (
+                bucket VARCHAR(4) NOT NULL,
+                bucket_start DATETIME NOT NULL,
+                feed_id VARCHAR(50) NOT NULL,
+                article_count INT NOT NULL DEFAULT 0,
+                PRIMARY KEY (bucket, bucket_start, feed_id)
+            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+        """)
+        
         cursor.execute("""
             CREATE TABLE IF NOT EXISTS feed_updates (
                 feed_id VARCHAR(50) PRIMARY KEY,
@@ -45,7 +74,8 @@ def init_database(connection, db_type):
                 title TEXT NOT NULL,
                 published_date DATETIME NOT NULL,
                 created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-                UNIQUE(feed_id, url)
+                url_hash TEXT,
+                UNIQUE(feed_id, url_hash)
             )
         """)
         
@@ -59,6 +89,36 @@ def init_database(connection, db_type):
             ON news_articles(published_date)
         """)
         
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS news_changes (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                op TEXT NOT NULL,
+                feed_id TEXT NULL,
+                url TEXT NULL,
+                title TEXT NULL,
+                previous_title TEXT NULL,
+                published_date DATETIME NULL,
+                range_start DATETIME NULL,
+                range_end DATETIME NULL,
+                created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+        
+        cursor.execute("""
+            CREATE INDEX IF NOT EXISTS idx_news_changes_created
+            ON news_changes(created_at)
+        """)
+        
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS article_histogram (
+                bucket TEXT NOT NULL,
+                bucket_start DATETIME NOT NULL,
+                feed_id TEXT NOT NULL,
+                article_count INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (bucket, bucket_start, feed_id)
+            )
+        """)
+        
         cursor.execute("""
             CREATE TABLE IF NOT EXISTS feed_updates (
                 feed_id TEXT PRIMARY KEY,
@@ -79,7 +139,11 @@ def main():
 
     # Get database connection
     print("Initializing news database...")
-    connection, db_type = get_db_connection(env_vars)
+    try:
+        connection, db_type = get_db_connection(env_vars)
+    except DatabaseUnavailable as e:
+        print(f"ERROR: {e}")
+        sys.exit(1)
     print(f"✓ Connected to {db_type} database")
     
     try:
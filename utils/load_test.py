@@ -0,0 +1,402 @@
+#!/usr/bin/env python3
+"""
+Synthetic read-load generator for the news database.
+Fills a scratch database with N feeds x M articles, then runs many
+concurrent readers issuing the same queries php/news.php runs for a client
+poll while a writer applies update_news-style inserts and cleanup. Reports
+reader latency percentiles, lock waits and SQLITE_BUSY counts, comparing
+SQLite journal modes and, optionally, a scratch MySQL database.
+"""
+
+import io
+import os
+import sys
+import json
+import time
+import random
+import sqlite3
+import argparse
+import tempfile
+import threading
+from contextlib import redirect_stdout
+from datetime import datetime, timedelta
+
+from db_utils import load_env_file, mysql_connect_args
+from index_advisor import build_read_query, build_read_status_query
+from url_canon import url_hash
+
+DEFAULT_FEEDS = 50
+DEFAULT_ARTICLES_PER_FEED = 2000
+DEFAULT_SPAN_DAYS = 30
+DEFAULT_READERS = 16
+DEFAULT_DURATION = 10.0
+DEFAULT_WRITE_INTERVAL = 0.2
+DEFAULT_MODES = ('delete', 'wal')
+SQLITE_JOURNAL_MODES = ('delete', 'truncate', 'persist', 'wal')
+USERS = 200
+READ_KEYS_PER_USER = 100
+WRITE_BATCH = 30
+CLEANUP_EVERY = 25
+RETRY_BACKOFF_MAX = 0.05
+
+# MySQL error codes for lock wait timeout and deadlock
+MYSQL_LOCK_ERRORS = (1205, 1213)
+
+
+def is_lock_error(exc):
+    """Return True for SQLITE_BUSY / locked errors and MySQL lock conflicts."""
+    if isinstance(exc, sqlite3.OperationalError):
+        message = str(exc).lower()
+        return 'locked' in message or 'busy' in message
+    code = exc.args[0] if getattr(exc, 'args', None) else None
+    return code in MYSQL_LOCK_ERRORS
+
+
+def with_retry(operation, stats):
+    """
+    Run operation until it succeeds, retrying on lock errors.
+
+    SQLite connections are opened with timeout=0 so every SQLITE_BUSY is
+    visible here; each one is counted and the time spent backing off is
+    added to stats['lock_wait'].
+    """
+    backoff = 0.001
+    while True:
+        try:
+            return operation()
+        except Exception as exc:
+            if not is_lock_error(exc):
+                raise
+            stats['busy'] += 1
+            started = time.perf_counter()
+            time.sleep(backoff)
+            stats['lock_wait'] += time.perf_counter() - started
+            backoff = min(backoff * 2, RETRY_BACKOFF_MAX)
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    index = min(int(round(fraction * (len(sorted_values) - 1))), len(sorted_values) - 1)
+    return sorted_values[index]
+
+
+def connect_sqlite(path):
+    """Open a SQLite connection that reports SQLITE_BUSY immediately."""
+    connection = sqlite3.connect(path, timeout=0, check_same_thread=False)
+    return connection
+
+
+def connect_mysql_scratch(env_vars, database):
+    """Connect to a scratch MySQL database using the configured credentials."""
+    import pymysql
+    return pymysql.connect(autocommit=False, **mysql_connect_args(env_vars, database))
+
+
+def populate(connection, db_type, feed_count, articles_per_feed, span_days, seed=1):
+    """Create the schema and fill it with synthetic articles and read keys."""
+    import setup_tables
+
+    with redirect_stdout(io.StringIO()):
+        if db_type == 'mysql':
+            setup_tables.setup_tables_mysql(connection)
+    p = '%s' if db_type == 'mysql' else '?'
+    rng = random.Random(seed)
+    now = datetime.now()
+    feed_ids = [f"feed{n:03d}" for n in range(feed_count)]
+    cursor = connection.cursor()
+
+    for feed_id in feed_ids:
+        rows = [
+            (
+                feed_id,
+                f"https://example.com/{feed_id}/{index}",
+                f"Synthetic headline {index} for {feed_id}",
+                (now - timedelta(seconds=rng.randrange(span_days * 86400))).strftime('%Y-%m-%d %H:%M:%S'),
+                url_hash(f"https://example.com/{feed_id}/{index}"),
+            )
+            for index in range(articles_per_feed)
+        ]
+        cursor.executemany(
+            f"INSERT INTO news_articles (feed_id, url, title, published_date, url_hash) "
+            f"VALUES ({p}, {p}, {p}, {p}, {p})",
+            rows
+        )
+        connection.commit()
+
+    user_hashes = [f"loaduser{n:08x}" for n in range(USERS)]
+    kv_rows = [
+        (f"{user}/{rng.getrandbits(32):x}", '1', 2.0)
+        for user in user_hashes
+        for _ in range(READ_KEYS_PER_USER)
+    ]
+    ignore = 'INSERT IGNORE' if db_type == 'mysql' else 'INSERT OR IGNORE'
+    cursor.executemany(
+        f"{ignore} INTO key_value (`key`, `value`, `life_time`) VALUES ({p}, {p}, {p})", kv_rows
+    )
+    connection.commit()
+    return {'feed_ids': feed_ids, 'user_hashes': user_hashes, 'now': now}
+
+
+def reader_loop(connect, db_type, ctx, stop, stats, seed):
+    """Issue news.php-style polls until stop is set, recording latency."""
+    rng = random.Random(seed)
+    connection = connect()
+    cursor = connection.cursor()
+    try:
+        while not stop.is_set():
+            feeds = rng.sample(ctx['feed_ids'], rng.randint(3, min(20, len(ctx['feed_ids']))))
+            max_age = rng.choice((0, 1, 2, 7))
+            cutoff = None
+            if max_age:
+                cutoff = (datetime.now() - timedelta(days=max_age)).strftime('%Y-%m-%d %H:%M:%S')
+            read_sql, read_params = build_read_query(db_type, feeds, cutoff)
+            status_sql, status_params = build_read_status_query(db_type, rng.choice(ctx['user_hashes']))
+
+            def poll():
+                cursor.execute(status_sql, status_params)
+                cursor.fetchall()
+                cursor.execute(read_sql, read_params)
+                cursor.fetchall()
+                if db_type == 'mysql':
+                    # End the read transaction so the next poll sees new rows
+                    connection.commit()
+
+            started = time.perf_counter()
+            with_retry(poll, stats)
+            stats['latencies'].append((time.perf_counter() - started) * 1000)
+    finally:
+        connection.close()
+
+
+def writer_loop(connect, db_type, ctx, stop, stats, interval, seed):
+    """Apply update_news-style article upserts, feed timestamps and cleanup."""
+    rng = random.Random(seed)
+    p = '%s' if db_type == 'mysql' else '?'
+    connection = connect()
+    cursor = connection.cursor()
+    if db_type == 'mysql':
+        upsert = f"""
+            INSERT INTO news_articles (feed_id, url, title, published_date, url_hash)
+            VALUES ({p}, {p}, {p}, {p}, {p})
+            ON DUPLICATE KEY UPDATE title = VALUES(title)
+        """
+        touch = f"""
+            INSERT INTO feed_updates (feed_id, last_updated, last_check, update_count)
+            VALUES ({p}, {p}, {p}, 1)
+            ON DUPLICATE KEY UPDATE last_updated = VALUES(last_updated),
+                last_check = VALUES(last_check), update_count = update_count + 1
+        """
+    else:
+        upsert = f"""
+            INSERT OR REPLACE INTO news_articles (feed_id, url, title, published_date, url_hash)
+            VALUES ({p}, {p}, {p}, {p}, {p})
+        """
+        touch = f"""
+            INSERT OR REPLACE INTO feed_updates (feed_id, last_updated, last_check, update_count)
+            VALUES ({p}, {p}, {p}, COALESCE((SELECT update_count FROM feed_updates WHERE feed_id = {p}), 0) + 1)
+        """
+    iteration = 0
+    try:
+        while not stop.is_set():
+            iteration += 1
+            feed_id = rng.choice(ctx['feed_ids'])
+            now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+            batch = [
+                (feed_id, f"https://example.com/{feed_id}/live-{iteration}-{n}",
+                 f"Live headline {iteration}-{n}", now,
+                 url_hash(f"https://example.com/{feed_id}/live-{iteration}-{n}"))
+                for n in range(WRITE_BATCH)
+            ]
+            touch_params = (feed_id, now, now) if db_type == 'mysql' else (feed_id, now, now, feed_id)
+
+            def write():
+                try:
+                    for row in batch:
+                        cursor.execute(upsert, row)
+                    cursor.execute(touch, touch_params)
+                    if iteration % CLEANUP_EVERY == 0:
+                        cutoff = (ctx['now'] - timedelta(days=rng.randint(20, 29))).strftime('%Y-%m-%d %H:%M:%S')
+                        cursor.execute(
+                            f"DELETE FROM news_articles WHERE feed_id = {p} AND published_date < {p}",
+                            (feed_id, cutoff)
+                        )
+                    connection.commit()
+                except Exception:
+                    connection.rollback()
+                    raise
+
+            started = time.perf_counter()
+            with_retry(write, stats)
+            stats['latencies'].append((time.perf_counter() - started) * 1000)
+            stop.wait(interval)
+    finally:
+        connection.close()
+
+
+def new_stats():
+    return {'latencies': [], 'busy': 0, 'lock_wait': 0.0}
+
+
+def run_scenario(label, connect, db_type, ctx, readers, duration, write_interval):
+    """Run readers and one writer for duration seconds and summarize."""
+    stop = threading.Event()
+    reader_stats = [new_stats() for _ in range(readers)]
+    writer_stats = new_stats()
+    threads = [
+        threading.Thread(target=reader_loop, args=(connect, db_type, ctx, stop, reader_stats[n], n + 1))
+        for n in range(readers)
+    ]
+    threads.append(threading.Thread(
+        target=writer_loop, args=(connect, db_type, ctx, stop, writer_stats, write_interval, 0)
+    ))
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    time.sleep(duration)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    latencies = sorted(l for stats in reader_stats for l in stats['latencies'])
+    writes = sorted(writer_stats['latencies'])
+    return {
+        'label': label,
+        'polls': len(latencies),
+        'polls_per_second': round(len(latencies) / elapsed, 1),
+        'reader_p50_ms': round(percentile(latencies, 0.50), 2),
+        'reader_p99_ms': round(percentile(latencies, 0.99), 2),
+        'reader_busy': sum(stats['busy'] for stats in reader_stats),
+        'reader_lock_wait_s': round(sum(stats['lock_wait'] for stats in reader_stats), 3),
+        'writes': len(writes),
+        'writer_p50_ms': round(percentile(writes, 0.50), 2),
+        'writer_p99_ms': round(percentile(writes, 0.99), 2),
+        'writer_busy': writer_stats['busy'],
+        'writer_lock_wait_s': round(writer_stats['lock_wait'], 3),
+    }
+
+
+def run_sqlite_mode(mode, tmp_dir, args):
+    """Populate a fresh SQLite file in the given journal mode and load it."""
+    import setup_tables
+
+    path = os.path.join(tmp_dir, f"load_{mode}.db")
+    with redirect_stdout(io.StringIO()):
+        setup_tables.setup_tables_sqlite(path)
+    connection = sqlite3.connect(path)
+    connection.execute(f"PRAGMA journal_mode={mode}")
+    ctx = populate(connection, 'sqlite', args.feeds, args.articles, args.span_days)
+    connection.close()
+    return run_scenario(
+        f"sqlite/{mode}", lambda: connect_sqlite(path), 'sqlite', ctx,
+        args.readers, args.duration, args.write_interval
+    )
+
+
+def mysql_lock_counters(connection):
+    """Return InnoDB row lock wait count and time (ms) from global status."""
+    cursor = connection.cursor()
+    cursor.execute("SHOW GLOBAL STATUS LIKE 'Innodb_row_lock_%'")
+    values = {name: int(value) for name, value in cursor.fetchall() if value.isdigit()}
+    return values.get('Innodb_row_lock_waits', 0), values.get('Innodb_row_lock_time', 0)
+
+
+def run_mysql(env_vars, database, args):
+    """Populate the scratch MySQL database and load it."""
+    connection = connect_mysql_scratch(env_vars, database)
+    try:
+        cursor = connection.cursor()
+        for table in ('news_articles', 'feed_updates', 'key_value'):
+            cursor.execute(f"DROP TABLE IF EXISTS {table}")
+        ctx = populate(connection, 'mysql', args.feeds, args.articles, args.span_days)
+        waits_before, time_before = mysql_lock_counters(connection)
+        result = run_scenario(
+            'mysql', lambda: connect_mysql_scratch(env_vars, database), 'mysql', ctx,
+            args.readers, args.duration, args.write_interval
+        )
+        waits_after, time_after = mysql_lock_counters(connection)
+        result['innodb_row_lock_waits'] = waits_after - waits_before
+        result['innodb_row_lock_time_ms'] = time_after - time_before
+        return result
+    finally:
+        connection.close()
+
+
+def print_report(results):
+    print("\nLoad test results")
+    print("=" * 106)
+    print(f"{'Target':<16} {'Polls/s':>8} {'p50':>9} {'p99':>9} {'Busy':>7} {'Lock wait':>10}"
+          f" {'Writes':>7} {'W p99':>9} {'W busy':>7} {'W wait':>9}")
+    print("-" * 106)
+    for r in results:
+        print(
+            f"{r['label']:<16} {r['polls_per_second']:>8} {r['reader_p50_ms']:>7.2f}ms {r['reader_p99_ms']:>7.2f}ms"
+            f" {r['reader_busy']:>7} {r['reader_lock_wait_s']:>9.2f}s"
+            f" {r['writes']:>7} {r['writer_p99_ms']:>7.2f}ms {r['writer_busy']:>7}"
+            f" {r['writer_lock_wait_s']:>8.2f}s"
+        )
+        if 'innodb_row_lock_waits' in r:
+            print(f"{'':<16} InnoDB row lock waits: {r['innodb_row_lock_waits']} "
+                  f"({r['innodb_row_lock_time_ms']} ms)")
+    print("=" * 106)
+
+
+def main():
+    """Main function."""
+    parser = argparse.ArgumentParser(description="Simulate news.php polling load alongside feed updates.")
+    parser.add_argument('--feeds', type=int, default=DEFAULT_FEEDS, help="synthetic feeds (default %(default)s)")
+    parser.add_argument('--articles', type=int, default=DEFAULT_ARTICLES_PER_FEED,
+                        help="articles per feed (default %(default)s)")
+    parser.add_argument('--span-days', type=int, default=DEFAULT_SPAN_DAYS,
+                        help="publish-date span of the articles (default %(default)s)")
+    parser.add_argument('--readers', type=int, default=DEFAULT_READERS,
+                        help="concurrent polling clients (default %(default)s)")
+    parser.add_argument('--duration', type=float, default=DEFAULT_DURATION,
+                        help="seconds per scenario (default %(default)s)")
+    parser.add_argument('--write-interval', type=float, default=DEFAULT_WRITE_INTERVAL,
+                        help="seconds between writer batches (default %(default)s)")
+    parser.add_argument('--modes', default=','.join(DEFAULT_MODES),
+                        help="SQLite journal modes to compare (default %(default)s)")
+    parser.add_argument('--mysql-db', metavar='NAME',
+                        help="scratch MySQL database to load (its news tables are dropped and recreated)")
+    parser.add_argument('--json', metavar='PATH', help="write results as JSON")
+    args = parser.parse_args()
+
+    modes = [m.strip().lower() for m in args.modes.split(',') if m.strip()]
+    unknown = [m for m in modes if m not in SQLITE_JOURNAL_MODES]
+    if unknown:
+        parser.error(f"unknown journal mode(s): {', '.join(unknown)}")
+    if min(args.feeds, args.articles, args.readers, args.span_days) < 1 or args.duration <= 0:
+        parser.error("counts and durations must be positive")
+
+    env_vars = load_env_file()
+    if args.mysql_db and args.mysql_db == env_vars.get('SQL_DB_NAME'):
+        print("ERROR: --mysql-db must name a scratch database, not SQL_DB_NAME")
+        sys.exit(1)
+
+    print(f"Load test: {args.feeds} feeds x {args.articles} articles, {args.readers} readers, "
+          f"{args.duration:g}s per target")
+    results = []
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for mode in modes:
+            print(f"\nRunning SQLite journal_mode={mode}...")
+            results.append(run_sqlite_mode(mode, tmp_dir, args))
+    if args.mysql_db:
+        print(f"\nRunning MySQL scratch database {args.mysql_db}...")
+        try:
+            results.append(run_mysql(env_vars, args.mysql_db, args))
+        except ImportError:
+            print("ERROR: pymysql package required for MySQL load tests")
+        except Exception as e:
+            print(f"ERROR: MySQL load test failed: {e}")
+
+    print_report(results)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"✓ Wrote JSON results to {args.json}")
+
+
+if __name__ == '__main__':
+    main()
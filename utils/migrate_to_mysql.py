@@ -6,8 +6,9 @@ Copies all articles and feed update data from the SQLite database to MySQL.
 
 import sys
 import sqlite3
-from db_utils import load_env_file, resolve_sqlite_path
+from db_utils import load_env_file, resolve_sqlite_path, mysql_connect_args
 from init_db import init_database
+from url_canon import url_hash, url_hash_available
 
 def get_mysql_connection(env_vars):
     """Get MySQL connection from environment variables."""
@@ -19,12 +20,8 @@ def get_mysql_connection(env_vars):
     try:
         import pymysql
         connection = pymysql.connect(
-            host='localhost',
-            user=env_vars.get('SQL_USER'),
-            password=env_vars.get('SQL_PASS'),
-            database=env_vars.get('SQL_DB_NAME'),
-            charset='utf8mb4',
-            cursorclass=pymysql.cursors.DictCursor
+            cursorclass=pymysql.cursors.DictCursor,
+            **mysql_connect_args(env_vars)
         )
         return connection
     except ImportError:
@@ -67,24 +64,25 @@ def migrate_news_articles(sqlite_conn, mysql_conn):
         print("  No articles to migrate")
         return 0
 
-    # Write to MySQL
+    # Write to MySQL; on a url_hash-keyed table, canonical duplicates are skipped
     mysql_cursor = mysql_conn.cursor()
+    hashed = url_hash_available(mysql_conn, 'mysql')
     migrated = 0
     skipped = 0
 
     for article in articles:
         try:
-            mysql_cursor.execute("""
+            mysql_cursor.execute(f"""
                 INSERT INTO news_articles
-                (feed_id, url, title, published_date, created_at)
-                VALUES (%s, %s, %s, %s, %s)
+                (feed_id, url, title, published_date, created_at{', url_hash' if hashed else ''})
+                VALUES (%s, %s, %s, %s, %s{', %s' if hashed else ''})
             """, (
                 article['feed_id'],
                 article['url'],
                 article['title'],
                 article['published_date'],
                 article['created_at']
-            ))
+            ) + ((url_hash(article['url']),) if hashed else ()))
             migrated += 1
         except Exception as e:
             # Skip duplicates (likely already exists)
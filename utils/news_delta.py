@@ -0,0 +1,288 @@
+#!/usr/bin/env python3
+"""
+Incremental "delta since" feed of news_articles changes.
+store_articles() and the cleanup code append to the news_changes log, whose
+AUTOINCREMENT seq is the ingest sequence number. A polling client keeps the
+last seq it saw and asks only for the changes after it. Articles carry their
+payload in the log, so a delta never touches news_articles. Deletes are
+logged as compact prune ranges (feed, published_date window), one row per
+cleanup pass instead of one per article.
+"""
+
+import sys
+import json
+import argparse
+from datetime import datetime, timedelta
+
+from db_utils import load_env_file, get_db_connection, row_field, sql_placeholder, DatabaseUnavailable
+
+CHANGE_TABLE = 'news_changes'
+OP_ARTICLE = 'I'  # new or retitled article
+OP_PRUNE = 'P'  # articles of feed_id (all feeds if NULL) in [range_start, range_end) removed
+DEFAULT_DELTA_LIMIT = 500
+DEFAULT_KEEP_DAYS = 7
+
+_missing_reported = False
+
+
+def change_log_keep_days(env_vars):
+    """Days of changes kept for lagging clients (DELTA_LOG_DAYS in .env)."""
+    value = env_vars.get('DELTA_LOG_DAYS')
+    try:
+        days = float(value) if value not in (None, '') else DEFAULT_KEEP_DAYS
+    except (TypeError, ValueError):
+        print(f"⚠ Invalid DELTA_LOG_DAYS='{value}', using {DEFAULT_KEEP_DAYS} days")
+        return DEFAULT_KEEP_DAYS
+    return days if days > 0 else DEFAULT_KEEP_DAYS
+
+
+def change_log_available(connection, db_type):
+    """
+    True when the news_changes table exists.
+
+    Deployments that have not rerun setup_tables.py keep working; they just
+    do not record changes.
+    """
+    global _missing_reported
+    cursor = connection.cursor()
+    if db_type == 'mysql':
+        cursor.execute("""
+            SELECT COUNT(*) AS count FROM information_schema.tables
+            WHERE table_schema = DATABASE() AND table_name = %s
+        """, (CHANGE_TABLE,))
+        available = row_field(cursor.fetchone(), 'count', 0) > 0
+    else:
+        cursor.execute("SELECT COUNT(*) FROM sqlite_master WHERE type='table' AND name=?", (CHANGE_TABLE,))
+        available = cursor.fetchone()[0] > 0
+    if not available and not _missing_reported:
+        print(f"⚠ {CHANGE_TABLE} table missing; run setup_tables.py to enable delta polling")
+        _missing_reported = True
+    return available
+
+
+def existing_titles(connection, db_type, feed_id, urls, column='url'):
+    """
+    Map url -> stored title for the given feed's articles that already exist.
+    Pass column='url_hash' and hashes as urls to look articles up by hash.
+    """
+    if not urls:
+        return {}
+    cursor = connection.cursor()
+    placeholder = sql_placeholder(db_type)
+    titles = {}
+    urls = list(urls)
+    # Stay well below SQLite's bound-parameter limit
+    for start in range(0, len(urls), 500):
+        chunk = urls[start:start + 500]
+        cursor.execute(f"""
+            SELECT {column} AS article_key, title FROM news_articles
+            WHERE feed_id = {placeholder} AND {column} IN ({', '.join([placeholder] * len(chunk))})
+        """, (feed_id, *chunk))
+        for row in cursor.fetchall():
+            titles[row_field(row, 'article_key', 0)] = row_field(row, 'title', 1)
+    return titles
+
+
+def record_article(cursor, db_type, feed_id, url, title, published_date, previous_title=None):
+    """Log a new article, or a stored one whose title changed."""
+    placeholder = sql_placeholder(db_type)
+    cursor.execute(f"""
+        INSERT INTO {CHANGE_TABLE} (op, feed_id, url, title, previous_title, published_date)
+        VALUES ({', '.join([placeholder] * 6)})
+    """, (OP_ARTICLE, feed_id, url, title, previous_title, published_date))
+
+
+def record_prune(cursor, db_type, feed_ids, before=None, after=None):
+    """
+    Log that articles were removed by published_date window.
+
+    feed_ids=None covers every feed. before is the exclusive upper bound and
+    after the inclusive lower bound; either may be None for an open end.
+    """
+    placeholder = sql_placeholder(db_type)
+    for feed_id in feed_ids if feed_ids is not None else [None]:
+        cursor.execute(f"""
+            INSERT INTO {CHANGE_TABLE} (op, feed_id, range_start, range_end)
+            VALUES ({', '.join([placeholder] * 4)})
+        """, (OP_PRUNE, feed_id, after, before))
+
+
+def latest_seq(connection, db_type):
+    """Highest logged seq, or 0 when the log is empty."""
+    cursor = connection.cursor()
+    cursor.execute(f"SELECT MAX(seq) AS seq FROM {CHANGE_TABLE}")
+    return row_field(cursor.fetchone(), 'seq', 0) or 0
+
+
+def _oldest_seq(connection, db_type):
+    cursor = connection.cursor()
+    cursor.execute(f"SELECT MIN(seq) AS seq FROM {CHANGE_TABLE}")
+    return row_field(cursor.fetchone(), 'seq', 0)
+
+
+def _as_datetime(value):
+    if value is None or isinstance(value, datetime):
+        return value.replace(tzinfo=None) if value is not None else None
+    text = str(value).replace('T', ' ')
+    try:
+        return datetime.fromisoformat(text[:19] if len(text) >= 19 else text[:10])
+    except ValueError:
+        return None
+
+
+def _in_window(article, window):
+    """True when a prune window covers the article."""
+    if window['feed_id'] is not None and window['feed_id'] != article['feed_id']:
+        return False
+    published = _as_datetime(article['published_date'])
+    if published is None:
+        return False
+    after, before = _as_datetime(window['after']), _as_datetime(window['before'])
+    return (after is None or published >= after) and (before is None or published < before)
+
+
+def fetch_changes(connection, db_type, since, feed_ids=None, limit=DEFAULT_DELTA_LIMIT):
+    """
+    Return the changes after seq `since`, in seq order.
+
+    The result is a dict:
+      seq      - cursor to send next time
+      reset    - True when `since` is older than the log (trimmed) or newer
+                 than it (another database); the client must reload in full
+      more     - True when limit was hit; poll again with the new seq
+      articles - latest state of each new or retitled article, with its
+                 client article id and, if retitled, the id it replaces
+      pruned   - removal windows as {feed_id, after, before}; feed_id None
+                 means every feed
+    Clients apply the pruned windows to what they hold, then add articles.
+    An article that changes several times in the window is reported once.
+    """
+    head = latest_seq(connection, db_type)
+    oldest = _oldest_seq(connection, db_type)
+    result = {'seq': head, 'reset': False, 'more': False, 'articles': [], 'pruned': []}
+    if since > head or (oldest is not None and since < oldest - 1):
+        result['reset'] = True
+        return result
+    if since == head:
+        return result
+
+    # Imported here: only delta reads need the article id port
+    from backfill import generate_article_id
+
+    placeholder = sql_placeholder(db_type)
+    params = [since]
+    feed_filter = ''
+    if feed_ids:
+        feed_filter = f"AND (feed_id IS NULL OR feed_id IN ({', '.join([placeholder] * len(feed_ids))}))"
+        params.extend(feed_ids)
+    params.append(limit + 1)
+    cursor = connection.cursor()
+    cursor.execute(f"""
+        SELECT seq, op, feed_id, url, title, previous_title, published_date, range_start, range_end
+        FROM {CHANGE_TABLE}
+        WHERE seq > {placeholder} {feed_filter}
+        ORDER BY seq
+        LIMIT {placeholder}
+    """, params)
+    rows = cursor.fetchall()
+    if len(rows) > limit:
+        rows = rows[:limit]
+        result['more'] = True
+        result['seq'] = row_field(rows[-1], 'seq', 0)
+
+    articles = {}
+    for row in rows:
+        feed_id = row_field(row, 'feed_id', 2)
+        if row_field(row, 'op', 1) == OP_PRUNE:
+            window = {
+                'feed_id': feed_id,
+                'after': row_field(row, 'range_start', 7),
+                'before': row_field(row, 'range_end', 8),
+            }
+            result['pruned'].append(window)
+            # Clients apply prunes before adding articles, so drop the
+            # articles this prune already removed again
+            for key in [key for key, article in articles.items() if _in_window(article, window)]:
+                del articles[key]
+            continue
+        url, title = row_field(row, 'url', 3), row_field(row, 'title', 4)
+        previous = articles.pop((feed_id, url), None)
+        replaces = previous['replaces'] if previous else None
+        previous_title = row_field(row, 'previous_title', 5)
+        if previous_title is not None and replaces is None:
+            replaces = generate_article_id(feed_id, previous_title)
+        articles[(feed_id, url)] = {
+            'seq': row_field(row, 'seq', 0),
+            'id': generate_article_id(feed_id, title),
+            'replaces': replaces,
+            'feed_id': feed_id,
+            'url': url,
+            'title': title,
+            'published_date': row_field(row, 'published_date', 6),
+        }
+    result['articles'] = sorted(articles.values(), key=lambda article: article['seq'])
+    return result
+
+
+def trim_change_log(connection, db_type, keep_days=DEFAULT_KEEP_DAYS):
+    """
+    Delete log entries older than keep_days, always keeping the newest one
+    so the sequence is never reset. Clients further behind get reset=True.
+    Returns the number of rows removed.
+    """
+    placeholder = sql_placeholder(db_type)
+    cutoff = datetime.now() - timedelta(days=keep_days)
+    head = latest_seq(connection, db_type)
+    cursor = connection.cursor()
+    cursor.execute(f"""
+        DELETE FROM {CHANGE_TABLE}
+        WHERE created_at < {placeholder} AND seq < {placeholder}
+    """, (cutoff, head))
+    deleted = cursor.rowcount or 0
+    connection.commit()
+    return deleted
+
+
+def _json_default(value):
+    return value.isoformat(sep=' ') if isinstance(value, datetime) else str(value)
+
+
+def main():
+    """Main function."""
+    parser = argparse.ArgumentParser(description="Read or trim the news_articles change log.")
+    parser.add_argument('feeds', nargs='*', help="only report changes for these feeds")
+    parser.add_argument('--since', type=int, default=None, help="print the changes after this seq as JSON")
+    parser.add_argument('--limit', type=int, default=DEFAULT_DELTA_LIMIT,
+                        help=f"maximum log rows per delta (default {DEFAULT_DELTA_LIMIT})")
+    parser.add_argument('--trim', action='store_true', help="delete log entries older than --keep-days")
+    parser.add_argument('--keep-days', type=float, default=None,
+                        help=f"days of changes kept for lagging clients (default DELTA_LOG_DAYS or {DEFAULT_KEEP_DAYS})")
+    args = parser.parse_args()
+    if args.limit < 1:
+        parser.error("--limit must be at least 1")
+
+    env_vars = load_env_file()
+    keep_days = args.keep_days if args.keep_days is not None else change_log_keep_days(env_vars)
+    try:
+        connection, db_type = get_db_connection(env_vars)
+    except DatabaseUnavailable as e:
+        print(f"ERROR: {e}")
+        sys.exit(1)
+    try:
+        if not change_log_available(connection, db_type):
+            sys.exit(1)
+        if args.trim:
+            print(f"✓ Removed {trim_change_log(connection, db_type, keep_days):,} change log row(s)")
+        if args.since is not None:
+            delta = fetch_changes(connection, db_type, args.since, args.feeds or None, args.limit)
+            print(json.dumps(delta, indent=2, default=_json_default))
+        elif not args.trim:
+            oldest = _oldest_seq(connection, db_type)
+            head = latest_seq(connection, db_type)
+            print(f"Change log: seq {oldest or 0}..{head}")
+    finally:
+        connection.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,760 @@
+#!/usr/bin/env python3
+"""
+Time-partitioned layout for news_articles.
+On MySQL the table is RANGE-partitioned by month on published_date. On
+SQLite each month lives in its own table (news_articles_pYYYYMM) behind a
+UNION ALL view that keeps the name news_articles, with INSTEAD OF triggers
+routing inserts and deletes, so readers and writers need no changes.
+Retention can then drop a whole month once every feed in it has expired
+instead of deleting it row by row.
+"""
+
+import io
+import os
+import re
+import sys
+import time
+import random
+import shutil
+import argparse
+import tempfile
+import statistics
+from contextlib import redirect_stdout
+from datetime import date, datetime, timedelta
+
+from db_utils import load_env_file, get_db_connection, row_field, DatabaseUnavailable
+
+TABLE = 'news_articles'
+OLD_PARTITION = 'p_old'
+FUTURE_PARTITION = 'p_future'
+SQLITE_SEQUENCE_TABLE = 'news_articles_seq'
+DEFAULT_MONTHS_AHEAD = 3
+# Rows older than this many months at conversion time share p_old
+MAX_HISTORY_MONTHS = 120
+BASE_COLUMNS = ('id', 'feed_id', 'url', 'title', 'published_date', 'created_at')
+
+DEFAULT_BENCH_ROWS = 500000
+DEFAULT_BENCH_MONTHS = 24
+DEFAULT_BENCH_FEEDS = 50
+DEFAULT_BENCH_INGEST = 20000
+DEFAULT_BENCH_REPEATS = 5
+
+_MONTH_NAME = re.compile(r'^p\d{6}$')
+
+
+def _as_datetime(value):
+    if value is None or isinstance(value, datetime):
+        return value
+    text = str(value).replace('T', ' ')
+    try:
+        return datetime.fromisoformat(text[:19] if len(text) >= 19 else text[:10])
+    except ValueError:
+        return None
+
+
+def month_start(value):
+    return date(value.year, value.month, 1)
+
+
+def add_months(month, count):
+    index = month.year * 12 + month.month - 1 + count
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(month):
+    return f"p{month:%Y%m}"
+
+
+def partition_month(name):
+    """Return the first day of a monthly partition, or None for p_old/p_future."""
+    if not _MONTH_NAME.match(name):
+        return None
+    return date(int(name[1:5]), int(name[5:7]), 1)
+
+
+def _sqlite_table(name):
+    return f"{TABLE}_{name}"
+
+
+def _partition_source(db_type, name):
+    """FROM-clause target reading a single partition."""
+    if db_type == 'mysql':
+        return f"{TABLE} PARTITION ({name})"
+    return _sqlite_table(name)
+
+
+def is_partitioned(connection, db_type):
+    """True when news_articles uses the partitioned layout."""
+    cursor = connection.cursor()
+    if db_type == 'mysql':
+        cursor.execute("""
+            SELECT COUNT(*) AS count FROM information_schema.PARTITIONS
+            WHERE table_schema = DATABASE() AND table_name = %s AND partition_name IS NOT NULL
+        """, (TABLE,))
+        return row_field(cursor.fetchone(), 'count', 0) > 0
+    cursor.execute("SELECT COUNT(*) FROM sqlite_master WHERE type='view' AND name=?", (TABLE,))
+    return cursor.fetchone()[0] > 0
+
+
+def list_partitions(connection, db_type):
+    """
+    Return the partitions in range order as dicts with name, start and end.
+
+    Ranges are half-open [start, end) on published_date; p_old has no start
+    and p_future no end. A dropped month's range passes to a neighbour:
+    on MySQL to the partition after it, since each one holds everything
+    LESS THAN its bound, and on SQLite to the partition before it, whose
+    range runs up to the next remaining month.
+    """
+    if db_type == 'mysql':
+        cursor = connection.cursor()
+        cursor.execute("""
+            SELECT partition_name AS name, partition_description AS bound
+            FROM information_schema.PARTITIONS
+            WHERE table_schema = DATABASE() AND table_name = %s AND partition_name IS NOT NULL
+            ORDER BY partition_ordinal_position
+        """, (TABLE,))
+        partitions = []
+        start = None
+        for row in cursor.fetchall():
+            bound = str(row_field(row, 'bound', 1))
+            # MySQL TO_DAYS() counts from year 0, Python ordinals from year 1
+            end = None if bound == 'MAXVALUE' else date.fromordinal(int(bound) - 365)
+            partitions.append({'name': row_field(row, 'name', 0), 'start': start, 'end': end})
+            start = end
+        return partitions
+
+    if not is_partitioned(connection, db_type):
+        return []
+    return _sqlite_partitions(connection)
+
+
+def _sqlite_partitions(connection):
+    """Partition ranges from the SQLite partition tables themselves."""
+    cursor = connection.cursor()
+    cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name LIKE ?", (f"{TABLE}_p%",))
+    names = {row[0][len(TABLE) + 1:] for row in cursor.fetchall()}
+    months = sorted(m for m in (partition_month(name) for name in names) if m)
+    partitions = []
+    if OLD_PARTITION in names:
+        partitions.append({'name': OLD_PARTITION, 'start': None, 'end': months[0] if months else None})
+    for index, month in enumerate(months):
+        end = months[index + 1] if index + 1 < len(months) else add_months(month, 1)
+        partitions.append({'name': partition_name(month), 'start': month, 'end': end})
+    if FUTURE_PARTITION in names:
+        partitions.append({'name': FUTURE_PARTITION, 'start': partitions[-1]['end'] if partitions else None,
+                           'end': None})
+    return partitions
+
+
+def _range_condition(partition, column):
+    conditions = []
+    if partition['start'] is not None:
+        conditions.append(f"{column} >= '{partition['start']:%Y-%m-%d}'")
+    if partition['end'] is not None:
+        conditions.append(f"{column} < '{partition['end']:%Y-%m-%d}'")
+    return ' AND '.join(conditions) or '1'
+
+
+def _sqlite_columns(cursor, table):
+    cursor.execute(f"PRAGMA table_info({table})")
+    return [(row[1], row[2]) for row in cursor.fetchall()]
+
+
+def _create_sqlite_partition(cursor, name, extra_columns):
+    table = _sqlite_table(name)
+    cursor.execute("SELECT COUNT(*) FROM sqlite_master WHERE type='table' AND name=?", (table,))
+    if cursor.fetchone()[0]:
+        return
+    # Tables keyed by url_hash (url_canon.py) keep that key per partition
+    hashed = any(column == 'url_hash' for column, _ in extra_columns)
+    cursor.execute(f"""
+        CREATE TABLE {table} (
+            id INTEGER PRIMARY KEY,
+            feed_id TEXT NOT NULL,
+            url TEXT NOT NULL,
+            title TEXT NOT NULL,
+            published_date DATETIME NOT NULL,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            {'url_hash TEXT, UNIQUE(feed_id, url_hash)' if hashed else 'UNIQUE(feed_id, url)'}
+        )
+    """)
+    for column, column_type in extra_columns:
+        if hashed and column == 'url_hash':
+            continue
+        cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {column_type}")
+    cursor.execute(f"CREATE INDEX {table}_feed_date ON {table}(feed_id, published_date)")
+    cursor.execute(f"CREATE INDEX {table}_published_date ON {table}(published_date)")
+
+
+def _rebuild_sqlite_view(connection):
+    """
+    (Re)create the news_articles view and its triggers over the current
+    partition tables. Ids come from a shared AUTOINCREMENT sequence so they
+    stay unique across months. Each partition's UNIQUE key only covers its
+    own month, so an insert first deletes the article from every partition,
+    which keeps INSERT OR REPLACE a replace when the date moves it.
+    """
+    cursor = connection.cursor()
+    cursor.execute(f"DROP VIEW IF EXISTS {TABLE}")
+    partitions = _sqlite_partitions(connection)
+    columns = [name for name, _ in _sqlite_columns(cursor, _sqlite_table(partitions[0]['name']))]
+    column_list = ', '.join(columns)
+    cursor.execute(f"CREATE VIEW {TABLE} AS " + ' UNION ALL '.join(
+        f"SELECT {column_list} FROM {_sqlite_table(p['name'])}" for p in partitions
+    ))
+
+    values = ', '.join(
+        'last_insert_rowid()' if column == 'id'
+        else 'COALESCE(NEW.created_at, CURRENT_TIMESTAMP)' if column == 'created_at'
+        else f"NEW.{column}"
+        for column in columns
+    )
+    key = 'url_hash' if 'url_hash' in columns else 'url'
+    replaces = [
+        f"DELETE FROM {_sqlite_table(p['name'])} WHERE feed_id = NEW.feed_id AND {key} = NEW.{key};"
+        for p in partitions
+    ]
+    routes = []
+    for partition in partitions:
+        condition = _range_condition(partition, 'NEW.published_date')
+        if partition['start'] is None:
+            # NULL dates land here and fail the NOT NULL constraint like a plain table would
+            condition = f"({condition} OR NEW.published_date IS NULL)"
+        routes.append(
+            f"INSERT INTO {_sqlite_table(partition['name'])} ({column_list}) SELECT {values} WHERE {condition};"
+        )
+    cursor.execute(f"""
+        CREATE TRIGGER {TABLE}_insert INSTEAD OF INSERT ON {TABLE}
+        BEGIN
+            {' '.join(replaces)}
+            INSERT INTO {SQLITE_SEQUENCE_TABLE} (id) VALUES (NEW.id);
+            {' '.join(routes)}
+            DELETE FROM {SQLITE_SEQUENCE_TABLE};
+        END
+    """)
+    cursor.execute(f"""
+        CREATE TRIGGER {TABLE}_delete INSTEAD OF DELETE ON {TABLE}
+        BEGIN
+            {' '.join(f"DELETE FROM {_sqlite_table(p['name'])} WHERE id = OLD.id;" for p in partitions)}
+        END
+    """)
+
+
+def _conversion_months(connection, db_type, months_ahead, now):
+    cursor = connection.cursor()
+    cursor.execute(f"SELECT MIN(published_date) AS oldest FROM {TABLE}")
+    oldest = _as_datetime(row_field(cursor.fetchone(), 'oldest', 0))
+    current = month_start(now)
+    if oldest is None:
+        # An empty table needs no history partitions
+        first = current
+    else:
+        first = min(max(add_months(current, -MAX_HISTORY_MONTHS), month_start(oldest)), current)
+    months = []
+    month = first
+    while month <= add_months(current, months_ahead):
+        months.append(month)
+        month = add_months(month, 1)
+    return months
+
+
+def _mysql_partition(name, bound):
+    return f"PARTITION {name} VALUES LESS THAN (TO_DAYS('{bound:%Y-%m-%d}'))"
+
+
+def _convert_mysql(connection, months):
+    definitions = [_mysql_partition(OLD_PARTITION, months[0])]
+    definitions += [_mysql_partition(partition_name(month), add_months(month, 1)) for month in months]
+    definitions.append(f"PARTITION {FUTURE_PARTITION} VALUES LESS THAN MAXVALUE")
+    cursor = connection.cursor()
+    cursor.execute("""
+        SELECT COUNT(*) AS count FROM information_schema.statistics
+        WHERE table_schema = DATABASE() AND table_name = %s
+          AND index_name = 'unique_article' AND column_name = 'url_hash'
+    """, (TABLE,))
+    article_key = 'feed_id, url_hash' if row_field(cursor.fetchone(), 'count', 0) else 'feed_id, url(255)'
+    # Every unique key must contain the partitioning column, so the
+    # primary key and the article key both gain published_date.
+    cursor.execute(f"""
+        ALTER TABLE {TABLE}
+            DROP PRIMARY KEY,
+            ADD PRIMARY KEY (id, published_date),
+            DROP INDEX unique_article,
+            ADD UNIQUE KEY unique_article ({article_key}, published_date)
+        PARTITION BY RANGE (TO_DAYS(published_date)) (
+            {', '.join(definitions)}
+        )
+    """)
+    connection.commit()
+
+
+def _convert_sqlite(connection, months):
+    cursor = connection.cursor()
+    legacy = f"{TABLE}_unpartitioned"
+    cursor.execute("BEGIN")
+    try:
+        extra_columns = [column for column in _sqlite_columns(cursor, TABLE) if column[0] not in BASE_COLUMNS]
+        cursor.execute("SELECT seq FROM sqlite_sequence WHERE name=?", (TABLE,))
+        row = cursor.fetchone()
+        last_id = row[0] if row else None
+        cursor.execute(f"ALTER TABLE {TABLE} RENAME TO {legacy}")
+        cursor.execute(f"CREATE TABLE IF NOT EXISTS {SQLITE_SEQUENCE_TABLE} (id INTEGER PRIMARY KEY AUTOINCREMENT)")
+
+        for name in [OLD_PARTITION] + [partition_name(month) for month in months] + [FUTURE_PARTITION]:
+            _create_sqlite_partition(cursor, name, extra_columns)
+        _rebuild_sqlite_view(connection)
+
+        column_list = ', '.join(name for name, _ in _sqlite_columns(cursor, legacy))
+        for partition in list_partitions(connection, 'sqlite'):
+            cursor.execute(f"""
+                INSERT INTO {_sqlite_table(partition['name'])} ({column_list})
+                SELECT {column_list} FROM {legacy}
+                WHERE {_range_condition(partition, 'published_date')}
+            """)
+
+        cursor.execute(f"SELECT MAX(id) FROM {legacy}")
+        last_id = max(filter(None, (last_id, cursor.fetchone()[0])), default=None)
+        if last_id:
+            # Carry the id high-water mark over so ids are never reused
+            cursor.execute(f"INSERT INTO {SQLITE_SEQUENCE_TABLE} (id) VALUES (?)", (last_id,))
+            cursor.execute(f"DELETE FROM {SQLITE_SEQUENCE_TABLE}")
+        cursor.execute(f"DROP TABLE {legacy}")
+        connection.commit()
+    except Exception:
+        connection.rollback()
+        raise
+
+
+def convert_to_partitioned(connection, db_type, months_ahead=DEFAULT_MONTHS_AHEAD, now=None):
+    """
+    Convert an unpartitioned news_articles table in place.
+
+    Monthly partitions cover the oldest stored month (at most
+    MAX_HISTORY_MONTHS back) through months_ahead months from now; older
+    rows go to p_old and later ones to p_future. Returns the partition names,
+    or None when the table was already partitioned.
+    """
+    if is_partitioned(connection, db_type):
+        return None
+    now = now or datetime.now()
+    months = _conversion_months(connection, db_type, months_ahead, now)
+    if db_type == 'mysql':
+        _convert_mysql(connection, months)
+    else:
+        _convert_sqlite(connection, months)
+    return [p['name'] for p in list_partitions(connection, db_type)]
+
+
+def ensure_partitions(connection, db_type, months_ahead=DEFAULT_MONTHS_AHEAD, now=None):
+    """
+    Add monthly partitions so the current month and months_ahead after it
+    exist. Rows already in p_future that fall in a new month move into it.
+    Returns the names of the partitions created.
+    """
+    partitions = list_partitions(connection, db_type)
+    if not partitions:
+        return []
+    months = [partition_month(p['name']) for p in partitions if partition_month(p['name'])]
+    current = month_start(now or datetime.now())
+    newest = months[-1] if months else add_months(current, -1)
+    wanted = []
+    month = add_months(newest, 1)
+    while month <= add_months(current, months_ahead):
+        wanted.append(month)
+        month = add_months(month, 1)
+    if not wanted:
+        return []
+
+    cursor = connection.cursor()
+    if db_type == 'mysql':
+        definitions = [_mysql_partition(partition_name(month), add_months(month, 1)) for month in wanted]
+        definitions.append(f"PARTITION {FUTURE_PARTITION} VALUES LESS THAN MAXVALUE")
+        cursor.execute(f"""
+            ALTER TABLE {TABLE} REORGANIZE PARTITION {FUTURE_PARTITION} INTO (
+                {', '.join(definitions)}
+            )
+        """)
+        connection.commit()
+        return [partition_name(month) for month in wanted]
+
+    future = _sqlite_table(FUTURE_PARTITION)
+    cursor.execute("BEGIN")
+    try:
+        columns = _sqlite_columns(cursor, future)
+        extra_columns = [column for column in columns if column[0] not in BASE_COLUMNS]
+        for month in wanted:
+            _create_sqlite_partition(cursor, partition_name(month), extra_columns)
+        _rebuild_sqlite_view(connection)
+        column_list = ', '.join(name for name, _ in columns)
+        created = {partition_name(month) for month in wanted}
+        for partition in list_partitions(connection, 'sqlite'):
+            if partition['name'] not in created:
+                continue
+            condition = _range_condition(partition, 'published_date')
+            cursor.execute(f"""
+                INSERT INTO {_sqlite_table(partition['name'])} ({column_list})
+                SELECT {column_list} FROM {future} WHERE {condition}
+            """)
+            cursor.execute(f"DELETE FROM {future} WHERE {condition}")
+        connection.commit()
+    except Exception:
+        connection.rollback()
+        raise
+    return [partition_name(month) for month in wanted]
+
+
+def expired_partitions(connection, db_type, lifetimes, now=None):
+    """
+    Return partitions that only hold rows past their feed's lifetime.
+
+    lifetimes maps feed_id to days, or None for feeds kept forever; rows
+    from feeds missing from it are kept too. The current month, later
+    months and p_future are never candidates. Each returned dict gains a
+    'rows' count.
+    """
+    now = now or datetime.now()
+    current = month_start(now)
+    cursor = connection.cursor()
+    expired = []
+    for partition in list_partitions(connection, db_type):
+        if partition['end'] is None or partition['end'] > current:
+            continue
+        cursor.execute(f"""
+            SELECT feed_id, MAX(published_date) AS newest, COUNT(*) AS row_count
+            FROM {_partition_source(db_type, partition['name'])}
+            GROUP BY feed_id
+        """)
+        rows = 0
+        keep = False
+        for row in cursor.fetchall():
+            rows += int(row_field(row, 'row_count', 2))
+            days = lifetimes.get(row_field(row, 'feed_id', 0))
+            newest = _as_datetime(row_field(row, 'newest', 1))
+            if days is None or newest is None or newest >= now - timedelta(days=days):
+                keep = True
+                break
+        # An empty p_old has nothing to truncate
+        if not keep and (rows or partition['name'] != OLD_PARTITION):
+            expired.append(dict(partition, rows=rows))
+    return expired
+
+
+def drop_partitions(connection, db_type, partitions):
+    """
+    Remove the given partitions' rows in one metadata operation each.
+    p_old is emptied rather than dropped so it keeps catching old dates.
+    """
+    if not partitions:
+        return
+    cursor = connection.cursor()
+    if db_type == 'mysql':
+        for partition in partitions:
+            action = 'TRUNCATE' if partition['name'] == OLD_PARTITION else 'DROP'
+            cursor.execute(f"ALTER TABLE {TABLE} {action} PARTITION {partition['name']}")
+        connection.commit()
+        return
+
+    cursor.execute("BEGIN")
+    try:
+        cursor.execute(f"DROP VIEW IF EXISTS {TABLE}")
+        for partition in partitions:
+            table = _sqlite_table(partition['name'])
+            if partition['name'] == OLD_PARTITION:
+                cursor.execute(f"DELETE FROM {table}")
+            else:
+                cursor.execute(f"DROP TABLE {table}")
+        _rebuild_sqlite_view(connection)
+        connection.commit()
+    except Exception:
+        connection.rollback()
+        raise
+
+
+def drop_expired_partitions(connection, db_type, lifetimes, now=None, dry_run=False):
+    """Drop every expired partition; returns the list from expired_partitions()."""
+    expired = expired_partitions(connection, db_type, lifetimes, now)
+    if not dry_run:
+        drop_partitions(connection, db_type, expired)
+    return expired
+
+
+def article_tables(connection, db_type, before=None):
+    """
+    Tables row-level DML on news_articles should target.
+
+    Deleting through the SQLite view fires a per-row trigger, so on the
+    partitioned SQLite layout this returns the partition tables that can
+    hold rows older than `before` (all of them when it is None). Otherwise
+    it is just news_articles; MySQL prunes partitions itself.
+    """
+    if db_type == 'mysql' or not is_partitioned(connection, db_type):
+        return [TABLE]
+    before = _as_datetime(before)
+    return [
+        _sqlite_table(p['name']) for p in list_partitions(connection, db_type)
+        if before is None or p['start'] is None or datetime.combine(p['start'], datetime.min.time()) < before
+    ]
+
+
+def maintain_partitions(connection, db_type, convert=False, months_ahead=DEFAULT_MONTHS_AHEAD):
+    """
+    Setup hook: optionally convert news_articles, then keep months_ahead
+    months of partitions ready. Returns None for an unpartitioned table,
+    otherwise the names of partitions created.
+    """
+    if convert:
+        created = convert_to_partitioned(connection, db_type, months_ahead)
+        if created is not None:
+            return created
+    if not is_partitioned(connection, db_type):
+        return None
+    created = ensure_partitions(connection, db_type, months_ahead)
+    if db_type == 'sqlite' and not created:
+        # Picks up trigger changes on databases converted by an older version
+        cursor = connection.cursor()
+        cursor.execute("BEGIN")
+        try:
+            _rebuild_sqlite_view(connection)
+            connection.commit()
+        except Exception:
+            connection.rollback()
+            raise
+    return created
+
+
+def print_status(connection, db_type):
+    partitions = list_partitions(connection, db_type)
+    if not partitions:
+        print(f"{TABLE} is not partitioned (run with --convert to switch layouts)")
+        return
+    cursor = connection.cursor()
+    print(f"{TABLE}: {len(partitions)} partition(s) on {db_type}")
+    print(f"  {'partition':<10} {'from':<11} {'until':<11} {'rows':>10}")
+    for partition in partitions:
+        cursor.execute(f"SELECT COUNT(*) AS count FROM {_partition_source(db_type, partition['name'])}")
+        count = row_field(cursor.fetchone(), 'count', 0)
+        start = f"{partition['start']:%Y-%m-%d}" if partition['start'] else '-'
+        end = f"{partition['end']:%Y-%m-%d}" if partition['end'] else '-'
+        print(f"  {partition['name']:<10} {start:<11} {end:<11} {count:>10,}")
+
+
+def _populate_benchmark(path, rows, months, feeds, now, seed):
+    import sqlite3
+    from setup_tables import setup_tables_sqlite
+    from url_canon import url_hash
+
+    with redirect_stdout(io.StringIO()):
+        setup_tables_sqlite(path)
+    rng = random.Random(seed)
+    feed_ids = [f"feed{n:03d}" for n in range(feeds)]
+    span_seconds = months * 30 * 86400
+    connection = sqlite3.connect(path)
+    connection.executemany(
+        f"INSERT INTO {TABLE} (feed_id, url, title, published_date, url_hash) VALUES (?, ?, ?, ?, ?)",
+        (
+            (feed_id, f"https://example.com/{feed_id}/{index}", f"Synthetic headline {index}",
+             (now - timedelta(seconds=rng.randrange(span_seconds))).strftime('%Y-%m-%d %H:%M:%S'),
+             url_hash(f"https://example.com/{feed_id}/{index}"))
+            for index, feed_id in enumerate(rng.choice(feed_ids) for _ in range(rows))
+        )
+    )
+    connection.commit()
+    connection.close()
+    return feed_ids
+
+
+def _time_ingest(connection, feed_ids, count, now, seed):
+    from url_canon import url_hash
+
+    rng = random.Random(seed)
+    rows = [
+        (rng.choice(feed_ids), f"https://example.com/new/{index}", f"Fresh headline {index}",
+         (now - timedelta(seconds=rng.randrange(86400))).strftime('%Y-%m-%d %H:%M:%S'),
+         url_hash(f"https://example.com/new/{index}"))
+        for index in range(count)
+    ]
+    started = time.perf_counter()
+    # Same statement fetch_feeds.store_articles issues, one row at a time
+    for row in rows:
+        connection.execute(
+            f"INSERT OR REPLACE INTO {TABLE} (feed_id, url, title, published_date, url_hash) VALUES (?, ?, ?, ?, ?)",
+            row
+        )
+    connection.commit()
+    return count / (time.perf_counter() - started)
+
+
+def _time_reads(connection, feed_ids, now, repeats):
+    from index_advisor import build_read_query
+
+    sql, params = build_read_query('sqlite', feed_ids[:10], (now - timedelta(days=7)).strftime('%Y-%m-%d %H:%M:%S'))
+    timings = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        connection.execute(sql, params).fetchall()
+        timings.append((time.perf_counter() - started) * 1000)
+    return statistics.median(timings)
+
+
+def _row_count(connection):
+    return connection.execute(f"SELECT COUNT(*) FROM {TABLE}").fetchone()[0]
+
+
+def run_benchmark(rows=DEFAULT_BENCH_ROWS, months=DEFAULT_BENCH_MONTHS, feeds=DEFAULT_BENCH_FEEDS,
+                  ingest=DEFAULT_BENCH_INGEST, repeats=DEFAULT_BENCH_REPEATS, seed=1):
+    """
+    Compare the two layouts on a synthetic SQLite corpus spread over
+    `months` months, with every feed's lifetime set to half that span:
+    retention by cleanup_db's row-level DELETE against dropping expired
+    partitions, plus ingest and news.php read cost. Returns a dict.
+    """
+    import sqlite3
+    from retention import sqlite_free_bytes
+
+    now = datetime(2025, 1, 15, 12, 0, 0)
+    lifetime_days = months * 30 // 2
+    cutoff = now - timedelta(days=lifetime_days)
+    result = {'rows': rows, 'months': months, 'feeds': feeds, 'lifetime_days': lifetime_days}
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        single_path = os.path.join(temp_dir, 'single.db')
+        partitioned_path = os.path.join(temp_dir, 'partitioned.db')
+        feed_ids = _populate_benchmark(single_path, rows, months, feeds, now, seed)
+        shutil.copyfile(single_path, partitioned_path)
+        lifetimes = {feed_id: lifetime_days for feed_id in feed_ids}
+        placeholders = ','.join('?' * len(feed_ids))
+
+        single = sqlite3.connect(single_path)
+        partitioned = sqlite3.connect(partitioned_path)
+        try:
+            started = time.perf_counter()
+            convert_to_partitioned(partitioned, 'sqlite', now=now)
+            result['convert_seconds'] = time.perf_counter() - started
+            result['partitions'] = len(list_partitions(partitioned, 'sqlite'))
+
+            layouts = {}
+            for label, connection in (('single', single), ('partitioned', partitioned)):
+                layouts[label] = {
+                    'ingest_rows_per_second': _time_ingest(connection, feed_ids, ingest, now, seed),
+                    'read_ms': _time_reads(connection, feed_ids, now, repeats),
+                }
+
+            free_before = {'single': sqlite_free_bytes(single), 'partitioned': sqlite_free_bytes(partitioned)}
+            started = time.perf_counter()
+            cursor = single.execute(
+                f"DELETE FROM {TABLE} WHERE feed_id IN ({placeholders}) AND published_date < ?",
+                (*feed_ids, cutoff.strftime('%Y-%m-%d %H:%M:%S'))
+            )
+            single.commit()
+            layouts['single'].update(retention_seconds=time.perf_counter() - started, deleted=cursor.rowcount,
+                                     dropped_partitions=0)
+
+            started = time.perf_counter()
+            dropped = drop_expired_partitions(partitioned, 'sqlite', lifetimes, now)
+            deleted = sum(p['rows'] for p in dropped)
+            # Rows in the partially expired boundary month still go row by row
+            for table in article_tables(partitioned, 'sqlite', cutoff):
+                cursor = partitioned.execute(
+                    f"DELETE FROM {table} WHERE feed_id IN ({placeholders}) AND published_date < ?",
+                    (*feed_ids, cutoff.strftime('%Y-%m-%d %H:%M:%S'))
+                )
+                deleted += cursor.rowcount
+            partitioned.commit()
+            layouts['partitioned'].update(retention_seconds=time.perf_counter() - started, deleted=deleted,
+                                          dropped_partitions=len(dropped))
+
+            for label, connection in (('single', single), ('partitioned', partitioned)):
+                layouts[label]['rows'] = _row_count(connection)
+                layouts[label]['freed_bytes'] = sqlite_free_bytes(connection) - free_before[label]
+            if layouts['single']['rows'] != layouts['partitioned']['rows']:
+                raise RuntimeError(
+                    f"Layouts disagree after retention: {layouts['single']['rows']:,} vs "
+                    f"{layouts['partitioned']['rows']:,} rows"
+                )
+        finally:
+            single.close()
+            partitioned.close()
+
+    result['layouts'] = layouts
+    return result
+
+
+def print_benchmark(result):
+    print(f"Synthetic corpus: {result['rows']:,} rows, {result['feeds']} feeds over {result['months']} months, "
+          f"lifetime {result['lifetime_days']} days")
+    print(f"Converted to {result['partitions']} partitions in {result['convert_seconds']:.2f}s")
+    print(f"  {'layout':<12} {'retention':>10} {'deleted':>10} {'dropped':>8} {'ingest/s':>9} "
+          f"{'read':>8} {'freed':>12}")
+    for label, stats in result['layouts'].items():
+        print(f"  {label:<12} {stats['retention_seconds'] * 1000:8.1f}ms {stats['deleted']:10,} "
+              f"{stats['dropped_partitions']:8} {stats['ingest_rows_per_second']:9,.0f} "
+              f"{stats['read_ms']:6.2f}ms {stats['freed_bytes']:12,}")
+    single, partitioned = result['layouts']['single'], result['layouts']['partitioned']
+    if partitioned['retention_seconds'] > 0:
+        print(f"  Retention speedup: {single['retention_seconds'] / partitioned['retention_seconds']:.1f}x")
+
+
+def main():
+    """Main function."""
+    parser = argparse.ArgumentParser(description="Manage the monthly partitioned layout of news_articles.")
+    parser.add_argument('--convert', action='store_true', help="convert news_articles to the partitioned layout")
+    parser.add_argument('--ensure', action='store_true', help="create partitions for the coming months")
+    parser.add_argument('--drop-expired', action='store_true',
+                        help="drop partitions in which every feed has outlived its lifetime")
+    parser.add_argument('--dry-run', action='store_true', help="with --drop-expired, only report")
+    parser.add_argument('--months-ahead', type=int, default=DEFAULT_MONTHS_AHEAD,
+                        help=f"months of partitions kept ready ahead of now (default {DEFAULT_MONTHS_AHEAD})")
+    parser.add_argument('--benchmark', action='store_true',
+                        help="compare partition drops with row-level DELETE on synthetic SQLite data")
+    parser.add_argument('--rows', type=int, default=DEFAULT_BENCH_ROWS, help="benchmark corpus rows")
+    parser.add_argument('--months', type=int, default=DEFAULT_BENCH_MONTHS, help="benchmark corpus span in months")
+    args = parser.parse_args()
+    if args.months_ahead < 0:
+        parser.error("--months-ahead cannot be negative")
+    if args.months < 2:
+        parser.error("--months must be at least 2")
+
+    if args.benchmark:
+        try:
+            print_benchmark(run_benchmark(args.rows, args.months))
+        except RuntimeError as e:
+            print(f"ERROR: {e}")
+            sys.exit(1)
+        return
+
+    try:
+        connection, db_type = get_db_connection(load_env_file())
+    except DatabaseUnavailable as e:
+        print(f"ERROR: {e}")
+        sys.exit(1)
+    try:
+        if args.convert:
+            created = convert_to_partitioned(connection, db_type, args.months_ahead)
+            if created is None:
+                print(f"{TABLE} is already partitioned")
+            else:
+                print(f"✓ Converted {TABLE} to {len(created)} partition(s)")
+        if args.ensure:
+            created = ensure_partitions(connection, db_type, args.months_ahead)
+            print(f"✓ Created {len(created)} partition(s)" + (f": {', '.join(created)}" if created else ""))
+        if args.drop_expired:
+            from feed_registry import get_registry
+
+            lifetimes = {feed['id']: feed['lifetime'] for feed in get_registry().feeds}
+            dropped = drop_expired_partitions(connection, db_type, lifetimes, dry_run=args.dry_run)
+            verb = "Would drop" if args.dry_run else "Dropped"
+            print(f"✓ {verb} {len(dropped)} partition(s) holding {sum(p['rows'] for p in dropped):,} row(s)")
+            for partition in dropped:
+                print(f"  - {partition['name']}: {partition['rows']:,} row(s)")
+        if not (args.convert or args.ensure or args.drop_expired):
+            print_status(connection, db_type)
+    except Exception as e:
+        print(f"ERROR: {e}")
+        sys.exit(1)
+    finally:
+        connection.close()
+
+
+if __name__ == '__main__':
+    main()
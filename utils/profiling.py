@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+"""
+Opt-in profiling for update runs (update_news.py / fetch_feeds.py --profile).
+'cprofile' records every call with cProfile, in the main thread and in each
+fetch worker, and writes one merged .pstats file. 'sample' records the stacks
+of all threads every few milliseconds and writes a .collapsed file for
+flamegraph tools. Both also write a .spans.json file with per-feed fetch,
+parse and store times; sampled stacks are rooted at their feed and phase.
+
+When no profile is running, span() and thread_scope() return a shared no-op
+context manager, so the hot paths pay one global lookup per feed.
+"""
+
+import os
+import sys
+import json
+import time
+import threading
+from contextlib import contextmanager, nullcontext
+from datetime import datetime
+
+from db_utils import SCRIPT_DIR
+
+PROFILE_MODES = ('cprofile', 'sample')
+DEFAULT_PROFILE_DIR = SCRIPT_DIR / 'profiles'
+DEFAULT_SAMPLE_INTERVAL = 0.005
+SPAN_REPORT_TOP = 10
+
+_NULL_CONTEXT = nullcontext()
+_active = None
+
+
+class Profiler:
+    """One profiled run; use start_profiling()/stop_profiling() or profiled_run()."""
+
+    def __init__(self, mode, output_dir=None, label='run', interval=DEFAULT_SAMPLE_INTERVAL):
+        if mode not in PROFILE_MODES:
+            raise ValueError(f"Unknown profile mode '{mode}'")
+        self.mode = mode
+        self.output_dir = output_dir or DEFAULT_PROFILE_DIR
+        self.label = label
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._spans = {}  # (feed_id, phase) -> [seconds, count]
+        self._tags = {}  # thread ident -> "feed:<id>;<phase>" while in a span
+        self._thread_profiles = []
+        self._main_profile = None
+        self._samples = None
+        self._sampler = None
+        self._stop = threading.Event()
+        self._started = None
+
+    def start(self):
+        self._started = time.perf_counter()
+        if self.mode == 'cprofile':
+            import cProfile
+            self._main_profile = cProfile.Profile()
+            self._main_profile.enable()
+        else:
+            from collections import Counter
+            self._samples = Counter()
+            self._sampler = threading.Thread(target=self._sample_loop, name='profile-sampler', daemon=True)
+            self._sampler.start()
+
+    def stop(self):
+        """Stop profiling and write the output files; returns their paths."""
+        elapsed = time.perf_counter() - self._started
+        if self._main_profile is not None:
+            self._main_profile.disable()
+        if self._sampler is not None:
+            self._stop.set()
+            self._sampler.join()
+
+        os.makedirs(self.output_dir, exist_ok=True)
+        stamp = datetime.now().strftime('%Y%m%d-%H%M%S')
+        base = os.path.join(str(self.output_dir), f"{self.label}-{stamp}-{os.getpid()}")
+        paths = []
+        if self.mode == 'cprofile':
+            import pstats
+            stats = pstats.Stats(self._main_profile)
+            for profile in self._thread_profiles:
+                stats.add(profile)
+            stats.dump_stats(base + '.pstats')
+            paths.append(base + '.pstats')
+        else:
+            with open(base + '.collapsed', 'w') as f:
+                for stack, count in sorted(self._samples.items()):
+                    f.write(f"{stack} {count}\n")
+            paths.append(base + '.collapsed')
+
+        spans = [
+            {'feed_id': feed_id, 'phase': phase, 'seconds': round(seconds, 6), 'count': count}
+            for (feed_id, phase), (seconds, count) in self._spans.items()
+        ]
+        spans.sort(key=lambda span: -span['seconds'])
+        with open(base + '.spans.json', 'w') as f:
+            json.dump({'label': self.label, 'mode': self.mode, 'wall_seconds': round(elapsed, 3),
+                       'spans': spans}, f, indent=2)
+        paths.append(base + '.spans.json')
+        self.print_span_report(spans)
+        return paths
+
+    @contextmanager
+    def thread_scope(self):
+        """Profile the calling worker thread too (cProfile sees one thread before 3.12)."""
+        if self.mode != 'cprofile':
+            yield
+            return
+        import cProfile
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            # Python 3.12+ profiles every thread from the main profile and
+            # refuses a second one
+            yield
+            return
+        try:
+            yield
+        finally:
+            profile.disable()
+            with self._lock:
+                self._thread_profiles.append(profile)
+
+    @contextmanager
+    def span(self, feed_id, phase):
+        """Time one phase of one feed and tag the thread's samples with it."""
+        ident = threading.get_ident()
+        previous = self._tags.get(ident)
+        self._tags[ident] = f"feed:{feed_id};{phase}"
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - started
+            if previous is None:
+                self._tags.pop(ident, None)
+            else:
+                self._tags[ident] = previous
+            with self._lock:
+                totals = self._spans.setdefault((feed_id, phase), [0.0, 0])
+                totals[0] += seconds
+                totals[1] += 1
+
+    def _sample_loop(self):
+        own = threading.get_ident()
+        names = {}
+        while not self._stop.wait(self.interval):
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                stack.reverse()
+                root = self._tags.get(ident)
+                if root is None:
+                    if ident not in names:
+                        names.update((thread.ident, thread.name) for thread in threading.enumerate())
+                    root = names.get(ident, 'thread')
+                self._samples[';'.join([root] + stack)] += 1
+
+    @staticmethod
+    def print_span_report(spans):
+        if not spans:
+            return
+        print(f"\nSlowest feed phases (top {min(SPAN_REPORT_TOP, len(spans))} of {len(spans)}):")
+        for span in spans[:SPAN_REPORT_TOP]:
+            print(f"  {span['feed_id']:<30} {span['phase']:<6} {span['seconds'] * 1000:>9.1f} ms")
+
+
+def start_profiling(mode, output_dir=None, label='run'):
+    """Start a profile for this process; only one can run at a time."""
+    global _active
+    if _active is not None:
+        raise RuntimeError("A profile is already running")
+    profiler = Profiler(mode, output_dir, label)
+    profiler.start()
+    _active = profiler
+    return profiler
+
+
+def stop_profiling():
+    """Stop the running profile and return the files written ([] if none ran)."""
+    global _active
+    profiler, _active = _active, None
+    if profiler is None:
+        return []
+    paths = profiler.stop()
+    for path in paths:
+        print(f"✓ Profile written to {path}")
+    return paths
+
+
+@contextmanager
+def profiled_run(mode, output_dir=None, label='run'):
+    """Profile the enclosed block when mode is set; the files are written even if it exits early."""
+    if not mode:
+        yield
+        return
+    start_profiling(mode, output_dir, label)
+    try:
+        yield
+    finally:
+        stop_profiling()
+
+
+def span(feed_id, phase):
+    """Context manager timing one feed phase; a no-op unless profiling."""
+    return _NULL_CONTEXT if _active is None else _active.span(feed_id, phase)
+
+
+def thread_scope():
+    """Context manager for the body of a worker thread; a no-op unless profiling."""
+    return _NULL_CONTEXT if _active is None else _active.thread_scope()
@@ -0,0 +1,377 @@
+#!/usr/bin/env python3
+"""
+Batch prefetcher for the php/quote.php cache.
+quote.php fetches a ticker from Finnhub on demand and caches it for one
+minute in /tmp/stock_cache_{ticker}.json, so the first client to ask for a
+cold ticker waits for the upstream round trip. This script refreshes every
+symbol in config/stocks.json and config/indexes.json shortly before its
+cache entry expires, writing the same files atomically, so quote.php
+always finds warm data. Run it as the web server user: in a sticky
+directory such as /tmp only a file's owner may replace it, so entries
+quote.php wrote are reported as failures for any other user.
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import queue
+import argparse
+import tempfile
+import threading
+
+from db_utils import PROJECT_ROOT, load_env_file
+from http_client import HttpClient, FetchError
+
+QUOTE_API_URL = 'https://finnhub.io/api/v1/quote'
+QUOTE_CACHE_DIR_DEFAULT = '/tmp'
+QUOTE_CACHE_LIFETIME = 60  # php/quote.php $cacheLifetimeMinutes, in seconds
+DEFAULT_LEAD_SECONDS = 15
+DEFAULT_CONCURRENCY = 4
+BACKOFF_BASE_SECONDS = 30
+BACKOFF_MAX_SECONDS = 600
+# Same check as quote.php, so every file written here is one it can read
+SYMBOL_PATTERN = re.compile(r'^[A-Za-z0-9.\-_]+$')
+
+
+def load_symbols(config_dir=None):
+    """
+    Return the distinct symbols of config/stocks.json and the tracking ETFs
+    of config/indexes.json, in config order.
+    """
+    config_dir = config_dir or PROJECT_ROOT / 'config'
+    sources = (('stocks.json', 'Symbol'), ('indexes.json', 'TrackingETF'))
+    symbols = []
+    for filename, key in sources:
+        try:
+            with open(os.path.join(str(config_dir), filename), 'r') as f:
+                entries = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"⚠ Skipping {filename}: {e}")
+            continue
+        for entry in entries:
+            symbol = str(entry.get(key) or '').strip()
+            if not symbol:
+                continue
+            if not SYMBOL_PATTERN.match(symbol):
+                print(f"⚠ Skipping invalid symbol '{symbol}' in {filename}")
+                continue
+            if symbol not in symbols:
+                symbols.append(symbol)
+    return symbols
+
+
+def cache_path(cache_dir, symbol):
+    """The cache file quote.php reads for symbol."""
+    return os.path.join(cache_dir, f"stock_cache_{symbol}.json")
+
+
+def cache_timestamp(path):
+    """When the cache file was written (epoch seconds), or None."""
+    try:
+        with open(path, 'r') as f:
+            return int(json.load(f)['timestamp'])
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+
+
+def build_quote(symbol, data):
+    """Turn a Finnhub /quote response into quote.php's output object."""
+    def number(key):
+        return float(data[key]) if data.get(key) is not None else None
+
+    return {
+        'symbol': symbol,
+        'quoteTime': int(data.get('t') or 0),
+        'price': float(data.get('c') or 0),
+        'percentChange': float(data.get('dp') or 0),
+        'open': number('o'),
+        'high': number('h'),
+        'low': number('l'),
+        'previousClose': number('pc'),
+        'change': number('d'),
+        'cache': False,
+    }
+
+
+def write_cache(path, quote, timestamp=None):
+    """
+    Write a cache entry atomically: readers see the old file or the new one.
+    Raises PermissionError naming the owner when another user's entry
+    cannot be replaced.
+    """
+    payload = {'timestamp': int(timestamp if timestamp is not None else time.time()), 'data': quote}
+    directory = os.path.dirname(path) or '.'
+    fd, tmp_path = tempfile.mkstemp(prefix='.stock_cache_', suffix='.tmp', dir=directory)
+    try:
+        with os.fdopen(fd, 'w') as f:
+            json.dump(payload, f, separators=(',', ':'))
+        # mkstemp creates 0600 files; quote.php may run as another user
+        os.chmod(tmp_path, 0o644)
+        try:
+            os.replace(tmp_path, path)
+        except PermissionError as e:
+            try:
+                owner = os.stat(path).st_uid
+            except OSError:
+                raise e
+            if owner == os.geteuid():
+                raise
+            raise PermissionError(e.errno, f"cannot replace {path} owned by uid {owner}; "
+                                           f"run as that user or use another --cache-dir") from e
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+class QuotePrefetcher:
+    """
+    Keeps the quote cache of a fixed symbol list warm.
+
+    Each pass refreshes the symbols whose cache entry expires within
+    lead seconds, at most concurrency at a time. A symbol that fails is
+    retried after an exponential backoff; a 429 from upstream pauses the
+    whole prefetcher for its Retry-After (or the backoff).
+    """
+
+    def __init__(self, api_key, symbols, cache_dir=QUOTE_CACHE_DIR_DEFAULT, api_url=QUOTE_API_URL,
+                 lifetime=QUOTE_CACHE_LIFETIME, lead=DEFAULT_LEAD_SECONDS,
+                 concurrency=DEFAULT_CONCURRENCY, client=None):
+        self.api_key = api_key
+        self.symbols = list(dict.fromkeys(symbols))
+        self.cache_dir = cache_dir
+        self.api_url = api_url
+        self.lifetime = lifetime
+        self.lead = min(lead, lifetime)
+        self.concurrency = max(concurrency, 1)
+        self.client = client or HttpClient(max_idle_per_host=self.concurrency)
+        os.makedirs(cache_dir, exist_ok=True)
+        self.failures = {}  # symbol -> (consecutive failures, retry at)
+        self.paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def refresh_at(self, symbol, now):
+        """When symbol should next be refreshed (epoch seconds)."""
+        written = cache_timestamp(cache_path(self.cache_dir, symbol))
+        due = 0 if written is None else written + self.lifetime - self.lead
+        if symbol in self.failures:
+            due = max(due, self.failures[symbol][1])
+        return max(due, self.paused_until)
+
+    def due_symbols(self, now=None):
+        now = now if now is not None else time.time()
+        return [symbol for symbol in self.symbols if self.refresh_at(symbol, now) <= now]
+
+    def seconds_until_due(self, now=None):
+        now = now if now is not None else time.time()
+        if not self.symbols:
+            return self.lifetime
+        return max(min(self.refresh_at(symbol, now) for symbol in self.symbols) - now, 0)
+
+    def fetch_quote(self, symbol):
+        """Fetch one symbol and write its cache entry."""
+        url = f"{self.api_url}?symbol={symbol}&token={self.api_key}"
+        body, _ = self.client.fetch(url)
+        try:
+            data = json.loads(body)
+        except ValueError as e:
+            raise FetchError(f"Invalid JSON from upstream: {e}") from e
+        if not data or not isinstance(data, dict):
+            raise FetchError("Empty response from upstream")
+        write_cache(cache_path(self.cache_dir, symbol), build_quote(symbol, data))
+
+    def _record_failure(self, symbol, error):
+        now = time.time()
+        with self._lock:
+            count = self.failures.get(symbol, (0, 0))[0] + 1
+            delay = min(BACKOFF_BASE_SECONDS * 2 ** (count - 1), BACKOFF_MAX_SECONDS)
+            self.failures[symbol] = (count, now + delay)
+            if getattr(error, 'status', None) == 429:
+                try:
+                    pause = float(error.retry_after)
+                except (TypeError, ValueError):
+                    pause = delay
+                self.paused_until = max(self.paused_until, now + pause)
+        return delay
+
+    def _worker(self, pending, report):
+        while time.time() >= self.paused_until:
+            try:
+                symbol = pending.get_nowait()
+            except queue.Empty:
+                return
+            try:
+                self.fetch_quote(symbol)
+            except (FetchError, OSError) as e:
+                delay = self._record_failure(symbol, e)
+                with self._lock:
+                    report['failed'].append(symbol)
+                print(f"  ✗ {symbol}: {e} (retry in {delay:g}s)")
+                continue
+            with self._lock:
+                self.failures.pop(symbol, None)
+                report['fetched'].append(symbol)
+
+    def refresh(self, symbols=None):
+        """
+        Refresh the given (default: due) symbols with bounded concurrency.
+
+        Returns {'fetched': [...], 'failed': [...], 'skipped': [...]}; skipped
+        symbols were not started because upstream asked us to slow down.
+        """
+        symbols = self.due_symbols() if symbols is None else list(dict.fromkeys(symbols))
+        report = {'fetched': [], 'failed': [], 'skipped': []}
+        if not symbols:
+            return report
+        pending = queue.Queue()
+        for symbol in symbols:
+            pending.put(symbol)
+        workers = [
+            threading.Thread(target=self._worker, args=(pending, report), daemon=True)
+            for _ in range(min(self.concurrency, len(symbols)))
+        ]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        while not pending.empty():
+            report['skipped'].append(pending.get_nowait())
+        return report
+
+    def run(self, duration=None):
+        """Refresh symbols as they come due until duration seconds have passed (forever if None)."""
+        stop_at = time.time() + duration if duration is not None else None
+        while True:
+            report = self.refresh()
+            print_report(report)
+            wait = max(self.seconds_until_due(), 1.0)
+            if stop_at is not None and time.time() + wait >= stop_at:
+                return
+            time.sleep(wait)
+
+    def close(self):
+        self.client.close()
+
+
+def print_report(report):
+    """One line per pass with anything to say."""
+    if not any(report.values()):
+        return
+    line = f"{time.strftime('%H:%M:%S')} ✓ Refreshed {len(report['fetched'])} quote(s)"
+    if report['failed']:
+        line += f", {len(report['failed'])} failed"
+    if report['skipped']:
+        line += f", {len(report['skipped'])} postponed (upstream rate limit)"
+    print(line)
+
+
+def start_stub_server(fail_every=0):
+    """
+    Serve Finnhub-shaped quotes on a local port, for trying the prefetcher
+    without an API key. Every fail_every-th request gets a 429. Returns
+    (server, api_url); call server.shutdown() when done.
+    """
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+    from urllib.parse import urlsplit, parse_qs
+
+    counter = {'requests': 0}
+    lock = threading.Lock()
+
+    class StubHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            with lock:
+                counter['requests'] += 1
+                count = counter['requests']
+            symbol = parse_qs(urlsplit(self.path).query).get('symbol', [''])[0]
+            if fail_every and count % fail_every == 0:
+                self.send_response(429)
+                self.send_header('Retry-After', '1')
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+            price = 100 + sum(map(ord, symbol)) % 400
+            body = json.dumps({'c': price, 'd': 1.5, 'dp': 1.5 / price * 100, 'h': price + 2, 'l': price - 2,
+                               'o': price - 1, 'pc': price - 1.5, 't': int(time.time())}).encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/api/v1/quote"
+
+
+def main():
+    """Main function."""
+    parser = argparse.ArgumentParser(description="Keep the quote.php cache warm for all configured symbols.")
+    parser.add_argument('symbols', nargs='*', help="symbols to refresh (default: config/stocks.json and indexes.json)")
+    parser.add_argument('--loop', action='store_true', help="keep refreshing symbols as their cache comes due")
+    parser.add_argument('--duration', type=float, default=None, help="with --loop, stop after this many seconds")
+    parser.add_argument('--force', action='store_true', help="refresh every symbol, even if its cache is fresh")
+    parser.add_argument('--lead', type=float, default=DEFAULT_LEAD_SECONDS,
+                        help=f"refresh this many seconds before the cache expires (default {DEFAULT_LEAD_SECONDS})")
+    parser.add_argument('--concurrency', type=int, default=DEFAULT_CONCURRENCY,
+                        help=f"upstream requests in flight (default {DEFAULT_CONCURRENCY})")
+    parser.add_argument('--cache-dir', default=None, help=f"cache directory (default {QUOTE_CACHE_DIR_DEFAULT})")
+    parser.add_argument('--stub', action='store_true',
+                        help="fetch from a local stub quote server into a scratch cache directory")
+    parser.add_argument('--stub-fail-every', type=int, default=0, help="with --stub, answer every Nth request with 429")
+    args = parser.parse_args()
+    if args.concurrency < 1:
+        parser.error("--concurrency must be at least 1")
+
+    symbols = args.symbols or load_symbols()
+    invalid = [symbol for symbol in symbols if not SYMBOL_PATTERN.match(symbol)]
+    if invalid:
+        parser.error(f"invalid symbol(s): {', '.join(invalid)}")
+    if not symbols:
+        print("No symbols configured")
+        return
+
+    server = None
+    cache_dir = args.cache_dir or QUOTE_CACHE_DIR_DEFAULT
+    if args.stub:
+        server, api_url = start_stub_server(args.stub_fail_every)
+        api_key = 'stub'
+        cache_dir = args.cache_dir or tempfile.mkdtemp(prefix='quote_cache_')
+        print(f"Stub quote server at {api_url}, cache in {cache_dir}")
+    else:
+        env_vars = load_env_file()
+        api_key = env_vars.get('FINNHUB_KEY')
+        api_url = env_vars.get('QUOTE_API_URL') or QUOTE_API_URL
+        if not api_key:
+            print("ERROR: FINNHUB_KEY not found in .env")
+            sys.exit(1)
+
+    prefetcher = QuotePrefetcher(api_key, symbols, cache_dir, api_url, lead=args.lead,
+                                 concurrency=args.concurrency)
+    print(f"Prefetching {len(prefetcher.symbols)} symbol(s) with {prefetcher.concurrency} worker(s)...")
+    try:
+        if args.loop:
+            prefetcher.run(args.duration)
+        else:
+            report = prefetcher.refresh(prefetcher.symbols if args.force else None)
+            print_report(report)
+            if not any(report.values()):
+                print("✓ All quotes are fresh")
+            if report['failed'] and not report['fetched']:
+                sys.exit(1)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        prefetcher.close()
+        if server is not None:
+            server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
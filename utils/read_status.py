@@ -0,0 +1,455 @@
+#!/usr/bin/env python3
+"""
+Compaction of per-user read status into daily compact sets.
+rest_db.php stores one key_value row per read article ("<user>/<articleId>")
+and news.php loads them with a LIKE prefix scan on every poll. This job
+folds markers into read_status_sets as soon as their day is over: one row
+per user per day holding a sorted array of 32-bit article hashes, so the
+prefix scan only ever sees the current (UTC) day's markers. It also expires
+whole day buckets once their life_time has passed, and benchmarks the
+lookup before/after. Expiring key_value markers is left to retention.py;
+news.php no longer deletes anything during a request.
+"""
+
+import io
+import os
+import re
+import sys
+import time
+import random
+import struct
+import argparse
+import tempfile
+import statistics
+from contextlib import redirect_stdout
+from datetime import datetime, timedelta, timezone
+
+from db_utils import load_env_file, get_db_connection, resolve_restdb_sqlite_path, sql_placeholder
+from retention import table_exists, cutoff_timestamp, sqlite_free_bytes, ROW_OVERHEAD_BYTES
+
+DEFAULT_CHUNK_SIZE = 5000
+DEFAULT_BENCH_USERS = 50
+DEFAULT_BENCH_IDS_PER_USER = 2000
+DEFAULT_BENCH_DAYS = 30
+DEFAULT_BENCH_REPEATS = 200
+
+# Article IDs from generateArticleId() are lowercase hex of a 32-bit hash
+# without leading zeros; only IDs that round-trip exactly are compacted.
+ARTICLE_ID_PATTERN = re.compile(r'^[0-9a-f]{1,8}$')
+SET_ROW_OVERHEAD_BYTES = ROW_OVERHEAD_BYTES + 32
+TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+
+def _row_value(row, key, index, db_type):
+    return row[key] if db_type == 'mysql' else row[index]
+
+
+def _as_datetime(value):
+    """Return a naive datetime for a DATETIME column value (str or datetime)."""
+    if value is None or isinstance(value, datetime):
+        return value
+    try:
+        return datetime.strptime(str(value)[:19], TIMESTAMP_FORMAT)
+    except ValueError:
+        return None
+
+
+def article_hash(article_id):
+    """Return the 32-bit hash for an article ID, or None if it cannot round-trip."""
+    if not ARTICLE_ID_PATTERN.match(article_id or ''):
+        return None
+    value = int(article_id, 16)
+    return value if format(value, 'x') == article_id else None
+
+
+def parse_marker_key(key):
+    """Split a "<user>/<articleId>" key into (user_hash, article_hash), or None."""
+    parts = (key or '').split('/')
+    if len(parts) != 2 or not parts[0]:
+        return None
+    value = article_hash(parts[1])
+    return None if value is None else (parts[0], value)
+
+
+def encode_ids(ids):
+    """Pack article hashes as a sorted, de-duplicated big-endian uint32 array."""
+    ordered = sorted(set(ids))
+    return struct.pack(f'>{len(ordered)}I', *ordered)
+
+
+def decode_ids(blob):
+    """Unpack a blob written by encode_ids()."""
+    blob = bytes(blob or b'')
+    return list(struct.unpack(f'>{len(blob) // 4}I', blob))
+
+
+def _merge_expiry(current, candidate):
+    """Combine bucket expiry times; None means the bucket never expires."""
+    if current is None or candidate is None:
+        return None
+    return max(current, candidate)
+
+
+def _load_set(cursor, db_type, user_hash, day):
+    p = sql_placeholder(db_type)
+    cursor.execute(f"""
+        SELECT article_hashes, expires_at FROM read_status_sets
+        WHERE user_hash = {p} AND bucket_day = {p}
+    """, (user_hash, day))
+    row = cursor.fetchone()
+    if row is None:
+        return None
+    return decode_ids(_row_value(row, 'article_hashes', 0, db_type)), _as_datetime(_row_value(row, 'expires_at', 1, db_type))
+
+
+def _store_set(cursor, db_type, user_hash, day, ids, expires_at):
+    p = sql_placeholder(db_type)
+    if db_type == 'mysql':
+        upsert = """
+            ON DUPLICATE KEY UPDATE
+                article_hashes = VALUES(article_hashes),
+                id_count = VALUES(id_count),
+                expires_at = VALUES(expires_at),
+                updated_at = VALUES(updated_at)
+        """
+    else:
+        upsert = """
+            ON CONFLICT(user_hash, bucket_day) DO UPDATE SET
+                article_hashes = excluded.article_hashes,
+                id_count = excluded.id_count,
+                expires_at = excluded.expires_at,
+                updated_at = excluded.updated_at
+        """
+    blob = encode_ids(ids)
+    cursor.execute(f"""
+        INSERT INTO read_status_sets (user_hash, bucket_day, article_hashes, id_count, expires_at, updated_at)
+        VALUES ({p}, {p}, {p}, {p}, {p}, {p})
+        {upsert}
+    """, (
+        user_hash, day, blob, len(blob) // 4,
+        expires_at.strftime(TIMESTAMP_FORMAT) if expires_at else None,
+        datetime.now(timezone.utc).strftime(TIMESTAMP_FORMAT),
+    ))
+    return len(blob)
+
+
+def compaction_cutoff(min_age_days=None, now=None):
+    """Markers created before this are compacted: the start of the current UTC day by default."""
+    now = now or datetime.now(timezone.utc).replace(tzinfo=None)
+    if min_age_days is None:
+        return now.replace(hour=0, minute=0, second=0, microsecond=0).strftime(TIMESTAMP_FORMAT)
+    return cutoff_timestamp(min_age_days, now)
+
+
+def compact_read_status(connection, db_type, min_age_days=None,
+                        chunk_size=DEFAULT_CHUNK_SIZE, dry_run=False, now=None):
+    """
+    Fold read markers from key_value into read_status_sets: those of earlier
+    days by default, or those older than min_age_days.
+
+    Markers are grouped by user and by the day they were created. A bucket
+    expires when its longest-lived marker would have (created_at + life_time),
+    and never if any marker had a life_time of zero or less. Directory rows,
+    expired markers and keys whose article ID is not a 32-bit hex hash stay in
+    key_value. Each chunk is merged and deleted in a single transaction.
+    """
+    now = now or datetime.now(timezone.utc).replace(tzinfo=None)
+    p = sql_placeholder(db_type)
+    cutoff = compaction_cutoff(min_age_days, now)
+
+    cursor = connection.cursor()
+    totals = {'rows': 0, 'bytes': 0, 'sets': 0, 'set_bytes': 0, 'skipped': 0}
+    last_key = ''
+    while True:
+        cursor.execute(f"""
+            SELECT `key` AS k, `value` AS v, life_time, created_at
+            FROM key_value
+            WHERE `key` > {p} AND `value` IS NOT NULL AND created_at < {p}
+            ORDER BY `key`
+            LIMIT {int(chunk_size)}
+        """, (last_key, cutoff))
+        rows = cursor.fetchall()
+        if not rows:
+            break
+
+        buckets = {}
+        migrated = []
+        for row in rows:
+            key = _row_value(row, 'k', 0, db_type)
+            marker = parse_marker_key(key)
+            created_at = _as_datetime(_row_value(row, 'created_at', 3, db_type))
+            if marker is None or created_at is None:
+                totals['skipped'] += 1
+                continue
+            life_time = float(_row_value(row, 'life_time', 2, db_type) or 0)
+            expires_at = created_at + timedelta(days=life_time) if life_time > 0 else None
+            if expires_at is not None and expires_at < now:
+                continue  # Left for retention.py to expire
+            user_hash, value = marker
+            bucket = buckets.setdefault((user_hash, created_at.strftime('%Y-%m-%d')), {'ids': set(), 'expires_at': expires_at})
+            bucket['ids'].add(value)
+            bucket['expires_at'] = _merge_expiry(bucket['expires_at'], expires_at)
+            migrated.append(key)
+            totals['bytes'] += len(key.encode()) + len(str(_row_value(row, 'v', 1, db_type)).encode()) + ROW_OVERHEAD_BYTES
+
+        totals['rows'] += len(migrated)
+        totals['sets'] += len(buckets)
+        if not dry_run and migrated:
+            for (user_hash, day), bucket in buckets.items():
+                ids, expires_at = bucket['ids'], bucket['expires_at']
+                existing = _load_set(cursor, db_type, user_hash, day)
+                if existing is not None:
+                    ids = ids.union(existing[0])
+                    expires_at = _merge_expiry(expires_at, existing[1])
+                totals['set_bytes'] += _store_set(cursor, db_type, user_hash, day, ids, expires_at)
+            placeholders = ','.join([p] * len(migrated))
+            cursor.execute(f"DELETE FROM key_value WHERE `key` IN ({placeholders})", migrated)
+            connection.commit()
+        elif dry_run:
+            totals['set_bytes'] += sum(len(bucket['ids']) * 4 for bucket in buckets.values())
+
+        last_key = _row_value(rows[-1], 'k', 0, db_type)
+        if len(rows) < chunk_size:
+            break
+    return totals
+
+
+def expire_read_sets(connection, db_type, dry_run=False, now=None):
+    """Delete whole read_status_sets buckets whose expires_at has passed."""
+    now_value = (now or datetime.now(timezone.utc).replace(tzinfo=None)).strftime(TIMESTAMP_FORMAT)
+    p = sql_placeholder(db_type)
+    expired = f"expires_at IS NOT NULL AND expires_at < {p}"
+    cursor = connection.cursor()
+    cursor.execute(f"""
+        SELECT COUNT(*) AS row_count,
+               SUM(COALESCE(LENGTH(article_hashes), 0) + {SET_ROW_OVERHEAD_BYTES}) AS size_bytes
+        FROM read_status_sets
+        WHERE {expired}
+    """, (now_value,))
+    row = cursor.fetchone()
+    totals = {
+        'rows': int(_row_value(row, 'row_count', 0, db_type) or 0),
+        'bytes': int(_row_value(row, 'size_bytes', 1, db_type) or 0),
+    }
+    if totals['rows'] and not dry_run:
+        cursor.execute(f"DELETE FROM read_status_sets WHERE {expired}", (now_value,))
+        connection.commit()
+    return totals
+
+
+def load_read_ids(connection, db_type, user_hash, now=None):
+    """
+    Return the set of article IDs a user has read, as news.php resolves them.
+
+    Combines unexpired read_status_sets buckets with markers still held in
+    key_value, so results are identical before and after compaction.
+    """
+    now = now or datetime.now(timezone.utc).replace(tzinfo=None)
+    p = sql_placeholder(db_type)
+    cursor = connection.cursor()
+    ids = set()
+
+    cursor.execute(f"""
+        SELECT article_hashes, expires_at FROM read_status_sets
+        WHERE user_hash = {p}
+    """, (user_hash,))
+    for row in cursor.fetchall():
+        expires_at = _as_datetime(_row_value(row, 'expires_at', 1, db_type))
+        if expires_at is not None and expires_at < now:
+            continue
+        ids.update(format(value, 'x') for value in decode_ids(_row_value(row, 'article_hashes', 0, db_type)))
+
+    cursor.execute(f"""
+        SELECT `key` AS k, life_time, created_at
+        FROM key_value
+        WHERE (`key` = {p} OR `key` LIKE {p}) AND `value` IS NOT NULL
+    """, (user_hash, user_hash + '/%'))
+    for row in cursor.fetchall():
+        created_at = _as_datetime(_row_value(row, 'created_at', 2, db_type))
+        life_time = float(_row_value(row, 'life_time', 1, db_type) or 0)
+        if created_at is not None and life_time > 0 and created_at + timedelta(days=life_time) < now:
+            continue
+        article_id = _row_value(row, 'k', 0, db_type).split('/')[-1]
+        if article_id and article_id != user_hash:
+            ids.add(article_id)
+    return ids
+
+
+def _random_article_id(rng):
+    return format(rng.randrange(1, 0x80000000), 'x')
+
+
+def _populate_benchmark(connection, users, ids_per_user, days, seed):
+    """Fill key_value with synthetic per-article read markers."""
+    rng = random.Random(seed)
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    user_hashes = [format(rng.getrandbits(256), '064x') for _ in range(users)]
+    rows = []
+    for user_hash in user_hashes:
+        rows.append((user_hash, None, 30, now.strftime(TIMESTAMP_FORMAT)))
+        for _ in range(ids_per_user):
+            created_at = now - timedelta(days=rng.uniform(1, days), seconds=1)
+            rows.append((f"{user_hash}/{_random_article_id(rng)}", str(int(created_at.timestamp() * 1000)),
+                         days + 2, created_at.strftime(TIMESTAMP_FORMAT)))
+    connection.executemany(
+        "INSERT OR IGNORE INTO key_value (`key`, `value`, life_time, created_at) VALUES (?, ?, ?, ?)", rows
+    )
+    connection.commit()
+    return user_hashes
+
+
+def _time_lookups(connection, user_hashes, repeats, seed):
+    """Return (median_ms, p95_ms, ids_per_lookup) for full read-status loads."""
+    rng = random.Random(seed)
+    timings = []
+    sizes = []
+    for _ in range(repeats):
+        user_hash = rng.choice(user_hashes)
+        started = time.perf_counter()
+        ids = load_read_ids(connection, 'sqlite', user_hash)
+        timings.append((time.perf_counter() - started) * 1000)
+        sizes.append(len(ids))
+    timings.sort()
+    return statistics.median(timings), timings[int(len(timings) * 0.95) - 1], statistics.mean(sizes)
+
+
+def _database_bytes(connection):
+    connection.execute("VACUUM")
+    page_count = connection.execute("PRAGMA page_count").fetchone()[0]
+    return page_count * connection.execute("PRAGMA page_size").fetchone()[0]
+
+
+def run_benchmark(users=DEFAULT_BENCH_USERS, ids_per_user=DEFAULT_BENCH_IDS_PER_USER,
+                  days=DEFAULT_BENCH_DAYS, repeats=DEFAULT_BENCH_REPEATS, seed=1):
+    """
+    Compare read-status lookup cost on a synthetic SQLite key_value table
+    before and after compaction. Returns a dict of measurements.
+    """
+    from setup_tables import setup_tables_sqlite
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        path = os.path.join(temp_dir, 'restdb.sqlite')
+        with redirect_stdout(io.StringIO()):
+            setup_tables_sqlite(path)
+        env_vars = {'RESTDB_SQLITE_PATH': path}
+        connection, db_type = get_db_connection(env_vars, sqlite_path=path)
+        try:
+            user_hashes = _populate_benchmark(connection, users, ids_per_user, days, seed)
+            expected = {user_hash: load_read_ids(connection, db_type, user_hash) for user_hash in user_hashes[:5]}
+            before = _time_lookups(connection, user_hashes, repeats, seed)
+            before_bytes = _database_bytes(connection)
+
+            started = time.perf_counter()
+            totals = compact_read_status(connection, db_type, min_age_days=0)
+            compact_seconds = time.perf_counter() - started
+
+            for user_hash, ids in expected.items():
+                if load_read_ids(connection, db_type, user_hash) != ids:
+                    raise RuntimeError(f"Read IDs changed after compaction for user {user_hash[:12]}…")
+            after = _time_lookups(connection, user_hashes, repeats, seed)
+            after_bytes = _database_bytes(connection)
+        finally:
+            connection.close()
+
+    return {
+        'users': users,
+        'ids_per_user': ids_per_user,
+        'days': days,
+        'rows_compacted': totals['rows'],
+        'sets_written': totals['sets'],
+        'compact_seconds': compact_seconds,
+        'before': {'median_ms': before[0], 'p95_ms': before[1], 'ids': before[2], 'db_bytes': before_bytes},
+        'after': {'median_ms': after[0], 'p95_ms': after[1], 'ids': after[2], 'db_bytes': after_bytes},
+    }
+
+
+def print_benchmark(result):
+    before, after = result['before'], result['after']
+    print(f"Synthetic data: {result['users']} user(s) × {result['ids_per_user']:,} read IDs over {result['days']} days")
+    print(f"Compacted {result['rows_compacted']:,} row(s) into {result['sets_written']:,} set(s) "
+          f"in {result['compact_seconds']:.2f}s")
+    print(f"  {'layout':<14} {'median':>9} {'p95':>9} {'IDs/lookup':>11} {'DB size':>12}")
+    for label, stats in (('key_value', before), ('compact sets', after)):
+        print(f"  {label:<14} {stats['median_ms']:8.2f}ms {stats['p95_ms']:8.2f}ms "
+              f"{stats['ids']:11,.0f} {stats['db_bytes']:12,}")
+    if after['median_ms'] > 0:
+        print(f"  Lookup speedup: {before['median_ms'] / after['median_ms']:.1f}x, "
+              f"size {after['db_bytes'] / before['db_bytes']:.0%} of before")
+
+
+def run_compaction(env_vars, min_age_days=None, chunk_size=DEFAULT_CHUNK_SIZE,
+                   dry_run=False, expire_only=False):
+    """Compact read markers and expire old buckets in the read-status database."""
+    sqlite_path = resolve_restdb_sqlite_path(env_vars)
+    connection, db_type = get_db_connection(env_vars, sqlite_path=sqlite_path)
+    try:
+        for table in ('key_value', 'read_status_sets'):
+            if not table_exists(connection, db_type, table):
+                print(f"✗ {table} table missing; run setup_tables.py first")
+                return None
+
+        verb = "Would" if dry_run else ""
+        results = {}
+        if not expire_only:
+            if min_age_days is None:
+                print(f"Compacting read markers created before {compaction_cutoff()} UTC...")
+            else:
+                print(f"Compacting read markers older than {min_age_days:g} day(s)...")
+            totals = compact_read_status(connection, db_type, min_age_days, chunk_size, dry_run)
+            print(f"  ✓ {verb + ' move' if dry_run else 'Moved'} {totals['rows']:,} marker(s) "
+                  f"(~{totals['bytes']:,} bytes) into {totals['sets']:,} daily set write(s) "
+                  f"(~{totals['set_bytes']:,} bytes of hashes)")
+            if totals['skipped']:
+                print(f"  - {totals['skipped']:,} key(s) left in key_value (article IDs that are not 32-bit hashes)")
+            results['compact'] = totals
+
+        print("Expiring old read-status buckets...")
+        expired = expire_read_sets(connection, db_type, dry_run)
+        print(f"  ✓ {verb + ' remove' if dry_run else 'Removed'} {expired['rows']:,} bucket(s), "
+              f"~{expired['bytes']:,} bytes")
+        results['expire'] = expired
+
+        if db_type == 'sqlite' and not dry_run and (expired['rows'] or results.get('compact', {}).get('rows')):
+            print(f"  SQLite freelist now {sqlite_free_bytes(connection):,} bytes (VACUUM to return to disk)")
+        return results
+    finally:
+        connection.close()
+
+
+def main():
+    """Main function."""
+    parser = argparse.ArgumentParser(description="Compact per-article read markers into daily per-user sets.")
+    parser.add_argument('--min-age-days', type=float, default=None,
+                        help="only compact markers older than this (default: every marker from before today, UTC)")
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE,
+                        help=f"key_value rows per batch (default {DEFAULT_CHUNK_SIZE})")
+    parser.add_argument('--dry-run', action='store_true', help="report what would change without writing")
+    parser.add_argument('--expire-only', action='store_true', help="only expire old buckets")
+    parser.add_argument('--benchmark', action='store_true',
+                        help="compare lookup cost before/after compaction on synthetic SQLite data")
+    parser.add_argument('--users', type=int, default=DEFAULT_BENCH_USERS, help="benchmark users")
+    parser.add_argument('--ids-per-user', type=int, default=DEFAULT_BENCH_IDS_PER_USER,
+                        help="benchmark read markers per user")
+    parser.add_argument('--repeats', type=int, default=DEFAULT_BENCH_REPEATS, help="benchmark lookups per layout")
+    args = parser.parse_args()
+    if args.chunk_size < 1:
+        parser.error("--chunk-size must be at least 1")
+    if args.min_age_days is not None and args.min_age_days < 0:
+        parser.error("--min-age-days cannot be negative")
+
+    if args.benchmark:
+        print_benchmark(run_benchmark(args.users, args.ids_per_user, repeats=args.repeats))
+        return
+
+    try:
+        results = run_compaction(load_env_file(), args.min_age_days, args.chunk_size,
+                                 args.dry_run, args.expire_only)
+    except Exception as e:
+        print(f"ERROR: {e}")
+        sys.exit(1)
+    if results is None:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
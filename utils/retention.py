@@ -0,0 +1,411 @@
+#!/usr/bin/env python3
+"""
+Retention and rollup jobs for the application tables.
+Expires key_value rows by created_at + life_time and compacted read-status
+buckets by expires_at, prunes old login_hist rows in chunks and rolls old
+ping_data up into hourly per-user summaries before deleting the raw rows.
+Each pass reports rows and bytes reclaimed.
+"""
+
+import sys
+import argparse
+from datetime import datetime, timedelta, timezone
+
+from db_utils import (
+    load_env_file,
+    get_db_connection,
+    resolve_table_sqlite_path,
+    sql_placeholder
+)
+
+DEFAULT_CHUNK_SIZE = 5000
+DEFAULT_LOGIN_HIST_DAYS = 365
+DEFAULT_PING_RAW_DAYS = 30
+DEFAULT_PING_HOURLY_DAYS = 0  # 0 keeps hourly summaries forever
+
+# Fixed per-row overhead used when estimating reclaimed bytes
+ROW_OVERHEAD_BYTES = 24
+
+
+def _text_bytes(db_type, column):
+    """SQL expression for the stored byte length of a text column."""
+    if db_type == 'mysql':
+        return f"COALESCE(LENGTH({column}), 0)"
+    return f"COALESCE(LENGTH(CAST({column} AS BLOB)), 0)"
+
+
+def _row_value(row, key, index, db_type):
+    return row[key] if db_type == 'mysql' else row[index]
+
+
+def _env_days(env_vars, key, default):
+    """Read a retention period in days from .env, falling back to default."""
+    value = env_vars.get(key)
+    if value in (None, ''):
+        return default
+    try:
+        days = float(value)
+    except (TypeError, ValueError):
+        print(f"⚠ Invalid {key}='{value}', using {default} days")
+        return default
+    if days < 0:
+        print(f"⚠ Negative {key}='{value}', using {default} days")
+        return default
+    return days
+
+
+def cutoff_timestamp(days, now=None):
+    """Return the UTC cutoff string for rows older than the given days."""
+    now = now or datetime.now(timezone.utc).replace(tzinfo=None)
+    return (now - timedelta(days=days)).strftime('%Y-%m-%d %H:%M:%S')
+
+
+def expire_key_value(connection, db_type, chunk_size=DEFAULT_CHUNK_SIZE, dry_run=False, now=None):
+    """
+    Delete key_value rows whose created_at + life_time (days) has passed.
+
+    Rows with a life_time of zero or less never expire here, matching the
+    read-status loader in news.php.
+    """
+    now_value = (now or datetime.now(timezone.utc).replace(tzinfo=None)).strftime('%Y-%m-%d %H:%M:%S')
+    p = sql_placeholder(db_type)
+    if db_type == 'mysql':
+        expired = f"life_time > 0 AND TIMESTAMPADD(SECOND, ROUND(life_time * 86400), created_at) < {p}"
+    else:
+        expired = f"life_time > 0 AND julianday(created_at) + life_time < julianday({p})"
+    size = f"{_text_bytes(db_type, '`key`')} + {_text_bytes(db_type, '`value`')} + {ROW_OVERHEAD_BYTES}"
+
+    cursor = connection.cursor()
+    totals = {'rows': 0, 'bytes': 0}
+    last_key = ''
+    while True:
+        cursor.execute(f"""
+            SELECT `key` AS k, {size} AS size
+            FROM key_value
+            WHERE `key` > {p} AND {expired}
+            ORDER BY `key`
+            LIMIT {int(chunk_size)}
+        """, (last_key, now_value))
+        rows = cursor.fetchall()
+        if not rows:
+            break
+        keys = [_row_value(row, 'k', 0, db_type) for row in rows]
+        totals['rows'] += len(keys)
+        totals['bytes'] += sum(int(_row_value(row, 'size', 1, db_type) or 0) for row in rows)
+        if not dry_run:
+            placeholders = ','.join([p] * len(keys))
+            cursor.execute(f"DELETE FROM key_value WHERE `key` IN ({placeholders})", keys)
+            connection.commit()
+        last_key = keys[-1]
+        if len(keys) < chunk_size:
+            break
+    return totals
+
+
+def prune_login_hist(connection, db_type, max_age_days, chunk_size=DEFAULT_CHUNK_SIZE,
+                     dry_run=False, now=None):
+    """Delete login_hist rows older than max_age_days, oldest first, in id chunks."""
+    if max_age_days <= 0:
+        return {'rows': 0, 'bytes': 0}
+    p = sql_placeholder(db_type)
+    cutoff = cutoff_timestamp(max_age_days, now)
+    size = f"{_text_bytes(db_type, 'user_id')} + {_text_bytes(db_type, 'ip_address')} + {ROW_OVERHEAD_BYTES}"
+
+    cursor = connection.cursor()
+    totals = {'rows': 0, 'bytes': 0}
+    last_id = 0
+    while True:
+        cursor.execute(f"""
+            SELECT MAX(id) AS max_id, COUNT(*) AS row_count, SUM(size) AS size_bytes
+            FROM (
+                SELECT id, {size} AS size
+                FROM login_hist
+                WHERE id > {p} AND login_time < {p}
+                ORDER BY id
+                LIMIT {int(chunk_size)}
+            ) chunk
+        """, (last_id, cutoff))
+        row = cursor.fetchone()
+        max_id = _row_value(row, 'max_id', 0, db_type)
+        row_count = int(_row_value(row, 'row_count', 1, db_type) or 0)
+        if not row_count:
+            break
+        totals['rows'] += row_count
+        totals['bytes'] += int(_row_value(row, 'size_bytes', 2, db_type) or 0)
+        if not dry_run:
+            cursor.execute(f"""
+                DELETE FROM login_hist
+                WHERE id > {p} AND id <= {p} AND login_time < {p}
+            """, (last_id, max_id, cutoff))
+            connection.commit()
+        last_id = max_id
+        if row_count < chunk_size:
+            break
+    return totals
+
+
+def rollup_ping_data(connection, db_type, max_age_days, chunk_size=DEFAULT_CHUNK_SIZE,
+                     dry_run=False, now=None):
+    """
+    Fold ping_data rows older than max_age_days into ping_hourly, then delete them.
+
+    ping_hourly keeps one row per user per hour with counts and coordinate sums,
+    so averages stay exact when later chunks add to an existing bucket.
+    Each chunk is summarized and deleted in a single transaction.
+    'bucket_writes' counts the (user, hour) groups written per chunk; a
+    bucket that spans chunks is written, and counted, once per chunk.
+    """
+    if max_age_days <= 0:
+        return {'rows': 0, 'bytes': 0, 'bucket_writes': 0}
+    p = sql_placeholder(db_type)
+    cutoff = cutoff_timestamp(max_age_days, now)
+    size = f"{_text_bytes(db_type, 'user_id')} + {_text_bytes(db_type, 'ip_address')} + {ROW_OVERHEAD_BYTES + 32}"
+    if db_type == 'mysql':
+        hour = "DATE_FORMAT(`timestamp`, '%%Y-%%m-%%d %%H:00:00')"
+        upsert = """
+            ON DUPLICATE KEY UPDATE
+                ping_count = ping_count + VALUES(ping_count),
+                located_count = located_count + VALUES(located_count),
+                latitude_sum = latitude_sum + VALUES(latitude_sum),
+                longitude_sum = longitude_sum + VALUES(longitude_sum),
+                altitude_count = altitude_count + VALUES(altitude_count),
+                altitude_sum = altitude_sum + VALUES(altitude_sum),
+                first_ping = LEAST(first_ping, VALUES(first_ping)),
+                last_ping = GREATEST(last_ping, VALUES(last_ping))
+        """
+    else:
+        hour = "strftime('%Y-%m-%d %H:00:00', `timestamp`)"
+        upsert = """
+            ON CONFLICT(user_id, hour_start) DO UPDATE SET
+                ping_count = ping_count + excluded.ping_count,
+                located_count = located_count + excluded.located_count,
+                latitude_sum = latitude_sum + excluded.latitude_sum,
+                longitude_sum = longitude_sum + excluded.longitude_sum,
+                altitude_count = altitude_count + excluded.altitude_count,
+                altitude_sum = altitude_sum + excluded.altitude_sum,
+                first_ping = MIN(first_ping, excluded.first_ping),
+                last_ping = MAX(last_ping, excluded.last_ping)
+        """
+    located = "latitude IS NOT NULL AND longitude IS NOT NULL"
+
+    cursor = connection.cursor()
+    totals = {'rows': 0, 'bytes': 0, 'bucket_writes': 0}
+    last_id = 0
+    while True:
+        cursor.execute(f"""
+            SELECT MAX(id) AS max_id, COUNT(*) AS row_count, SUM(size) AS size_bytes
+            FROM (
+                SELECT id, {size} AS size
+                FROM ping_data
+                WHERE id > {p} AND `timestamp` < {p}
+                ORDER BY id
+                LIMIT {int(chunk_size)}
+            ) chunk
+        """, (last_id, cutoff))
+        row = cursor.fetchone()
+        max_id = _row_value(row, 'max_id', 0, db_type)
+        row_count = int(_row_value(row, 'row_count', 1, db_type) or 0)
+        if not row_count:
+            break
+        totals['rows'] += row_count
+        totals['bytes'] += int(_row_value(row, 'size_bytes', 2, db_type) or 0)
+        chunk_filter = f"id > {p} AND id <= {p} AND `timestamp` < {p}"
+        chunk_params = (last_id, max_id, cutoff)
+        # Upsert rowcount counts MySQL updates twice, so count the groups instead
+        cursor.execute(f"""
+            SELECT COUNT(*) AS group_count FROM (
+                SELECT 1 FROM ping_data WHERE {chunk_filter} GROUP BY user_id, {hour}
+            ) chunk_groups
+        """, chunk_params)
+        totals['bucket_writes'] += int(_row_value(cursor.fetchone(), 'group_count', 0, db_type) or 0)
+        if not dry_run:
+            cursor.execute(f"""
+                INSERT INTO ping_hourly (
+                    user_id, hour_start, ping_count, located_count,
+                    latitude_sum, longitude_sum, altitude_count, altitude_sum,
+                    first_ping, last_ping
+                )
+                SELECT
+                    user_id,
+                    {hour},
+                    COUNT(*),
+                    SUM(CASE WHEN {located} THEN 1 ELSE 0 END),
+                    COALESCE(SUM(CASE WHEN {located} THEN latitude END), 0),
+                    COALESCE(SUM(CASE WHEN {located} THEN longitude END), 0),
+                    COUNT(altitude),
+                    COALESCE(SUM(altitude), 0),
+                    MIN(`timestamp`),
+                    MAX(`timestamp`)
+                FROM ping_data
+                WHERE {chunk_filter}
+                GROUP BY user_id, {hour}
+                {upsert}
+            """, chunk_params)
+            cursor.execute(f"DELETE FROM ping_data WHERE {chunk_filter}", chunk_params)
+            connection.commit()
+        last_id = max_id
+        if row_count < chunk_size:
+            break
+    return totals
+
+
+def prune_ping_hourly(connection, db_type, max_age_days, dry_run=False, now=None):
+    """Delete hourly ping summaries older than max_age_days (0 keeps them forever)."""
+    if max_age_days <= 0:
+        return {'rows': 0, 'bytes': 0}
+    p = sql_placeholder(db_type)
+    cutoff = cutoff_timestamp(max_age_days, now)
+    cursor = connection.cursor()
+    cursor.execute(f"""
+        SELECT COUNT(*) AS row_count,
+               SUM({_text_bytes(db_type, 'user_id')} + {ROW_OVERHEAD_BYTES + 64}) AS size_bytes
+        FROM ping_hourly
+        WHERE hour_start < {p}
+    """, (cutoff,))
+    row = cursor.fetchone()
+    totals = {
+        'rows': int(_row_value(row, 'row_count', 0, db_type) or 0),
+        'bytes': int(_row_value(row, 'size_bytes', 1, db_type) or 0),
+    }
+    if totals['rows'] and not dry_run:
+        cursor.execute(f"DELETE FROM ping_hourly WHERE hour_start < {p}", (cutoff,))
+        connection.commit()
+    return totals
+
+
+def sqlite_free_bytes(connection):
+    """Return bytes held on the SQLite freelist (reusable, or reclaimable by VACUUM)."""
+    cursor = connection.cursor()
+    cursor.execute("PRAGMA freelist_count")
+    free_pages = cursor.fetchone()[0]
+    cursor.execute("PRAGMA page_size")
+    return free_pages * cursor.fetchone()[0]
+
+
+def table_exists(connection, db_type, table):
+    cursor = connection.cursor()
+    if db_type == 'mysql':
+        cursor.execute("""
+            SELECT COUNT(*) AS count FROM information_schema.tables
+            WHERE table_schema = DATABASE() AND table_name = %s
+        """, (table,))
+        return cursor.fetchone()['count'] > 0
+    cursor.execute("SELECT COUNT(*) FROM sqlite_master WHERE type='table' AND name=?", (table,))
+    return cursor.fetchone()[0] > 0
+
+
+def _expire_read_sets(connection, db_type, chunk_size, dry_run):
+    # Imported lazily: read_status builds on helpers from this module
+    from read_status import expire_read_sets
+    return expire_read_sets(connection, db_type, dry_run)
+
+
+def build_policies(env_vars):
+    """
+    Return the retention policies, one per table.
+
+    Each policy names the table, the SQLite file it lives in when MySQL is
+    not configured, and the job that enforces it.
+    """
+    login_days = _env_days(env_vars, 'RETENTION_LOGIN_HIST_DAYS', DEFAULT_LOGIN_HIST_DAYS)
+    ping_days = _env_days(env_vars, 'RETENTION_PING_RAW_DAYS', DEFAULT_PING_RAW_DAYS)
+    hourly_days = _env_days(env_vars, 'RETENTION_PING_HOURLY_DAYS', DEFAULT_PING_HOURLY_DAYS)
+    return [
+        {
+            'table': 'key_value',
+            'description': 'expire rows past created_at + life_time',
+            'sqlite_path': resolve_table_sqlite_path(env_vars, 'key_value'),
+            'job': lambda conn, db_type, chunk, dry: expire_key_value(conn, db_type, chunk, dry),
+        },
+        {
+            'table': 'read_status_sets',
+            'description': 'expire compacted read-status buckets past expires_at',
+            'sqlite_path': resolve_table_sqlite_path(env_vars, 'read_status_sets'),
+            'job': _expire_read_sets,
+        },
+        {
+            'table': 'login_hist',
+            'description': f"delete logins older than {login_days:g} days",
+            'sqlite_path': resolve_table_sqlite_path(env_vars, 'login_hist'),
+            'job': lambda conn, db_type, chunk, dry: prune_login_hist(conn, db_type, login_days, chunk, dry),
+        },
+        {
+            'table': 'ping_data',
+            'description': f"roll up pings older than {ping_days:g} days into ping_hourly",
+            'sqlite_path': resolve_table_sqlite_path(env_vars, 'ping_data'),
+            'job': lambda conn, db_type, chunk, dry: rollup_ping_data(conn, db_type, ping_days, chunk, dry),
+        },
+        {
+            'table': 'ping_hourly',
+            'description': (
+                f"delete hourly summaries older than {hourly_days:g} days"
+                if hourly_days > 0 else "keep hourly summaries forever"
+            ),
+            'sqlite_path': resolve_table_sqlite_path(env_vars, 'ping_hourly'),
+            'job': lambda conn, db_type, chunk, dry: prune_ping_hourly(conn, db_type, hourly_days, dry),
+        },
+    ]
+
+
+def run_retention(env_vars, tables=None, chunk_size=DEFAULT_CHUNK_SIZE, dry_run=False):
+    """
+    Run every retention policy (or only those for the given tables).
+
+    Returns a dict of table -> result with 'rows' and 'bytes' reclaimed.
+    Missing tables are skipped with a note rather than treated as errors.
+    """
+    results = {}
+    for policy in build_policies(env_vars):
+        table = policy['table']
+        if tables and table not in tables:
+            continue
+        print(f"\n{table}: {policy['description']}")
+        connection, db_type = get_db_connection(env_vars, sqlite_path=policy['sqlite_path'])
+        try:
+            if not table_exists(connection, db_type, table):
+                print("  - table not found, skipping")
+                continue
+            if table == 'ping_data' and not table_exists(connection, db_type, 'ping_hourly'):
+                print("  ✗ ping_hourly table missing; run setup_tables.py first")
+                continue
+            result = policy['job'](connection, db_type, chunk_size, dry_run)
+            verb = "Would reclaim" if dry_run else "Reclaimed"
+            line = f"  ✓ {verb} {result['rows']:,} row(s), ~{result['bytes']:,} bytes"
+            if result.get('bucket_writes'):
+                line += f" ({result['bucket_writes']:,} hourly bucket write(s))"
+            print(line)
+            if db_type == 'sqlite' and result['rows'] and not dry_run:
+                print(f"  SQLite freelist now {sqlite_free_bytes(connection):,} bytes (VACUUM to return to disk)")
+            results[table] = result
+        except Exception as e:
+            print(f"  ✗ Retention failed for {table}: {e}")
+        finally:
+            connection.close()
+    return results
+
+
+def main():
+    """Main function."""
+    parser = argparse.ArgumentParser(description="Apply retention and rollup policies to application tables.")
+    parser.add_argument('tables', nargs='*', help="limit the run to these tables")
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE,
+                        help=f"rows per delete batch (default {DEFAULT_CHUNK_SIZE})")
+    parser.add_argument('--dry-run', action='store_true', help="report what would be removed without deleting")
+    args = parser.parse_args()
+    if args.chunk_size < 1:
+        parser.error("--chunk-size must be at least 1")
+
+    print("Applying retention policies..." + (" (dry run)" if args.dry_run else ""))
+    try:
+        results = run_retention(load_env_file(), args.tables, args.chunk_size, args.dry_run)
+    except Exception as e:
+        print(f"ERROR: {e}")
+        sys.exit(1)
+
+    total_rows = sum(result['rows'] for result in results.values())
+    total_bytes = sum(result['bytes'] for result in results.values())
+    print(f"\nTotal: {total_rows:,} row(s), ~{total_bytes:,} bytes")
+
+
+if __name__ == '__main__':
+    main()
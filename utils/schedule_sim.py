@@ -0,0 +1,292 @@
+#!/usr/bin/env python3
+"""
+Discrete-event simulator for feed refresh policies.
+Replays the recorded published_date stream of every configured feed
+through the due-feed decision of update_news.py on a simulated clock, one
+cron tick at a time, and reports outbound requests against how long
+articles waited between publication and the fetch that found them.
+A simulated week takes seconds, so refresh settings in config/news.json
+can be tuned for cost before they are deployed.
+
+Policies (compare several in one run with --policy ... --policy ...):
+  fixed           the configured refresh of each feed
+  fixed:M         every feed refreshed every M minutes
+  adaptive[:LO:HI]  halve a feed's interval after a fetch that found
+                  something, grow it by 1.5x after an empty one, within
+                  [LO, HI] minutes (default 5:720), starting at its refresh
+  host:N          configured refresh, at most N requests per host per run;
+                  the rest are deferred to the next run like a missed deadline
+"""
+
+import sys
+import json
+import random
+import argparse
+from bisect import bisect_right
+from datetime import datetime, timedelta
+
+from db_utils import load_env_file, get_db_connection, load_news_config, load_feed_config
+from fetch_limits import feed_host, resolve_fetch_settings
+from update_news import normalize_datetime, select_due_feeds, prioritize_feeds
+
+DEFAULT_DAYS = 7
+DEFAULT_TICK_MINUTES = 5  # the cron cadence of update_news.py
+DEFAULT_FETCH_SECONDS = 1.5
+DEFAULT_POLICIES = ('fixed', 'adaptive', 'host:1')
+ADAPTIVE_BOUNDS = (5.0, 720.0)
+ADAPTIVE_SHRINK = 0.5
+ADAPTIVE_GROWTH = 1.5
+
+
+def parse_policy(spec):
+    """Turn 'fixed', 'fixed:30', 'adaptive:5:720' or 'host:2' into a policy dict."""
+    name, _, rest = spec.partition(':')
+    args = [a for a in rest.split(':') if a] if rest else []
+    try:
+        values = [float(a) for a in args]
+    except ValueError:
+        raise ValueError(f"invalid policy '{spec}'")
+    if name == 'fixed' and len(values) <= 1 and all(v > 0 for v in values):
+        return {'name': spec, 'kind': 'fixed', 'interval': values[0] if values else None}
+    if name == 'adaptive' and len(values) in (0, 2) and all(v > 0 for v in values):
+        low, high = values or ADAPTIVE_BOUNDS
+        if low <= high:
+            return {'name': spec, 'kind': 'adaptive', 'bounds': (low, high)}
+    if name == 'host' and len(values) == 1 and values[0] >= 1:
+        return {'name': spec, 'kind': 'host', 'per_run': int(values[0])}
+    raise ValueError(f"invalid policy '{spec}'")
+
+
+def load_history(env_vars, feed_ids, days, end=None):
+    """
+    Read published_date per feed from news_articles.
+
+    Returns (start, end, {feed_id: sorted datetimes}) for the days before
+    end, which defaults to the newest stored article.
+    """
+    connection, db_type = get_db_connection(env_vars)
+    p = '%s' if db_type == 'mysql' else '?'
+    try:
+        cursor = connection.cursor()
+        if end is None:
+            cursor.execute("SELECT MAX(published_date) AS newest FROM news_articles")
+            row = cursor.fetchone()
+            end = normalize_datetime(row['newest'] if db_type == 'mysql' else row[0])
+            if end is None:
+                raise RuntimeError("news_articles is empty; use --synthetic")
+        start = end - timedelta(days=days)
+        # Stored dates are compared as text on SQLite
+        bound = (lambda value: value) if db_type == 'mysql' else (lambda value: value.isoformat(sep=' '))
+        cursor.execute(f"""
+            SELECT feed_id, published_date FROM news_articles
+            WHERE published_date >= {p} AND published_date <= {p}
+        """, (bound(start), bound(end)))
+        history = {feed_id: [] for feed_id in feed_ids}
+        for row in cursor.fetchall():
+            feed_id = row['feed_id'] if db_type == 'mysql' else row[0]
+            published = normalize_datetime(row['published_date'] if db_type == 'mysql' else row[1])
+            if feed_id in history and published is not None:
+                history[feed_id].append(published)
+    finally:
+        connection.close()
+    for dates in history.values():
+        dates.sort()
+    return start, end, history
+
+
+def synthetic_history(feed_ids, days, seed=1, end=None):
+    """Poisson article streams with a day/night cycle, 2-200 articles per feed per day."""
+    rng = random.Random(seed)
+    end = end or datetime(2025, 1, 8)
+    start = end - timedelta(days=days)
+    history = {}
+    for feed_id in feed_ids:
+        per_day = min(max(rng.lognormvariate(3.0, 1.2), 2.0), 200.0)
+        dates = []
+        t = 0.0
+        while True:
+            t += rng.expovariate(per_day * 2 / 86400)
+            if t >= days * 86400:
+                break
+            # Thin by time of day: quiet at night, busiest in the afternoon
+            hour = (t / 3600) % 24
+            if rng.random() < (0.15 if hour < 6 else 1.0 if 12 <= hour < 18 else 0.6):
+                dates.append(start + timedelta(seconds=t))
+        history[feed_id] = dates
+    return start, end, history
+
+
+def simulate(feeds, history, start, end, policy, fetch_settings, tick_minutes=DEFAULT_TICK_MINUTES,
+             fetch_seconds=DEFAULT_FETCH_SECONDS, deadline=None, seed=1):
+    """
+    Run one policy from start to end and return its request and latency figures.
+
+    Each tick asks select_due_feeds() which feeds are due, orders them with
+    prioritize_feeds() (deferred first, then most overdue) and starts each
+    fetch when its host's concurrency and spacing limits allow. A fetch
+    finds every article published up to the moment it starts. Feeds begin
+    with a random phase within their interval, so the run does not open with
+    every feed due at once. Articles published before start count as known.
+    """
+    rng = random.Random(seed)
+    per_host_limit = fetch_settings['perHostLimit']
+    host_spacing = fetch_settings['hostSpacingSeconds']
+    max_concurrency = fetch_settings['maxConcurrency']
+    span_seconds = (end - start).total_seconds()
+    by_id = {}
+    for feed in feeds:
+        sim_feed = dict(feed)
+        if policy['kind'] == 'fixed' and policy['interval']:
+            sim_feed['refresh'] = policy['interval']
+        elif policy['kind'] == 'adaptive':
+            low, high = policy['bounds']
+            sim_feed['refresh'] = min(max(sim_feed['refresh'], low), high)
+        by_id[sim_feed['id']] = sim_feed
+    sim_feeds = list(by_id.values())
+    hosts = {feed_id: feed_host(feed) for feed_id, feed in by_id.items()}
+    published = {
+        feed_id: [(date - start).total_seconds() for date in history.get(feed_id, ())]
+        for feed_id in by_id
+    }
+    found = {feed_id: 0 for feed_id in by_id}
+    last_updates = {
+        feed_id: start - timedelta(minutes=rng.uniform(0, feed['refresh'])) for feed_id, feed in by_id.items()
+    }
+
+    requests = empty = deferred_total = 0
+    latencies = []
+    deferred = []
+    tick = 0.0
+    while tick <= span_seconds:
+        now = start + timedelta(seconds=tick)
+        overdue = {}
+        due = select_due_feeds(sim_feeds, last_updates, now, overdue, verbose=False)
+        ordered = prioritize_feeds(due, sim_feeds, overdue, 'overdue', deferred)
+        deferred = []
+        per_host = {}
+        for index, feed_id in enumerate(ordered):
+            host = hosts[feed_id]
+            slot = per_host.get(host, 0)
+            started = max(
+                (index // max_concurrency) * fetch_seconds,
+                (slot // per_host_limit) * fetch_seconds,
+                slot * host_spacing,
+            )
+            if (policy['kind'] == 'host' and slot >= policy['per_run']) or (deadline and started > deadline):
+                deferred.append(feed_id)
+                continue
+            per_host[host] = slot + 1
+            fetched_at = tick + started
+            requests += 1
+            dates = published[feed_id]
+            upto = bisect_right(dates, fetched_at)
+            new = upto - found[feed_id]
+            latencies.extend(fetched_at - dates[i] for i in range(found[feed_id], upto))
+            found[feed_id] = upto
+            if not new:
+                empty += 1
+            last_updates[feed_id] = start + timedelta(seconds=fetched_at)
+            if policy['kind'] == 'adaptive':
+                low, high = policy['bounds']
+                feed = by_id[feed_id]
+                factor = ADAPTIVE_SHRINK if new else ADAPTIVE_GROWTH
+                feed['refresh'] = min(max(feed['refresh'] * factor, low), high)
+        deferred_total += len(deferred)
+        tick += tick_minutes * 60
+
+    total = sum(len(dates) for dates in published.values())
+    latencies.sort()
+    days = span_seconds / 86400 or 1
+
+    def percentile(fraction):
+        return latencies[min(int(fraction * len(latencies)), len(latencies) - 1)] / 60 if latencies else None
+
+    return {
+        'policy': policy['name'],
+        'requests': requests,
+        'requests_per_day': requests / days,
+        'empty_fraction': empty / requests if requests else 0.0,
+        'deferred': deferred_total,
+        'articles': total,
+        'discovered': len(latencies),
+        'latency_mean_minutes': sum(latencies) / len(latencies) / 60 if latencies else None,
+        'latency_p50_minutes': percentile(0.5),
+        'latency_p95_minutes': percentile(0.95),
+        'latency_max_minutes': latencies[-1] / 60 if latencies else None,
+    }
+
+
+def print_results(results, start, end, feed_count):
+    print(f"Simulated {start:%Y-%m-%d %H:%M} → {end:%Y-%m-%d %H:%M} UTC, {feed_count} feed(s), "
+          f"{results[0]['articles']:,} article(s)\n")
+    print(f"  {'policy':<16} {'requests':>9} {'req/day':>8} {'empty':>6} {'deferred':>8} "
+          f"{'found':>7} {'mean':>7} {'p50':>7} {'p95':>7} {'max':>7}")
+
+    def minutes(value):
+        return f"{value:6.1f}m" if value is not None else '     - '
+
+    for r in results:
+        print(f"  {r['policy']:<16} {r['requests']:>9,} {r['requests_per_day']:>8,.0f} {r['empty_fraction']:>6.0%} "
+              f"{r['deferred']:>8,} {r['discovered']:>7,} {minutes(r['latency_mean_minutes'])} "
+              f"{minutes(r['latency_p50_minutes'])} {minutes(r['latency_p95_minutes'])} "
+              f"{minutes(r['latency_max_minutes'])}")
+    print("\n  Latency is publication to discovering fetch; articles not found by the end are not counted.")
+
+
+def main():
+    """Main function."""
+    parser = argparse.ArgumentParser(description="Replay feed history through refresh policies on a simulated clock.")
+    parser.add_argument('--policy', action='append', dest='policies', metavar='SPEC',
+                        help=f"policy to simulate, repeatable (default: {' '.join(DEFAULT_POLICIES)})")
+    parser.add_argument('--days', type=float, default=DEFAULT_DAYS, help="simulated span (default %(default)s)")
+    parser.add_argument('--end', help="end of the replayed window (default: newest stored article)")
+    parser.add_argument('--tick', type=float, default=DEFAULT_TICK_MINUTES,
+                        help="minutes between update_news runs (default %(default)s)")
+    parser.add_argument('--fetch-seconds', type=float, default=DEFAULT_FETCH_SECONDS,
+                        help="simulated duration of one fetch (default %(default)s)")
+    parser.add_argument('--deadline', type=float,
+                        help="defer fetches that would start later than this many seconds into a run")
+    parser.add_argument('--synthetic', action='store_true',
+                        help="replay generated article streams instead of news_articles")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--json', metavar='PATH', help="write the results as JSON")
+    args = parser.parse_args()
+
+    try:
+        policies = [parse_policy(spec) for spec in (args.policies or DEFAULT_POLICIES)]
+    except ValueError as e:
+        parser.error(str(e))
+    if args.days <= 0 or args.tick <= 0 or args.fetch_seconds < 0:
+        parser.error("--days and --tick must be positive and --fetch-seconds not negative")
+    end = normalize_datetime(args.end) if args.end else None
+    if args.end and end is None:
+        parser.error("--end must be an ISO date")
+
+    env_vars = load_env_file()
+    feeds = load_feed_config()
+    fetch_settings = resolve_fetch_settings(load_news_config(), env_vars)
+    feed_ids = [feed['id'] for feed in feeds]
+    if args.synthetic:
+        start, end, history = synthetic_history(feed_ids, args.days, args.seed, end)
+    else:
+        try:
+            start, end, history = load_history(env_vars, feed_ids, args.days, end)
+        except Exception as e:
+            print(f"ERROR: Could not read article history: {e}")
+            sys.exit(1)
+
+    results = [
+        simulate(feeds, history, start, end, policy, fetch_settings, args.tick, args.fetch_seconds,
+                 args.deadline, args.seed)
+        for policy in policies
+    ]
+    print_results(results, start, end, len(feeds))
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'start': start.isoformat(), 'end': end.isoformat(), 'results': results}, f, indent=2)
+        print(f"✓ Wrote JSON report to {args.json}")
+
+
+if __name__ == '__main__':
+    main()
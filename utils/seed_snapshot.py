@@ -0,0 +1,332 @@
+#!/usr/bin/env python3
+"""
+Seed snapshots for bootstrapping new deployments.
+A fresh node starts with an empty news database, so news.php shows little
+until every feed has been fetched once. --export writes the recent
+articles and feed_updates of a running node to a compact, versioned file;
+--import bulk-loads it on an empty node in one transaction with the
+secondary indexes built afterwards. The first update_news.py run then only
+fetches what is new.
+
+File format (gzip, one JSON document per line):
+  {"format": "teslacloud-news-seed", "version": 1, "config_hash": ..., "feeds": {id: hash},
+   "columns": {"a": [...], "u": [...]}, ...}     header
+  ["a", feed_id, url, title, published_date]      news_articles row
+  ["u", feed_id, last_updated, last_check, update_count]   feed_updates row
+  {"end": true, "rows": N, "sha256": ...}         trailer: row count and SHA-256 of the row lines
+"""
+
+import os
+import sys
+import json
+import gzip
+import time
+import hashlib
+import argparse
+from datetime import datetime, timedelta, timezone
+
+from db_utils import (
+    PROJECT_ROOT, load_env_file, get_db_connection, load_news_config, row_field, DatabaseUnavailable
+)
+from update_news import normalize_datetime
+
+SEED_FORMAT = 'teslacloud-news-seed'
+SEED_VERSION = 1
+DEFAULT_SEED_PATH = PROJECT_ROOT / 'data' / 'news-seed.jsonl.gz'
+DEFAULT_DAYS = 7
+DEFAULT_MAX_PER_FEED = 200
+ARTICLE_COLUMNS = ('feed_id', 'url', 'title', 'published_date')
+UPDATE_COLUMNS = ('feed_id', 'last_updated', 'last_check', 'update_count')
+INSERT_BATCH = 1000
+
+
+def _stable_hash(value):
+    return hashlib.sha256(json.dumps(value, sort_keys=True).encode('utf-8')).hexdigest()[:16]
+
+
+def config_hashes(config):
+    """(hash of the whole news.json, {feed_id: hash of its entry})."""
+    feeds = {feed['id']: _stable_hash(feed) for feed in config.get('feeds', []) if feed.get('id')}
+    return _stable_hash(config), feeds
+
+
+def _timestamp(value):
+    value = normalize_datetime(value)
+    return value.strftime('%Y-%m-%d %H:%M:%S') if value else None
+
+
+def export_seed(env_vars, path, days=DEFAULT_DAYS, max_per_feed=DEFAULT_MAX_PER_FEED):
+    """
+    Write the newest articles (per feed, at most max_per_feed from the last
+    `days` days) and every feed_updates row to path. Returns the header.
+    """
+    config = load_news_config()
+    config_hash, feed_hashes = config_hashes(config)
+    cutoff = datetime.now(timezone.utc).replace(tzinfo=None) - timedelta(days=days)
+    connection, db_type = get_db_connection(env_vars)
+    p = '%s' if db_type == 'mysql' else '?'
+    digest = hashlib.sha256()
+    rows = 0
+    header = {
+        'format': SEED_FORMAT,
+        'version': SEED_VERSION,
+        'created_at': datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S'),
+        'source_db': db_type,
+        'config_hash': config_hash,
+        'feeds': feed_hashes,
+        'days': days,
+        'columns': {'a': list(ARTICLE_COLUMNS), 'u': list(UPDATE_COLUMNS)},
+    }
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    try:
+        cursor = connection.cursor()
+        with gzip.open(tmp_path, 'wt', encoding='utf-8', compresslevel=9) as out:
+            out.write(json.dumps(header, separators=(',', ':')) + '\n')
+
+            def emit(record):
+                nonlocal rows
+                line = json.dumps(record, separators=(',', ':'), ensure_ascii=False) + '\n'
+                digest.update(line.encode('utf-8'))
+                out.write(line)
+                rows += 1
+
+            cutoff_value = cutoff if db_type == 'mysql' else cutoff.isoformat(sep=' ')
+            for feed_id in feed_hashes:
+                # One (feed_id, published_date) index range per feed
+                cursor.execute(f"""
+                    SELECT feed_id, url, title, published_date FROM news_articles
+                    WHERE feed_id = {p} AND published_date >= {p}
+                    ORDER BY published_date DESC LIMIT {int(max_per_feed)}
+                """, (feed_id, cutoff_value))
+                for row in cursor.fetchall():
+                    emit(['a', row_field(row, 'feed_id', 0), row_field(row, 'url', 1), row_field(row, 'title', 2),
+                          _timestamp(row_field(row, 'published_date', 3))])
+
+            cursor.execute(f"SELECT {', '.join(UPDATE_COLUMNS)} FROM feed_updates")
+            for row in cursor.fetchall():
+                emit(['u', row_field(row, 'feed_id', 0), _timestamp(row_field(row, 'last_updated', 1)),
+                      _timestamp(row_field(row, 'last_check', 2)), row_field(row, 'update_count', 3) or 0])
+
+            out.write(json.dumps({'end': True, 'rows': rows, 'sha256': digest.hexdigest()}) + '\n')
+        os.replace(tmp_path, path)
+    finally:
+        connection.close()
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    header['rows'] = rows
+    return header
+
+
+def read_seed(path):
+    """
+    Return (header, article rows, feed_updates rows) after checking the
+    format, version, row count and checksum; raises ValueError otherwise.
+    """
+    articles, updates = [], []
+    digest = hashlib.sha256()
+    trailer = None
+    with gzip.open(path, 'rt', encoding='utf-8') as f:
+        header = json.loads(f.readline() or 'null')
+        if not isinstance(header, dict) or header.get('format') != SEED_FORMAT:
+            raise ValueError("not a news seed snapshot")
+        if header.get('version') != SEED_VERSION:
+            raise ValueError(f"unsupported seed version {header.get('version')} (expected {SEED_VERSION})")
+        for line in f:
+            record = json.loads(line)
+            if isinstance(record, dict):
+                trailer = record
+                break
+            digest.update(line.encode('utf-8'))
+            (articles if record[0] == 'a' else updates).append(record[1:])
+    if not trailer or not trailer.get('end'):
+        raise ValueError("seed snapshot is truncated")
+    if trailer.get('rows') != len(articles) + len(updates) or trailer.get('sha256') != digest.hexdigest():
+        raise ValueError("seed snapshot checksum mismatch")
+    return header, articles, updates
+
+
+def _article_count(connection):
+    cursor = connection.cursor()
+    cursor.execute("SELECT COUNT(*) AS count FROM news_articles")
+    return row_field(cursor.fetchone(), 'count', 0)
+
+
+def _secondary_indexes(connection, db_type):
+    """
+    [(name, create statement)] of news_articles indexes that can be dropped
+    for the load; the article key stays so duplicates are still rejected.
+    """
+    cursor = connection.cursor()
+    if db_type == 'mysql':
+        cursor.execute("""
+            SELECT index_name AS name, GROUP_CONCAT(column_name ORDER BY seq_in_index) AS columns
+            FROM information_schema.statistics
+            WHERE table_schema = DATABASE() AND table_name = 'news_articles' AND non_unique = 1
+            GROUP BY index_name
+        """)
+        return [(row_field(row, 'name', 0), f"ADD INDEX {row_field(row, 'name', 0)} ({row_field(row, 'columns', 1)})")
+                for row in cursor.fetchall()]
+    cursor.execute("""
+        SELECT name, sql FROM sqlite_master
+        WHERE type = 'index' AND tbl_name = 'news_articles' AND sql IS NOT NULL AND sql NOT LIKE 'CREATE UNIQUE%'
+    """)
+    return [(row[0], row[1]) for row in cursor.fetchall()]
+
+
+def import_seed(env_vars, path, if_empty=False):
+    """
+    Bulk-load a seed snapshot. Articles of feeds no longer configured are
+    skipped, and feed_updates rows only kept for feeds whose news.json entry
+    is unchanged, so edited feeds are fetched right away. Returns a summary,
+    or None when if_empty is set and news_articles already has rows.
+    """
+    from partitions import is_partitioned
+    from url_canon import url_hash, url_hash_available
+
+    header, articles, updates = read_seed(path)
+    _, feed_hashes = config_hashes(load_news_config())
+    articles = [row for row in articles if row[0] in feed_hashes]
+    stale = {feed_id for feed_id, digest in header['feeds'].items() if feed_hashes.get(feed_id) != digest}
+    updates = [row for row in updates if row[0] in feed_hashes and row[0] not in stale]
+
+    connection, db_type = get_db_connection(env_vars)
+    p = '%s' if db_type == 'mysql' else '?'
+    try:
+        try:
+            existing = _article_count(connection)
+        except Exception:
+            # A brand-new node: create the news tables first
+            from init_db import init_database
+            connection.rollback()
+            init_database(connection, db_type)
+            existing = 0
+        if if_empty and existing:
+            return None
+        started = time.perf_counter()
+        cursor = connection.cursor()
+        hashed = url_hash_available(connection, db_type)
+        if hashed:
+            articles = [row + [url_hash(row[1])] for row in articles]
+        # A seed from a node keyed on the raw URL can hold variants of one
+        # story; keep the first so the load does not rely on the key alone
+        unique = {}
+        for row in articles:
+            unique.setdefault((row[0], row[-1] if hashed else row[1]), row)
+        articles = list(unique.values())
+        columns = list(ARTICLE_COLUMNS) + (['url_hash'] if hashed else [])
+        # A partitioned table is loaded through its view or partitions as is
+        deferred = [] if is_partitioned(connection, db_type) else _secondary_indexes(connection, db_type)
+
+        if db_type == 'mysql':
+            if deferred:
+                cursor.execute("ALTER TABLE news_articles " + ', '.join(f"DROP INDEX {name}" for name, _ in deferred))
+            insert = f"INSERT IGNORE INTO news_articles ({', '.join(columns)}) VALUES ({', '.join([p] * len(columns))})"
+            upsert = f"""
+                INSERT INTO feed_updates ({', '.join(UPDATE_COLUMNS)}) VALUES ({', '.join([p] * 4)})
+                ON DUPLICATE KEY UPDATE last_updated = VALUES(last_updated), last_check = VALUES(last_check)
+            """
+        else:
+            cursor.execute("PRAGMA synchronous = OFF")
+            for name, _ in deferred:
+                cursor.execute(f"DROP INDEX {name}")
+            insert = f"INSERT OR IGNORE INTO news_articles ({', '.join(columns)}) VALUES ({', '.join([p] * len(columns))})"
+            upsert = f"INSERT OR REPLACE INTO feed_updates ({', '.join(UPDATE_COLUMNS)}) VALUES ({', '.join([p] * 4)})"
+
+        try:
+            for start in range(0, len(articles), INSERT_BATCH):
+                cursor.executemany(insert, articles[start:start + INSERT_BATCH])
+            if updates:
+                cursor.executemany(upsert, updates)
+            connection.commit()
+        except Exception:
+            connection.rollback()
+            raise
+        finally:
+            # Put the indexes back even if the load failed
+            if db_type == 'mysql':
+                if deferred:
+                    cursor.execute("ALTER TABLE news_articles " + ', '.join(sql for _, sql in deferred))
+            else:
+                for _, sql in deferred:
+                    cursor.execute(sql)
+                connection.commit()
+        load_seconds = time.perf_counter() - started
+
+        from histogram import histogram_available, rebuild_histogram
+        if histogram_available(connection, db_type):
+            rebuild_histogram(connection, db_type)
+        return {
+            'articles': len(articles),
+            'feed_updates': len(updates),
+            'stale_feeds': sorted(stale & set(feed_hashes)),
+            'rows_stored': _article_count(connection),
+            'seconds': load_seconds,
+            'created_at': header.get('created_at'),
+        }
+    finally:
+        connection.close()
+
+
+def main():
+    """Main function."""
+    parser = argparse.ArgumentParser(description="Export or import a news seed snapshot.")
+    action = parser.add_mutually_exclusive_group(required=True)
+    action.add_argument('--export', nargs='?', const=str(DEFAULT_SEED_PATH), metavar='PATH',
+                        help=f"write a seed snapshot (default {DEFAULT_SEED_PATH})")
+    action.add_argument('--import', dest='import_path', nargs='?', const=str(DEFAULT_SEED_PATH), metavar='PATH',
+                        help="bulk-load a seed snapshot")
+    action.add_argument('--info', metavar='PATH', help="verify a seed snapshot and describe it")
+    parser.add_argument('--days', type=int, default=DEFAULT_DAYS, help="export articles this recent (default %(default)s)")
+    parser.add_argument('--max-per-feed', type=int, default=DEFAULT_MAX_PER_FEED,
+                        help="export at most this many articles per feed (default %(default)s)")
+    parser.add_argument('--if-empty', action='store_true', help="import only into an empty news_articles table")
+    args = parser.parse_args()
+
+    env_vars = load_env_file()
+    if args.export:
+        if args.days < 1 or args.max_per_feed < 1:
+            parser.error("--days and --max-per-feed must be positive")
+        started = time.perf_counter()
+        try:
+            header = export_seed(env_vars, args.export, args.days, args.max_per_feed)
+        except DatabaseUnavailable as e:
+            print(f"ERROR: {e}")
+            sys.exit(1)
+        print(f"✓ Wrote {header['rows']:,} row(s) to {args.export} "
+              f"({os.path.getsize(args.export):,} bytes, {time.perf_counter() - started:.2f}s)")
+        return
+
+    if args.info:
+        try:
+            header, articles, updates = read_seed(args.info)
+        except (OSError, ValueError) as e:
+            print(f"✗ {args.info}: {e}")
+            sys.exit(1)
+        _, feed_hashes = config_hashes(load_news_config())
+        stale = [feed_id for feed_id, digest in header['feeds'].items() if feed_hashes.get(feed_id) != digest]
+        print(f"✓ {args.info}: version {header['version']}, created {header['created_at']} UTC from {header['source_db']}")
+        print(f"  {len(articles):,} article(s), {len(updates):,} feed_updates row(s), {len(header['feeds'])} feed(s)")
+        print(f"  {len(stale)} feed(s) changed or removed since export" + (f": {', '.join(stale)}" if stale else ''))
+        return
+
+    if not os.path.exists(args.import_path):
+        print(f"No seed snapshot at {args.import_path}; nothing to import")
+        return
+    try:
+        summary = import_seed(env_vars, args.import_path, args.if_empty)
+    except Exception as e:
+        print(f"ERROR: Seed import failed: {e}")
+        sys.exit(1)
+    if summary is None:
+        print("✓ news_articles already has rows; seed not imported")
+        return
+    print(f"✓ Loaded {summary['articles']:,} article(s) and {summary['feed_updates']:,} feed timestamp(s) "
+          f"from a seed of {summary['created_at']} UTC in {summary['seconds']:.2f}s")
+    if summary['stale_feeds']:
+        print(f"  {len(summary['stale_feeds'])} feed(s) changed since export will be fetched first: "
+              f"{', '.join(summary['stale_feeds'])}")
+
+
+if __name__ == '__main__':
+    main()
@@ -7,25 +7,30 @@ Run this script once during initial setup or after database reset.
 
 import sys
 import sqlite3
+import argparse
 from pathlib import Path
-from db_utils import load_env_file
+from db_utils import (
+    CONSOLIDATED_SQLITE_FILES,
+    load_env_file,
+    resolve_sqlite_path,
+    is_consolidated_sqlite,
+    consolidated_sqlite_path,
+    mysql_connect_args
+)
+from partitions import DEFAULT_MONTHS_AHEAD, is_partitioned, maintain_partitions
+from sqlite_layout import prepare_layout_file
 
 
 def get_connection_info(env_vars):
     """
     Determine database connection type and parameters.
-    Returns tuple of (connection_type, connection_params).
+    Returns tuple of (connection_type, connection_params); the MySQL
+    parameters are the pymysql.connect() arguments of mysql_connect_args.
     """
     # Check for MySQL configuration
     if env_vars.get('SQL_HOST'):
         # MySQL/MariaDB connection
-        return 'mysql', {
-            'host': env_vars.get('SQL_HOST'),
-            'user': env_vars.get('SQL_USER'),
-            'password': env_vars.get('SQL_PASS'),
-            'database': env_vars.get('SQL_DB_NAME'),
-            'charset': 'utf8mb4'
-        }
+        return 'mysql', mysql_connect_args(env_vars)
     else:
         # SQLite - we'll handle multiple paths for development
         return 'sqlite', None
@@ -88,6 +93,25 @@ def setup_tables_mysql(connection):
         ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
     """)
     
+    # Table 4b: ping_hourly (rollup of old ping_data rows, see retention.py)
+    print("  - Creating ping_hourly table...")
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS ping_hourly (
+            user_id VARCHAR(255) NOT NULL,
+            hour_start DATETIME NOT NULL,
+            ping_count INT NOT NULL DEFAULT 0,
+            located_count INT NOT NULL DEFAULT 0,
+            latitude_sum DOUBLE NOT NULL DEFAULT 0,
+            longitude_sum DOUBLE NOT NULL DEFAULT 0,
+            altitude_count INT NOT NULL DEFAULT 0,
+            altitude_sum DOUBLE NOT NULL DEFAULT 0,
+            first_ping DATETIME NULL,
+            last_ping DATETIME NULL,
+            PRIMARY KEY (user_id, hour_start),
+            INDEX idx_hour_start (hour_start)
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+    """)
+    
     # Table 5: key_value (from rest_db.php)
     print("  - Creating key_value table...")
     cursor.execute("""
@@ -100,6 +124,21 @@ def setup_tables_mysql(connection):
         ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
     """)
     
+    # Table 5b: read_status_sets (compacted read markers, see read_status.py)
+    print("  - Creating read_status_sets table...")
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS read_status_sets (
+            user_hash VARCHAR(255) NOT NULL,
+            bucket_day DATE NOT NULL,
+            article_hashes MEDIUMBLOB NOT NULL,
+            id_count INT NOT NULL DEFAULT 0,
+            expires_at DATETIME NULL,
+            updated_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (user_hash, bucket_day),
+            INDEX idx_expires_at (expires_at)
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+    """)
+    
     # Table 6: news_articles (from init_db.py)
     print("  - Creating news_articles table...")
     cursor.execute("""
@@ -110,12 +149,43 @@ def setup_tables_mysql(connection):
             title TEXT NOT NULL,
             published_date DATETIME NOT NULL,
             created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-            UNIQUE KEY unique_article (feed_id, url(255)),
+            url_hash CHAR(16) NULL,
+            UNIQUE KEY unique_article (feed_id, url_hash),
             INDEX idx_feed_date (feed_id, published_date),
             INDEX idx_published_date (published_date)
         ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
     """)
     
+    # Table 6b: news_changes (delta log for polling clients, see news_delta.py)
+    print("  - Creating news_changes table...")
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS news_changes (
+            seq BIGINT AUTO_INCREMENT PRIMARY KEY,
+            op CHAR(1) NOT NULL,
+            feed_id VARCHAR(50) NULL,
+            url TEXT NULL,
+            title TEXT NULL,
+            previous_title TEXT NULL,
+            published_date DATETIME NULL,
+            range_start DATETIME NULL,
+            range_end DATETIME NULL,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            INDEX idx_created_at (created_at)
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+    """)
+    
+    # Table 6c: article_histogram (hourly/daily article counts, see histogram.py)
+    print("  - Creating article_histogram table...")
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS article_histogram (
+            bucket VARCHAR(4) NOT NULL,
+            bucket_start DATETIME NOT NULL,
+            feed_id VARCHAR(50) NOT NULL,
+            article_count INT NOT NULL DEFAULT 0,
+            PRIMARY KEY (bucket, bucket_start, feed_id)
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+    """)
+    
     # Table 7: feed_updates (from init_db.py)
     print("  - Creating feed_updates table...")
     cursor.execute("""
@@ -131,8 +201,13 @@ def setup_tables_mysql(connection):
     print("✓ All MySQL tables created successfully")
 
 
-def setup_tables_sqlite(db_path):
-    """Create all database tables for a SQLite database file."""
+def setup_tables_sqlite(db_path, tables=None):
+    """
+    Create database tables in a SQLite database file.
+
+    tables limits creation to the named tables (one file of the consolidated
+    layout); by default every table is created.
+    """
     print(f"Creating database tables for SQLite: {db_path}")
     
     # Create directory if it doesn't exist
@@ -141,104 +216,254 @@ def setup_tables_sqlite(db_path):
     
     connection = sqlite3.connect(db_path)
     cursor = connection.cursor()
+
+    def include(table):
+        return tables is None or table in tables
     
     # Table 1: user_settings (from settings.php)
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS user_settings (
-            user_id TEXT NOT NULL,
-            setting_key TEXT NOT NULL,
-            setting_value TEXT,
-            updated_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-            PRIMARY KEY (user_id, setting_key)
-        )
-    """)
+    if include('user_settings'):
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS user_settings (
+                user_id TEXT NOT NULL,
+                setting_key TEXT NOT NULL,
+                setting_value TEXT,
+                updated_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (user_id, setting_key)
+            )
+        """)
     
     # Table 2: user_ids (from settings.php)
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS user_ids (
-            user_id TEXT PRIMARY KEY,
-            initial_login DATETIME DEFAULT CURRENT_TIMESTAMP,
-            last_login DATETIME DEFAULT CURRENT_TIMESTAMP,
-            last_ip TEXT,
-            login_count INTEGER DEFAULT 0,
-            auto_created INTEGER DEFAULT 0
-        )
-    """)
+    if include('user_ids'):
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS user_ids (
+                user_id TEXT PRIMARY KEY,
+                initial_login DATETIME DEFAULT CURRENT_TIMESTAMP,
+                last_login DATETIME DEFAULT CURRENT_TIMESTAMP,
+                last_ip TEXT,
+                login_count INTEGER DEFAULT 0,
+                auto_created INTEGER DEFAULT 0
+            )
+        """)
     
     # Table 3: login_hist (from settings.php)
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS login_hist (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id TEXT NOT NULL,
-            login_time DATETIME DEFAULT CURRENT_TIMESTAMP,
-            ip_address TEXT NOT NULL
-        )
-    """)
+    if include('login_hist'):
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS login_hist (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id TEXT NOT NULL,
+                login_time DATETIME DEFAULT CURRENT_TIMESTAMP,
+                ip_address TEXT NOT NULL
+            )
+        """)
     
     # Table 4: ping_data (from ping.php)
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS ping_data (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id TEXT NOT NULL,
-            latitude REAL NULL,
-            longitude REAL NULL,
-            altitude REAL NULL,
-            ip_address TEXT NULL,
-            timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
-        )
-    """)
+    if include('ping_data'):
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS ping_data (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id TEXT NOT NULL,
+                latitude REAL NULL,
+                longitude REAL NULL,
+                altitude REAL NULL,
+                ip_address TEXT NULL,
+                timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+    
+    # Table 4b: ping_hourly (rollup of old ping_data rows, see retention.py)
+    if include('ping_hourly'):
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS ping_hourly (
+                user_id TEXT NOT NULL,
+                hour_start DATETIME NOT NULL,
+                ping_count INTEGER NOT NULL DEFAULT 0,
+                located_count INTEGER NOT NULL DEFAULT 0,
+                latitude_sum REAL NOT NULL DEFAULT 0,
+                longitude_sum REAL NOT NULL DEFAULT 0,
+                altitude_count INTEGER NOT NULL DEFAULT 0,
+                altitude_sum REAL NOT NULL DEFAULT 0,
+                first_ping DATETIME NULL,
+                last_ping DATETIME NULL,
+                PRIMARY KEY (user_id, hour_start)
+            )
+        """)
+    
+        cursor.execute("""
+            CREATE INDEX IF NOT EXISTS idx_ping_hourly_hour
+            ON ping_hourly(hour_start)
+        """)
     
     # Table 5: key_value (from rest_db.php)
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS key_value (
-            `key` TEXT NOT NULL PRIMARY KEY,
-            `value` TEXT NULL,
-            `life_time` REAL DEFAULT 30,
-            `created_at` DATETIME DEFAULT CURRENT_TIMESTAMP,
-            `updated_at` DATETIME DEFAULT CURRENT_TIMESTAMP
-        )
-    """)
+    if include('key_value'):
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS key_value (
+                `key` TEXT NOT NULL PRIMARY KEY,
+                `value` TEXT NULL,
+                `life_time` REAL DEFAULT 30,
+                `created_at` DATETIME DEFAULT CURRENT_TIMESTAMP,
+                `updated_at` DATETIME DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
     
-    # Table 6: news_articles (from init_db.py)
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS news_articles (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            feed_id TEXT NOT NULL,
-            url TEXT NOT NULL,
-            title TEXT NOT NULL,
-            published_date DATETIME NOT NULL,
-            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-            UNIQUE(feed_id, url)
-        )
-    """)
+    # Table 5b: read_status_sets (compacted read markers, see read_status.py)
+    if include('read_status_sets'):
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS read_status_sets (
+                user_hash TEXT NOT NULL,
+                bucket_day DATE NOT NULL,
+                article_hashes BLOB NOT NULL,
+                id_count INTEGER NOT NULL DEFAULT 0,
+                expires_at DATETIME NULL,
+                updated_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (user_hash, bucket_day)
+            )
+        """)
     
-    cursor.execute("""
-        CREATE INDEX IF NOT EXISTS idx_feed_date 
-        ON news_articles(feed_id, published_date)
-    """)
+        cursor.execute("""
+            CREATE INDEX IF NOT EXISTS idx_read_status_sets_expires
+            ON read_status_sets(expires_at)
+        """)
     
-    cursor.execute("""
-        CREATE INDEX IF NOT EXISTS idx_published_date 
-        ON news_articles(published_date)
-    """)
+    # Table 6: news_articles (from init_db.py); on the partitioned layout it is
+    # a view over monthly tables that partitions.py maintains instead
+    if include('news_articles') and not is_partitioned(connection, 'sqlite'):
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS news_articles (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                feed_id TEXT NOT NULL,
+                url TEXT NOT NULL,
+                title TEXT NOT NULL,
+                published_date DATETIME NOT NULL,
+                created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                url_hash TEXT,
+                UNIQUE(feed_id, url_hash)
+            )
+        """)
+    
+        cursor.execute("""
+            CREATE INDEX IF NOT EXISTS idx_feed_date 
+            ON news_articles(feed_id, published_date)
+        """)
+    
+        cursor.execute("""
+            CREATE INDEX IF NOT EXISTS idx_published_date 
+            ON news_articles(published_date)
+        """)
+    
+    # Table 6b: news_changes (delta log for polling clients, see news_delta.py)
+    if include('news_changes'):
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS news_changes (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                op TEXT NOT NULL,
+                feed_id TEXT NULL,
+                url TEXT NULL,
+                title TEXT NULL,
+                previous_title TEXT NULL,
+                published_date DATETIME NULL,
+                range_start DATETIME NULL,
+                range_end DATETIME NULL,
+                created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+    
+        cursor.execute("""
+            CREATE INDEX IF NOT EXISTS idx_news_changes_created
+            ON news_changes(created_at)
+        """)
+    
+    # Table 6c: article_histogram (hourly/daily article counts, see histogram.py)
+    if include('article_histogram'):
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS article_histogram (
+                bucket TEXT NOT NULL,
+                bucket_start DATETIME NOT NULL,
+                feed_id TEXT NOT NULL,
+                article_count INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (bucket, bucket_start, feed_id)
+            )
+        """)
     
     # Table 7: feed_updates (from init_db.py)
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS feed_updates (
-            feed_id TEXT PRIMARY KEY,
-            last_updated DATETIME NOT NULL,
-            last_check DATETIME DEFAULT CURRENT_TIMESTAMP,
-            update_count INTEGER DEFAULT 0
-        )
-    """)
+    if include('feed_updates'):
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS feed_updates (
+                feed_id TEXT PRIMARY KEY,
+                last_updated DATETIME NOT NULL,
+                last_check DATETIME DEFAULT CURRENT_TIMESTAMP,
+                update_count INTEGER DEFAULT 0
+            )
+        """)
     
     connection.commit()
     connection.close()
-    print(f"✓ All tables created in {db_path}")
+    if tables is None:
+        print(f"✓ All tables created in {db_path}")
+    else:
+        print(f"✓ {', '.join(tables)} created in {db_path}")
+
+
+def apply_recommended_indexes(connection, db_type, indexes):
+    """
+    Create indexes recommended by index_advisor.py.
+
+    indexes maps index name to its candidate definition. Indexes that already
+    exist, or whose table is absent from this database, are skipped.
+    """
+    cursor = connection.cursor()
+    for name, candidate in indexes.items():
+        ddl = candidate.get(db_type)
+        if not ddl:
+            print(f"  - {name}: not applicable to {db_type}")
+            continue
+        if db_type == 'mysql':
+            cursor.execute("""
+                SELECT COUNT(*) FROM information_schema.statistics
+                WHERE table_schema = DATABASE() AND table_name = %s AND index_name = %s
+            """, (candidate['table'], name))
+            if cursor.fetchone()[0] > 0:
+                print(f"  - {name}: already exists")
+                continue
+        else:
+            cursor.execute("SELECT COUNT(*) FROM sqlite_master WHERE type='table' AND name=?", (candidate['table'],))
+            if cursor.fetchone()[0] == 0:
+                print(f"  - {name}: table {candidate['table']} not present, skipping")
+                continue
+        cursor.execute(ddl)
+        print(f"  ✓ {name} on {candidate['table']}")
+    connection.commit()
+
+
+def report_partitions(created):
+    """Print the outcome of partitions.maintain_partitions()."""
+    if created is None:
+        return
+    if created:
+        print(f"✓ news_articles partitions created: {', '.join(created)}")
+    else:
+        print("✓ news_articles partitions are up to date")
 
 
 def main():
     """Main function to setup all database tables."""
+    parser = argparse.ArgumentParser(description="Create all Tesla Cloud database tables.")
+    parser.add_argument('--apply-recommended-indexes', action='store_true',
+                        help="also create the indexes saved by index_advisor.py --write-recommendations")
+    parser.add_argument('--partition-news', action='store_true',
+                        help="convert news_articles to monthly partitions (see partitions.py)")
+    parser.add_argument('--months-ahead', type=int, default=DEFAULT_MONTHS_AHEAD,
+                        help=f"monthly partitions kept ready ahead of now (default {DEFAULT_MONTHS_AHEAD})")
+    args = parser.parse_args()
+    if args.months_ahead < 0:
+        parser.error("--months-ahead cannot be negative")
+    
+    recommended = {}
+    if args.apply_recommended_indexes:
+        from index_advisor import RECOMMENDATIONS_PATH, load_recommendations
+        recommended = load_recommendations()
+        if not recommended:
+            print(f"⚠ No recommended indexes found in {RECOMMENDATIONS_PATH}")
+    
     print("Tesla Cloud - Database Table Setup")
     print("=" * 50)
     
@@ -253,17 +478,17 @@ def main():
         print("\nConnecting to MySQL database...")
         try:
             import pymysql
-            connection = pymysql.connect(
-                host=conn_params['host'],
-                user=conn_params['user'],
-                password=conn_params['password'],
-                database=conn_params['database'],
-                charset=conn_params['charset']
-            )
+            connection = pymysql.connect(**conn_params)
             print(f"✓ Connected to MySQL database: {conn_params['database']}")
             
             try:
                 setup_tables_mysql(connection)
+                report_partitions(
+                    maintain_partitions(connection, 'mysql', args.partition_news, args.months_ahead)
+                )
+                if recommended:
+                    print("\nApplying recommended indexes...")
+                    apply_recommended_indexes(connection, 'mysql', recommended)
             finally:
                 connection.close()
                 print("\n✓ Database connection closed")
@@ -275,38 +500,66 @@ def main():
             print(f"ERROR: Failed to connect to MySQL: {e}")
             sys.exit(1)
     else:
-        # SQLite setup - create tables in multiple database files for development
-        print("\nNo MySQL configuration found, using SQLite databases...")
-        print("Creating tables in all SQLite database locations...")
-        
-        # Define all SQLite database paths used by different PHP scripts
-        script_dir = Path(__file__).resolve().parent
-        project_root = script_dir.parent
-        
-        sqlite_paths = [
-            # rest_db.php default
-            '/tmp/restdb.sqlite',
-            # settings.php default
-            '/tmp/teslacloud_settings.db',
-            # news.php and Python utilities default
-            str(script_dir / 'news_articles.db'),
-        ]
+        if is_consolidated_sqlite(env_vars):
+            # Consolidated layout - each table in the one file tuned for it
+            print("\nNo MySQL configuration found, using the consolidated SQLite layout...")
+            sqlite_paths = []
+            for group, spec in CONSOLIDATED_SQLITE_FILES.items():
+                db_path = consolidated_sqlite_path(env_vars, group)
+                prepare_layout_file(db_path, spec)
+                setup_tables_sqlite(db_path, spec['tables'])
+                sqlite_paths.append(db_path)
+        else:
+            # SQLite setup - create tables in multiple database files for development
+            print("\nNo MySQL configuration found, using SQLite databases...")
+            print("Creating tables in all SQLite database locations...")
+            
+            # Define all SQLite database paths used by different PHP scripts
+            script_dir = Path(__file__).resolve().parent
+            
+            sqlite_paths = [
+                # rest_db.php default
+                '/tmp/restdb.sqlite',
+                # settings.php default
+                '/tmp/teslacloud_settings.db',
+                # news.php and Python utilities default
+                str(script_dir / 'news_articles.db'),
+            ]
+            
+            # Add custom SQLITE_PATH from env if specified
+            if env_vars.get('SQLITE_PATH'):
+                custom_path = env_vars.get('SQLITE_PATH')
+                if custom_path not in sqlite_paths:
+                    sqlite_paths.append(custom_path)
+            
+            for db_path in sqlite_paths:
+                setup_tables_sqlite(db_path)
         
-        # Add custom SQLITE_PATH from env if specified
-        if env_vars.get('SQLITE_PATH'):
-            custom_path = env_vars.get('SQLITE_PATH')
-            if custom_path not in sqlite_paths:
-                sqlite_paths.append(custom_path)
+        if recommended:
+            for db_path in sqlite_paths:
+                print(f"Applying recommended indexes to {db_path}...")
+                connection = sqlite3.connect(db_path)
+                try:
+                    apply_recommended_indexes(connection, 'sqlite', recommended)
+                finally:
+                    connection.close()
         
-        # Create tables in each SQLite database
-        for db_path in sqlite_paths:
-            setup_tables_sqlite(db_path)
+        # Only the news database holds articles worth partitioning
+        connection = sqlite3.connect(resolve_sqlite_path(env_vars))
+        try:
+            report_partitions(maintain_partitions(connection, 'sqlite', args.partition_news, args.months_ahead))
+        finally:
+            connection.close()
     
     print("\n" + "=" * 50)
     print("Database setup complete!")
     print("\nAll tables are ready for use.")
     
-    if conn_type == 'sqlite':
+    if conn_type == 'sqlite' and is_consolidated_sqlite(env_vars):
+        print("\nTables created in the consolidated SQLite layout:")
+        for path in sqlite_paths:
+            print(f"  - {path}")
+    elif conn_type == 'sqlite':
         print("\nNote: Tables created in multiple SQLite files for development:")
         for path in sqlite_paths:
             print(f"  - {path}")
@@ -0,0 +1,275 @@
+#!/usr/bin/env python3
+"""
+Consolidated SQLite layout.
+The legacy SQLite setup creates every table in three files (/tmp/restdb.sqlite,
+/tmp/teslacloud_settings.db and utils/news_articles.db) although each service
+uses only some of them. With SQLITE_LAYOUT=consolidated every table lives in
+exactly one file under SQLITE_DIR, with the page size and journal mode suited
+to how it is used; news.php ATTACHes the hot file for read status. This
+script reports on the layout and migrates data from the legacy files.
+"""
+
+import os
+import sys
+import sqlite3
+import argparse
+from pathlib import Path
+
+from db_utils import (
+    CONSOLIDATED_SQLITE_FILES,
+    load_env_file,
+    is_consolidated_sqlite,
+    consolidated_sqlite_path,
+    resolve_table_sqlite_path
+)
+
+LEGACY_ALIAS = 'legacy'
+
+
+def legacy_env(env_vars):
+    """env_vars with the consolidated layout switched off, for legacy paths."""
+    return {key: value for key, value in env_vars.items() if key != 'SQLITE_LAYOUT'}
+
+
+def prepare_layout_file(db_path, spec):
+    """
+    Give a layout file its page size and journal mode.
+
+    Both are stored in the file, so this only has to run once; it is cheap on
+    a file that is already set up. Changing the page size of a populated file
+    rebuilds it with VACUUM, which needs the rollback journal. Returns the
+    resulting (page_size, journal_mode).
+    """
+    Path(db_path).parent.mkdir(parents=True, exist_ok=True)
+    connection = sqlite3.connect(db_path)
+    try:
+        if connection.execute("PRAGMA page_size").fetchone()[0] != spec['page_size']:
+            connection.execute("PRAGMA journal_mode = DELETE")
+            connection.execute(f"PRAGMA page_size = {spec['page_size']}")
+            connection.execute("VACUUM")
+        journal_mode = connection.execute(f"PRAGMA journal_mode = {spec['journal_mode']}").fetchone()[0]
+        page_size = connection.execute("PRAGMA page_size").fetchone()[0]
+        return page_size, journal_mode
+    finally:
+        connection.close()
+
+
+def _object_type(connection, schema, name):
+    """'table', 'view' or None for name in the given schema."""
+    row = connection.execute(
+        f"SELECT type FROM {schema}.sqlite_master WHERE name = ? AND type IN ('table', 'view')",
+        (name,)
+    ).fetchone()
+    return row[0] if row else None
+
+
+def _columns(connection, schema, table):
+    """[(name, declared type)] of a table or view."""
+    return [(row[1], row[2]) for row in connection.execute(f'PRAGMA {schema}.table_info("{table}")')]
+
+
+def _count(connection, schema, table):
+    return connection.execute(f'SELECT COUNT(*) FROM {schema}."{table}"').fetchone()[0]
+
+
+def copy_legacy_table(connection, source_path, table, dry_run=False):
+    """
+    Copy one table from a legacy file into the same table of connection.
+
+    The source is ATTACHed, so the copy is a single INSERT ... SELECT. Rows
+    keep their ids, and rows already present are left alone, so the copy can
+    be rerun. Columns that exist only in the source (such as ones added by
+    backfill.py) are added to the target table first. Returns a dict with
+    the source row count, rows copied and a status note.
+    """
+    result = {'source': source_path, 'rows': 0, 'copied': 0, 'note': ''}
+    if not os.path.exists(source_path):
+        result['note'] = 'no legacy file'
+        return result
+
+    connection.execute(f"ATTACH DATABASE ? AS {LEGACY_ALIAS}", (source_path,))
+    try:
+        if _object_type(connection, LEGACY_ALIAS, table) is None:
+            result['note'] = 'not in legacy file'
+            return result
+        result['rows'] = _count(connection, LEGACY_ALIAS, table)
+        if dry_run or result['rows'] == 0:
+            return result
+
+        target_columns = {name for name, _ in _columns(connection, 'main', table)}
+        target_is_table = _object_type(connection, 'main', table) == 'table'
+        columns = []
+        for name, declared_type in _columns(connection, LEGACY_ALIAS, table):
+            if name not in target_columns:
+                if not target_is_table:
+                    result['note'] = f"column {name} not copied (target is partitioned)"
+                    continue
+                connection.execute(f'ALTER TABLE main."{table}" ADD COLUMN "{name}" {declared_type}')
+            columns.append(f'"{name}"')
+
+        column_list = ', '.join(columns)
+        before = _count(connection, 'main', table)
+        connection.execute(f"""
+            INSERT OR IGNORE INTO main."{table}" ({column_list})
+            SELECT {column_list} FROM {LEGACY_ALIAS}."{table}"
+        """)
+        connection.commit()
+        result['copied'] = _count(connection, 'main', table) - before
+        return result
+    finally:
+        connection.execute(f"DETACH DATABASE {LEGACY_ALIAS}")
+
+
+def _file_bytes(path):
+    """Size of a database file including its WAL, 0 if missing."""
+    return sum(os.path.getsize(p) for p in (path, path + '-wal') if os.path.exists(p))
+
+
+def legacy_paths(env_vars):
+    """The distinct legacy SQLite files, in table order."""
+    paths = []
+    for spec in CONSOLIDATED_SQLITE_FILES.values():
+        for table in spec['tables']:
+            path = resolve_table_sqlite_path(legacy_env(env_vars), table)
+            if path not in paths:
+                paths.append(path)
+    return paths
+
+
+def migrate_legacy(env_vars, dry_run=False):
+    """
+    Move every table from the legacy files into the consolidated layout.
+
+    Each table is taken from the legacy file its service actually used; the
+    empty copies that the legacy setup created elsewhere are ignored. A
+    partitioned legacy news_articles is copied through its view and the new
+    table is partitioned again afterwards. Legacy files are left untouched.
+    Returns {table: result} as produced by copy_legacy_table().
+    """
+    # Imported here: setup_tables imports this module
+    from setup_tables import setup_tables_sqlite
+    from partitions import is_partitioned, convert_to_partitioned
+
+    old_env = legacy_env(env_vars)
+    results = {}
+    for group, spec in CONSOLIDATED_SQLITE_FILES.items():
+        target = consolidated_sqlite_path(env_vars, group)
+        print(f"\n{group}: {target} ({', '.join(spec['tables'])})")
+        if not dry_run:
+            page_size, journal_mode = prepare_layout_file(target, spec)
+            print(f"  page_size {page_size}, journal_mode {journal_mode}")
+            setup_tables_sqlite(target, spec['tables'])
+        elif not os.path.exists(target):
+            print("  (would be created)")
+
+        connection = sqlite3.connect(':memory:' if dry_run else target)
+        try:
+            for table in spec['tables']:
+                source = resolve_table_sqlite_path(old_env, table)
+                result = copy_legacy_table(connection, source, table, dry_run)
+                results[table] = result
+                if result['rows'] == 0:
+                    print(f"  - {table}: nothing to copy from {source}"
+                          + (f" ({result['note']})" if result['note'] else ""))
+                    continue
+                if dry_run:
+                    print(f"  - {table}: would copy {result['rows']:,} row(s) from {source}")
+                    continue
+                skipped = result['rows'] - result['copied']
+                line = f"  ✓ {table}: copied {result['copied']:,} of {result['rows']:,} row(s) from {source}"
+                if skipped:
+                    line += f" ({skipped:,} already present)"
+                if result['note']:
+                    line += f" ⚠ {result['note']}"
+                print(line)
+
+            if not dry_run and 'news_articles' in spec['tables']:
+                source = resolve_table_sqlite_path(old_env, 'news_articles')
+                if os.path.exists(source) and _legacy_partitioned(source, is_partitioned):
+                    created = convert_to_partitioned(connection, 'sqlite')
+                    if created:
+                        print(f"  ✓ news_articles partitioned again ({len(created)} partition(s))")
+            if not dry_run:
+                connection.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        finally:
+            connection.close()
+    return results
+
+
+def _legacy_partitioned(path, is_partitioned):
+    connection = sqlite3.connect(path)
+    try:
+        return is_partitioned(connection, 'sqlite')
+    finally:
+        connection.close()
+
+
+def print_status(env_vars):
+    """Describe the consolidated files and compare their size with the legacy ones."""
+    enabled = is_consolidated_sqlite(env_vars)
+    print(f"SQLite layout: {'consolidated' if enabled else 'legacy (set SQLITE_LAYOUT=consolidated to switch)'}")
+
+    consolidated_bytes = 0
+    for group, spec in CONSOLIDATED_SQLITE_FILES.items():
+        path = consolidated_sqlite_path(env_vars, group)
+        if not os.path.exists(path):
+            print(f"\n{group}: {path} (not created)")
+            continue
+        consolidated_bytes += _file_bytes(path)
+        connection = sqlite3.connect(path)
+        try:
+            page_size = connection.execute("PRAGMA page_size").fetchone()[0]
+            journal_mode = connection.execute("PRAGMA journal_mode").fetchone()[0]
+            print(f"\n{group}: {path} ({_file_bytes(path):,} bytes)")
+            flag = '' if (page_size, journal_mode) == (spec['page_size'], spec['journal_mode']) else ' ⚠ run setup_tables.py'
+            print(f"  page_size {page_size} (want {spec['page_size']}), "
+                  f"journal_mode {journal_mode} (want {spec['journal_mode']}){flag}")
+            for table in spec['tables']:
+                if _object_type(connection, 'main', table):
+                    print(f"  - {table}: {_count(connection, 'main', table):,} row(s)")
+                else:
+                    print(f"  - {table}: missing")
+        finally:
+            connection.close()
+
+    print("\nLegacy files:")
+    legacy_bytes = 0
+    for path in legacy_paths(env_vars):
+        size = _file_bytes(path)
+        legacy_bytes += size
+        print(f"  - {path}: {f'{size:,} bytes' if os.path.exists(path) else 'missing'}")
+    if consolidated_bytes and legacy_bytes:
+        print(f"\nConsolidated {consolidated_bytes:,} bytes vs legacy {legacy_bytes:,} bytes "
+              f"({consolidated_bytes / legacy_bytes:.0%})")
+
+
+def main():
+    """Main function."""
+    parser = argparse.ArgumentParser(description="Inspect or migrate to the consolidated SQLite layout.")
+    parser.add_argument('--migrate', action='store_true',
+                        help="copy tables from the legacy SQLite files into the consolidated layout")
+    parser.add_argument('--dry-run', action='store_true', help="with --migrate, only report what would be copied")
+    args = parser.parse_args()
+
+    env_vars = load_env_file()
+    if env_vars.get('SQL_HOST'):
+        print("MySQL is configured; the SQLite layout does not apply")
+        sys.exit(1)
+
+    if not args.migrate:
+        print_status(env_vars)
+        return
+
+    try:
+        results = migrate_legacy(env_vars, args.dry_run)
+    except sqlite3.Error as e:
+        print(f"ERROR: Migration failed: {e}")
+        sys.exit(1)
+    total = sum(result['rows' if args.dry_run else 'copied'] for result in results.values())
+    print(f"\n✓ {'Would copy' if args.dry_run else 'Copied'} {total:,} row(s) in {len(results)} table(s)")
+    if not args.dry_run and not is_consolidated_sqlite(env_vars):
+        print("Set SQLITE_LAYOUT=consolidated in .env to switch the PHP endpoints and scripts over.")
+
+
+if __name__ == '__main__':
+    main()
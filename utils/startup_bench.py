@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+"""
+Cold-start benchmark for the utils entry points.
+Runs each CLI module's import in a fresh interpreter under -X importtime,
+reports wall-clock start-up and the heaviest imports, and flags modules
+that the cron fast path (update_news with nothing due) should never load.
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import statistics
+import subprocess
+
+from db_utils import SCRIPT_DIR
+
+DEFAULT_MODULES = ('update_news', 'fetch_feeds', 'cleanup_db', 'db_stats', 'retention', 'read_status')
+DEFAULT_REPEATS = 7
+DEFAULT_TOP = 8
+
+# Modules a "nothing due" update_news run must not import: feed parsing,
+# HTTP/TLS and the database drivers load only once they are needed.
+FAST_PATH_MODULE = 'update_news'
+FAST_PATH_FORBIDDEN = (
+    'fetch_feeds', 'cleanup_db', 'init_db', 'http_client', 'http.client', 'ssl',
+    'xml.etree.ElementTree', 'email.utils', 'pymysql', 'sqlite3',
+)
+
+STARTUP_SNIPPET = """
+import time
+_started = time.perf_counter()
+import {module}
+print(f"@@wall {{(time.perf_counter() - _started) * 1000:.3f}}")
+"""
+
+
+def parse_importtime(stderr):
+    """Parse -X importtime output into [(depth, name, self_us, cumulative_us)]."""
+    entries = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'imported package' in line:
+            continue
+        parts = line[len('import time:'):].split('|')
+        if len(parts) != 3:
+            continue
+        raw_name = parts[2].rstrip()
+        depth = (len(raw_name) - len(raw_name.lstrip(' ')) - 1) // 2
+        entries.append((depth, raw_name.strip(), int(parts[0]), int(parts[1])))
+    return entries
+
+
+def _child_env():
+    # Let the interpreter cache bytecode as it would under cron
+    env = dict(os.environ)
+    env.pop('PYTHONDONTWRITEBYTECODE', None)
+    return env
+
+
+def measure_module(module, repeats=DEFAULT_REPEATS):
+    """
+    Import a module in fresh interpreters and return timing details.
+
+    The first run is a warm-up that writes bytecode caches; the reported
+    figures are medians over the remaining runs, and the import breakdown
+    comes from the fastest one.
+    """
+    runs = []
+    env = _child_env()
+    for _ in range(repeats + 1):
+        started = time.perf_counter()
+        completed = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', STARTUP_SNIPPET.format(module=module)],
+            cwd=SCRIPT_DIR, env=env, capture_output=True, text=True
+        )
+        process_ms = (time.perf_counter() - started) * 1000
+        if completed.returncode != 0:
+            raise RuntimeError(f"importing {module} failed: {completed.stderr.strip().splitlines()[-1:]}")
+        import_ms = next(
+            (float(line.split()[1]) for line in completed.stdout.splitlines() if line.startswith('@@wall')), 0.0
+        )
+        runs.append({'process_ms': process_ms, 'import_ms': import_ms, 'entries': parse_importtime(completed.stderr)})
+    runs = runs[1:]
+    best = min(runs, key=lambda run: run['import_ms'])
+    return {
+        'module': module,
+        'process_ms': statistics.median(run['process_ms'] for run in runs),
+        'import_ms': statistics.median(run['import_ms'] for run in runs),
+        'loaded': sorted({name for _, name, _, _ in best['entries']}),
+        'heaviest': heaviest_imports(best['entries'], module),
+    }
+
+
+def heaviest_imports(entries, module, top=DEFAULT_TOP):
+    """Return the module's direct imports, heaviest cumulative time first."""
+    # importtime prints children before their parent, so the direct imports
+    # of `module` are the depth-1 entries between the previous top-level
+    # entry and the module's own line.
+    children = []
+    for depth, name, self_us, cumulative_us in entries:
+        if depth == 0:
+            if name == module:
+                break
+            children = []
+        elif depth == 1:
+            children.append({'name': name, 'cumulative_ms': cumulative_us / 1000, 'self_ms': self_us / 1000})
+    children.sort(key=lambda child: -child['cumulative_ms'])
+    return children[:top]
+
+
+def fast_path_violations(result):
+    """Return forbidden modules loaded by importing update_news."""
+    loaded = set(result['loaded'])
+    return [name for name in FAST_PATH_FORBIDDEN if name in loaded]
+
+
+def print_results(results, baseline):
+    print(f"Interpreter baseline (bare interpreter): {baseline['process_ms']:.1f}ms")
+    print(f"\n  {'module':<14} {'process':>9} {'imports':>9} {'modules':>8}")
+    for result in results:
+        print(f"  {result['module']:<14} {result['process_ms']:8.1f}ms {result['import_ms']:8.1f}ms "
+              f"{len(result['loaded']):8}")
+    for result in results:
+        print(f"\n{result['module']}: heaviest direct imports")
+        for child in result['heaviest']:
+            print(f"  {child['name']:<28} {child['cumulative_ms']:7.2f}ms")
+
+
+def main():
+    """Main function."""
+    parser = argparse.ArgumentParser(description="Measure cold-start import cost of the utils entry points.")
+    parser.add_argument('modules', nargs='*', default=list(DEFAULT_MODULES), help="modules to measure")
+    parser.add_argument('--repeats', type=int, default=DEFAULT_REPEATS,
+                        help=f"fresh interpreters per module (default {DEFAULT_REPEATS})")
+    parser.add_argument('--json', metavar='PATH', help="also write results as JSON")
+    parser.add_argument('--check', action='store_true',
+                        help=f"exit 1 if {FAST_PATH_MODULE} loads modules its fast path should not")
+    args = parser.parse_args()
+    if args.repeats < 1:
+        parser.error("--repeats must be at least 1")
+
+    modules = list(args.modules)
+    if args.check and FAST_PATH_MODULE not in modules:
+        modules.insert(0, FAST_PATH_MODULE)
+
+    try:
+        baseline = measure_module('sys', args.repeats)
+        results = [measure_module(module, args.repeats) for module in modules]
+    except RuntimeError as e:
+        print(f"ERROR: {e}")
+        sys.exit(1)
+    print_results(results, baseline)
+
+    violations = []
+    for result in results:
+        if result['module'] == FAST_PATH_MODULE:
+            violations = fast_path_violations(result)
+            if violations:
+                print(f"\n⚠ {FAST_PATH_MODULE} loads {', '.join(violations)} at startup")
+            else:
+                print(f"\n✓ {FAST_PATH_MODULE} startup loads no feed, HTTP or driver modules")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'baseline': baseline, 'results': results}, f, indent=2)
+        print(f"Wrote {args.json}")
+
+    if args.check and violations:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,458 @@
+#!/usr/bin/env python3
+"""
+Trending terms from headlines, without scanning news_articles.
+store_articles() passes the title of every new article to observe(); the
+words and two-word phrases of each title go into sliding-window Count-Min
+sketches for the last hour (12 five-minute slots) and the last day (24
+hourly slots). A slot that leaves its window is folded into a baseline
+sketch that decays with a half-life of a day (hour window) or a week (day
+window), so trend_report() can compare what is being written about now
+with what is usual. Each window also keeps a bounded set of its most
+frequent terms as top-k candidates.
+
+All state lives in one gzip file (TRENDING_STATE, default
+utils/trending_state.gz) of fixed size, however many articles are kept.
+flush() applies the titles observed by this process under a file lock, so
+fetch runs and the journal loader can update it side by side. Counts are
+Count-Min estimates: never too low, occasionally too high for rare terms.
+"""
+
+import os
+import re
+import sys
+import gzip
+import json
+import math
+import fcntl
+import hashlib
+from array import array
+from datetime import datetime, timezone
+
+from db_utils import SCRIPT_DIR, load_env_file
+
+DEFAULT_STATE_PATH = SCRIPT_DIR / 'trending_state.gz'
+STATE_VERSION = 1
+SKETCH_DEPTH = 4
+TOP_CANDIDATES = 200
+MIN_COUNT = 3
+CELL_CACHE_SIZE = 50000
+SLOT_COUNT_MAX = 0xFFFF  # slots are uint16; a term seen 65535 times in one slot saturates
+WINDOWS = {
+    '1h': {'slot_seconds': 300, 'slots': 12, 'width': 2048, 'half_life_hours': 24},
+    '24h': {'slot_seconds': 3600, 'slots': 24, 'width': 8192, 'half_life_hours': 7 * 24},
+}
+
+STOPWORDS = frozenset("""
+a about after again against all also am an and any are as at be because been before being between both but by
+can could did do does doing down during each few for from further had has have having he her here hers him his
+how i if in into is it its itself just me more most my no nor not now of off on once only or other our ours out
+over own same she should so some such than that the their theirs them then there these they this those through
+to too under until up very was we were what when where which while who whom why will with would you your yours
+says said say new news live video watch update updates latest report reports amid year years day days week
+top get gets make makes one two first last back still may might must us via what's here's
+""".split())
+
+_TOKEN = re.compile(r"[^\W\d_][\w'’\-]*")
+
+_pending = []
+_settings = None
+
+
+def _load_settings():
+    global _settings
+    if _settings is None:
+        env_vars = load_env_file()
+        _settings = {
+            'enabled': str(env_vars.get('TRENDING', '1')).strip().lower() not in ('0', 'false', 'no', 'off'),
+            'path': str(env_vars.get('TRENDING_STATE') or DEFAULT_STATE_PATH),
+        }
+    return _settings
+
+
+def enabled():
+    """False when TRENDING=0 in .env; store_articles() then skips title tracking."""
+    return _load_settings()['enabled']
+
+
+def state_path():
+    return _load_settings()['path']
+
+
+def tokenize(title):
+    """Distinct terms of a title: lowercase words and phrases of two adjacent words, minus stopwords."""
+    title = title or ''
+    words = []
+    previous_end = 0
+    for match in _TOKEN.finditer(title):
+        if title[previous_end:match.start()].strip():
+            words.append(None)  # punctuation between words ends a phrase
+        previous_end = match.end()
+        raw = match.group().strip("'’-")
+        word = raw.lower()
+        for suffix in ("'s", "’s"):
+            if word.endswith(suffix):
+                word = word[:-2]
+        # Two-letter words only count as acronyms (AI, EU, UK)
+        keep = word not in STOPWORDS and (len(word) >= 3 or (len(word) == 2 and raw.isupper()))
+        words.append(word if keep else None)
+    terms = {word for word in words if word}
+    terms.update(f"{first} {second}" for first, second in zip(words, words[1:]) if first and second)
+    return terms
+
+
+def _epoch(value):
+    """Epoch seconds of a datetime or ISO string; naive values are UTC, as stored."""
+    if isinstance(value, (int, float)):
+        return float(value)
+    if not isinstance(value, datetime):
+        value = datetime.fromisoformat(str(value))
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.timestamp()
+
+
+def _now():
+    return datetime.now(timezone.utc).timestamp()
+
+
+class SlidingWindow:
+    """
+    Count-Min sketches for the slots of one window, their sum, and a
+    decayed baseline of the slots that have left it.
+
+    The baseline is stored divided by `scale` so decaying it is a single
+    multiplication of scale instead of a pass over every cell.
+    """
+
+    def __init__(self, name, slot_seconds, slots, width, half_life_hours):
+        self.name = name
+        self.slot_seconds = slot_seconds
+        self.slots = slots
+        self.width = width
+        self.half_life_seconds = half_life_hours * 3600
+        cells = SKETCH_DEPTH * width
+        self.slot_sketches = [array('H', bytes(2 * cells)) for _ in range(slots)]
+        self.slot_titles = [0] * slots
+        self.head = 0  # index of the newest slot
+        self.head_start = None  # epoch seconds at which the newest slot starts
+        self.window = array('I', bytes(4 * cells))
+        self.baseline = array('d', bytes(8 * cells))
+        self.scale = 1.0
+        self.baseline_titles = 0.0
+        self.baseline_at = None
+        self.candidates = {}
+        self._cells = {}
+
+    def config(self):
+        return {'slot_seconds': self.slot_seconds, 'slots': self.slots, 'width': self.width,
+                'half_life_hours': self.half_life_seconds / 3600}
+
+    def cells(self, term):
+        cells = self._cells.get(term)
+        if cells is None:
+            digest = hashlib.blake2b(term.encode('utf-8'), digest_size=8).digest()
+            h1 = int.from_bytes(digest[:4], 'little')
+            h2 = int.from_bytes(digest[4:], 'little') | 1
+            cells = [row * self.width + (h1 + row * h2) % self.width for row in range(SKETCH_DEPTH)]
+            if len(self._cells) >= CELL_CACHE_SIZE:
+                self._cells.clear()
+            self._cells[term] = cells
+        return cells
+
+    def _decay_to(self, when):
+        if self.baseline_at is None:
+            self.baseline_at = when
+            return
+        if when > self.baseline_at:
+            factor = 0.5 ** ((when - self.baseline_at) / self.half_life_seconds)
+            self.scale *= factor
+            self.baseline_titles *= factor
+            self.baseline_at = when
+            if self.scale < 1e-200:
+                self.baseline = array('d', (value * self.scale for value in self.baseline))
+                self.scale = 1.0
+
+    def _expire_oldest(self, slot_end):
+        """Fold the oldest slot into the baseline and empty it for reuse as the newest."""
+        oldest = (self.head + 1) % self.slots
+        sketch = self.slot_sketches[oldest]
+        self._decay_to(slot_end)
+        if self.slot_titles[oldest]:
+            inverse = 1.0 / self.scale
+            window, baseline = self.window, self.baseline
+            for index, count in enumerate(sketch):
+                if count:
+                    window[index] -= count
+                    baseline[index] += count * inverse
+            self.baseline_titles += self.slot_titles[oldest]
+            self.slot_sketches[oldest] = array('H', bytes(len(sketch) * 2))
+            self.slot_titles[oldest] = 0
+        self.head = oldest
+
+    def advance(self, when):
+        """Move the window so its newest slot holds `when`."""
+        start = when - when % self.slot_seconds
+        if self.head_start is None:
+            self.head_start = start
+            return
+        steps = int((start - self.head_start) // self.slot_seconds)
+        if steps <= 0:
+            return
+        for step in range(min(steps, self.slots)):
+            # The oldest slot ends where the window starts after this step
+            self._expire_oldest(self.head_start + (step + 2 - self.slots) * self.slot_seconds)
+        self.head_start = start
+        self._decay_to(start - (self.slots - 1) * self.slot_seconds)
+        counts = {term: self.estimate(self.cells(term)) for term in self.candidates}
+        self.candidates = {term: count for term, count in counts.items() if count}
+
+    def add(self, terms, when):
+        """Count one title's terms at time `when` (epoch seconds)."""
+        if self.head_start is None or when >= self.head_start + self.slot_seconds:
+            self.advance(when)
+        age_slots = int((self.head_start - (when - when % self.slot_seconds)) // self.slot_seconds)
+        if age_slots >= self.slots:
+            # Older than the window: straight into the baseline, already decayed
+            self._decay_to(self.head_start - (self.slots - 1) * self.slot_seconds)
+            weight = 0.5 ** (max(self.baseline_at - when, 0) / self.half_life_seconds) / self.scale
+            for term in terms:
+                for index in set(self.cells(term)):
+                    self.baseline[index] += weight
+            self.baseline_titles += weight * self.scale
+            return
+        slot = (self.head - max(age_slots, 0)) % self.slots
+        sketch = self.slot_sketches[slot]
+        self.slot_titles[slot] += 1
+        for term in terms:
+            cells = self.cells(term)
+            # Conservative update: only raise the cells holding the current minimum
+            floor = min(sketch[index] for index in cells)
+            if floor >= SLOT_COUNT_MAX:
+                continue
+            for index in set(cells):
+                if sketch[index] == floor:
+                    sketch[index] = floor + 1
+                    self.window[index] += 1
+            self._offer(term, self.estimate(cells))
+
+    def _offer(self, term, count):
+        self.candidates[term] = count
+        if len(self.candidates) > 2 * TOP_CANDIDATES:
+            keep = sorted(self.candidates.items(), key=lambda item: item[1], reverse=True)[:TOP_CANDIDATES]
+            self.candidates = dict(keep)
+
+    def estimate(self, cells):
+        return min(self.window[index] for index in cells)
+
+    def baseline_estimate(self, cells):
+        return min(self.baseline[index] for index in cells) * self.scale
+
+    def window_titles(self):
+        return sum(self.slot_titles)
+
+    def report(self, top=20, min_count=MIN_COUNT):
+        """Terms of the current window ranked by how far they exceed the baseline."""
+        titles = self.window_titles()
+        terms = []
+        for term in self.candidates:
+            cells = self.cells(term)
+            count = self.estimate(cells)
+            if count < min_count:
+                continue
+            expected = (self.baseline_estimate(cells) * titles / self.baseline_titles
+                        if self.baseline_titles >= 1 else 0.0)
+            score = (count - expected) / math.sqrt(expected + 1)
+            if score <= 0:
+                continue
+            terms.append({'term': term, 'count': count, 'expected': round(expected, 2),
+                          'ratio': round((count + 1) / (expected + 1), 2), 'score': round(score, 2)})
+        terms.sort(key=lambda entry: (entry['score'], entry['count']), reverse=True)
+        window_start = None if self.head_start is None else self.head_start - (self.slots - 1) * self.slot_seconds
+        return {
+            'window': self.name,
+            'window_start': _format_epoch(window_start),
+            'window_end': _format_epoch(None if self.head_start is None else self.head_start + self.slot_seconds),
+            'titles': titles,
+            'baseline_titles': round(self.baseline_titles, 1),
+            'baseline_half_life_hours': self.half_life_seconds / 3600,
+            'terms': terms[:top],
+        }
+
+    def header(self):
+        return dict(self.config(), head=self.head, head_start=self.head_start, slot_titles=self.slot_titles,
+                    scale=self.scale, baseline_titles=self.baseline_titles, baseline_at=self.baseline_at,
+                    candidates=self.candidates)
+
+    def arrays(self):
+        return self.slot_sketches + [self.window, self.baseline]
+
+    def restore(self, header, read_array):
+        self.head = header['head']
+        self.head_start = header['head_start']
+        self.slot_titles = header['slot_titles']
+        self.scale = header['scale']
+        self.baseline_titles = header['baseline_titles']
+        self.baseline_at = header['baseline_at']
+        self.candidates = header['candidates']
+        self.slot_sketches = [read_array('H', len(sketch)) for sketch in self.slot_sketches]
+        self.window = read_array('I', len(self.window))
+        self.baseline = read_array('d', len(self.baseline))
+
+
+def _format_epoch(value):
+    if value is None:
+        return None
+    return datetime.fromtimestamp(value, timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+
+
+class TrendTracker:
+    """One SlidingWindow per entry of WINDOWS."""
+
+    def __init__(self):
+        self.windows = {name: SlidingWindow(name, **spec) for name, spec in WINDOWS.items()}
+        self.observed = 0
+
+    def observe(self, terms, when):
+        for window in self.windows.values():
+            window.add(terms, when)
+        self.observed += 1
+
+    def advance(self, when):
+        for window in self.windows.values():
+            window.advance(when)
+
+    def dumps(self):
+        header = {'version': STATE_VERSION, 'byteorder': sys.byteorder, 'depth': SKETCH_DEPTH,
+                  'observed': self.observed,
+                  'windows': {name: window.header() for name, window in self.windows.items()}}
+        chunks = [json.dumps(header, separators=(',', ':')).encode('utf-8'), b'\n']
+        for window in self.windows.values():
+            chunks.extend(sketch.tobytes() for sketch in window.arrays())
+        return gzip.compress(b''.join(chunks), compresslevel=6)
+
+    @classmethod
+    def loads(cls, data):
+        tracker = cls()
+        raw = gzip.decompress(data)
+        newline = raw.index(b'\n')
+        header = json.loads(raw[:newline])
+        if header.get('version') != STATE_VERSION or header.get('depth') != SKETCH_DEPTH:
+            raise ValueError("unsupported trending state version")
+        tracker.observed = header.get('observed', 0)
+        offset = newline + 1
+        swap = header['byteorder'] != sys.byteorder
+
+        def read_array(typecode, length):
+            nonlocal offset
+            values = array(typecode)
+            size = values.itemsize * length
+            values.frombytes(raw[offset:offset + size])
+            offset += size
+            if swap:
+                values.byteswap()
+            return values
+
+        for name, saved in header['windows'].items():
+            window = tracker.windows.get(name)
+            if window is None or any(saved[key] != value for key, value in window.config().items()):
+                # Window layout changed: skip its arrays and start it empty
+                offset += SKETCH_DEPTH * saved['width'] * (saved['slots'] * 2 + 4 + 8)
+                print(f"⚠ Trending window {name} changed shape; starting it empty")
+                continue
+            window.restore(saved, read_array)
+        return tracker
+
+
+def load_tracker(path=None):
+    """The saved tracker, or an empty one when there is no usable state file."""
+    path = path or state_path()
+    try:
+        with open(path, 'rb') as f:
+            return TrendTracker.loads(f.read())
+    except FileNotFoundError:
+        return TrendTracker()
+    except (OSError, ValueError, EOFError, KeyError) as e:
+        print(f"⚠ Ignoring unreadable trending state {path}: {e}")
+        return TrendTracker()
+
+
+def save_tracker(tracker, path=None):
+    path = path or state_path()
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(tracker.dumps())
+    os.replace(tmp_path, path)
+
+
+def observe(title, published):
+    """Queue a new article's title for the next flush()."""
+    if not enabled():
+        return
+    terms = tokenize(title)
+    if terms:
+        _pending.append((_epoch(published), terms))
+
+
+def discard():
+    """Drop queued titles, e.g. after their transaction was rolled back."""
+    _pending.clear()
+
+
+def flush(path=None, now=None):
+    """
+    Apply the queued titles to the saved state, oldest first, and move the
+    windows up to now. Returns the number of titles applied.
+    """
+    if not _pending or not enabled():
+        return 0
+    path = path or state_path()
+    observations = sorted(_pending, key=lambda item: item[0])
+    _pending.clear()
+    now = _now() if now is None else now
+    with open(f"{path}.lock", 'a') as lock:
+        fcntl.flock(lock.fileno(), fcntl.LOCK_EX)
+        tracker = load_tracker(path)
+        for when, terms in observations:
+            tracker.observe(terms, min(when, now))
+        tracker.advance(now)
+        save_tracker(tracker, path)
+    return len(observations)
+
+
+def trend_report(window='1h', top=20, path=None, now=None, min_count=MIN_COUNT):
+    """Top trending terms of one window as a dict ready for JSON output."""
+    tracker = load_tracker(path)
+    tracker.advance(_now() if now is None else now)
+    return tracker.windows[window].report(top, min_count)
+
+
+def rebuild_trending(connection, db_type, days=7, path=None):
+    """
+    Recreate the state from the titles published in the last `days` days,
+    e.g. to seed the baseline once. Returns the number of titles read.
+    """
+    now = _now()
+    since = datetime.fromtimestamp(now - days * 86400, timezone.utc).replace(tzinfo=None)
+    cursor = connection.cursor()
+    placeholder = '%s' if db_type == 'mysql' else '?'
+    cursor.execute(f"""
+        SELECT title, published_date FROM news_articles
+        WHERE published_date >= {placeholder}
+        ORDER BY published_date
+    """, (since if db_type == 'mysql' else since.isoformat(sep=' '),))
+    tracker = TrendTracker()
+    read = 0
+    for row in cursor:
+        title, published = (row['title'], row['published_date']) if isinstance(row, dict) else (row[0], row[1])
+        if not published:
+            continue
+        terms = tokenize(title)
+        if terms:
+            tracker.observe(terms, min(_epoch(published), now))
+            read += 1
+    tracker.advance(now)
+    path = path or state_path()
+    with open(f"{path}.lock", 'a') as lock:
+        fcntl.flock(lock.fileno(), fcntl.LOCK_EX)
+        save_tracker(tracker, path)
+    return read
@@ -7,20 +7,34 @@ Handles initialization, fetching feeds that need updates, and cleanup.
 
 import os
 import sys
+import json
+import time
+import argparse
 from datetime import datetime, timedelta, timezone
 
 from db_utils import (
     PROJECT_ROOT,
+    SCRIPT_DIR,
     load_env_file,
     get_db_connection,
     load_feed_config,
     resolve_sqlite_path
 )
-import init_db
-import fetch_feeds
-import cleanup_db
+from db_pool import run_idempotent
+from feed_registry import DEFAULT_REFRESH_MINUTES
 
-DEFAULT_REFRESH_MINUTES = 60
+# init_db, fetch_feeds and cleanup_db (and through them XML, HTTP and email
+# parsing) are imported where they are used, so a cron tick with nothing due
+# only pays for loading the config and one feed_updates query.
+
+# Deadline handling: stop starting fetches early enough that in-flight
+# requests (bounded by the HTTP timeout) and cleanup still fit the budget.
+FETCH_GRACE_SECONDS = 10
+CLEANUP_RESERVE_SECONDS = 10
+PRIORITY_POLICIES = ('overdue', 'default')
+# Mirrors profiling.PROFILE_MODES; profiling is only imported for --profile
+PROFILE_MODES = ('cprofile', 'sample')
+DEFERRED_STATE_PATH = SCRIPT_DIR / 'deferred_feeds.json'
 
 
 def normalize_datetime(value):
@@ -38,28 +52,27 @@ def normalize_datetime(value):
 
 
 def get_database_stats(connection, db_type):
-    """Return total article count and oldest publish date."""
+    """
+    Return total article count and oldest publish date. Errors are raised
+    so run_idempotent() can retry a dropped connection.
+    """
     cursor = connection.cursor()
-    try:
-        if db_type == 'mysql':
-            cursor.execute("""
-                SELECT COUNT(*) AS total, MIN(published_date) AS oldest
-                FROM news_articles
-            """)
-            row = cursor.fetchone()
-            total = row['total'] if row and row['total'] is not None else 0
-            oldest = row['oldest'] if row else None
-        else:
-            cursor.execute("""
-                SELECT COUNT(*), MIN(published_date)
-                FROM news_articles
-            """)
-            row = cursor.fetchone()
-            total = row[0] if row and row[0] is not None else 0
-            oldest = row[1] if row else None
-    except Exception as exc:
-        print(f"ERROR: Failed to read database stats: {exc}")
-        return {'total': 0, 'oldest': None}
+    if db_type == 'mysql':
+        cursor.execute("""
+            SELECT COUNT(*) AS total, MIN(published_date) AS oldest
+            FROM news_articles
+        """)
+        row = cursor.fetchone()
+        total = row['total'] if row and row['total'] is not None else 0
+        oldest = row['oldest'] if row else None
+    else:
+        cursor.execute("""
+            SELECT COUNT(*), MIN(published_date)
+            FROM news_articles
+        """)
+        row = cursor.fetchone()
+        total = row[0] if row and row[0] is not None else 0
+        oldest = row[1] if row else None
     
     return {'total': total, 'oldest': oldest}
 
@@ -95,25 +108,30 @@ def parse_last_updated(value):
 
 
 def remove_future_dated_articles(env_vars):
-    """Remove articles whose published date is in the future."""
-    connection, db_type = get_db_connection(env_vars)
+    """
+    Remove articles whose published date is in the future. ingest_validate
+    rejects such items before they are stored, so this only runs as an
+    audit (--audit) and should find nothing.
+    """
+    from partitions import article_tables
+    from news_delta import change_log_available, record_prune
+
+    connection, db_type = get_db_connection(env_vars, pooled=True)
     cursor = connection.cursor()
     now = datetime.now(timezone.utc).replace(tzinfo=None)
     now_value = now if db_type == 'mysql' else now.isoformat(sep=' ')
+    placeholder = '%s' if db_type == 'mysql' else '?'
 
     try:
-        if db_type == 'mysql':
-            cursor.execute("""
-                DELETE FROM news_articles
-                WHERE published_date > %s
-            """, (now_value,))
-        else:
-            cursor.execute("""
-                DELETE FROM news_articles
-                WHERE published_date > ?
+        removed_count = 0
+        for table in article_tables(connection, db_type):
+            cursor.execute(f"""
+                DELETE FROM {table}
+                WHERE published_date > {placeholder}
             """, (now_value,))
-
-        removed_count = cursor.rowcount if cursor.rowcount is not None else 0
+            removed_count += cursor.rowcount if cursor.rowcount is not None else 0
+        if removed_count > 0 and change_log_available(connection, db_type):
+            record_prune(cursor, db_type, None, after=now_value)
         connection.commit()
         return removed_count
     finally:
@@ -147,10 +165,10 @@ def check_and_init_database(env_vars):
     print("Checking database tables...")
     
     try:
-        connection, db_type = get_db_connection(env_vars)
+        connection, db_type = get_db_connection(env_vars, pooled=True)
         cursor = connection.cursor()
         
-        # Check if news_articles table exists
+        # Check if news_articles exists (a view on the partitioned SQLite layout)
         if db_type == 'mysql':
             cursor.execute("""
                 SELECT COUNT(*) as count FROM information_schema.tables 
@@ -162,18 +180,20 @@ def check_and_init_database(env_vars):
         else:
             cursor.execute("""
                 SELECT COUNT(*) as count FROM sqlite_master 
-                WHERE type='table' AND name='news_articles'
+                WHERE type IN ('table', 'view') AND name='news_articles'
             """)
             result = cursor.fetchone()
             tables_exist = result[0] > 0
         
-        connection.close()
-        
-        if not tables_exist:
-            print("✓ Database tables not found, initializing...")
-            init_db.main()
-        else:
-            print("✓ Database tables exist")
+        try:
+            if not tables_exist:
+                print("✓ Database tables not found, initializing...")
+                import init_db
+                init_db.init_database(connection, db_type)
+            else:
+                print("✓ Database tables exist")
+        finally:
+            connection.close()
         
         return True
     except Exception as e:
@@ -181,7 +201,16 @@ def check_and_init_database(env_vars):
         return False
 
 
-def get_feeds_needing_update(connection, db_type, feeds):
+def load_last_updates(connection, db_type):
+    """Return {feed_id: last_updated} for every feed in one query."""
+    cursor = connection.cursor()
+    cursor.execute("SELECT feed_id, last_updated FROM feed_updates")
+    if db_type == 'mysql':
+        return {row['feed_id']: row['last_updated'] for row in cursor.fetchall()}
+    return {row[0]: row[1] for row in cursor.fetchall()}
+
+
+def get_feeds_needing_update(connection, db_type, feeds, overdue_minutes=None):
     """
     Determine which feeds need to be updated based on their refresh interval.
 
@@ -189,64 +218,186 @@ def get_feeds_needing_update(connection, db_type, feeds):
         connection: Database connection
         db_type: 'mysql' or 'sqlite'
         feeds: List of feed configurations
+        overdue_minutes: Optional dict that receives, for each due feed, how many
+            minutes past its refresh interval it is (infinity if never updated)
 
     Returns:
         List of feed IDs that need updating
     """
-    cursor = connection.cursor()
     current_time = datetime.now(timezone.utc).replace(tzinfo=None)
-    feeds_to_update = []
+    last_updates = load_last_updates(connection, db_type)
 
     print("  Feed update disposition:")
+    return select_due_feeds(feeds, last_updates, current_time, overdue_minutes)
+
+
+def select_due_feeds(feeds, last_updates, current_time, overdue_minutes=None, verbose=True):
+    """
+    The due-feed decision of get_feeds_needing_update() for a given clock.
+
+    last_updates maps feed_id -> last_updated (datetime or string) and
+    current_time is naive UTC; schedule_sim.py replays runs through this
+    on a simulated clock with verbose=False.
+    """
+    feeds_to_update = []
 
     for feed in feeds:
         feed_id = feed.get('id')
-        feed_name = feed.get('name', feed_id)
         refresh_minutes = feed.get('refresh', DEFAULT_REFRESH_MINUTES)
-        
-        # Get last update time for this feed
-        if db_type == 'mysql':
-            cursor.execute("""
-                SELECT last_updated FROM feed_updates WHERE feed_id = %s
-            """, (feed_id,))
-        else:
-            cursor.execute("""
-                SELECT last_updated FROM feed_updates WHERE feed_id = ?
-            """, (feed_id,))
-        
-        result = cursor.fetchone()
-        last_updated_raw = None if result is None else (
-            result['last_updated'] if db_type == 'mysql' else result[0]
-        )
+        last_updated_raw = last_updates.get(feed_id)
         last_updated = parse_last_updated(last_updated_raw)
-        last_updated_display = format_last_updated(last_updated_raw)
         refresh_duration = timedelta(minutes=refresh_minutes)
         feed_label = f"{feed_id}"
         
         if last_updated is None:
             # Never updated, needs update
-            print(f"  + {feed_label}: due (last updated {last_updated_display}, interval {refresh_minutes}m)")
+            if verbose:
+                print(f"  + {feed_label}: due (last updated {format_last_updated(last_updated_raw)}, "
+                      f"interval {refresh_minutes}m)")
             feeds_to_update.append(feed_id)
+            if overdue_minutes is not None:
+                overdue_minutes[feed_id] = float('inf')
         else:
             # Check if refresh interval has elapsed
             time_since_update = current_time - last_updated
-            minutes_until_refresh = max(
-                int(round((refresh_duration - time_since_update).total_seconds() / 60)),
-                0
-            )
 
             if time_since_update >= refresh_duration:
-                print(f"  + {feed_label}: due (last updated {last_updated_display}, interval {refresh_minutes}m)")
+                if verbose:
+                    print(f"  + {feed_label}: due (last updated {format_last_updated(last_updated_raw)}, "
+                          f"interval {refresh_minutes}m)")
                 feeds_to_update.append(feed_id)
-            else:
+                if overdue_minutes is not None:
+                    overdue_minutes[feed_id] = (time_since_update - refresh_duration).total_seconds() / 60
+            elif verbose:
+                minutes_until_refresh = max(
+                    int(round((refresh_duration - time_since_update).total_seconds() / 60)),
+                    0
+                )
                 print(
-                    f"  - {feed_label}: not due (last updated {last_updated_display}, "
+                    f"  - {feed_label}: not due (last updated {format_last_updated(last_updated_raw)}, "
                     f"{minutes_until_refresh}m until refresh)"
                 )
     
     return feeds_to_update
 
 
+def find_due_feeds(env_vars, feeds, overdue_minutes=None):
+    """
+    Return the IDs of feeds that are due, using a single feed_updates query.
+
+    The query doubles as the schema check: only if it fails are the tables
+    checked (and created) before trying once more.
+    """
+    for attempt in range(2):
+        connection, db_type = get_db_connection(env_vars, pooled=True)
+        try:
+            return run_idempotent(
+                connection, db_type,
+                lambda conn: get_feeds_needing_update(conn, db_type, feeds, overdue_minutes)
+            )
+        except Exception as e:
+            if attempt:
+                raise
+            print(f"  ⚠ Could not read feed_updates ({e})")
+        finally:
+            connection.close()
+        if not check_and_init_database(env_vars):
+            raise RuntimeError("Failed to initialize database")
+
+
+def prioritize_feeds(feed_ids, feeds, overdue_minutes, policy='overdue', deferred_ids=()):
+    """
+    Order due feed IDs so the most important fetches start first.
+
+    Feeds deferred by the previous run always go first. The 'overdue' policy
+    then orders by how far past their refresh interval feeds are; 'default'
+    puts defaultEnabled feeds ahead of the rest and breaks ties by overdue time.
+    """
+    default_enabled = {f.get('id') for f in feeds if f.get('defaultEnabled')}
+    deferred_ids = set(deferred_ids)
+
+    def sort_key(feed_id):
+        key = [feed_id not in deferred_ids]
+        if policy == 'default':
+            key.append(feed_id not in default_enabled)
+        key.append(-overdue_minutes.get(feed_id, 0.0))
+        return key
+
+    return sorted(feed_ids, key=sort_key)
+
+
+def load_deferred_state(path=DEFERRED_STATE_PATH):
+    """
+    Return (feed_ids, cleanup_skipped) recorded by the previous run.
+
+    Both are empty/False when the previous run finished everything.
+    """
+    try:
+        with open(path, 'r') as f:
+            state = json.load(f)
+    except FileNotFoundError:
+        return [], False
+    except (OSError, ValueError) as exc:
+        print(f"⚠ Ignoring unreadable deferred-feed state {path}: {exc}")
+        return [], False
+    return [str(feed_id) for feed_id in state.get('feeds', [])], bool(state.get('cleanup_skipped'))
+
+
+def save_deferred_feeds(feed_ids, cleanup_skipped=False, path=DEFERRED_STATE_PATH):
+    """Record feeds (and cleanup) deferred by this run for the next one."""
+    if not feed_ids and not cleanup_skipped:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        return
+    state = {
+        'recorded_at': datetime.now(timezone.utc).replace(tzinfo=None).isoformat(sep=' '),
+        'feeds': list(feed_ids),
+        'cleanup_skipped': cleanup_skipped,
+    }
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(state, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def remaining_seconds(deadline_at):
+    """Seconds left before the run deadline, or None when no deadline is set."""
+    if deadline_at is None:
+        return None
+    return deadline_at - time.monotonic()
+
+
+def parse_args(argv=None):
+    """Parse command line options for an update run."""
+    parser = argparse.ArgumentParser(description="Fetch due news feeds and clean up old articles.")
+    parser.add_argument(
+        '--deadline', type=float, metavar='SECONDS',
+        help="time budget for the whole run; new fetches stop once it is nearly used"
+    )
+    parser.add_argument(
+        '--priority', choices=PRIORITY_POLICIES, default='overdue',
+        help="order of due feeds: most overdue first (default) or defaultEnabled feeds first"
+    )
+    parser.add_argument(
+        '--audit', action='store_true',
+        help="after cleanup, check for and remove future-dated articles that got past ingest validation"
+    )
+    parser.add_argument(
+        '--profile', nargs='?', const='cprofile', choices=PROFILE_MODES,
+        help="profile the run: cProfile .pstats (default) or sampled .collapsed stacks (see profiling.py)"
+    )
+    parser.add_argument(
+        '--profile-dir', metavar='DIR',
+        help="directory for profile files (default utils/profiles)"
+    )
+    args = parser.parse_args(argv)
+    if args.deadline is not None and args.deadline <= 0:
+        parser.error("--deadline must be a positive number of seconds")
+    return args
+
+
 def ensure_project_root():
     """Ensure the process runs from the project root so relative paths resolve."""
     try:
@@ -256,10 +407,26 @@ def ensure_project_root():
         sys.exit(1)
 
 
-def main():
+def main(argv=None):
     """Main update function."""
+    args = parse_args(argv)
+    if args.profile:
+        from profiling import profiled_run
+        with profiled_run(args.profile, args.profile_dir, 'update_news'):
+            run_update(args)
+    else:
+        run_update(args)
+
+
+def run_update(args):
+    """Run one update: fetch due feeds, clean up and report statistics."""
+    run_started = time.monotonic()
+    deadline_at = run_started + args.deadline if args.deadline else None
+
     print("=" * 60)
     print("News Feed Update - " + datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
+    if deadline_at is not None:
+        print(f"Time budget: {args.deadline:g}s (priority: {args.priority})")
     print("=" * 60)
 
     ensure_project_root()
@@ -267,12 +434,7 @@ def main():
     # Load environment variables
     env_vars = load_env_file()
     
-    # Step 1: Check/initialize database
-    if not check_and_init_database(env_vars):
-        print("ERROR: Failed to initialize database")
-        sys.exit(1)
-    
-    # Step 2: Load feed configuration
+    # Step 1: Load feed configuration
     print("\nLoading feed configuration...")
     try:
         feeds = load_feed_config()
@@ -281,18 +443,11 @@ def main():
         print(f"ERROR: Failed to load feed config: {e}")
         sys.exit(1)
     
-    before_stats = {'total': 0, 'oldest': None}
-    
-    # Step 3: Determine which feeds need updating
+    # Step 2: Determine which feeds need updating
     print("\nChecking which feeds need updates...")
+    overdue_minutes = {}
     try:
-        connection, db_type = get_db_connection(env_vars)
-        try:
-            before_stats = get_database_stats(connection, db_type)
-            feeds_to_update = get_feeds_needing_update(connection, db_type, feeds)
-        finally:
-            connection.close()
-        
+        feeds_to_update = find_due_feeds(env_vars, feeds, overdue_minutes)
         if feeds_to_update:
             print(f"✓ {len(feeds_to_update)} feed(s) need updating")
         else:
@@ -301,11 +456,45 @@ def main():
         print(f"ERROR: Failed to check feed status: {e}")
         sys.exit(1)
     
+    previously_deferred, cleanup_pending = load_deferred_state()
+    if not feeds_to_update and not cleanup_pending:
+        # Common cron tick: no new articles, so cleanup and statistics can wait
+        # for the next run that fetches something.
+        print("\nNothing due; skipping cleanup and statistics")
+        print("\n" + "=" * 60)
+        print(f"Update complete! ({time.monotonic() - run_started:.1f}s)")
+        print("=" * 60)
+        return
+    
+    # Step 3: Check/initialize database
+    if not check_and_init_database(env_vars):
+        print("ERROR: Failed to initialize database")
+        sys.exit(1)
+    
+    before_stats = {'total': 0, 'oldest': None}
+    try:
+        connection, db_type = get_db_connection(env_vars, pooled=True)
+        try:
+            before_stats = run_idempotent(connection, db_type, lambda conn: get_database_stats(conn, db_type))
+        finally:
+            connection.close()
+    except Exception as e:
+        print(f"ERROR: Failed to read database stats: {e}")
+    
+    feeds_to_update = prioritize_feeds(
+        feeds_to_update, feeds, overdue_minutes, args.priority, previously_deferred
+    )
+    deferred_feeds = []
+    
     # Step 4: Fetch feeds that need updating
     if feeds_to_update:
         print("\nFetching feeds...")
+        stop_at = None
+        if deadline_at is not None:
+            stop_at = deadline_at - FETCH_GRACE_SECONDS - CLEANUP_RESERVE_SECONDS
         try:
-            success_count = fetch_feeds.fetch_feeds(feeds_to_update)
+            import fetch_feeds
+            success_count = fetch_feeds.fetch_feeds(feeds_to_update, stop_at=stop_at, deferred=deferred_feeds)
 
             if success_count > 0:
                 print(f"✓ Successfully updated {success_count} feed(s)")
@@ -316,61 +505,79 @@ def main():
             # Don't exit here, continue with cleanup
     
     # Step 5: Clean up old articles
-    print("\nCleaning up old articles...")
     deleted_count = 0
     future_deleted_count = 0
-    try:
-        deleted_count = cleanup_db.cleanup_by_feed_lifetime()
-
-        if deleted_count > 0:
-            print(f"✓ Cleaned up {deleted_count} old article(s)")
-        else:
-            print("✓ No old articles to clean up")
-    except Exception as e:
-        print(f"ERROR: Failed to clean up: {e}")
-        # Don't exit, this is not critical
+    remaining = remaining_seconds(deadline_at)
+    cleanup_skipped = remaining is not None and remaining < CLEANUP_RESERVE_SECONDS
+    if cleanup_skipped:
+        print(f"\n⚠ Skipping cleanup: {max(remaining, 0):.1f}s left in time budget")
+    else:
+        print("\nCleaning up old articles...")
+        try:
+            import cleanup_db
+            deleted_count = cleanup_db.cleanup_by_feed_lifetime(stop_at=deadline_at)
 
-    # Step 6: Remove future-dated articles
-    print("\nSanity check: removing future-dated articles...")
-    try:
-        future_deleted_count = remove_future_dated_articles(env_vars)
-        if future_deleted_count > 0:
-            print(f"✓ Removed {future_deleted_count} future-dated article(s)")
-        else:
-            print("✓ No future-dated articles found")
-    except Exception as e:
-        print(f"ERROR: Failed to remove future-dated articles: {e}")
+            if deleted_count > 0:
+                print(f"✓ Cleaned up {deleted_count} old article(s)")
+            else:
+                print("✓ No old articles to clean up")
+        except Exception as e:
+            print(f"ERROR: Failed to clean up: {e}")
+            # Don't exit, this is not critical
+
+        # Step 6: Optional audit for future-dated articles (rejected at ingest)
+        if args.audit:
+            print("\nAudit: checking for future-dated articles...")
+            try:
+                future_deleted_count = remove_future_dated_articles(env_vars)
+                if future_deleted_count > 0:
+                    print(f"⚠ Removed {future_deleted_count} future-dated article(s) that passed ingest validation")
+                else:
+                    print("✓ No future-dated articles found")
+            except Exception as e:
+                print(f"ERROR: Failed to remove future-dated articles: {e}")
     
-    print("\nCollecting database statistics...")
     try:
-        connection, db_type = get_db_connection(env_vars)
+        save_deferred_feeds(deferred_feeds, cleanup_skipped)
+        if deferred_feeds or cleanup_skipped:
+            print(f"\n⚠ Recorded {len(deferred_feeds)} deferred feed(s) for the next run")
+    except OSError as e:
+        print(f"ERROR: Failed to record deferred feeds: {e}")
+    
+    remaining = remaining_seconds(deadline_at)
+    if remaining is not None and remaining <= 0:
+        print("\n⚠ Time budget used up; skipping database statistics")
+    else:
+        print("\nCollecting database statistics...")
         try:
-            final_stats = get_database_stats(connection, db_type)
-            db_size_mb = get_database_size_mb(env_vars, db_type, connection)
-        finally:
-            connection.close()
-        
-        total_after = final_stats['total']
-        total_before = before_stats.get('total', 0)
-        total_removed = deleted_count + future_deleted_count
-        added_count = total_after - total_before + total_removed
-        if added_count < 0:
-            added_count = 0
-        
-        oldest_days = compute_age_days(final_stats['oldest'])
-        oldest_display = f"{oldest_days} day(s) old" if oldest_days is not None else "N/A"
-        
-        print("\nDatabase statistics:")
-        print(f"  Total articles: {total_after:,}")
-        print(f"  Database size: {db_size_mb:.2f} MB")
-        print(f"  Oldest article: {oldest_display}")
-        print(f"  Entries added this run: {added_count:,}")
-        print(f"  Entries removed this run: {total_removed:,}")
-    except Exception as e:
-        print(f"ERROR: Failed to collect database stats: {e}")
+            connection, db_type = get_db_connection(env_vars, pooled=True)
+            try:
+                final_stats = run_idempotent(connection, db_type, lambda conn: get_database_stats(conn, db_type))
+                db_size_mb = get_database_size_mb(env_vars, db_type, connection)
+            finally:
+                connection.close()
+            
+            total_after = final_stats['total']
+            total_before = before_stats.get('total', 0)
+            total_removed = deleted_count + future_deleted_count
+            added_count = total_after - total_before + total_removed
+            if added_count < 0:
+                added_count = 0
+            
+            oldest_days = compute_age_days(final_stats['oldest'])
+            oldest_display = f"{oldest_days} day(s) old" if oldest_days is not None else "N/A"
+            
+            print("\nDatabase statistics:")
+            print(f"  Total articles: {total_after:,}")
+            print(f"  Database size: {db_size_mb:.2f} MB")
+            print(f"  Oldest article: {oldest_display}")
+            print(f"  Entries added this run: {added_count:,}")
+            print(f"  Entries removed this run: {total_removed:,}")
+        except Exception as e:
+            print(f"ERROR: Failed to collect database stats: {e}")
     
     print("\n" + "=" * 60)
-    print("Update complete!")
+    print(f"Update complete! ({time.monotonic() - run_started:.1f}s)")
     print("=" * 60)
 
 
@@ -0,0 +1,453 @@
+#!/usr/bin/env python3
+"""
+Canonical article URLs and the compact url_hash article key.
+Feeds hand out the same article with tracking parameters (utm_*, cmpid,
+...), over http and https, or with and without a trailing slash. Keyed on
+the raw URL each variant became its own row, and MySQL indexed a 255
+character prefix of every URL. store_articles() now stores the canonical
+URL and a 64-bit hash of its scheme-less, slash-less form, and the article
+key is (feed_id, url_hash). --migrate converts an existing database:
+it fills url_hash, merges the duplicates it exposes, swaps the unique key
+and rewrites stored URLs to canonical form.
+"""
+
+import os
+import sys
+import json
+import hashlib
+import argparse
+from datetime import datetime
+from urllib.parse import urlsplit, urlunsplit, unquote
+
+from db_utils import SCRIPT_DIR, load_env_file, get_db_connection, row_field, DatabaseUnavailable
+
+HASH_COLUMN = 'url_hash'
+MIGRATION_REPORT_PATH = SCRIPT_DIR / 'url_canon_migration.json'
+SCAN_BATCH_SIZE = 5000
+MYSQL_URL_PREFIX = 255  # old unique key: url(255)
+
+# Query parameters that only identify the campaign or click, never the article
+TRACKING_PARAMS = frozenset({
+    'cmpid', 'cmp', 'ncid', 'ocid', 'smid', 'smtyp', 'xtor', 'fbclid', 'gclid', 'dclid',
+    'msclkid', 'mc_cid', 'mc_eid', 'igshid', 'yclid', '_ga', 'at_medium', 'at_campaign',
+    'rss', 'feedtype', 'partner',
+})
+TRACKING_PREFIXES = ('utm_',)
+DEFAULT_PORTS = {'http': ':80', 'https': ':443'}
+
+_missing_reported = False
+
+
+def _is_tracking(param):
+    name = unquote(param.split('=', 1)[0]).strip().lower()
+    return name in TRACKING_PARAMS or name.startswith(TRACKING_PREFIXES)
+
+
+def canonical_url(url):
+    """
+    The URL to store: lower-case host, no default port, no fragment and no
+    tracking parameters. Other parameters keep their order and encoding, and
+    non-http(s) or unparsable URLs are returned stripped but otherwise as is.
+    """
+    url = (url or '').strip()
+    try:
+        parts = urlsplit(url)
+    except ValueError:
+        return url
+    scheme = parts.scheme.lower()
+    if scheme not in DEFAULT_PORTS or not parts.netloc:
+        return url
+    netloc = parts.netloc.lower()
+    if netloc.endswith(DEFAULT_PORTS[scheme]):
+        netloc = netloc[:-len(DEFAULT_PORTS[scheme])]
+    query = '&'.join(param for param in parts.query.split('&') if param and not _is_tracking(param))
+    return urlunsplit((scheme, netloc, parts.path or '/', query, ''))
+
+
+def url_key(url):
+    """Canonical URL without scheme or trailing slash, parameters sorted: the identity of an article."""
+    canonical = canonical_url(url)
+    try:
+        parts = urlsplit(canonical)
+    except ValueError:
+        return canonical
+    if not parts.netloc:
+        return canonical
+    query = '&'.join(sorted(param for param in parts.query.split('&') if param))
+    return f"{parts.netloc}{parts.path.rstrip('/')}" + (f"?{query}" if query else '')
+
+
+def url_hash(url):
+    """16 hex characters (64 bits) identifying an article URL within a feed."""
+    return hashlib.sha1(url_key(url).encode('utf-8')).hexdigest()[:16]
+
+
+def url_hash_available(connection, db_type):
+    """True when news_articles has url_hash; run url_canon.py --migrate to add it."""
+    global _missing_reported
+    cursor = connection.cursor()
+    if db_type == 'mysql':
+        cursor.execute("""
+            SELECT COUNT(*) AS count FROM information_schema.columns
+            WHERE table_schema = DATABASE() AND table_name = 'news_articles' AND column_name = %s
+        """, (HASH_COLUMN,))
+        available = row_field(cursor.fetchone(), 'count', 0) > 0
+    else:
+        cursor.execute("PRAGMA table_info(news_articles)")
+        available = any(row[1] == HASH_COLUMN for row in cursor.fetchall())
+    if not available and not _missing_reported:
+        print("⚠ news_articles.url_hash missing; run url_canon.py --migrate to key articles by URL hash")
+        _missing_reported = True
+    return available
+
+
+def url_hash_mode(connection, db_type):
+    """
+    How store_articles() uses url_hash: 'key' once (feed_id, url_hash) is
+    the article key, 'fill' while the column exists but (feed_id, url) is
+    still the key (after backfill.py url_hash or an interrupted --migrate),
+    and 'raw' without the column.
+    """
+    if not url_hash_available(connection, db_type):
+        return 'raw'
+    return 'key' if HASH_COLUMN in unique_key_columns(connection, db_type) else 'fill'
+
+
+def unique_key_columns(connection, db_type):
+    """Columns of the news_articles article key, e.g. ['feed_id', 'url']."""
+    cursor = connection.cursor()
+    if db_type == 'mysql':
+        cursor.execute("""
+            SELECT column_name AS name FROM information_schema.statistics
+            WHERE table_schema = DATABASE() AND table_name = 'news_articles' AND index_name = 'unique_article'
+            ORDER BY seq_in_index
+        """)
+        return [row_field(row, 'name', 0) for row in cursor.fetchall()]
+    from partitions import article_tables
+    # On the partitioned layout the key lives on each month table, not the view
+    cursor.execute(f"PRAGMA index_list({article_tables(connection, db_type)[0]})")
+    for row in cursor.fetchall():
+        # (seq, name, unique, origin, partial); origin 'u' is a UNIQUE constraint
+        if row[2] and row[3] in ('u', 'c'):
+            cursor.execute(f"PRAGMA index_info('{row[1]}')")
+            columns = [info[2] for info in cursor.fetchall()]
+            if 'feed_id' in columns:
+                return columns
+    return []
+
+
+def scan_duplicates(connection, db_type):
+    """
+    Walk news_articles once and compare raw with canonical keys.
+
+    Returns rows, duplicate rows and groups under the canonical key, rows
+    whose URL would change, and the estimated bytes of the old and new
+    unique keys.
+    """
+    result = {'rows': 0, 'duplicate_rows': 0, 'duplicate_groups': 0, 'rewritten_urls': 0,
+              'old_key_bytes': 0, 'new_key_bytes': 0}
+    seen = {}
+    cursor = connection.cursor()
+    placeholder = '%s' if db_type == 'mysql' else '?'
+    last_id = 0
+    while True:
+        cursor.execute(f"""
+            SELECT id, feed_id, url FROM news_articles
+            WHERE id > {placeholder} ORDER BY id LIMIT {SCAN_BATCH_SIZE}
+        """, (last_id,))
+        rows = cursor.fetchall()
+        if not rows:
+            break
+        for row in rows:
+            last_id, feed_id, url = row_field(row, 'id', 0), row_field(row, 'feed_id', 1), row_field(row, 'url', 2)
+            result['rows'] += 1
+            key = (feed_id, url_hash(url))
+            seen[key] = seen.get(key, 0) + 1
+            if canonical_url(url) != url:
+                result['rewritten_urls'] += 1
+            feed_bytes = len(feed_id.encode('utf-8'))
+            url_bytes = len(url.encode('utf-8'))
+            result['old_key_bytes'] += feed_bytes + (min(len(url), MYSQL_URL_PREFIX) if db_type == 'mysql' else url_bytes)
+            result['new_key_bytes'] += feed_bytes + 16
+    for count in seen.values():
+        if count > 1:
+            result['duplicate_groups'] += 1
+            result['duplicate_rows'] += count - 1
+    return result
+
+
+def index_sizes(connection, db_type):
+    """{index name: bytes} for the news_articles indexes, or {} if unknown."""
+    cursor = connection.cursor()
+    try:
+        if db_type == 'mysql':
+            cursor.execute("ANALYZE TABLE news_articles")
+            cursor.fetchall()
+            cursor.execute("""
+                SELECT index_name AS name, SUM(stat_value) * @@innodb_page_size AS bytes
+                FROM mysql.innodb_index_stats
+                WHERE database_name = DATABASE() AND table_name LIKE 'news_articles%%' AND stat_name = 'size'
+                GROUP BY index_name
+            """)
+            return {row_field(row, 'name', 0): int(row_field(row, 'bytes', 1)) for row in cursor.fetchall()}
+        cursor.execute("""
+            SELECT name, SUM(pgsize) FROM dbstat
+            WHERE name IN (SELECT name FROM sqlite_master WHERE tbl_name = 'news_articles' AND type = 'index')
+            GROUP BY name
+        """)
+        return {row[0]: row[1] for row in cursor.fetchall()}
+    except Exception:
+        # No access to mysql.innodb_index_stats, or SQLite built without dbstat
+        return {}
+
+
+def merge_duplicates(connection, db_type):
+    """
+    Keep the newest row (highest id) of each (feed_id, url_hash) and delete
+    the others. Returns (rows deleted, groups merged).
+    """
+    p = '%s' if db_type == 'mysql' else '?'
+    cursor = connection.cursor()
+    cursor.execute(f"""
+        SELECT feed_id, {HASH_COLUMN} AS url_hash, MAX(id) AS keep_id
+        FROM news_articles
+        WHERE {HASH_COLUMN} IS NOT NULL
+        GROUP BY feed_id, {HASH_COLUMN}
+        HAVING COUNT(*) > 1
+    """)
+    groups = [(row_field(row, 'feed_id', 0), row_field(row, 'url_hash', 1), row_field(row, 'keep_id', 2))
+              for row in cursor.fetchall()]
+    deleted = 0
+    for feed_id, hash_value, keep_id in groups:
+        cursor.execute(f"""
+            DELETE FROM news_articles WHERE feed_id = {p} AND {HASH_COLUMN} = {p} AND id <> {p}
+        """, (feed_id, hash_value, keep_id))
+        deleted += cursor.rowcount or 0
+    connection.commit()
+    return deleted, len(groups)
+
+
+def canonicalize_stored_urls(connection, db_type):
+    """Rewrite stored URLs to their canonical form; only safe once url_hash is the key."""
+    p = '%s' if db_type == 'mysql' else '?'
+    cursor = connection.cursor()
+    last_id = 0
+    rewritten = 0
+    while True:
+        cursor.execute(f"""
+            SELECT id, url FROM news_articles
+            WHERE id > {p} ORDER BY id LIMIT {SCAN_BATCH_SIZE}
+        """, (last_id,))
+        rows = cursor.fetchall()
+        if not rows:
+            break
+        last_id = row_field(rows[-1], 'id', 0)
+        updates = [(canonical_url(row_field(row, 'url', 1)), row_field(row, 'id', 0)) for row in rows
+                   if canonical_url(row_field(row, 'url', 1)) != row_field(row, 'url', 1)]
+        if updates:
+            cursor.executemany(f"UPDATE news_articles SET url = {p} WHERE id = {p}", updates)
+            connection.commit()
+            rewritten += len(updates)
+    return rewritten
+
+
+def _rekey_sqlite(connection):
+    """Rebuild news_articles with UNIQUE(feed_id, url_hash); SQLite cannot drop a table constraint."""
+    cursor = connection.cursor()
+    connection.commit()
+    cursor.execute("""
+        SELECT sql FROM sqlite_master
+        WHERE type = 'index' AND tbl_name = 'news_articles' AND sql IS NOT NULL
+    """)
+    index_sql = [row[0] for row in cursor.fetchall()]
+    cursor.execute("PRAGMA table_info(news_articles)")
+    columns = cursor.fetchall()
+    definitions = []
+    for _, name, column_type, not_null, default, primary_key in columns:
+        if primary_key:
+            definitions.append(f"{name} INTEGER PRIMARY KEY AUTOINCREMENT")
+            continue
+        definition = f"{name} {column_type}".rstrip()
+        if not_null:
+            definition += " NOT NULL"
+        if default is not None:
+            definition += f" DEFAULT {default}"
+        definitions.append(definition)
+    definitions.append(f"UNIQUE(feed_id, {HASH_COLUMN})")
+    column_list = ', '.join(column[1] for column in columns)
+
+    cursor.execute("BEGIN")
+    try:
+        cursor.execute("SELECT seq FROM sqlite_sequence WHERE name = 'news_articles'")
+        row = cursor.fetchone()
+        last_seq = row[0] if row else None
+        cursor.execute(f"CREATE TABLE news_articles_rekeyed ({', '.join(definitions)})")
+        cursor.execute(f"INSERT INTO news_articles_rekeyed ({column_list}) SELECT {column_list} FROM news_articles")
+        cursor.execute("DROP TABLE news_articles")
+        cursor.execute("ALTER TABLE news_articles_rekeyed RENAME TO news_articles")
+        for sql in index_sql:
+            cursor.execute(sql)
+        if last_seq is not None:
+            # Keep ids of deleted rows from being handed out again
+            cursor.execute("UPDATE sqlite_sequence SET seq = MAX(seq, ?) WHERE name = 'news_articles'", (last_seq,))
+        cursor.execute("COMMIT")
+    except Exception:
+        cursor.execute("ROLLBACK")
+        raise
+
+
+def swap_unique_key(connection, db_type):
+    """Make (feed_id, url_hash) the article key; returns False if it already is."""
+    if HASH_COLUMN in unique_key_columns(connection, db_type):
+        return False
+    if db_type == 'mysql':
+        from partitions import is_partitioned
+        # Unique keys of a partitioned table must include the partitioning column
+        columns = f"feed_id, {HASH_COLUMN}" + (", published_date" if is_partitioned(connection, db_type) else "")
+        cursor = connection.cursor()
+        cursor.execute(f"""
+            ALTER TABLE news_articles
+                DROP INDEX unique_article,
+                ADD UNIQUE KEY unique_article ({columns})
+        """)
+        connection.commit()
+    else:
+        _rekey_sqlite(connection)
+    return True
+
+
+def migrate(env_vars):
+    """
+    Key news_articles by url_hash: fill the column (resumably, through
+    backfill.py), merge duplicates, swap the unique key, then rewrite stored
+    URLs to canonical form. Returns a summary that the report shows later.
+    """
+    from backfill import run_backfill
+    from partitions import is_partitioned
+
+    connection, db_type = get_db_connection(env_vars)
+    try:
+        if db_type == 'sqlite' and is_partitioned(connection, db_type):
+            raise RuntimeError("the partitioned SQLite layout is not supported; migrate before converting")
+        before = {'rows': _count_rows(connection), 'indexes': index_sizes(connection, db_type)}
+    finally:
+        connection.close()
+
+    print("Filling url_hash...")
+    filled = run_backfill(env_vars, 'url_hash', missing_only=True)
+    print(f"  ✓ Hashed {filled['rows_written']:,} row(s)")
+
+    connection, db_type = get_db_connection(env_vars)
+    try:
+        deleted, groups = merge_duplicates(connection, db_type)
+        print(f"  ✓ Merged {groups:,} duplicate group(s), {deleted:,} row(s) removed")
+        swapped = swap_unique_key(connection, db_type)
+        if swapped:
+            print(f"  ✓ Article key is now (feed_id, {HASH_COLUMN})")
+        else:
+            print(f"  ✓ Article key was already (feed_id, {HASH_COLUMN})")
+        rewritten = canonicalize_stored_urls(connection, db_type)
+        print(f"  ✓ Rewrote {rewritten:,} stored URL(s) to canonical form")
+        after = {'rows': _count_rows(connection), 'indexes': index_sizes(connection, db_type)}
+    finally:
+        connection.close()
+
+    summary = {
+        'migrated_at': datetime.now().isoformat(sep=' ', timespec='seconds'),
+        'db_type': db_type,
+        'rows_before': before['rows'],
+        'rows_after': after['rows'],
+        'rows_merged': deleted,
+        'index_bytes_before': before['indexes'],
+        'index_bytes_after': after['indexes'],
+    }
+    if swapped or deleted:
+        # A no-op rerun keeps the report of the migration that did the work
+        with open(MIGRATION_REPORT_PATH, 'w') as f:
+            json.dump(summary, f, indent=2)
+    return summary
+
+
+def _count_rows(connection):
+    cursor = connection.cursor()
+    cursor.execute("SELECT COUNT(*) AS count FROM news_articles")
+    return row_field(cursor.fetchone(), 'count', 0)
+
+
+def _format_bytes(size):
+    for unit in ('B', 'KB', 'MB', 'GB'):
+        if size < 1024 or unit == 'GB':
+            return f"{size:,.0f} {unit}" if unit == 'B' else f"{size:,.1f} {unit}"
+        size /= 1024
+
+
+def print_migration_summary(summary):
+    print(f"\nMigration of {summary['migrated_at']} ({summary['db_type']}):")
+    print(f"  Rows: {summary['rows_before']:,} → {summary['rows_after']:,} ({summary['rows_merged']:,} duplicates merged)")
+    before = sum(summary['index_bytes_before'].values())
+    after = sum(summary['index_bytes_after'].values())
+    if before and after:
+        print(f"  Index bytes: {_format_bytes(before)} → {_format_bytes(after)} "
+              f"({_format_bytes(before - after)} saved, {1 - after / before:.0%})")
+    elif not before:
+        print("  Index bytes: not measurable on this server")
+
+
+def print_report(env_vars):
+    """What canonical keys would merge (or have merged) and what the key costs."""
+    connection, db_type = get_db_connection(env_vars)
+    try:
+        key = unique_key_columns(connection, db_type)
+        scan = scan_duplicates(connection, db_type)
+        sizes = index_sizes(connection, db_type)
+    finally:
+        connection.close()
+
+    print(f"URL canonicalization report ({db_type})")
+    print(f"  Article key: ({', '.join(key) or 'none'})"
+          + ("" if HASH_COLUMN in key else " - run url_canon.py --migrate"))
+    print(f"  Rows: {scan['rows']:,}")
+    print(f"  Duplicates under canonical URLs: {scan['duplicate_rows']:,} row(s) in {scan['duplicate_groups']:,} group(s)")
+    print(f"  Stored URLs that are not canonical: {scan['rewritten_urls']:,}")
+    if scan['old_key_bytes']:
+        saved = 1 - scan['new_key_bytes'] / scan['old_key_bytes']
+        print(f"  Key bytes (estimated): (feed_id, url) {_format_bytes(scan['old_key_bytes'])}, "
+              f"(feed_id, url_hash) {_format_bytes(scan['new_key_bytes'])} ({saved:.0%} smaller)")
+    for name, size in sorted(sizes.items()):
+        print(f"  - index {name}: {_format_bytes(size)}")
+    if os.path.exists(MIGRATION_REPORT_PATH):
+        with open(MIGRATION_REPORT_PATH, 'r') as f:
+            print_migration_summary(json.load(f))
+
+
+def main():
+    """Main function."""
+    parser = argparse.ArgumentParser(description="Canonical article URLs and the url_hash article key.")
+    parser.add_argument('urls', nargs='*', help="print the canonical form and hash of these URLs")
+    parser.add_argument('--migrate', action='store_true',
+                        help="fill url_hash, merge duplicates and make (feed_id, url_hash) the article key")
+    args = parser.parse_args()
+
+    if args.urls:
+        for url in args.urls:
+            print(f"{url_hash(url)}  {canonical_url(url)}")
+        return
+
+    env_vars = load_env_file()
+    if not args.migrate:
+        try:
+            print_report(env_vars)
+        except DatabaseUnavailable as e:
+            print(f"ERROR: {e}")
+            sys.exit(1)
+        return
+    try:
+        summary = migrate(env_vars)
+    except Exception as e:
+        print(f"ERROR: Migration failed: {e}")
+        sys.exit(1)
+    print_migration_summary(summary)
+
+
+if __name__ == '__main__':
+    main()
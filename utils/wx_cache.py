@@ -0,0 +1,342 @@
+#!/usr/bin/env python3
+"""
+Response cache for the php/openwx.php weather proxy.
+openwx.php keeps one JSON file per cached response in OPENWX_CACHE_DIR:
+city geocodes keyed by the normalized city name, and weather responses
+keyed by endpoint, grid cell and query options. Coordinates are snapped to
+the centre of their grid cell before the upstream call, so nearby cars
+share one entry. This script warms the cells seen recently in ping_data,
+evicts expired and least recently used entries, and reports on the cache.
+"""
+
+import os
+import sys
+import json
+import math
+import time
+import queue
+import hashlib
+import argparse
+import tempfile
+import threading
+from urllib.parse import urlencode
+
+from db_utils import load_env_file, get_db_connection, resolve_table_sqlite_path, DatabaseUnavailable
+
+# php/openwx.php mirrors these; keys and file names must match exactly
+WX_CACHE_DIR_DEFAULT = '/tmp/openwx_cache'
+WX_CACHE_PATHS = {
+    # path: TTL seconds, grid cell size in degrees
+    'data/3.0/onecall': {'ttl': 600, 'grid': 0.1},
+    'data/2.5/forecast': {'ttl': 1800, 'grid': 0.1},
+    'data/2.5/air_pollution': {'ttl': 1800, 'grid': 0.1},
+    'geo/1.0/reverse': {'ttl': 30 * 86400, 'grid': 0.01},
+}
+WX_KEY_PARAMS = ('units', 'lang', 'exclude', 'limit')
+
+WX_API_URL = 'https://api.openweathermap.org/'
+# What js/wx.js requests for the car's position
+WARM_REQUESTS = (
+    ('data/3.0/onecall', {'units': 'imperial'}),
+    ('data/2.5/forecast', {'units': 'imperial'}),
+    ('data/2.5/air_pollution', {}),
+)
+DEFAULT_WARM_HOURS = 2
+DEFAULT_LEAD_SECONDS = 120
+DEFAULT_CONCURRENCY = 4
+DEFAULT_MAX_ENTRIES = 20000
+
+
+def cache_dir(env_vars):
+    return env_vars.get('OPENWX_CACHE_DIR') or WX_CACHE_DIR_DEFAULT
+
+
+def grid_cell(lat, lon, grid):
+    """Integer (row, column) of the grid cell holding lat/lon."""
+    return math.floor(lat / grid), math.floor(lon / grid)
+
+
+def cell_center(cell, grid):
+    """The '%.4f' lat/lon strings openwx.php sends upstream for a cell."""
+    return f"{(cell[0] + 0.5) * grid:.4f}", f"{(cell[1] + 0.5) * grid:.4f}"
+
+
+def weather_key(path, cell, grid, params):
+    """Cache key of a weather response; see openwxWeatherKey() in openwx.php."""
+    options = '|'.join(str(params.get(name, '')) for name in WX_KEY_PARAMS)
+    return f"{path}|{grid:g}|{cell[0]}|{cell[1]}|{options}"
+
+
+def entry_path(directory, kind, key):
+    """File of one entry; kind is 'geo' or 'wx'."""
+    return os.path.join(directory, f"{kind}_{hashlib.md5(key.encode('utf-8')).hexdigest()}.json")
+
+
+def read_entry(path):
+    """The cached entry dict ({timestamp, ttl, status, key, body}), or None."""
+    try:
+        with open(path, 'r') as f:
+            entry = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return entry if isinstance(entry, dict) and 'timestamp' in entry else None
+
+
+def expires_at(entry):
+    return int(entry.get('timestamp', 0)) + int(entry.get('ttl', 0))
+
+
+def write_entry(path, key, body, ttl, status=200, timestamp=None):
+    """Write an entry atomically: openwx.php sees the old file or the new one."""
+    entry = {'timestamp': int(timestamp if timestamp is not None else time.time()), 'ttl': int(ttl),
+             'status': status, 'key': key, 'body': body}
+    fd, tmp_path = tempfile.mkstemp(prefix='.wx_', suffix='.tmp', dir=os.path.dirname(path))
+    try:
+        with os.fdopen(fd, 'w') as f:
+            json.dump(entry, f, separators=(',', ':'))
+        # mkstemp creates 0600 files; openwx.php may run as another user
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+def recent_cells(env_vars, hours=DEFAULT_WARM_HOURS, grid=WX_CACHE_PATHS['data/3.0/onecall']['grid']):
+    """
+    Grid cells of the pings received in the last `hours`, busiest first.
+    Returns [(cell, ping count)].
+    """
+    connection, db_type = get_db_connection(env_vars, sqlite_path=resolve_table_sqlite_path(env_vars, 'ping_data'))
+    # timestamp defaults to the database's CURRENT_TIMESTAMP, so compare
+    # against the database clock
+    if db_type == 'mysql':
+        cutoff, params = "NOW() - INTERVAL %s SECOND", (int(hours * 3600),)
+    else:
+        cutoff, params = "datetime('now', ?)", (f"-{int(hours * 3600)} seconds",)
+    counts = {}
+    try:
+        cursor = connection.cursor()
+        cursor.execute(f"""
+            SELECT latitude, longitude FROM ping_data
+            WHERE timestamp >= {cutoff} AND latitude IS NOT NULL AND longitude IS NOT NULL
+        """, params)
+        for row in cursor.fetchall():
+            lat, lon = (row['latitude'], row['longitude']) if isinstance(row, dict) else (row[0], row[1])
+            try:
+                cell = grid_cell(float(lat), float(lon), grid)
+            except (TypeError, ValueError):
+                continue
+            counts[cell] = counts.get(cell, 0) + 1
+    finally:
+        connection.close()
+    return sorted(counts.items(), key=lambda item: -item[1])
+
+
+def warm(env_vars, cells, api_key, api_url=WX_API_URL, requests=WARM_REQUESTS,
+         lead=DEFAULT_LEAD_SECONDS, concurrency=DEFAULT_CONCURRENCY, client=None):
+    """
+    Fetch the responses js/wx.js asks for in each cell whose cache entry is
+    missing or expires within lead seconds. Returns {'fetched', 'fresh', 'failed'}.
+    """
+    from http_client import HttpClient, FetchError
+
+    directory = cache_dir(env_vars)
+    os.makedirs(directory, exist_ok=True)
+    now = time.time()
+    pending = queue.Queue()
+    report = {'fetched': 0, 'fresh': 0, 'failed': 0}
+    for cell in cells:
+        for path, params in requests:
+            grid = WX_CACHE_PATHS[path]['grid']
+            # Warm cells are computed on the onecall grid; map to this path's grid
+            lat, lon = cell_center(cell, WX_CACHE_PATHS['data/3.0/onecall']['grid'])
+            path_cell = grid_cell(float(lat), float(lon), grid)
+            key = weather_key(path, path_cell, grid, params)
+            target = entry_path(directory, 'wx', key)
+            entry = read_entry(target)
+            if entry is not None and expires_at(entry) - lead > now:
+                report['fresh'] += 1
+                continue
+            pending.put((path, params, path_cell, key, target))
+
+    own_client = client is None
+    client = client or HttpClient(max_idle_per_host=concurrency)
+    lock = threading.Lock()
+
+    def worker():
+        while True:
+            try:
+                path, params, path_cell, key, target = pending.get_nowait()
+            except queue.Empty:
+                return
+            lat, lon = cell_center(path_cell, WX_CACHE_PATHS[path]['grid'])
+            query = dict(params, lat=lat, lon=lon, appid=api_key)
+            try:
+                body, _ = client.fetch(f"{api_url.rstrip('/')}/{path}?{urlencode(query)}")
+                json.loads(body)
+                write_entry(target, key, body.decode('utf-8'), WX_CACHE_PATHS[path]['ttl'])
+                outcome = 'fetched'
+            except (FetchError, OSError, ValueError) as e:
+                print(f"  ✗ {path} at {lat},{lon}: {e}")
+                outcome = 'failed'
+            with lock:
+                report[outcome] += 1
+
+    try:
+        workers = [threading.Thread(target=worker, daemon=True) for _ in range(max(min(concurrency, pending.qsize()), 1))]
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+    finally:
+        if own_client:
+            client.close()
+    return report
+
+
+def _entries(directory):
+    """[(path, mtime, size, entry)] of every cache file; mtime is the last hit."""
+    result = []
+    try:
+        names = os.listdir(directory)
+    except FileNotFoundError:
+        return result
+    for name in names:
+        if not name.endswith('.json') or not name.startswith(('wx_', 'geo_')):
+            continue
+        path = os.path.join(directory, name)
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            continue
+        result.append((path, stat.st_mtime, stat.st_size, read_entry(path)))
+    return result
+
+
+def evict(env_vars, max_entries=DEFAULT_MAX_ENTRIES, dry_run=False):
+    """
+    Delete expired entries, then the least recently used ones beyond
+    max_entries (openwx.php touches a file on every hit). Returns
+    (expired removed, LRU removed).
+    """
+    directory = cache_dir(env_vars)
+    now = time.time()
+    expired, live = [], []
+    for path, mtime, size, entry in _entries(directory):
+        if entry is None or expires_at(entry) <= now:
+            expired.append(path)
+        else:
+            live.append((mtime, path))
+    live.sort()
+    overflow = [path for _, path in live[:max(len(live) - max_entries, 0)]]
+    if not dry_run:
+        for path in expired + overflow:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+    return len(expired), len(overflow)
+
+
+def print_status(env_vars):
+    directory = cache_dir(env_vars)
+    entries = _entries(directory)
+    now = time.time()
+    print(f"openwx cache: {directory}")
+    if not entries:
+        print("  (empty)")
+        return
+    for kind in ('geo', 'wx'):
+        mine = [item for item in entries if os.path.basename(item[0]).startswith(kind + '_')]
+        fresh = sum(1 for item in mine if item[3] is not None and expires_at(item[3]) > now)
+        size = sum(item[2] for item in mine)
+        label = 'geocodes' if kind == 'geo' else 'weather responses'
+        print(f"  - {label}: {len(mine):,} ({fresh:,} fresh, {size:,} bytes)")
+
+
+def start_stub_server():
+    """
+    Serve OpenWeatherMap-shaped responses on a local port, for trying the
+    warmer without an API key. Returns (server, api_url).
+    """
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+    from urllib.parse import urlsplit, parse_qs
+
+    class StubHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            parts = urlsplit(self.path)
+            query = {key: values[0] for key, values in parse_qs(parts.query).items()}
+            if parts.path.endswith('/geo/1.0/direct'):
+                payload = [{'name': query.get('q', ''), 'lat': 42.3601, 'lon': -71.0589}]
+            else:
+                payload = {'lat': float(query.get('lat', 0)), 'lon': float(query.get('lon', 0)),
+                           'path': parts.path, 'current': {'dt': int(time.time()), 'temp': 60.0}}
+            body = json.dumps(payload).encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/"
+
+
+def main():
+    """Main function."""
+    parser = argparse.ArgumentParser(description="Warm, evict or inspect the openwx.php response cache.")
+    parser.add_argument('--warm', action='store_true', help="prefetch weather for grid cells seen recently in ping_data")
+    parser.add_argument('--hours', type=float, default=DEFAULT_WARM_HOURS,
+                        help=f"with --warm, look at pings from the last N hours (default {DEFAULT_WARM_HOURS})")
+    parser.add_argument('--max-cells', type=int, default=200, help="with --warm, at most this many cells, busiest first")
+    parser.add_argument('--evict', action='store_true', help="delete expired and least recently used entries")
+    parser.add_argument('--max-entries', type=int, default=DEFAULT_MAX_ENTRIES,
+                        help=f"with --evict, entries kept (default {DEFAULT_MAX_ENTRIES})")
+    parser.add_argument('--dry-run', action='store_true', help="with --evict, only count what would be removed")
+    parser.add_argument('--stub', action='store_true', help="with --warm, fetch from a local stub API")
+    args = parser.parse_args()
+
+    env_vars = load_env_file()
+    if args.warm:
+        try:
+            cells = [cell for cell, _ in recent_cells(env_vars, args.hours)][:args.max_cells]
+        except DatabaseUnavailable as e:
+            print(f"ERROR: {e}")
+            sys.exit(1)
+        server = None
+        if args.stub:
+            server, api_url = start_stub_server()
+            api_key = 'stub'
+            print(f"Stub weather API at {api_url}")
+        else:
+            api_key = env_vars.get('OPENWX_KEY')
+            api_url = env_vars.get('OPENWX_API_URL') or WX_API_URL
+            if not api_key:
+                print("ERROR: OPENWX_KEY not found in .env")
+                sys.exit(1)
+        try:
+            print(f"Warming {len(cells)} grid cell(s) seen in the last {args.hours:g}h...")
+            report = warm(env_vars, cells, api_key, api_url)
+        finally:
+            if server is not None:
+                server.shutdown()
+        print(f"✓ Fetched {report['fetched']}, {report['fresh']} already fresh"
+              + (f", {report['failed']} failed" if report['failed'] else ""))
+    if args.evict:
+        expired, overflow = evict(env_vars, args.max_entries, args.dry_run)
+        verb = 'Would remove' if args.dry_run else 'Removed'
+        print(f"✓ {verb} {expired:,} expired and {overflow:,} least recently used entries")
+    if not args.warm and not args.evict:
+        print_status(env_vars)
+
+
+if __name__ == '__main__':
+    main()